@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from midas_open_downloader.downloader.dap_downloader import HTTPDownloader
+from midas_open_downloader.downloader.rate_limiter import RateLimiter
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+test_capabilities_file = os.path.join(current_dir, "test_capabilities_file.txt")
+
+
+class StubCedaServer:
+    """
+    A local stand-in for the CEDA DAP server. Capability files are served from
+    test_capabilities_file, every other path gets a small generated body.
+    Bodies for specific paths can be set in `bodies`, extra response headers
+    in `headers`. Range requests are honoured with 206 Partial Content and a
+    matching If-None-Match with 304 Not Modified. Each request is delayed by
+    `latency` seconds to emulate a remote server. The most requests handled at
+    once are counted in `peak_in_flight`. With `range_start` set, ranges are
+    served from that byte instead of the requested one, like a misbehaving proxy.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.bodies = {}
+        self.headers = {}
+        self.etag = '"stub-etag"'
+        self.requests = []
+        self.range_requests = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.range_start = None
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server._lock:
+                    server.requests.append(self.path)
+                    server.in_flight += 1
+                    server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+                try:
+                    time.sleep(server.latency)
+                    self.respond()
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def respond(self):
+                if self.path in server.bodies:
+                    body = server.bodies[self.path]
+                elif self.path.endswith('_capability.csv'):
+                    with open(test_capabilities_file, 'rb') as f:
+                        body = f.read()
+                else:
+                    body = f"body of {self.path}\n".encode()
+                if self.headers.get('If-None-Match') == server.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                range_header = self.headers.get('Range')
+                with server._lock:
+                    server.range_requests.append(range_header)
+                if range_header and range_header.startswith('bytes='):
+                    start = int(range_header[len('bytes='):].split('-', 1)[0])
+                    if server.range_start is not None:
+                        start = server.range_start
+                    if start >= len(body):
+                        self.send_response(416)
+                        self.send_header('Content-Range', f"bytes */{len(body)}")
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', f"bytes {start}-{len(body) - 1}/{len(body)}")
+                    body = body[start:]
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', server.etag)
+                for name, value in server.headers.get(self.path, {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class StubHTTPDownloader(HTTPDownloader):
+    """An HTTPDownloader pointed at a StubCedaServer, without credentials or rate limits."""
+
+    def __init__(self, base_url, **kwargs):
+        kwargs.setdefault('rate_limiter', RateLimiter(requests_per_second=None))
+        super().__init__(**kwargs)
+        self.base_path = base_url
+        self.cert_file = None
+
+    def setup_credentials(self):
+        return False
+
+
+@pytest.fixture
+def make_stub_downloader(stub_server):
+    def make(**kwargs):
+        return StubHTTPDownloader(stub_server.base_url, **kwargs)
+    return make
+
+
+@pytest.fixture
+def stub_server():
+    server = StubCedaServer().start()
+    yield server
+    server.stop()
@@ -0,0 +1,129 @@
+import pytest
+import asyncio
+import threading
+from unittest.mock import MagicMock
+
+pytest.importorskip("aiohttp")
+
+from midas_open_downloader.aio import AsyncRepository, AsyncRetriever
+from midas_open_downloader.downloader.abstract_downloader import AsyncMidasOpenDownloader, MidasOpenDownloader
+from midas_open_downloader.downloader.async_dap_downloader import AsyncHTTPDownloader
+from midas_open_downloader.downloader.errors import NotModifiedError
+from midas_open_downloader.downloader.partial import PartialDownload
+from midas_open_downloader.downloader.sinks import LocalSink
+from midas_open_downloader.downloader.rate_limiter import RateLimiter
+
+
+class StubAsyncHTTPDownloader(AsyncHTTPDownloader):
+    def __init__(self, base_url, **kwargs):
+        super().__init__(rate_limiter=RateLimiter(requests_per_second=None), **kwargs)
+        self.base_path = base_url
+        self.cert_file = None
+
+    async def setup_credentials(self):
+        pass
+
+@pytest.fixture
+def retriever(stub_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return AsyncRetriever(AsyncRepository(StubAsyncHTTPDownloader(stub_server.base_url)), max_in_flight=50)
+
+def test_download_hourly_files(retriever, tmp_path):
+    downloaded_files = asyncio.run(retriever.download_hourly_files("staffordshire", ["00622_keele", "00623_oaken"], 2021, 2022))
+
+    assert downloaded_files == [
+        f"midas-open_uk-hourly-weather-obs_dv-202308_staffordshire_{station}_qcv-1_{year}.csv"
+        for station in ["00622_keele", "00623_oaken"]
+        for year in [2021, 2022]
+    ]
+    assert (tmp_path / downloaded_files[0]).read_text().startswith("body of /dataset-version-202308/staffordshire/00622_keele/")
+
+def test_skips_stations_outside_range(retriever):
+    assert retriever.download_hourly_files_sync("staffordshire", ["00622_keele"], 2020, 2023) == []
+
+def test_requests_are_multiplexed(retriever, stub_server):
+    stub_server.latency = 0.2
+    station_ids = [f"{i:05d}_station" for i in range(10)]
+
+    downloaded_files = retriever.download_hourly_files_sync("staffordshire", station_ids, 2019, 2022)
+
+    # The 40 hourly files are requested at once rather than one by one
+    assert len(downloaded_files) == 40
+    assert stub_server.peak_in_flight >= 20
+
+def test_is_not_a_sync_downloader():
+    assert issubclass(AsyncHTTPDownloader, AsyncMidasOpenDownloader)
+    assert not issubclass(AsyncHTTPDownloader, MidasOpenDownloader)
+
+def test_conditional_download(stub_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    downloader = StubAsyncHTTPDownloader(stub_server.base_url)
+    uri = downloader.get_hourly_path("staffordshire", "00622_keele", "1", 2022)
+
+    async def download_twice():
+        await downloader.init()
+        try:
+            await downloader.download(uri)
+            validators = downloader.last_validators
+            with pytest.raises(NotModifiedError):
+                await downloader.download(uri, validators=validators)
+            return validators
+        finally:
+            await downloader.cleanup()
+
+    assert asyncio.run(download_twice())['etag'] == stub_server.etag
+
+def test_file_io_runs_off_the_event_loop(stub_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    threads = []
+
+    class RecordingPartial(PartialDownload):
+        def open(self, append=False):
+            file_object = super().open(append)
+            write = file_object.write
+            file_object.write = lambda data: threads.append(threading.get_ident()) or write(data)
+            return file_object
+
+    sink = LocalSink()
+    sink.partial = RecordingPartial
+    downloader = StubAsyncHTTPDownloader(stub_server.base_url, sink=sink)
+
+    async def download():
+        await downloader.init()
+        try:
+            return await downloader.download(downloader.get_hourly_path("staffordshire", "00622_keele", "1", 2022))
+        finally:
+            await downloader.cleanup()
+
+    local_file_path = asyncio.run(download())
+
+    assert (tmp_path / local_file_path).read_text().startswith("body of ")
+    assert threads and threading.get_ident() not in threads
+
+def test_requests_are_not_paced_by_default():
+    downloader = AsyncHTTPDownloader(credentials=MagicMock())
+
+    assert downloader.rate_limiter.requests_per_second is None
+
+def test_unexpected_content_range_downloads_whole_file(stub_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    downloader = StubAsyncHTTPDownloader(stub_server.base_url)
+    uri = downloader.get_hourly_path("staffordshire", "00622_keele", "1", 2022)
+    path = uri[len(stub_server.base_url):]
+    body = b"0123456789" * 10
+    stub_server.bodies[path] = body
+    stub_server.range_start = 0
+    local_file_path = downloader.local_path(uri)
+    (tmp_path / f"{local_file_path}.part").write_bytes(body[:40])
+    PartialDownload(local_file_path).save_metadata({'remote_path': uri, 'size': len(body)})
+
+    async def download():
+        await downloader.init()
+        try:
+            return await downloader.download(uri)
+        finally:
+            await downloader.cleanup()
+
+    assert asyncio.run(download()) == local_file_path
+    assert (tmp_path / local_file_path).read_bytes() == body
+    assert stub_server.range_requests == ["bytes=40-", None]
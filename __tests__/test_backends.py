@@ -0,0 +1,97 @@
+import pytest
+import os
+import sys
+import subprocess
+from unittest.mock import MagicMock
+from midas_open_downloader.downloader import backends
+from midas_open_downloader.downloader.abstract_downloader import MidasOpenDownloader
+from midas_open_downloader.downloader.backends import register_backend, available_backends, get_backend, create_downloader
+from midas_open_downloader.downloader.ftp_downloader import FTPDownloader
+from midas_open_downloader.downloader.dap_downloader import HTTPDownloader
+from midas_open_downloader.repository import Repository
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setattr(backends, '_backends', dict(backends._backends))
+    monkeypatch.setattr(backends, '_resolved', {})
+
+def test_builtin_backends():
+    assert available_backends() == ['dap', 'ftp']
+    assert get_backend('dap') is HTTPDownloader
+    assert get_backend('ftp') is FTPDownloader
+
+def test_unknown_backend():
+    with pytest.raises(ValueError, match="Unknown backend 'sftp'"):
+        get_backend('sftp')
+
+def test_register_backend_by_class_and_path():
+    downloader_class = MagicMock()
+    register_backend('mock', downloader_class)
+    register_backend('ftp-alias', 'midas_open_downloader.downloader.ftp_downloader:FTPDownloader')
+
+    assert create_downloader('mock', rate_limiter='limiter') is downloader_class.return_value
+    downloader_class.assert_called_once_with(rate_limiter='limiter')
+    assert get_backend('ftp-alias') is FTPDownloader
+
+def incomplete_downloader_class(missing):
+    methods = {name: lambda self, *args, **kwargs: None
+               for name in ('init', 'cleanup', 'setup_credentials', 'download', 'iter_chunks', 'probe', 'list_directory')
+               if name != missing}
+    return type('IncompleteDownloader', (MidasOpenDownloader,), methods)
+
+@pytest.mark.parametrize('missing', ['probe', 'list_directory', 'iter_chunks'])
+def test_backend_must_implement_every_method(missing):
+    register_backend('incomplete', incomplete_downloader_class(missing))
+
+    with pytest.raises(TypeError, match=missing):
+        create_downloader('incomplete')
+
+def test_repository_uses_backend():
+    assert isinstance(Repository(backend='ftp').downloader, FTPDownloader)
+
+def test_import_has_no_heavy_imports_or_side_effects(tmp_path):
+    code = (
+        "import sys; import midas_open_downloader.retriever, midas_open_downloader.__main__\n"
+        "from midas_open_downloader.repository import Repository; Repository(backend='ftp')\n"
+        "print(sorted(m for m in ('requests', 'bs4', 'cryptography', 'contrail', 'asyncio') if m in sys.modules))"
+    )
+    env = dict(os.environ, PYTHONPATH=root_dir)
+
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=tmp_path, env=env, text=True)
+
+    assert output.strip() == '[]'
+    assert os.listdir(tmp_path) == []
+
+def test_repository_passes_downloader_options():
+    pool = MagicMock()
+    repository = Repository(backend='ftp', downloader_options={'pool': pool})
+
+    repository.initialize()
+    repository.cleanup()
+
+    assert repository.downloader.pool is pool
+    pool.close.assert_not_called()
+
+def test_cli_shares_one_ftp_pool(tmp_path, monkeypatch):
+    from midas_open_downloader import __main__ as cli
+    (tmp_path / "conf").mkdir()
+    (tmp_path / "conf" / "ftp_account.txt").write_text("user\npassword\n")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, 'argv', ['midas_open_downloader', 'staffordshire', '00622_keele', '2022', '2022', '--backend', 'ftp', '--workers', '3'])
+    retriever_class = MagicMock()
+    monkeypatch.setattr(cli, 'Retriever', retriever_class)
+    monkeypatch.setattr(cli, 'set_default_rate_limiter', MagicMock())
+
+    cli.main()
+
+    repository_factory = retriever_class.call_args.kwargs['repository_factory']
+    pools = {repository_factory().downloader.pool for _ in range(2)}
+    assert len(pools) == 1
+    pool = pools.pop()
+    assert (pool.size, pool.host, pool.username) == (3, "ftp.ceda.ac.uk", "user")
+    # Closed at the end of the run
+    with pytest.raises(Exception, match="421"):
+        with pool.connection():
+            pass
@@ -0,0 +1,100 @@
+import pytest
+import os
+from midas_open_downloader.badc import read_badc_header_from_path, TIMESTAMP, FLOAT, INT, STRING
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+test_hourly_file = os.path.join(current_dir, "test_hourly_file.txt")
+test_capabilities_file = os.path.join(current_dir, "test_capabilities_file.txt")
+
+def test_read_header():
+    header = read_badc_header_from_path(test_hourly_file)
+
+    assert header.columns[:3] == ['ob_time', 'id', 'id_type']
+    assert header.metadata['observation_station'] == [('G', ['keele'])]
+    types = header.column_types()
+    assert types['ob_time'] == TIMESTAMP
+    assert types['air_temperature'] == FLOAT
+    assert types['wind_speed_q'] == INT
+    assert types['air_temperature_j'] == STRING
+    with open(test_hourly_file, 'rb') as f:
+        assert f.read()[header.data_offset:].startswith(b"2022-01-01 00:00:00,4617")
+
+def test_read_header_without_types():
+    header = read_badc_header_from_path(test_capabilities_file)
+
+    assert header.columns == ['id', 'id_type', 'met_domain_name', 'first_year', 'last_year']
+    assert set(header.column_types().values()) == {STRING}
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_load_dataframe(use_mmap):
+    pd = pytest.importorskip("pandas")
+    from midas_open_downloader.badc import load_badc_dataframe
+
+    frame = load_badc_dataframe(test_hourly_file, use_mmap=use_mmap)
+
+    assert len(frame) == 4
+    assert frame['ob_time'].iloc[2] == pd.Timestamp(2022, 1, 1, 2)
+    assert frame['air_temperature'].dtype == 'float64'
+    assert frame['air_temperature'].isna().tolist() == [False, False, True, False]
+    assert frame['wind_speed'].dtype == 'Int64'
+    assert frame['wind_speed'].isna().tolist() == [False, False, True, False]
+    assert frame['air_temperature_j'].tolist()[2] == "D"
+    assert frame['air_temperature_j'].isna().sum() == 3
+
+def test_load_selected_columns_as_arrays():
+    pytest.importorskip("pandas")
+    from midas_open_downloader.badc import load_badc_arrays
+
+    arrays = load_badc_arrays(test_hourly_file, columns=['air_temperature', 'id', 'wind_speed'])
+
+    assert list(arrays) == ['air_temperature', 'id', 'wind_speed']
+    assert arrays['id'].dtype == 'int64'
+    assert arrays['wind_speed'].dtype == 'float64'
+    assert arrays['air_temperature'][1] == 11.3
+
+def test_matches_parse_badc_csv():
+    pytest.importorskip("pandas")
+    from midas_open_parser import parse_badc_csv
+    from midas_open_downloader.parser import parse_hourly_observations
+
+    frame = parse_hourly_observations(test_hourly_file)
+    rows = parse_badc_csv(test_hourly_file)
+
+    assert len(frame) == len(rows)
+    assert [float(row['msl_pressure']) for row in rows] == frame['msl_pressure'].tolist()
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_incremental_parser_yields_typed_records(chunk_size):
+    import datetime
+    from midas_open_downloader.badc import iter_badc_records
+    with open(test_hourly_file, 'rb') as f:
+        data = f.read()
+
+    records = list(iter_badc_records(data[i:i + chunk_size] for i in range(0, len(data), chunk_size)))
+
+    assert len(records) == 4
+    assert records[2]['ob_time'] == datetime.datetime(2022, 1, 1, 2)
+    assert records[2]['air_temperature'] is None
+    assert records[2]['msl_pressure'] == 1014.9
+    assert records[2]['wind_direction'] == 240
+    assert records[2]['air_temperature_j'] == "D"
+    assert records[0]['id_type'] == "DCNN"
+
+def test_incremental_parser_returns_rows_as_they_complete():
+    from midas_open_downloader.badc import BadcRecordParser
+    with open(test_hourly_file, 'rb') as f:
+        data = f.read()
+    parser = BadcRecordParser()
+    first_row_end = data.index(b"\n", data.index(b"\n2022-01-01 00:00:00") + 1) + 1
+
+    assert parser.feed(data[:first_row_end - 1]) == []
+    assert len(parser.feed(data[first_row_end - 1:first_row_end])) == 1
+    assert parser.header.columns[0] == 'ob_time'
+    assert len(parser.feed(data[first_row_end:] + b"trailing garbage,after,end data\n")) == 3
+    assert parser.finished
+
+def test_incremental_parser_without_data_section():
+    from midas_open_downloader.badc import iter_badc_records
+
+    with pytest.raises(ValueError):
+        list(iter_badc_records([b"Conventions,G,BADC-CSV,1\n"]))
@@ -0,0 +1,132 @@
+import pytest
+import os
+from unittest.mock import MagicMock
+from midas_open_downloader.cache import DownloadCache, dataset_version_of
+from midas_open_downloader.repository import Repository
+from midas_open_downloader.downloader.errors import NotModifiedError
+
+remote_path = "/badc/uk-hourly-weather-obs/dataset-version-202308/staffordshire/00622_keele/qc-version-1/hourly_2022.csv"
+
+@pytest.fixture
+def cache(tmp_path):
+    return DownloadCache(str(tmp_path / "cache"))
+
+@pytest.fixture
+def local_file(tmp_path):
+    path = tmp_path / "hourly_2022.csv"
+    path.write_bytes(b"observations")
+    return str(path)
+
+def test_dataset_version_of():
+    assert dataset_version_of(remote_path) == "202308"
+    assert dataset_version_of("/some/other/file.csv") == ""
+
+def test_store_lookup_restore(cache, local_file, tmp_path):
+    assert cache.lookup(remote_path) is None
+
+    cache.store(remote_path, local_file, {'etag': '"abc"'})
+    entry = cache.lookup(remote_path)
+    restored = cache.restore(remote_path, entry, str(tmp_path / "restored.csv"))
+
+    assert entry['validators'] == {'etag': '"abc"'}
+    assert entry['dataset_version'] == "202308"
+    assert open(restored, 'rb').read() == b"observations"
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'entries': 1, 'size': len(b"observations")}
+
+def test_index_is_persistent(cache, local_file):
+    cache.store(remote_path, local_file)
+
+    reopened = DownloadCache(cache.cache_dir)
+
+    assert reopened.lookup(remote_path)['digest'] == cache.lookup(remote_path)['digest']
+
+def test_identical_content_is_stored_once(cache, local_file):
+    cache.store(remote_path, local_file)
+    cache.store(remote_path.replace("202308", "202407"), local_file)
+
+    assert cache.stats()['entries'] == 2
+    assert cache.stats()['size'] == len(b"observations")
+
+def test_evict_by_size(tmp_path):
+    cache = DownloadCache(str(tmp_path / "cache"), max_size=25)
+    for year in (2020, 2021, 2022):
+        path = tmp_path / f"{year}.csv"
+        path.write_bytes(f"observations {year}".encode())
+        cache.store(f"/dataset-version-202308/{year}.csv", str(path))
+
+    assert cache.lookup("/dataset-version-202308/2020.csv") is None
+    assert cache.lookup("/dataset-version-202308/2022.csv") is not None
+    assert cache.stats()['size'] <= 25
+
+def test_evict_by_age(tmp_path, local_file):
+    cache = DownloadCache(str(tmp_path / "cache"), max_age=60)
+    cache.store(remote_path, local_file)
+    digest = cache.lookup(remote_path)['digest']
+    cache.entries[next(iter(cache.entries))]['stored_at'] -= 120
+
+    cache.evict()
+
+    assert cache.lookup(remote_path) is None
+    assert not os.path.exists(cache._blob_path(digest))
+
+def test_repository_conditional_hit(cache, local_file, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache.store(remote_path, local_file, {'etag': '"abc"'})
+    downloader = MagicMock()
+    downloader.sink.compression = None
+    downloader.get_hourly_path.return_value = remote_path
+    downloader.local_path.return_value = "restored.csv"
+    downloader.download.side_effect = NotModifiedError(remote_path)
+    repository = Repository(downloader, cache=cache)
+
+    assert repository.download_hourly_file("staffordshire", "00622_keele", 2022, "1") == "restored.csv"
+    downloader.download.assert_called_once_with(remote_path, validators={'etag': '"abc"'})
+    assert (tmp_path / "restored.csv").read_bytes() == b"observations"
+    assert cache.stats()['hits'] == 1
+
+def test_repository_miss_stores(cache, local_file):
+    downloader = MagicMock()
+    downloader.sink.compression = None
+    downloader.get_hourly_path.return_value = remote_path
+    downloader.download.return_value = local_file
+    downloader.last_validators = {'etag': '"abc"'}
+    repository = Repository(downloader, cache=cache)
+
+    repository.download_hourly_file("staffordshire", "00622_keele", 2022, "1")
+
+    downloader.download.assert_called_once_with(remote_path, validators=None)
+    assert cache.lookup(remote_path)['validators'] == {'etag': '"abc"'}
+    assert cache.stats()['misses'] == 1
+
+def test_repository_without_revalidation_skips_download(tmp_path, local_file, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = DownloadCache(str(tmp_path / "cache"), revalidate=False)
+    cache.store(remote_path, local_file)
+    downloader = MagicMock()
+    downloader.sink.compression = None
+    downloader.get_hourly_path.return_value = remote_path
+    downloader.local_path.return_value = "restored.csv"
+    repository = Repository(downloader, cache=cache)
+
+    repository.download_hourly_file("staffordshire", "00622_keele", 2022, "1")
+
+    downloader.download.assert_not_called()
+
+def test_compressed_files_are_cached_apart(tmp_path, local_file, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = DownloadCache(str(tmp_path / "cache"), revalidate=False)
+    compressed_file = tmp_path / "hourly_2022.csv.gz"
+    compressed_file.write_bytes(b"\x1f\x8bcompressed")
+    cache.store(remote_path, str(compressed_file), compression='gzip')
+    downloader = MagicMock()
+    downloader.sink.compression = None
+    downloader.get_hourly_path.return_value = remote_path
+    downloader.download.return_value = local_file
+    downloader.last_validators = {}
+    repository = Repository(downloader, cache=cache)
+
+    assert repository.download_hourly_file("staffordshire", "00622_keele", 2022, "1") == local_file
+    downloader.download.assert_called_once_with(remote_path, validators=None)
+    assert cache.lookup(remote_path)['compression'] is None
+    assert cache.lookup(remote_path, 'gzip')['compression'] == 'gzip'
+    assert cache.stats()['entries'] == 2
@@ -0,0 +1,80 @@
+import pytest
+import os
+import threading
+import time
+from unittest.mock import MagicMock, patch
+from midas_open_downloader.capabilities import CapabilityIndex
+from midas_open_downloader.retriever import Retriever
+from midas_open_downloader.parser import StationCapabilities
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+test_capabilities_file = os.path.join(current_dir, "test_capabilities_file.txt")
+
+def make_repository(fetched):
+    repository = MagicMock()
+
+    def get_station_capabilities(historic_county, station_id, dataset_version):
+        fetched.append((station_id, threading.get_ident()))
+        time.sleep(0.02)
+        if station_id == "broken":
+            return None
+        return StationCapabilities(test_capabilities_file)
+    repository.get_station_capabilities.side_effect = get_station_capabilities
+    return repository
+
+def test_update_resolves_missing_stations_concurrently(tmp_path):
+    fetched = []
+    index = CapabilityIndex(str(tmp_path / "index.json"))
+    station_ids = [f"{i:05d}_station" for i in range(8)]
+
+    unresolved = index.update("staffordshire", station_ids, lambda: make_repository(fetched), workers=4)
+
+    assert unresolved == []
+    assert sorted(station_id for station_id, _ in fetched) == station_ids
+    assert len({thread_id for _, thread_id in fetched}) > 1
+    assert index.get_station_years("staffordshire", "00003_station") == (1972, 2022)
+
+def test_index_is_persisted(tmp_path):
+    fetched = []
+    CapabilityIndex(str(tmp_path / "index.json")).update("staffordshire", ["00622_keele"], lambda: make_repository(fetched))
+
+    index = CapabilityIndex(str(tmp_path / "index.json"))
+    index.update("staffordshire", ["00622_keele"], lambda: make_repository(fetched))
+
+    assert len(fetched) == 1
+    assert index.get_station_years("staffordshire", "00622_keele") == (1972, 2022)
+    assert index.get_station_years("staffordshire", "00622_keele", dataset_version="202407") is None
+
+def test_unresolved_stations_are_not_indexed(tmp_path):
+    index = CapabilityIndex()
+
+    unresolved = index.update("staffordshire", ["broken", "00622_keele"], lambda: make_repository([]))
+
+    assert unresolved == ["broken"]
+    assert index.get_station_years("staffordshire", "broken") is None
+
+def test_retriever_validates_from_index():
+    with patch("midas_open_downloader.retriever.Repository") as mock_repo:
+        repository = mock_repo.return_value
+        repository.download_hourly_file.return_value = "local_file_path"
+        index = CapabilityIndex()
+        index.set_station_years("staffordshire", "00622_keele", 1972, 2022)
+        index.set_station_years("staffordshire", "00623_oaken", 2010, 2020)
+
+        downloaded_files = Retriever(capability_index=index).download_hourly_files("staffordshire", ["00622_keele", "00623_oaken"], 2021, 2022)
+
+        assert downloaded_files == ["local_file_path", "local_file_path"]
+        repository.get_station_capabilities.assert_not_called()
+
+def test_single_worker_retriever_reuses_its_repository():
+    fetched = []
+    created = []
+    repository_factory = lambda: created.append(make_repository(fetched)) or created[-1]
+    index = CapabilityIndex()
+    retriever = Retriever(capability_index=index, repository_factory=repository_factory)
+    retriever.repository.download_hourly_file.return_value = "local_file_path"
+
+    assert retriever.download_hourly_files("staffordshire", ["00622_keele"], 2021, 2022) == ["local_file_path", "local_file_path"]
+
+    assert len(created) == 1
+    assert [station_id for station_id, _ in fetched] == ["00622_keele"]
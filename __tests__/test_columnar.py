@@ -0,0 +1,102 @@
+import pytest
+import datetime
+import os
+import shutil
+from unittest.mock import MagicMock
+
+pa = pytest.importorskip("pyarrow")
+
+from midas_open_downloader.columnar import ColumnarStore, iter_record_batches
+from midas_open_downloader.repository import Repository
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+test_hourly_file = os.path.join(current_dir, "test_hourly_file.txt")
+
+@pytest.fixture
+def store(tmp_path):
+    return ColumnarStore(str(tmp_path / "parquet"))
+
+def test_columns_are_typed():
+    schema, batches = iter_record_batches(test_hourly_file)
+    table = pa.Table.from_batches(list(batches), schema)
+
+    assert table.num_rows == 4
+    assert table.schema.field('ob_time').type == pa.timestamp('s')
+    assert table.schema.field('air_temperature').type == pa.float64()
+    assert table.schema.field('air_temperature_q').type == pa.int32()
+    assert table.schema.field('id_type').type == pa.string()
+    assert table.column('ob_time')[1].as_py() == datetime.datetime(2022, 1, 1, 1)
+    assert table.column('air_temperature').to_pylist() == [11.5, 11.3, None, 10.9]
+    assert table.column('wind_speed').to_pylist() == [9, 10, None, 8]
+    assert table.column('air_temperature_j').to_pylist() == [None, None, "D", None]
+
+def test_malformed_rows_are_not_dropped(tmp_path):
+    truncated_file = tmp_path / "truncated.csv"
+    with open(test_hourly_file) as f:
+        lines = f.readlines()
+    data_start = lines.index("data\n") + 2
+    lines[data_start + 1] = lines[data_start + 1].split(',', 3)[0] + "\n"
+    truncated_file.write_text(''.join(lines))
+
+    with pytest.raises(pa.ArrowInvalid, match="Expected 14 columns, got 1"):
+        schema, batches = iter_record_batches(str(truncated_file))
+        list(batches)
+
+def test_write_and_read_partitions(store):
+    store.write_hourly_file(test_hourly_file, "00622_keele", 2022)
+    store.write_hourly_file(test_hourly_file, "00623_oaken", 2021)
+
+    table = store.read(station_ids=["00622_keele"], columns=['ob_time', 'air_temperature', 'station_id', 'year'])
+
+    assert os.path.exists(store.partition_path("00622_keele", 2022))
+    assert table.num_rows == 4
+    assert set(table.column('station_id').to_pylist()) == {"00622_keele"}
+    assert set(table.column('year').to_pylist()) == {2022}
+    assert store.read(start_year=2021, end_year=2021).num_rows == 4
+
+def test_leftover_of_interrupted_conversion_is_not_read(store):
+    path = store.write_hourly_file(test_hourly_file, "00622_keele", 2022)
+    leftover = os.path.join(os.path.dirname(path), ".part-0.parquet.part")
+    with open(leftover, 'wb') as f:
+        f.write(b"PAR1 truncated")
+
+    assert store.read().num_rows == 4
+
+def test_streams_in_bounded_blocks(store, tmp_path):
+    # Many more rows than fit in one block are written as several row groups
+    large_file = tmp_path / "large.csv"
+    with open(test_hourly_file) as f:
+        lines = f.readlines()
+    data_start = lines.index("data\n") + 2
+    with open(large_file, 'w') as f:
+        f.writelines(lines[:data_start])
+        for _ in range(2000):
+            f.writelines(lines[data_start:-1])
+        f.write("end data\n")
+    store.block_size = 16 * 1024
+
+    path = store.write_hourly_file(str(large_file), "00622_keele", 2022)
+
+    import pyarrow.parquet as pq
+    metadata = pq.ParquetFile(path).metadata
+    assert metadata.num_rows == 8000
+    assert metadata.num_row_groups > 1
+
+def test_up_to_date_partitions_are_not_rewritten(store):
+    path = store.write_hourly_file(test_hourly_file, "00622_keele", 2022)
+    modified = os.path.getmtime(path)
+
+    store.write_hourly_file(test_hourly_file, "00622_keele", 2022)
+
+    assert os.path.getmtime(path) == modified
+
+def test_repository_converts_downloaded_files(store, tmp_path):
+    downloader = MagicMock()
+    local_file = str(tmp_path / "hourly.csv")
+    shutil.copy(test_hourly_file, local_file)
+    downloader.download.return_value = local_file
+    repository = Repository(downloader, columnar_store=store)
+
+    assert repository.download_hourly_file("staffordshire", "00622_keele", 2022, "1") == local_file
+
+    assert os.path.exists(store.partition_path("00622_keele", 2022))
@@ -0,0 +1,174 @@
+import pytest
+import datetime
+import threading
+import time
+import requests
+from unittest.mock import MagicMock
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from midas_open_downloader.downloader.credentials import CredentialManager, get_default_credential_manager, set_default_credential_manager, stop_default_credential_manager
+from midas_open_downloader.downloader.dap_downloader import HTTPDownloader
+from midas_open_downloader.downloader.rate_limiter import RateLimiter
+
+def write_cert(cert_file, lifetime):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "test")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(minutes=1))
+            .not_valid_after(now + datetime.timedelta(seconds=lifetime))
+            .sign(key, hashes.SHA256()))
+    with open(cert_file, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+
+@pytest.fixture
+def account_file(tmp_path):
+    path = tmp_path / "dap_account.txt"
+    path.write_text("user\npassword\n")
+    return str(path)
+
+@pytest.fixture
+def issue():
+    return MagicMock(side_effect=lambda cert_file, username, password: write_cert(cert_file, 12 * 3600))
+
+@pytest.fixture
+def make_manager(tmp_path, account_file, issue):
+    managers = []
+
+    def make(**kwargs):
+        kwargs.setdefault('background_refresh', False)
+        kwargs.setdefault('sign_in', MagicMock(return_value=None))
+        manager = CredentialManager(str(tmp_path / "credentials.pem"), str(tmp_path / "cookies.json"), account_file, issue=issue, **kwargs)
+        managers.append(manager)
+        return manager
+    yield make
+    for manager in managers:
+        manager.stop()
+
+def test_valid_cached_certificate_is_reused(make_manager, issue, tmp_path):
+    write_cert(str(tmp_path / "credentials.pem"), 12 * 3600)
+
+    make_manager().ensure_valid()
+
+    issue.assert_not_called()
+
+def test_certificate_about_to_expire_is_refreshed(make_manager, issue, tmp_path):
+    write_cert(str(tmp_path / "credentials.pem"), 600)
+    manager = make_manager(min_lifetime=3600)
+
+    manager.ensure_valid()
+
+    # Issued next to the cached certificate and moved into place
+    issue.assert_called_once()
+    assert issue.call_args.args[0].startswith(str(tmp_path / "credentials.pem"))
+    assert issue.call_args.args[1:] == ("user", "password")
+    assert manager.is_valid()
+
+def test_concurrent_workers_issue_one_certificate(make_manager, issue):
+    manager = make_manager()
+    threads = [threading.Thread(target=manager.ensure_valid) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    issue.assert_called_once()
+
+def test_rejected_credentials_are_refreshed_once(make_manager, issue):
+    manager = make_manager()
+    generation = manager.ensure_valid()
+
+    manager.refresh(generation)
+    manager.refresh(generation)
+
+    assert issue.call_count == 2
+    assert manager.generation == generation + 1
+
+def test_sign_in_cookies_are_cached(make_manager):
+    jar = requests.cookies.RequestsCookieJar()
+    jar.set("sessionid", "abc", domain="auth.ceda.ac.uk", path="/")
+    jar.set("old", "x", domain="auth.ceda.ac.uk", path="/", expires=int(time.time()) - 10)
+    make_manager(sign_in=MagicMock(return_value=jar)).refresh()
+
+    # A new manager, e.g. in the next run, reuses the cookies without signing in
+    sign_in = MagicMock()
+    session = requests.Session()
+    make_manager(sign_in=sign_in).apply(session)
+
+    assert session.cookies.get("sessionid", domain="auth.ceda.ac.uk") == "abc"
+    assert "old" not in session.cookies
+    sign_in.assert_not_called()
+
+def test_background_refresh_before_expiry(make_manager, issue, tmp_path):
+    write_cert(str(tmp_path / "credentials.pem"), 4)
+    manager = make_manager(min_lifetime=1, background_refresh=True)
+
+    manager.ensure_valid()
+    deadline = time.monotonic() + 5
+    while not manager.refreshes and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    issue.assert_called_once()
+    assert manager.seconds_until_refresh() > 3600
+
+def test_background_refresh_does_not_block_downloads(make_manager, tmp_path):
+    issuing, release = threading.Event(), threading.Event()
+
+    def slow_issue(cert_file, username, password):
+        issuing.set()
+        release.wait(5)
+        write_cert(cert_file, 12 * 3600)
+    write_cert(str(tmp_path / "credentials.pem"), 3)
+    manager = make_manager(min_lifetime=1, background_refresh=True)
+    manager._issue = slow_issue
+
+    manager.ensure_valid()
+    assert issuing.wait(5)
+    # The current certificate is still handed out while the new one is issued
+    started = time.monotonic()
+    assert manager.ensure_valid() == 0
+    assert time.monotonic() - started < 1
+    release.set()
+    deadline = time.monotonic() + 5
+    while not manager.refreshes and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert manager.generation == 1
+    assert manager.seconds_until_refresh() > 3600
+
+def test_short_lived_refresh_does_not_loop(make_manager, tmp_path, monkeypatch):
+    monkeypatch.setattr("midas_open_downloader.downloader.credentials.BACKGROUND_RETRY_INTERVAL", 10)
+    issue = MagicMock(side_effect=lambda cert_file, username, password: write_cert(cert_file, 1))
+    write_cert(str(tmp_path / "credentials.pem"), 3)
+    manager = make_manager(min_lifetime=1, background_refresh=True)
+    manager._issue = issue
+
+    manager.ensure_valid()
+    # Refreshed a second before expiry, then waiting instead of refreshing again
+    time.sleep(1.5)
+
+    assert issue.call_count == 1
+
+def test_stop_default_credential_manager():
+    manager = MagicMock()
+    set_default_credential_manager(manager)
+
+    stop_default_credential_manager()
+    stop_default_credential_manager()
+
+    manager.stop.assert_called_once()
+    assert get_default_credential_manager() is not manager
+    set_default_credential_manager(None)
+
+def test_http_downloader_init_makes_no_requests(make_manager, stub_server, tmp_path, issue):
+    write_cert(str(tmp_path / "credentials.pem"), 12 * 3600)
+    downloader = HTTPDownloader(rate_limiter=RateLimiter(requests_per_second=None), credentials=make_manager())
+
+    downloader.init()
+    downloader.cleanup()
+
+    assert stub_server.requests == []
+    issue.assert_not_called()
@@ -0,0 +1,204 @@
+import pytest
+import os
+import base64
+import hashlib
+import requests
+from unittest.mock import MagicMock
+from midas_open_downloader.downloader.errors import DownloadError, NotModifiedError
+from midas_open_downloader.downloader.partial import PartialDownload
+from midas_open_downloader.downloader.integrity import get_default_checksum_registry
+
+hourly_path = "/dataset-version-202308/staffordshire/00622_keele/qc-version-1/hourly_2022.csv"
+
+@pytest.fixture
+def downloader(make_stub_downloader):
+    downloader = make_stub_downloader(chunk_size=1024)
+    downloader.init()
+    yield downloader
+    downloader.cleanup()
+
+def test_download_streams_to_final_name(downloader, stub_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    body = os.urandom(256 * 1024)
+    stub_server.bodies[hourly_path] = body
+
+    filename = downloader.download(stub_server.base_url + hourly_path)
+
+    assert filename == "hourly_2022.csv"
+    assert (tmp_path / filename).read_bytes() == body
+    assert os.listdir(tmp_path) == [filename]
+
+def test_download_uses_chunked_stream(downloader, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    response = MagicMock(status_code=200, headers={})
+    response.__enter__.return_value = response
+    response.iter_content.return_value = [b"a" * 1024, b"b" * 10]
+    downloader.session = MagicMock()
+    downloader.session.get.return_value = response
+
+    downloader.download("https://dap.ceda.ac.uk/file.csv")
+
+    assert downloader.session.get.call_args.kwargs['stream'] is True
+    response.iter_content.assert_called_once_with(chunk_size=1024)
+    assert (tmp_path / "file.csv").read_bytes() == b"a" * 1024 + b"b" * 10
+
+def test_interrupted_download_keeps_partial_file(downloader, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "file.csv").write_bytes(b"previous complete file")
+
+    def broken_stream(chunk_size):
+        yield b"partial"
+        raise requests.exceptions.ChunkedEncodingError("connection reset")
+
+    response = MagicMock(status_code=200, headers={'Content-Length': '100'})
+    response.__enter__.return_value = response
+    response.iter_content.side_effect = broken_stream
+    downloader.session = MagicMock()
+    downloader.session.get.return_value = response
+
+    with pytest.raises(DownloadError):
+        downloader.download("https://dap.ceda.ac.uk/file.csv")
+
+    assert sorted(os.listdir(tmp_path)) == ["file.csv", "file.csv.part", "file.csv.part.json"]
+    assert (tmp_path / "file.csv").read_bytes() == b"previous complete file"
+    assert (tmp_path / "file.csv.part").read_bytes() == b"partial"
+
+def test_resume_with_range_request(downloader, stub_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    body = os.urandom(64 * 1024)
+    uri = stub_server.base_url + hourly_path
+    stub_server.bodies[hourly_path] = body
+    (tmp_path / "hourly_2022.csv.part").write_bytes(body[:10000])
+    PartialDownload("hourly_2022.csv").save_metadata({'remote_path': uri, 'size': len(body), 'etag': stub_server.etag})
+
+    filename = downloader.download(uri)
+
+    assert (tmp_path / filename).read_bytes() == body
+    assert stub_server.range_requests == ["bytes=10000-"]
+    assert os.listdir(tmp_path) == [filename]
+
+def test_unexpected_content_range_downloads_whole_file(downloader, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    body = b"0123456789"
+    uri = "https://dap.ceda.ac.uk/file.csv"
+    (tmp_path / "file.csv.part").write_bytes(body[:5])
+    PartialDownload("file.csv").save_metadata({'remote_path': uri, 'size': len(body)})
+
+    def respond(status_code, headers, chunks):
+        response = MagicMock(status_code=status_code, headers=headers)
+        response.__enter__.return_value = response
+        response.iter_content.return_value = chunks
+        return response
+    downloader.session = MagicMock()
+    downloader.session.get.side_effect = [
+        # A range from the start of the file instead of from byte 5
+        respond(206, {'Content-Range': "bytes 0-9/10", 'Content-Length': '10'}, [body]),
+        respond(200, {'Content-Length': '10'}, [body]),
+    ]
+
+    assert downloader.download(uri) == "file.csv"
+
+    assert (tmp_path / "file.csv").read_bytes() == body
+    assert [call.kwargs['headers'].get('Range') for call in downloader.session.get.call_args_list] == ["bytes=5-", None]
+
+def test_complete_partial_file_is_committed_on_416(downloader, stub_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    body = b"x" * 500
+    uri = stub_server.base_url + hourly_path
+    stub_server.bodies[hourly_path] = body
+    (tmp_path / "hourly_2022.csv.part").write_bytes(body)
+    PartialDownload("hourly_2022.csv").save_metadata({'remote_path': uri, 'size': len(body)})
+
+    assert downloader.download(uri) == "hourly_2022.csv"
+    assert (tmp_path / "hourly_2022.csv").read_bytes() == body
+
+def test_partial_file_for_other_uri_is_not_resumed(downloader, stub_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    body = b"fresh body"
+    stub_server.bodies[hourly_path] = body
+    (tmp_path / "hourly_2022.csv.part").write_bytes(b"stale")
+    PartialDownload("hourly_2022.csv").save_metadata({'remote_path': "https://elsewhere/hourly_2022.csv", 'size': 99})
+
+    downloader.download(stub_server.base_url + hourly_path)
+
+    assert (tmp_path / "hourly_2022.csv").read_bytes() == body
+    assert stub_server.range_requests == [None]
+
+def test_short_body_is_not_committed(downloader, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    response = MagicMock(status_code=200, headers={'Content-Length': '100'})
+    response.__enter__.return_value = response
+    response.iter_content.return_value = [b"only ten b"]
+    downloader.session = MagicMock()
+    downloader.session.get.return_value = response
+
+    with pytest.raises(DownloadError):
+        downloader.download("https://dap.ceda.ac.uk/file.csv")
+
+    assert not (tmp_path / "file.csv").exists()
+    assert (tmp_path / "file.csv.part").read_bytes() == b"only ten b"
+
+def test_conditional_download_not_modified(downloader, stub_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    uri = stub_server.base_url + hourly_path
+
+    downloader.download(uri)
+    assert downloader.last_validators['etag'] == stub_server.etag
+
+    with pytest.raises(NotModifiedError):
+        downloader.download(uri, validators=downloader.last_validators)
+
+    stub_server.etag = '"changed"'
+    assert downloader.download(uri, validators={'etag': '"stub-etag"'}) == "hourly_2022.csv"
+
+def test_iter_chunks(downloader, stub_server):
+    body = os.urandom(10 * 1024 + 1)
+    stub_server.bodies[hourly_path] = body
+
+    chunks = list(downloader.iter_chunks(stub_server.base_url + hourly_path))
+
+    assert b"".join(chunks) == body
+    assert max(len(chunk) for chunk in chunks) <= 1024
+
+def test_iter_chunks_not_found(downloader, stub_server):
+    downloader.session = MagicMock()
+    response = downloader.session.get.return_value
+    response.__enter__.return_value = response
+    response.status_code = 404
+    response.raise_for_status.side_effect = requests.exceptions.HTTPError(response=response)
+
+    with pytest.raises(DownloadError):
+        list(downloader.iter_chunks(stub_server.base_url + hourly_path))
+
+def test_download_records_streamed_checksum(downloader, stub_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    body = os.urandom(64 * 1024)
+    stub_server.bodies[hourly_path] = body
+    stub_server.headers[hourly_path] = {'Digest': f"SHA-256={base64.b64encode(hashlib.sha256(body).digest()).decode()}"}
+
+    filename = downloader.download(stub_server.base_url + hourly_path)
+
+    assert downloader.last_checksum['sha256'] == hashlib.sha256(body).hexdigest()
+    assert downloader.last_checksum['checks'] == ['sha256', 'size']
+    assert get_default_checksum_registry().lookup(filename)['sha256'] == hashlib.sha256(body).hexdigest()
+
+def test_resumed_download_checksum_covers_whole_file(downloader, stub_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    body = os.urandom(64 * 1024)
+    uri = stub_server.base_url + hourly_path
+    stub_server.bodies[hourly_path] = body
+    (tmp_path / "hourly_2022.csv.part").write_bytes(body[:10000])
+    PartialDownload("hourly_2022.csv").save_metadata({'remote_path': uri, 'size': len(body), 'etag': stub_server.etag})
+
+    downloader.download(uri)
+
+    assert downloader.last_checksum['sha256'] == hashlib.sha256(body).hexdigest()
+
+def test_checksum_mismatch_discards_download(downloader, stub_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stub_server.bodies[hourly_path] = b"corrupted body"
+    stub_server.headers[hourly_path] = {'Content-MD5': base64.b64encode(hashlib.md5(b"original body").digest()).decode()}
+
+    with pytest.raises(DownloadError, match="Corrupt download.*md5 checksum mismatch"):
+        downloader.download(stub_server.base_url + hourly_path)
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,184 @@
+import pytest
+import errno
+import hashlib
+import ftplib
+from unittest.mock import MagicMock
+from midas_open_downloader.downloader.ftp_downloader import FTPDownloader
+from midas_open_downloader.downloader.ftp_pool import FTPConnectionPool
+from midas_open_downloader.downloader.partial import PartialDownload
+from midas_open_downloader.downloader.rate_limiter import RateLimiter
+from midas_open_downloader.downloader.errors import DownloadError, NotModifiedError
+from midas_open_downloader.downloader.retry import PERMANENT, classify_error
+from midas_open_downloader.downloader import tracing
+from midas_open_downloader.downloader.tracing import Tracer
+
+remote_path = "/badc/ukmo-midas-open/data/uk-hourly-weather-obs/hourly_2022.csv"
+body = b"0123456789" * 100
+
+def mock_ftp(body, modified="20230801000000"):
+    ftp = MagicMock()
+    ftp.size.return_value = len(body)
+    ftp.voidcmd.side_effect = lambda cmd: f"213 {modified}" if cmd.startswith('MDTM') else "200 Type set to I"
+
+    def retrbinary(cmd, callback, rest=None):
+        data = body[rest or 0:]
+        for i in range(0, len(data), 256):
+            callback(data[i:i + 256])
+    ftp.retrbinary.side_effect = retrbinary
+    return ftp
+
+@pytest.fixture
+def ftp():
+    return mock_ftp(body)
+
+@pytest.fixture
+def downloader(ftp, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pool = FTPConnectionPool(connect=lambda: ftp)
+    yield FTPDownloader(rate_limiter=RateLimiter(requests_per_second=None), pool=pool)
+    pool.close()
+
+def test_download(downloader, ftp, tmp_path):
+    assert downloader.download(remote_path) == "hourly_2022.csv"
+    assert (tmp_path / "hourly_2022.csv").read_bytes() == body
+    assert ftp.retrbinary.call_args.kwargs['rest'] is None
+
+def test_resume_with_rest_offset(downloader, ftp, tmp_path):
+    (tmp_path / "hourly_2022.csv.part").write_bytes(body[:300])
+    PartialDownload("hourly_2022.csv").save_metadata({'remote_path': remote_path, 'size': len(body), 'mdtm': "20230801000000"})
+
+    downloader.download(remote_path)
+
+    assert (tmp_path / "hourly_2022.csv").read_bytes() == body
+    assert ftp.retrbinary.call_args.kwargs['rest'] == 300
+    # The checksum covers the resumed prefix too
+    assert downloader.last_checksum['sha256'] == hashlib.sha256(body).hexdigest()
+    assert downloader.last_checksum['checks'] == ['size']
+
+def test_changed_remote_file_restarts(downloader, ftp, tmp_path):
+    (tmp_path / "hourly_2022.csv.part").write_bytes(b"old version")
+    PartialDownload("hourly_2022.csv").save_metadata({'remote_path': remote_path, 'size': len(body), 'mdtm': "20200101000000"})
+
+    downloader.download(remote_path)
+
+    assert (tmp_path / "hourly_2022.csv").read_bytes() == body
+    assert ftp.retrbinary.call_args.kwargs['rest'] is None
+
+def test_interrupted_transfer_keeps_partial_and_not_target(downloader, ftp, tmp_path):
+    def broken(cmd, callback, rest=None):
+        callback(body[:100])
+        raise ftplib.error_temp("426 Connection closed; transfer aborted")
+    ftp.retrbinary.side_effect = broken
+
+    with pytest.raises(DownloadError):
+        downloader.download(remote_path)
+
+    assert not (tmp_path / "hourly_2022.csv").exists()
+    assert (tmp_path / "hourly_2022.csv.part").read_bytes() == body[:100]
+
+def test_size_mismatch_raises(downloader, ftp, tmp_path):
+    ftp.size.return_value = len(body) + 1
+
+    with pytest.raises(DownloadError):
+        downloader.download(remote_path)
+
+    assert not (tmp_path / "hourly_2022.csv").exists()
+
+def test_unchanged_file_is_not_retrieved(downloader, ftp):
+    validators = {'mdtm': "20230801000000", 'size': len(body)}
+
+    with pytest.raises(NotModifiedError):
+        downloader.download(remote_path, validators=validators)
+
+    ftp.retrbinary.assert_not_called()
+
+def test_changed_file_is_retrieved(downloader, ftp):
+    downloader.download(remote_path, validators={'mdtm': "20200101000000", 'size': len(body)})
+
+    ftp.retrbinary.assert_called_once()
+    assert downloader.last_validators == {'mdtm': "20230801000000", 'size': len(body)}
+
+def test_dropped_connection_reconnects_and_resumes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dead, fresh = mock_ftp(body), mock_ftp(body)
+
+    def drop(cmd, callback, rest=None):
+        callback(body[:400])
+        raise EOFError()
+    dead.retrbinary.side_effect = drop
+    connections = iter([dead, fresh])
+    pool = FTPConnectionPool(connect=lambda: next(connections))
+    downloader = FTPDownloader(rate_limiter=RateLimiter(requests_per_second=None), pool=pool)
+
+    assert downloader.download(remote_path) == "hourly_2022.csv"
+
+    assert (tmp_path / "hourly_2022.csv").read_bytes() == body
+    assert fresh.retrbinary.call_args.kwargs['rest'] == 400
+    dead.close.assert_called_once()
+    pool.close()
+
+def test_local_write_error_is_permanent(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ftp = mock_ftp(body)
+    connections = []
+    pool = FTPConnectionPool(connect=lambda: connections.append(ftp) or ftp)
+    downloader = FTPDownloader(rate_limiter=RateLimiter(requests_per_second=None), pool=pool)
+
+    def full_disk(self, append=False):
+        file_object = MagicMock()
+        file_object.__enter__.return_value = file_object
+        file_object.write.side_effect = OSError(errno.ENOSPC, "No space left on device")
+        return file_object
+    monkeypatch.setattr(PartialDownload, 'open', full_disk)
+    ftp.close.side_effect = lambda: setattr(ftp, 'sock', None)
+
+    with pytest.raises(DownloadError) as raised:
+        downloader.download(remote_path)
+
+    assert classify_error(raised.value) == PERMANENT
+    assert "No space left on device" in str(raised.value)
+    # Not retried on a new connection; the one with the outstanding RETR is closed
+    ftp.retrbinary.assert_called_once()
+    assert ftp.sock is None
+    assert len(connections) == 1
+    assert pool._open == 0
+    pool.close()
+
+def data_connection(body, chunk_size=300):
+    connection = MagicMock()
+    connection.__enter__.return_value = connection
+    connection.recv.side_effect = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] + [b""]
+    return connection
+
+def test_iter_chunks(downloader, ftp):
+    ftp.transfercmd.return_value = data_connection(body)
+
+    assert b"".join(downloader.iter_chunks(remote_path)) == body
+
+    ftp.transfercmd.assert_called_once_with(f"RETR {remote_path}")
+    ftp.voidresp.assert_called_once()
+
+def test_iter_chunks_abandoned_aborts_transfer(downloader, ftp):
+    ftp.transfercmd.return_value = data_connection(body)
+
+    chunks = downloader.iter_chunks(remote_path)
+    next(chunks)
+    chunks.close()
+
+    ftp.abort.assert_called_once()
+    ftp.voidresp.assert_not_called()
+
+def test_iter_chunks_missing_file(downloader, ftp):
+    ftp.transfercmd.side_effect = ftplib.error_perm("550 No such file")
+
+    with pytest.raises(DownloadError):
+        list(downloader.iter_chunks(remote_path))
+
+def test_download_records_phases(downloader):
+    tracer = Tracer()
+
+    with tracer.span('file') as span:
+        downloader.download(remote_path)
+
+    assert set(span.phases) >= {tracing.CONNECT, tracing.TTFB, tracing.TRANSFER}
+    assert span.counters[tracing.BYTES] == len(body)
@@ -0,0 +1,147 @@
+import pytest
+import ftplib
+import threading
+import time
+from unittest.mock import MagicMock
+from midas_open_downloader.downloader.ftp_pool import FTPConnectionPool, is_connection_lost
+
+@pytest.fixture
+def connections():
+    return []
+
+@pytest.fixture
+def pool(connections):
+    def connect():
+        ftp = MagicMock(name=f"ftp{len(connections)}")
+        connections.append(ftp)
+        return ftp
+    pool = FTPConnectionPool(size=2, keepalive_interval=10, connect=connect)
+    yield pool
+    pool.close()
+
+def test_connections_are_reused(pool, connections):
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+
+    assert first is second
+    assert len(connections) == 1
+
+def test_pool_size_is_bounded(pool, connections):
+    in_use = []
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        with pool.connection() as ftp:
+            with lock:
+                in_use.append(ftp)
+                peak.append(len(in_use))
+            time.sleep(0.05)
+            with lock:
+                in_use.remove(ftp)
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) == 2
+    assert len(connections) == 2
+
+def test_lost_connection_is_replaced(pool, connections):
+    with pytest.raises(EOFError):
+        with pool.connection() as ftp:
+            raise EOFError()
+    with pool.connection() as replacement:
+        pass
+
+    assert replacement is not ftp
+    ftp.close.assert_called_once()
+
+def test_permanent_error_keeps_connection(pool, connections):
+    with pytest.raises(ftplib.error_perm):
+        with pool.connection() as ftp:
+            raise ftplib.error_perm("550 No such file")
+    with pool.connection() as same:
+        pass
+
+    assert same is ftp
+
+def test_stale_connection_is_checked_before_reuse(pool, connections):
+    with pool.connection() as ftp:
+        pass
+    pool.keepalive_interval = 0
+    ftp.voidcmd.side_effect = EOFError()
+
+    with pool.connection() as replacement:
+        pass
+
+    ftp.voidcmd.assert_called_with('NOOP')
+    assert replacement is not ftp
+
+def test_ping_idle_keeps_connections_alive(pool, connections):
+    with pool.connection() as ftp:
+        pass
+    pool.keepalive_interval = 0
+
+    pool.ping_idle()
+
+    ftp.voidcmd.assert_called_once_with('NOOP')
+
+def test_close_quits_idle_connections(pool, connections):
+    with pool.connection() as ftp:
+        pass
+
+    pool.close()
+
+    ftp.quit.assert_called_once()
+    with pytest.raises(ftplib.error_temp):
+        with pool.connection():
+            pass
+
+def test_ping_does_not_let_checkouts_exceed_the_size(connections):
+    pool = FTPConnectionPool(size=1, keepalive_interval=10, connect=lambda: connections.append(MagicMock()) or connections[-1])
+    with pool.connection() as ftp:
+        pass
+    pool.keepalive_interval = 0
+    pinging, resume = threading.Event(), threading.Event()
+    ftp.voidcmd.side_effect = lambda command: pinging.set() or resume.wait(5)
+    pinger = threading.Thread(target=pool.ping_idle)
+    pinger.start()
+    assert pinging.wait(5)
+    used = []
+
+    def work():
+        with pool.connection() as checked_out:
+            used.append(checked_out)
+    worker = threading.Thread(target=work)
+    worker.start()
+    time.sleep(0.05)
+    # The only connection is being pinged, so the checkout waits for it instead of logging in again
+    assert used == [] and len(connections) == 1
+    resume.set()
+    pinger.join()
+    worker.join()
+    pool.close()
+
+    assert used == [ftp] and len(connections) == 1
+
+def test_connection_returned_after_close_is_quit(pool, connections):
+    with pool.connection() as ftp:
+        pool.close()
+
+    ftp.quit.assert_called_once()
+    assert pool._idle.empty()
+
+def test_is_connection_lost():
+    assert is_connection_lost(ftplib.error_temp("421 Timeout"))
+    assert is_connection_lost(ConnectionResetError())
+    assert not is_connection_lost(ftplib.error_temp("450 File busy"))
+    assert not is_connection_lost(ftplib.error_perm("550 No such file"))
+    assert is_connection_lost(EOFError())
+    assert is_connection_lost(TimeoutError())
+    assert not is_connection_lost(OSError(28, "No space left on device"))
+    assert not is_connection_lost(PermissionError(13, "Permission denied"))
@@ -0,0 +1,109 @@
+import base64
+import hashlib
+import os
+
+import pytest
+from midas_open_downloader.downloader.integrity import StreamingChecksum, ChecksumRegistry, parse_digest_headers
+from midas_open_downloader.downloader.errors import DownloadError
+from midas_open_downloader.downloader.retry import classify_error, TRANSIENT
+from midas_open_downloader.journal import Journal
+from midas_open_downloader.sync import Manifest
+from midas_open_downloader.verify import verify_files, manifest_entries, main, OK, MISSING, SIZE_MISMATCH, CHECKSUM_MISMATCH
+
+
+def b64(digest):
+    return base64.b64encode(digest).decode()
+
+
+def test_streaming_checksum_matches_hashlib(tmp_path):
+    data = os.urandom(100000)
+    prefix = tmp_path / "prefix"
+    prefix.write_bytes(data[:30000])
+    checksum = StreamingChecksum(['md5'])
+    checksum.update_from_file(str(prefix))
+    checksum.update(data[30000:])
+
+    assert checksum.size == len(data)
+    assert checksum.hexdigest() == hashlib.sha256(data).hexdigest()
+    assert checksum.mismatches({'md5': hashlib.md5(data).hexdigest().upper()}) == []
+    assert checksum.mismatches({'md5': hashlib.md5(b"other").hexdigest()}) == ['md5']
+
+
+def test_parse_digest_headers():
+    sha256 = hashlib.sha256(b"body").digest()
+    md5 = hashlib.md5(b"body").digest()
+    headers = {'Digest': f"SHA-256={b64(sha256)}, unixsum=30637", 'Content-MD5': b64(md5)}
+
+    assert parse_digest_headers(headers) == {'sha256': sha256.hex(), 'md5': md5.hex()}
+    # Content-MD5 describes only the body of a partial response
+    assert parse_digest_headers(headers, whole_body=False) == {'sha256': sha256.hex()}
+    assert parse_digest_headers({'Repr-Digest': f"sha-256=:{b64(sha256)}:"}) == {'sha256': sha256.hex()}
+    assert parse_digest_headers({'Digest': "SHA-256=not base64!"}) == {}
+
+
+def test_registry_entry_is_dropped_when_file_changes(tmp_path):
+    path = tmp_path / "file.csv"
+    path.write_bytes(b"data")
+    checksum = StreamingChecksum()
+    checksum.update(b"data")
+    registry = ChecksumRegistry()
+    registry.record(str(path), checksum, ['size'])
+
+    assert registry.lookup(str(path)) == {'size': 4, 'mtime_ns': os.stat(path).st_mtime_ns, 'sha256': hashlib.sha256(b"data").hexdigest(), 'checks': ['size']}
+    path.write_bytes(b"more data")
+    assert registry.lookup(str(path)) is None
+
+
+def test_corrupt_download_is_transient():
+    assert classify_error(DownloadError("Corrupt download of x: md5 checksum mismatch")) == TRANSIENT
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    for name in ("ok", "missing", "truncated", "corrupt"):
+        path = tmp_path / f"{name}.csv"
+        path.write_bytes(b"0123456789")
+        manifest.record_file(name, str(path), "202308")
+    manifest.save()
+    os.remove(tmp_path / "missing.csv")
+    (tmp_path / "truncated.csv").write_bytes(b"01234")
+    (tmp_path / "corrupt.csv").write_bytes(b"0123456780")
+    return manifest
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_verify_files(mirror, workers):
+    results = verify_files(manifest_entries(mirror), workers=workers)
+
+    assert [(result['key'], result['status']) for result in results] == [
+        ("corrupt", CHECKSUM_MISMATCH), ("missing", MISSING), ("ok", OK), ("truncated", SIZE_MISMATCH),
+    ]
+
+
+def test_verify_command(mirror, tmp_path, capsys):
+    report = tmp_path / "report.json"
+
+    assert main(["--manifest", mirror.path, "--workers", "2", "--report", str(report)]) == 1
+
+    assert "Verified 4 files: 1 ok, 3 failed." in capsys.readouterr().out
+    assert report.exists()
+
+
+def test_verify_journal_does_not_modify_it(tmp_path, capsys):
+    path = tmp_path / "hourly_2022.csv"
+    path.write_bytes(b"0123456789")
+    journal_path = str(tmp_path / "journal.jsonl")
+    journal = Journal(journal_path, fsync=False)
+    journal.complete("202308/staffordshire/00622_keele/1/2022", str(path))
+    journal.close()
+    with open(journal_path, 'a') as f:
+        f.write('{"event": "comple')
+    with open(journal_path, 'rb') as f:
+        content = f.read()
+
+    assert main(["--journal", journal_path, "--workers", "1"]) == 0
+
+    assert "Verified 1 files: 1 ok, 0 failed." in capsys.readouterr().out
+    with open(journal_path, 'rb') as f:
+        assert f.read() == content
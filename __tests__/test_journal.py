@@ -0,0 +1,140 @@
+import pytest
+import os
+import json
+from unittest.mock import patch
+from midas_open_downloader.retriever import Retriever
+from midas_open_downloader.parser import StationCapabilities
+from midas_open_downloader.journal import Journal, PLANNED, STARTED, COMPLETED, FAILED
+from midas_open_downloader.downloader.errors import DownloadError
+from midas_open_downloader.downloader.retry import RetryPolicy
+from midas_open_downloader.sync import station_year_key
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+test_capabilities_file = os.path.join(current_dir, "test_capabilities_file.txt")
+
+
+def key(station_id, year):
+    return station_year_key("202308", "staffordshire", station_id, "1", year)
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "journal.jsonl")
+
+
+@pytest.fixture
+def mock_repository(tmp_path):
+    with patch("midas_open_downloader.retriever.Repository") as mock_repo:
+        repository = mock_repo.return_value
+        repository.get_station_capabilities.return_value = StationCapabilities(test_capabilities_file)
+
+        def download_hourly_file(historic_county, station_id, year, quality_control_version):
+            path = tmp_path / f"{station_id}_{year}.csv"
+            path.write_text(f"{station_id} {year}")
+            return str(path)
+        repository.download_hourly_file.side_effect = download_hourly_file
+        yield repository
+
+
+def test_events_are_replayed(journal_path, tmp_path):
+    local_file = tmp_path / "a.csv"
+    local_file.write_text("data")
+    journal = Journal(journal_path)
+    journal.plan("staffordshire", [("00622_keele", 2021), ("00622_keele", 2022)], "1", "202308")
+    journal.start(key("00622_keele", 2021))
+    journal.complete(key("00622_keele", 2021), str(local_file))
+    journal.start(key("00622_keele", 2022))
+    journal.close()
+
+    replayed = Journal(journal_path, resume=True)
+    assert replayed.state(key("00622_keele", 2021)) == COMPLETED
+    assert replayed.state(key("00622_keele", 2022)) == STARTED
+    assert replayed.completed_file(key("00622_keele", 2021)) == str(local_file)
+    assert replayed.units[key("00622_keele", 2021)]['size'] == 4
+    assert len(replayed.units[key("00622_keele", 2021)]['sha256']) == 64
+    assert replayed.summary() == {PLANNED: 0, STARTED: 1, COMPLETED: 1, FAILED: 0}
+
+
+def test_damaged_file_is_not_completed(journal_path, tmp_path):
+    local_file = tmp_path / "a.csv"
+    local_file.write_text("data")
+    journal = Journal(journal_path)
+    journal.complete(key("00622_keele", 2021), str(local_file))
+    local_file.write_text("dat")
+
+    assert journal.completed_file(key("00622_keele", 2021)) is None
+
+
+def test_torn_last_line_is_ignored(journal_path):
+    journal = Journal(journal_path)
+    journal.plan("staffordshire", [("00622_keele", 2021)], "1", "202308")
+    journal.close()
+    with open(journal_path, 'a') as f:
+        f.write('{"event": "comple')
+
+    replayed = Journal(journal_path, resume=True)
+    replayed.fail(key("00622_keele", 2021), "transient", 4, "timed out")
+    replayed.close()
+
+    with open(journal_path) as f:
+        lines = f.read().splitlines()
+    assert json.loads(lines[-1])['event'] == FAILED
+    assert Journal(journal_path, resume=True).state(key("00622_keele", 2021)) == FAILED
+
+
+def test_without_resume_the_journal_starts_over(journal_path):
+    Journal(journal_path).plan("staffordshire", [("00622_keele", 2021)], "1", "202308")
+    assert Journal(journal_path).units == {}
+
+
+def test_retriever_journals_the_run(journal_path, mock_repository):
+    journal = Journal(journal_path)
+
+    Retriever(journal=journal).download_hourly_files("staffordshire", ["00622_keele"], 2021, 2022)
+
+    assert journal.summary()[COMPLETED] == 2
+    with open(journal_path) as f:
+        events = [json.loads(line)['event'] for line in f]
+    assert events == [PLANNED, PLANNED, STARTED, COMPLETED, STARTED, COMPLETED]
+
+
+def test_resume_continues_where_the_run_stopped(journal_path, mock_repository):
+    download = mock_repository.download_hourly_file.side_effect
+
+    def crash_on_2022(historic_county, station_id, year, quality_control_version):
+        if year == 2022:
+            raise KeyboardInterrupt()
+        return download(historic_county, station_id, year, quality_control_version)
+    mock_repository.download_hourly_file.side_effect = crash_on_2022
+    with pytest.raises(KeyboardInterrupt):
+        Retriever(journal=Journal(journal_path)).download_hourly_files("staffordshire", ["00622_keele"], 2020, 2022)
+
+    mock_repository.reset_mock()
+    mock_repository.download_hourly_file.side_effect = download
+    files = Retriever(journal=Journal(journal_path, resume=True)).download_hourly_files("staffordshire", ["00622_keele"], 2020, 2022)
+
+    assert [c.args[2] for c in mock_repository.download_hourly_file.call_args_list] == [2022]
+    assert [f.rsplit('_', 1)[-1] for f in files] == ["2020.csv", "2021.csv", "2022.csv"]
+    assert Journal(journal_path, resume=True).summary()[COMPLETED] == 3
+
+
+def test_resume_fetches_what_was_added_to_the_request(journal_path, mock_repository):
+    Retriever(journal=Journal(journal_path)).download_hourly_files("staffordshire", ["00622_keele"], 2020, 2021)
+    mock_repository.reset_mock()
+
+    files = Retriever(journal=Journal(journal_path, resume=True)).download_hourly_files("staffordshire", ["00622_keele", "00623_oaken"], 2020, 2022)
+
+    fetched = [c.args[1:3] for c in mock_repository.download_hourly_file.call_args_list]
+    assert fetched == [("00622_keele", 2022), ("00623_oaken", 2020), ("00623_oaken", 2021), ("00623_oaken", 2022)]
+    assert len(files) == 6
+
+def test_failures_are_journaled(journal_path, mock_repository):
+    mock_repository.download_hourly_file.side_effect = DownloadError(ValueError("bad file"))
+    journal = Journal(journal_path)
+
+    Retriever(journal=journal, retry_policy=RetryPolicy(sleep=lambda seconds: None)).download_hourly_files("staffordshire", ["00622_keele"], 2022, 2022)
+
+    unit = journal.units[key("00622_keele", 2022)]
+    assert unit['state'] == FAILED
+    assert unit['kind'] == "permanent"
+    assert unit['error'] == "bad file"
@@ -0,0 +1,141 @@
+import pytest
+import ftplib
+from unittest.mock import MagicMock, patch
+from midas_open_downloader.listing import DatasetIndex
+from midas_open_downloader.retriever import Retriever
+from midas_open_downloader.downloader.errors import DownloadError
+from midas_open_downloader.downloader.dap_downloader import _parse_html_listing, _parse_json_listing
+from midas_open_downloader.downloader.ftp_downloader import FTPDownloader
+from midas_open_downloader.downloader.ftp_pool import FTPConnectionPool
+from midas_open_downloader.downloader.rate_limiter import RateLimiter
+
+base_url = "https://dap.ceda.ac.uk/badc/ukmo-midas-open/data/uk-hourly-weather-obs/dataset-version-202308/staffordshire/00622_keele/qc-version-1/"
+
+html_listing = f"""
+<html><body><table>
+<tr><td><a href="../">Parent directory</a></td></tr>
+<tr><td><a href="{base_url}midas-open_uk-hourly-weather-obs_dv-202308_staffordshire_00622_keele_qcv-1_2021.csv?download=1">2021</a></td><td>2023-08-01</td><td>1.5 MB</td></tr>
+<tr><td><a href="midas-open_uk-hourly-weather-obs_dv-202308_staffordshire_00622_keele_qcv-1_2022.csv">2022</a></td><td>512 B</td></tr>
+<tr><td><a href="subdir/">subdir</a></td><td>-</td></tr>
+<tr><td><a href="https://www.ceda.ac.uk/">CEDA</a></td></tr>
+</table></body></html>
+"""
+
+tree = {
+    "dataset-version-202308": ["staffordshire", "lancashire"],
+    "dataset-version-202308/staffordshire": ["00622_keele", "00623_oaken"],
+    "dataset-version-202308/staffordshire/00622_keele": ["qc-version-0", "qc-version-1", "capability.csv"],
+    "dataset-version-202308/staffordshire/00622_keele/qc-version-1": ["x_2020.csv", "x_2021.csv", "x_2022.csv"],
+    "dataset-version-202308/staffordshire/00622_keele/qc-version-0": ["x_2021.csv"],
+    "dataset-version-202308/staffordshire/00623_oaken": ["qc-version-1"],
+    "dataset-version-202308/staffordshire/00623_oaken/qc-version-1": ["x_2022.csv"],
+    "dataset-version-202308/lancashire": [],
+}
+
+def make_repository():
+    repository = MagicMock()
+
+    def list_directory(dataset_version, historic_county=None, station_id=None, quality_control_version=None):
+        parts = [f"dataset-version-{dataset_version}", historic_county, station_id,
+                 f"qc-version-{quality_control_version}" if quality_control_version else None]
+        path = "/".join(part for part in parts if part)
+        return [{'name': name, 'type': 'file' if name.endswith('.csv') else 'dir', 'size': 100 if name.endswith('.csv') else None}
+                for name in tree[path]]
+    repository.list_directory.side_effect = list_directory
+    return repository
+
+def test_parse_html_listing():
+    entries = _parse_html_listing(base_url, html_listing)
+
+    assert entries == [
+        {'name': "midas-open_uk-hourly-weather-obs_dv-202308_staffordshire_00622_keele_qcv-1_2021.csv", 'type': 'file', 'size': 1572864},
+        {'name': "midas-open_uk-hourly-weather-obs_dv-202308_staffordshire_00622_keele_qcv-1_2022.csv", 'type': 'file', 'size': 512},
+        {'name': "subdir", 'type': 'dir', 'size': None},
+    ]
+
+def test_parse_json_listing():
+    data = {'items': [{'name': "qc-version-1", 'type': 'dir'}, {'path': "/a/b/x_2022.csv", 'type': 'file', 'size': "42"}]}
+
+    assert _parse_json_listing(data) == [
+        {'name': "qc-version-1", 'type': 'dir', 'size': None},
+        {'name': "x_2022.csv", 'type': 'file', 'size': 42},
+    ]
+
+def test_ftp_list_directory_mlsd():
+    ftp = MagicMock()
+    downloader = FTPDownloader(rate_limiter=RateLimiter(requests_per_second=None), pool=FTPConnectionPool(connect=lambda: ftp))
+    ftp.mlsd.return_value = [
+        (".", {'type': 'cdir'}),
+        ("qc-version-1", {'type': 'dir'}),
+        ("x_2022.csv", {'type': 'file', 'size': '42'}),
+    ]
+
+    assert downloader.list_directory("/station") == [
+        {'name': "qc-version-1", 'type': 'dir', 'size': None},
+        {'name': "x_2022.csv", 'type': 'file', 'size': 42},
+    ]
+
+def test_ftp_list_directory_nlst_fallback():
+    ftp = MagicMock()
+    downloader = FTPDownloader(rate_limiter=RateLimiter(requests_per_second=None), pool=FTPConnectionPool(connect=lambda: ftp))
+    ftp.mlsd.side_effect = ftplib.error_perm("500 Unknown command")
+    ftp.nlst.return_value = ["/station/qc-version-1", "/station/x_2022.csv"]
+    ftp.size.side_effect = lambda path: 42 if path.endswith('.csv') else (_ for _ in ()).throw(ftplib.error_perm("550 Not a file"))
+
+    assert downloader.list_directory("/station") == [
+        {'name': "qc-version-1", 'type': 'dir', 'size': None},
+        {'name': "x_2022.csv", 'type': 'file', 'size': 42},
+    ]
+
+def test_crawl_builds_index(tmp_path):
+    index = DatasetIndex(str(tmp_path / "listing.json"))
+
+    index.crawl(make_repository, workers=2)
+
+    assert index.counties() == ["lancashire", "staffordshire"]
+    assert index.stations("staffordshire") == ["00622_keele", "00623_oaken"]
+    assert index.years("staffordshire", "00622_keele") == {2020: 100, 2021: 100, 2022: 100}
+    assert index.years("staffordshire", "00622_keele", quality_control_version="0") == {2021: 100}
+    assert DatasetIndex(index.path).versions == index.versions
+
+def test_recrawl_drops_stations_gone_from_server():
+    index = DatasetIndex()
+    index.set_station("staffordshire", "00621_gone", {"1": {2020: 100}})
+    index.set_station("staffordshire", "00623_oaken", {"1": {2021: 50}})
+
+    def make_flaky_repository():
+        repository = make_repository()
+        list_directory = repository.list_directory.side_effect
+
+        def flaky(dataset_version, historic_county=None, station_id=None, quality_control_version=None):
+            if station_id == "00623_oaken":
+                raise DownloadError("timed out")
+            return list_directory(dataset_version, historic_county, station_id, quality_control_version)
+        repository.list_directory.side_effect = flaky
+        return repository
+
+    index.crawl(make_flaky_repository, historic_counties=["staffordshire"])
+
+    assert index.stations("staffordshire") == ["00622_keele", "00623_oaken"]
+    # The station that could not be listed keeps what was known of it
+    assert index.years("staffordshire", "00623_oaken") == {2021: 50}
+
+def test_station_years_for_whole_county():
+    index = DatasetIndex()
+    index.crawl(make_repository, historic_counties=["staffordshire"])
+
+    assert index.station_years("staffordshire", None, 2021, 2030) == [
+        ("00622_keele", 2021), ("00622_keele", 2022), ("00623_oaken", 2022),
+    ]
+
+def test_retriever_plans_from_listing():
+    with patch("midas_open_downloader.retriever.Repository") as mock_repo:
+        repository = mock_repo.return_value
+        repository.list_directory.side_effect = make_repository().list_directory.side_effect
+        repository.download_hourly_file.return_value = "local_file_path"
+
+        downloaded_files = Retriever(dataset_index=DatasetIndex()).download_hourly_files("staffordshire", None, 2022, 2023)
+
+        assert [c.args[1:3] for c in repository.download_hourly_file.call_args_list] == [("00622_keele", 2022), ("00623_oaken", 2022)]
+        assert len(downloaded_files) == 2
+        repository.get_station_capabilities.assert_not_called()
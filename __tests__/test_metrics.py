@@ -0,0 +1,91 @@
+import pytest
+import json
+import requests
+from midas_open_downloader.downloader import tracing
+from midas_open_downloader.downloader.tracing import Tracer, record_phase
+from midas_open_downloader.metrics import MetricsCollector, percentile
+
+@pytest.fixture
+def metrics():
+    return MetricsCollector(buckets=(0.1, 1.0))
+
+@pytest.fixture
+def tracer(metrics):
+    return Tracer([metrics])
+
+def run_file(tracer, outcome='ok', transfer=0.5, nbytes=100, **events):
+    with tracer.span('file', kind='hourly') as span:
+        span.attributes['outcome'] = outcome
+        record_phase(tracing.TRANSFER, transfer)
+        tracer.event(tracing.BYTES, nbytes)
+        for name, value in events.items():
+            tracer.event(name, value)
+
+def test_percentile():
+    values = list(range(1, 101))
+
+    assert percentile(values, 0.5) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile([], 0.5) is None
+
+def test_summary(tracer, metrics):
+    run_file(tracer, transfer=0.05, retry=2)
+    run_file(tracer, transfer=2.0, cache_hit=1)
+    run_file(tracer, outcome='failed', transfer=0.5, nbytes=0)
+
+    summary = metrics.summary()
+
+    assert summary['files'] == {'hourly': {'failed': 1, 'ok': 2}}
+    assert summary['bytes'] == 200
+    assert summary['events'] == {'cache_hit': 1, 'retry': 2}
+    assert summary['phases']['transfer']['count'] == 3
+    assert summary['phases']['transfer']['p50'] == 0.5
+    assert summary['phases']['transfer']['max'] == 2.0
+    assert summary['durations']['hourly']['count'] == 3
+    json.dumps(summary)
+
+def test_prometheus_format(tracer, metrics):
+    run_file(tracer, transfer=0.05, retry=1)
+    run_file(tracer, transfer=2.0)
+
+    lines = metrics.to_prometheus().splitlines()
+
+    assert '# TYPE midas_files_total counter' in lines
+    assert 'midas_files_total{kind="hourly",outcome="ok"} 2' in lines
+    assert 'midas_bytes_total 200' in lines
+    assert 'midas_events_total{event="retry"} 1' in lines
+    assert '# TYPE midas_phase_seconds histogram' in lines
+    assert 'midas_phase_seconds_bucket{phase="transfer",le="0.1"} 1' in lines
+    assert 'midas_phase_seconds_bucket{phase="transfer",le="1.0"} 1' in lines
+    assert 'midas_phase_seconds_bucket{phase="transfer",le="+Inf"} 2' in lines
+    assert 'midas_phase_seconds_count{phase="transfer"} 2' in lines
+    assert 'midas_phase_seconds_sum{phase="transfer"} 2.05' in lines
+
+def test_label_values_are_escaped(tracer, metrics):
+    with tracer.span('file', kind='a"b\\c', outcome='ok'):
+        pass
+
+    assert 'midas_files_total{kind="a\\"b\\\\c",outcome="ok"} 1' in metrics.to_prometheus()
+
+def test_write_exports(tracer, metrics, tmp_path):
+    run_file(tracer)
+
+    metrics.write_json(tmp_path / "metrics.json")
+    metrics.write_prometheus(tmp_path / "metrics.prom")
+
+    assert json.loads((tmp_path / "metrics.json").read_text())['bytes'] == 100
+    assert 'midas_bytes_total 100' in (tmp_path / "metrics.prom").read_text()
+
+def test_http_server(tracer, metrics):
+    run_file(tracer)
+    port = metrics.start_http_server(0, host='127.0.0.1')
+    try:
+        response = requests.get(f"http://127.0.0.1:{port}/metrics")
+        missing = requests.get(f"http://127.0.0.1:{port}/other")
+    finally:
+        metrics.stop_http_server()
+
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/plain')
+    assert 'midas_bytes_total 100' in response.text
+    assert missing.status_code == 404
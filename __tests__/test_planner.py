@@ -0,0 +1,122 @@
+import os
+
+import pytest
+from unittest.mock import MagicMock
+from midas_open_downloader.listing import DatasetIndex
+from midas_open_downloader.planner import plan_work_units, assign_shards, shard_of, ShardWorker, HASH, SIZE
+from midas_open_downloader.work_queue import SQLiteWorkQueue, DONE, FAILED
+from midas_open_downloader.downloader.errors import DownloadError
+from midas_open_downloader.downloader.retry import RetryPolicy
+
+
+def make_index():
+    dataset_index = DatasetIndex()
+    dataset_index.set_station("staffordshire", "00622_keele", {"1": {2020: 300, 2021: 100, 2022: None}}, "202308")
+    dataset_index.set_station("staffordshire", "00623_oaken", {"1": {2021: 200}}, "202308")
+    dataset_index.set_station("lancashire", "01000_preston", {"1": {2021: 50}, "0": {2021: 40}}, "202308")
+    return dataset_index
+
+
+def test_plan_work_units():
+    units = plan_work_units(make_index(), ["staffordshire"], 2021, 2022, dataset_version="202308")
+    assert [(unit['station_id'], unit['year'], unit['size']) for unit in units] == [
+        ("00622_keele", 2021, 100), ("00622_keele", 2022, None), ("00623_oaken", 2021, 200),
+    ]
+    assert units[0]['key'] == "202308/staffordshire/00622_keele/qc-version-1/2021"
+    assert units[0]['historic_county'] == "staffordshire"
+
+
+def test_plan_every_county():
+    units = plan_work_units(make_index(), None, 2021, 2021, dataset_version="202308")
+    assert {unit['historic_county'] for unit in units} == {"staffordshire", "lancashire"}
+
+
+def test_hash_sharding_is_deterministic():
+    units = plan_work_units(make_index(), None, 2000, 2030, dataset_version="202308")
+    assign_shards(units, 3, HASH)
+    assert [unit['shard'] for unit in units] == [shard_of(unit['key'], 3) for unit in units]
+    assert shard_of("202308/staffordshire/00622_keele/qc-version-1/2021", 3) == shard_of("202308/staffordshire/00622_keele/qc-version-1/2021", 3)
+    assert all(0 <= unit['shard'] < 3 for unit in units)
+
+
+def test_size_sharding_balances_bytes():
+    units = [{'key': f"unit-{size}", 'size': size} for size in (100, 90, 60, 50, 40, 10)]
+    assign_shards(units, 2, SIZE)
+    loads = [sum(unit['size'] for unit in units if unit['shard'] == shard) for shard in range(2)]
+    # Largest first onto the least loaded shard
+    assert loads == [190, 160]
+    # Same plan for the units in any order
+    reordered = [dict(unit) for unit in reversed(units)]
+    assign_shards(reordered, 2, SIZE)
+    assert {unit['key']: unit['shard'] for unit in reordered} == {unit['key']: unit['shard'] for unit in units}
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        assign_shards([], 2, 'random')
+
+
+def make_worker(queue, repository, **kwargs):
+    retry_policy = RetryPolicy(max_attempts=2, base_delay=0, sleep=lambda seconds: None)
+    return ShardWorker(queue, repository_factory=lambda: repository, worker_id="worker-1", retry_policy=retry_policy, **kwargs)
+
+
+def test_worker_downloads_and_acks(tmp_path):
+    queue = SQLiteWorkQueue(str(tmp_path / "queue.sqlite"))
+    units = assign_shards(plan_work_units(make_index(), None, 2021, 2021, dataset_version="202308"), 2)
+    queue.enqueue(units)
+    repository = MagicMock()
+    repository.download_hourly_file.side_effect = lambda county, station, year, qcv, version: f"/data/{station}_{year}.csv"
+
+    files = make_worker(queue, repository, workers=2).run()
+
+    assert sorted(files) == ["/data/00622_keele_2021.csv", "/data/00623_oaken_2021.csv", "/data/01000_preston_2021.csv"]
+    assert queue.stats()[DONE] == 3
+    repository.cleanup.assert_called()
+
+
+def test_worker_claims_only_its_shard(tmp_path):
+    queue = SQLiteWorkQueue(str(tmp_path / "queue.sqlite"))
+    units = assign_shards(plan_work_units(make_index(), None, 2021, 2021, dataset_version="202308"), 2)
+    queue.enqueue(units)
+    repository = MagicMock()
+    repository.download_hourly_file.return_value = "/data/file.csv"
+
+    files = make_worker(queue, repository, shard=0).run()
+
+    assert len(files) == len([unit for unit in units if unit['shard'] == 0])
+
+
+def test_worker_fails_units(tmp_path):
+    queue = SQLiteWorkQueue(str(tmp_path / "queue.sqlite"), max_attempts=2)
+    queue.enqueue([{'key': "a", 'historic_county': "c", 'station_id': "s1", 'year': 2021, 'quality_control_version': "1", 'dataset_version': "202308"},
+                   {'key': "b", 'historic_county': "c", 'station_id': "s2", 'year': 2021, 'quality_control_version': "1", 'dataset_version': "202308"}])
+    repository = MagicMock()
+
+    def download(county, station, year, qcv, version):
+        if station == "s1":
+            raise DownloadError(ConnectionError("reset"))
+        raise DownloadError(ValueError("bad file"))
+    repository.download_hourly_file.side_effect = download
+
+    assert make_worker(queue, repository).run() == []
+    # The transient failure went back to the queue until its attempts ran out, the permanent one did not
+    assert [(unit['key'], unit['attempts'], unit['error']) for unit in queue.failures()] == [("a", 2, "reset"), ("b", 1, "bad file")]
+    assert queue.stats()[FAILED] == 2
+
+
+def test_worker_survives_unexpected_errors(tmp_path):
+    queue = SQLiteWorkQueue(str(tmp_path / "queue.sqlite"))
+    queue.enqueue([{'key': key, 'historic_county': "c", 'station_id': key, 'year': 2021, 'quality_control_version': "1", 'dataset_version': "202308"}
+                   for key in ("a", "b")])
+    repository = MagicMock()
+
+    def download(county, station, year, qcv, version):
+        if station == "a":
+            raise OSError(28, "No space left on device")
+        return f"/data/{station}.csv"
+    repository.download_hourly_file.side_effect = download
+
+    assert make_worker(queue, repository).run() == ["/data/b.csv"]
+    assert [(unit['key'], unit['attempts']) for unit in queue.failures()] == [("a", 1)]
+    assert queue.stats()[DONE] == 1
@@ -0,0 +1,66 @@
+import pytest
+import threading
+import time
+from unittest.mock import MagicMock
+from midas_open_downloader.pool import RepositoryPool, run_in_pool
+from midas_open_downloader.repository import Repository
+from midas_open_downloader.retriever import Retriever
+
+
+def test_repository_pool_one_repository_per_thread():
+    repositories = []
+    pool = RepositoryPool(lambda: repositories.append(MagicMock()) or repositories[-1])
+
+    def work(repository, item):
+        time.sleep(0.05)
+        return threading.get_ident(), repository
+
+    results = run_in_pool(pool, range(8), work, 4)
+    pool.cleanup()
+
+    repository_by_thread = {}
+    for thread_id, repository in results:
+        assert repository_by_thread.setdefault(thread_id, repository) is repository
+    assert len(repositories) == len(repository_by_thread)
+    for repository in repositories:
+        repository.initialize.assert_called_once()
+        repository.cleanup.assert_called_once()
+
+def test_run_in_pool_preserves_order():
+    pool = RepositoryPool(MagicMock)
+
+    def work(repository, item):
+        time.sleep(0.01 * (5 - item))
+        return item * 10
+
+    assert run_in_pool(pool, list(range(5)), work, 5) == [0, 10, 20, 30, 40]
+
+def test_download_hourly_files_concurrent_against_stub_server(make_stub_downloader, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    retriever = Retriever(workers=3, repository_factory=lambda: Repository(make_stub_downloader()))
+
+    downloaded_files = retriever.download_hourly_files("staffordshire", ["00622_keele", "00623_oaken"], 2020, 2022)
+
+    assert downloaded_files == [
+        f"midas-open_uk-hourly-weather-obs_dv-202308_staffordshire_{station}_qcv-1_{year}.csv"
+        for station in ["00622_keele", "00623_oaken"]
+        for year in [2020, 2021, 2022]
+    ]
+    for filename in downloaded_files:
+        assert (tmp_path / filename).read_text().startswith("body of /dataset-version-202308/staffordshire/")
+
+def test_throughput_scales_with_workers(stub_server, make_stub_downloader, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stub_server.latency = 0.1
+    station_ids = ["00622_keele", "00623_oaken"]
+
+    timings = {}
+    for workers in (1, 4):
+        retriever = Retriever(workers=workers, repository_factory=lambda: Repository(make_stub_downloader()))
+        started = time.perf_counter()
+        downloaded_files = retriever.download_hourly_files("staffordshire", station_ids, 2015, 2022)
+        timings[workers] = time.perf_counter() - started
+        assert len(downloaded_files) == 16
+
+    # 2 capability files + 16 hourly files: ~1.8 s serially, ~0.6 s with 4 workers
+    assert timings[1] / timings[4] > 2
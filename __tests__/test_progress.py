@@ -0,0 +1,114 @@
+import io
+import ftplib
+import pytest
+from unittest.mock import MagicMock
+from midas_open_downloader.downloader.errors import DownloadError
+from midas_open_downloader.downloader.retry import RetryPolicy
+from midas_open_downloader.downloader.tracing import BYTES, Tracer, event
+from midas_open_downloader.listing import DatasetIndex
+from midas_open_downloader.progress import Progress, ProgressDisplay, format_bytes, format_duration
+from midas_open_downloader.retriever import Retriever
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+def span(tracer, station_id, year):
+    return tracer.span('file', kind='hourly', historic_county="staffordshire", station_id=station_id, year=year)
+
+def test_progress_follows_spans_and_bytes():
+    clock = FakeClock()
+    snapshots = []
+    tracer = Tracer()
+    progress = tracer.add_hook(Progress(snapshots.append, interval=5, clock=clock))
+    progress.begin([("a", 2021), ("a", 2022), ("b", 2022)], [1000, 3000, 2000])
+
+    with span(tracer, "a", 2022) as file_span:
+        clock.now += 1
+        event(BYTES, 1500)
+        snapshot = progress.snapshot()
+        file_span.attributes['outcome'] = 'ok'
+
+    assert snapshot['files_active'] == 1 and snapshot['active'] == [("a", 2022)]
+    assert snapshot['bytes_done'] == 1500 and snapshot['bytes_total'] == 6000
+    assert snapshot['throughput'] == 1500
+    assert snapshot['eta'] == pytest.approx(3)
+    # The finished file counts with its actual size
+    snapshot = progress.snapshot()
+    assert snapshot['files_done'] == 1 and snapshot['bytes_total'] == 4500
+    clock.now += 5
+    with span(tracer, "b", 2022) as file_span:
+        file_span.attributes['outcome'] = 'failed'
+    # A cache hit transfers nothing and counts with its estimate
+    with span(tracer, "a", 2021) as file_span:
+        file_span.attributes['outcome'] = 'ok'
+    progress.end()
+
+    final = snapshots[-1]
+    assert final['finished'] and final['eta'] == 0
+    assert (final['files_done'], final['files_failed'], final['bytes_done'], final['bytes_total']) == (2, 1, 2500, 2500)
+    # Throttled: the forced reports at begin and end, plus one once the interval passed
+    assert len(snapshots) == 3
+
+def test_spans_of_other_files_are_ignored():
+    tracer = Tracer()
+    progress = tracer.add_hook(Progress())
+    progress.begin([("a", 2022)], [100])
+
+    with tracer.span('file', kind='capabilities', station_id="a"):
+        event(BYTES, 50)
+    with span(tracer, "z", 2022):
+        event(BYTES, 50)
+
+    assert progress.snapshot()['bytes_received'] == 0 and progress.snapshot()['eta'] is None
+
+def test_display_formats():
+    assert format_bytes(512) == "512 B" and format_bytes(3 * 1024 * 1024) == "3.0 MiB"
+    assert format_duration(None) == "--:--" and format_duration(75) == "01:15" and format_duration(3725) == "1:02:05"
+    stream = io.StringIO()
+    display = ProgressDisplay(stream)
+    snapshot = {'files_done': 3, 'files_total': 10, 'files_failed': 1, 'bytes_done': 2048, 'bytes_total': 10240,
+                'throughput': 1024, 'elapsed': 2, 'eta': 8, 'finished': False}
+
+    display(snapshot)
+    display(dict(snapshot, finished=True))
+
+    assert stream.getvalue().splitlines() == [
+        "3/10 files, 1 failed, 2.0 KiB of ~10.0 KiB, 1.0 KiB/s, ETA 00:08",
+        "3/10 files, 1 failed, 2.0 KiB of ~10.0 KiB, 1.0 KiB/s, elapsed 00:02",
+    ]
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_retriever_reports_progress(workers):
+    index = DatasetIndex()
+    index.set_station("staffordshire", "00622_keele", {"1": {2021: 400, 2022: 600}})
+    index.set_station("staffordshire", "00623_oaken", {"1": {2022: 200}})
+    attempts = {}
+
+    def make_repository():
+        repository = MagicMock()
+
+        def download_hourly_file(historic_county, station_id, year, quality_control_version):
+            attempts[(station_id, year)] = attempts.get((station_id, year), 0) + 1
+            if station_id == "00623_oaken" and attempts[(station_id, year)] == 1:
+                raise DownloadError(ftplib.error_temp("421 Service not available"))
+            event(BYTES, index.years(historic_county, station_id)[year])
+            return f"{station_id}_{year}.csv"
+        repository.download_hourly_file.side_effect = download_hourly_file
+        return repository
+
+    snapshots = []
+    retriever = Retriever(workers=workers, repository_factory=make_repository, dataset_index=index, tracer=Tracer(),
+                          retry_policy=RetryPolicy(max_attempts=1, base_delay=0), progress=Progress(snapshots.append, interval=0))
+
+    files = retriever.download_hourly_files("staffordshire", None, 2021, 2022)
+
+    assert len(files) == 3
+    # The transient failure was retried at the end of the run and counts as done
+    assert snapshots[0]['files_total'] == 3 and snapshots[0]['bytes_total'] == 1200
+    assert (snapshots[-1]['files_done'], snapshots[-1]['files_failed'], snapshots[-1]['bytes_done']) == (3, 0, 1200)
+    assert snapshots[-1]['finished']
+    assert retriever.tracer.hooks == []
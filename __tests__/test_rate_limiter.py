@@ -0,0 +1,115 @@
+import pytest
+import ftplib
+from unittest.mock import MagicMock, patch
+from midas_open_downloader.downloader.rate_limiter import RateLimiter, parse_retry_after
+from midas_open_downloader.downloader.ftp_downloader import FTPDownloader
+from midas_open_downloader.downloader.ftp_pool import FTPConnectionPool
+from midas_open_downloader.downloader.errors import DownloadError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+def test_requests_are_paced_after_burst(clock):
+    limiter = RateLimiter(requests_per_second=2, burst=2, clock=clock, sleep=clock.sleep)
+
+    for _ in range(4):
+        limiter.acquire()
+
+    assert clock.sleeps == [0.5, 0.5]
+
+def test_unlimited_requests_never_sleep(clock):
+    limiter = RateLimiter(requests_per_second=None, clock=clock, sleep=clock.sleep)
+
+    for _ in range(100):
+        limiter.acquire()
+        limiter.consume(10 ** 9)
+
+    assert clock.sleeps == []
+
+def test_bytes_budget(clock):
+    limiter = RateLimiter(requests_per_second=None, bytes_per_second=1000, clock=clock, sleep=clock.sleep)
+
+    limiter.consume(1000)
+    limiter.consume(500)
+
+    assert clock.sleeps == [0.5]
+
+def test_backoff_pauses_and_halves_rate(clock):
+    limiter = RateLimiter(requests_per_second=4, burst=1, clock=clock, sleep=clock.sleep)
+    limiter.acquire()
+
+    limiter.backoff(retry_after=5)
+    limiter.acquire()
+
+    assert limiter.factor == 0.5
+    assert clock.sleeps == [5]
+
+def test_recover_restores_full_rate(clock):
+    limiter = RateLimiter(requests_per_second=4, recovery_step=0.25, clock=clock, sleep=clock.sleep)
+    limiter.backoff()
+    limiter.backoff()
+    assert limiter.factor == 0.25
+
+    for _ in range(10):
+        limiter.recover()
+
+    assert limiter.factor == 1.0
+
+def test_backoff_respects_min_factor(clock):
+    limiter = RateLimiter(min_factor=0.1, clock=clock, sleep=clock.sleep)
+    for _ in range(10):
+        limiter.backoff(retry_after=0)
+    assert limiter.factor == 0.1
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") is None
+
+def test_ftp_421_backs_off(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    limiter = MagicMock()
+    ftp = MagicMock()
+    ftp.size.return_value = 100
+    ftp.voidcmd.return_value = "213 20230801000000"
+    ftp.retrbinary.side_effect = ftplib.error_temp("421 Too many connections")
+    downloader = FTPDownloader(rate_limiter=limiter, pool=FTPConnectionPool(connect=lambda: ftp))
+
+    with pytest.raises(DownloadError):
+        downloader.download("/badc/file.csv")
+
+    limiter.acquire.assert_called_once()
+    # 421 closes the control connection, so the transfer is retried once on a new one
+    assert limiter.backoff.call_count == 2
+
+def test_http_429_backs_off_with_retry_after(tmp_path, monkeypatch):
+    import requests
+    from midas_open_downloader.downloader.dap_downloader import HTTPDownloader
+    monkeypatch.chdir(tmp_path)
+    limiter = MagicMock()
+    downloader = HTTPDownloader(rate_limiter=limiter)
+    response = MagicMock(status_code=429, headers={'Retry-After': '7'})
+    response.__enter__.return_value = response
+    response.raise_for_status.side_effect = requests.exceptions.HTTPError("429 Too Many Requests")
+    downloader.session = MagicMock()
+    downloader.session.get.return_value = response
+
+    with pytest.raises(DownloadError):
+        downloader.download("https://dap.ceda.ac.uk/file.csv")
+
+    limiter.backoff.assert_called_once_with(7.0)
+    limiter.recover.assert_not_called()
@@ -3,6 +3,7 @@ import os
 from unittest.mock import MagicMock, patch
 from midas_open_downloader.repository import Repository
 from midas_open_downloader.downloader.errors import DownloadError
+from midas_open_downloader.downloader.sinks import LocalSink
 from midas_open_downloader.parser import StationCapabilities
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -67,3 +68,26 @@ def test_download_hourly_file_failure(repository, mock_downloader):
 
     mock_downloader.get_hourly_path.assert_called_with("historic_county", "station_id", "1", 2022)
     mock_downloader.download.assert_called_with("hourly_file_path")
+
+def test_iter_hourly_records_streams_while_transferring(repository, mock_downloader, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open(os.path.join(current_dir, "test_hourly_file.txt"), 'rb') as f:
+        data = f.read()
+    transferred = []
+
+    def iter_chunks(file_path):
+        for i in range(0, len(data), 64):
+            transferred.append(i)
+            yield data[i:i + 64]
+    mock_downloader.iter_chunks.side_effect = iter_chunks
+    mock_downloader.local_path.return_value = "hourly_2022.csv"
+    mock_downloader.sink = LocalSink()
+
+    records = repository.iter_hourly_records("staffordshire", "00622_keele", 2022, "1", tee=True)
+    first = next(records)
+
+    assert first['air_temperature'] == 11.5
+    assert len(transferred) < len(data) // 64
+    assert not (tmp_path / "hourly_2022.csv").exists()
+    assert len(list(records)) == 3
+    assert (tmp_path / "hourly_2022.csv").read_bytes() == data
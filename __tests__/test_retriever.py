@@ -79,3 +79,45 @@ def test_download_hourly_files_invalid_years(retriever, mock_repository):
     mock_repository.cooldown.assert_not_called()
     mock_repository.cleanup.assert_called_once()
 
+
+def test_transient_failures_are_retried_and_reported(mock_repository):
+    from midas_open_downloader.downloader.errors import DownloadError
+    from midas_open_downloader.downloader.retry import RetryPolicy
+    retriever = Retriever(retry_policy=RetryPolicy(max_attempts=2, jitter=lambda: 0.0))
+    mock_repository.get_station_capabilities.return_value = StationCapabilities(test_capabilities_file)
+    outcomes = {
+        "00622_keele": [DownloadError(ConnectionResetError()), DownloadError(ConnectionResetError()), "keele.csv"],
+        "00623_oaken": [DownloadError(ConnectionResetError())] * 4,
+    }
+    mock_repository.download_hourly_file.side_effect = lambda county, station_id, year, qcv: _next_outcome(outcomes[station_id])
+
+    downloaded_files = retriever.download_hourly_files("staffordshire", ["00622_keele", "00623_oaken"], 2022, 2022)
+
+    # keele exhausts its per-file attempts but succeeds in the deferred pass at the end of the run
+    assert downloaded_files == ["keele.csv"]
+    assert retriever.failures == [{
+        'historic_county': "staffordshire", 'station_id': "00623_oaken", 'year': 2022,
+        'kind': "transient", 'attempts': 2, 'error': "",
+    }]
+
+def _next_outcome(outcomes):
+    outcome = outcomes.pop(0)
+    if isinstance(outcome, Exception):
+        raise outcome
+    return outcome
+
+def test_iter_observations(retriever, mock_repository):
+    from midas_open_downloader.downloader.errors import DownloadError
+    mock_repository.get_station_capabilities.return_value = StationCapabilities(test_capabilities_file)
+
+    def iter_hourly_records(county, station_id, year, qcv, tee=False):
+        if station_id == "00623_oaken":
+            raise DownloadError("Incomplete download of oaken")
+        yield {'ob_time': year}
+    mock_repository.iter_hourly_records.side_effect = iter_hourly_records
+
+    observations = list(retriever.iter_observations("staffordshire", ["00622_keele", "00623_oaken"], 2021, 2022))
+
+    assert observations == [("00622_keele", 2021, {'ob_time': 2021}), ("00622_keele", 2022, {'ob_time': 2022})]
+    assert [(failure['station_id'], failure['year']) for failure in retriever.failures] == [("00623_oaken", 2021), ("00623_oaken", 2022)]
+    mock_repository.cleanup.assert_called_once()
@@ -0,0 +1,111 @@
+import pytest
+import asyncio
+import ftplib
+import requests
+from unittest.mock import MagicMock
+from midas_open_downloader.downloader.errors import DownloadError, RetriesExhaustedError
+from midas_open_downloader.downloader.retry import RetryPolicy, classify_error, TRANSIENT, AUTH, PERMANENT
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return DownloadError(requests.exceptions.HTTPError(response=response))
+
+@pytest.fixture
+def sleep():
+    return MagicMock()
+
+@pytest.fixture
+def policy(sleep):
+    return RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=4.0, jitter=lambda: 1.0, sleep=sleep)
+
+@pytest.mark.parametrize("error, kind", [
+    (http_error(502), TRANSIENT),
+    (http_error(429), TRANSIENT),
+    (http_error(401), AUTH),
+    (http_error(404), PERMANENT),
+    (DownloadError(requests.exceptions.ConnectionError()), TRANSIENT),
+    (DownloadError(requests.exceptions.ReadTimeout()), TRANSIENT),
+    (DownloadError(requests.exceptions.InvalidURL()), PERMANENT),
+    (DownloadError(ftplib.error_temp("421 Timeout")), TRANSIENT),
+    (DownloadError(ftplib.error_perm("530 Login incorrect")), AUTH),
+    (DownloadError(ftplib.error_perm("550 No such file")), PERMANENT),
+    (DownloadError("Incomplete download of x: expected 10 bytes"), TRANSIENT),
+    (DownloadError(asyncio.TimeoutError()), TRANSIENT),
+    # asyncio.TimeoutError before Python 3.11, which is not an OSError
+    (DownloadError(type('TimeoutError', (Exception,), {})()), TRANSIENT),
+])
+def test_classify_error(error, kind):
+    assert classify_error(error) == kind
+
+def test_transient_errors_are_retried_with_backoff(policy, sleep):
+    operation = MagicMock(side_effect=[http_error(502), http_error(503), "file.csv"])
+
+    assert policy.call(operation, "file") == "file.csv"
+
+    assert operation.call_count == 3
+    assert [c.args[0] for c in sleep.call_args_list] == [1.0, 2.0]
+
+def test_backoff_is_capped_and_jittered(sleep):
+    policy = RetryPolicy(base_delay=1.0, max_delay=4.0, jitter=lambda: 0.5, sleep=sleep)
+
+    assert [policy.delay(retry) for retry in range(1, 6)] == [0.5, 1.0, 2.0, 2.0, 2.0]
+
+def test_gives_up_after_max_attempts(policy):
+    operation = MagicMock(side_effect=http_error(502))
+
+    with pytest.raises(RetriesExhaustedError) as exc_info:
+        policy.call(operation, "file")
+
+    assert operation.call_count == 3
+    assert exc_info.value.kind == TRANSIENT
+    assert exc_info.value.attempts == 3
+
+def test_permanent_errors_are_not_retried(policy, sleep):
+    operation = MagicMock(side_effect=http_error(404))
+
+    with pytest.raises(RetriesExhaustedError) as exc_info:
+        policy.call(operation, "file")
+
+    assert operation.call_count == 1
+    assert exc_info.value.kind == PERMANENT
+    sleep.assert_not_called()
+
+def test_auth_errors_reauthenticate_once(policy, sleep):
+    reauthenticate = MagicMock()
+    operation = MagicMock(side_effect=[http_error(401), http_error(401)])
+
+    with pytest.raises(RetriesExhaustedError) as exc_info:
+        policy.call(operation, "file", reauthenticate)
+
+    assert operation.call_count == 2
+    reauthenticate.assert_called_once()
+    assert exc_info.value.kind == AUTH
+    sleep.assert_not_called()
+
+def test_retries_per_run_are_capped(sleep):
+    policy = RetryPolicy(max_attempts=5, max_retries_per_run=3, jitter=lambda: 0.0, sleep=sleep)
+    operation = MagicMock(side_effect=http_error(503))
+
+    with pytest.raises(RetriesExhaustedError):
+        policy.call(operation, "first")
+    with pytest.raises(RetriesExhaustedError):
+        policy.call(operation, "second")
+
+    # 1 + 3 retries for the first file, the second one gets no retries left
+    assert operation.call_count == 5
+    policy.reset()
+    assert policy.retries == 0
+
+def test_call_async_retries(policy):
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        if len(calls) < 2:
+            raise http_error(502)
+        return "file.csv"
+
+    policy.base_delay = 0.0
+    assert asyncio.run(policy.call_async(operation, "file")) == "file.csv"
+    assert len(calls) == 2
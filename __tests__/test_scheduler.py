@@ -0,0 +1,81 @@
+import pytest
+from unittest.mock import MagicMock
+from midas_open_downloader.journal import Journal
+from midas_open_downloader.listing import DatasetIndex
+from midas_open_downloader.retriever import Retriever
+from midas_open_downloader.scheduler import GIVEN, LARGEST, DEFAULT_UNIT_SIZE, Scheduler, SizeEstimator, parse_priorities
+from midas_open_downloader.sync import Manifest, station_year_key
+
+def make_index():
+    index = DatasetIndex()
+    index.set_station("staffordshire", "00622_keele", {"1": {2020: 100, 2021: 900, 2022: 500}})
+    index.set_station("staffordshire", "00623_oaken", {"1": {2021: 800, 2022: None}})
+    index.set_station("staffordshire", "00624_tiny", {"1": {2022: 10}})
+    return index
+
+def test_estimates_from_listing_and_fallbacks():
+    estimator = SizeEstimator(dataset_index=make_index())
+
+    sizes = estimator.estimate("staffordshire", [("00622_keele", 2021), ("00623_oaken", 2022), ("00625_unknown", 2022)])
+
+    # Unknown sizes: the mean of the station's other listed years, or else of the known sizes in the batch
+    assert sizes == [900, 800, 900]
+    assert SizeEstimator().estimate("staffordshire", [("00622_keele", 2021)]) == [DEFAULT_UNIT_SIZE]
+
+def test_estimates_from_history(tmp_path):
+    (tmp_path / "old.csv").write_bytes(b"x" * 300)
+    (tmp_path / "journaled.csv").write_bytes(b"x" * 700)
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    manifest.record_file(station_year_key("202207", "staffordshire", "00622_keele", "1", 2021), str(tmp_path / "old.csv"), "202207")
+    journal = Journal(str(tmp_path / "journal.jsonl"), fsync=False)
+    key = station_year_key("202308", "staffordshire", "00623_oaken", "1", 2021)
+    journal.plan("staffordshire", [("00623_oaken", 2021)], "1", "202308")
+    journal.complete(key, str(tmp_path / "journaled.csv"))
+    journal.close()
+
+    estimator = SizeEstimator(manifest=manifest, journal=journal)
+
+    # The older dataset version's file stands in for the new one
+    assert estimator.estimate("staffordshire", [("00622_keele", 2021), ("00623_oaken", 2021)], dataset_version="202308") == [300, 700]
+
+def test_largest_first_takes_turns_between_stations():
+    station_years = [("a", 2020), ("a", 2021), ("a", 2022), ("b", 2021), ("b", 2022)]
+    sizes = [100, 900, 500, 800, 50]
+
+    fair = Scheduler(LARGEST).schedule(station_years, sizes)
+    unfair = Scheduler(LARGEST, fair=False).schedule(station_years, sizes)
+
+    assert [station_years[index] for index in fair] == [("a", 2021), ("b", 2021), ("a", 2022), ("b", 2022), ("a", 2020)]
+    assert [sizes[index] for index in unfair] == [900, 800, 500, 100, 50]
+
+def test_priorities_go_first():
+    station_years = [("a", 2021), ("b", 2021), ("c", 2021), ("b", 2022)]
+    sizes = [900, 10, 500, 20]
+
+    assert Scheduler(LARGEST, priorities={"b": 1}).schedule(station_years, sizes) == [3, 1, 0, 2]
+    assert Scheduler(GIVEN, priorities={"c": 2, "b": 1}).schedule(station_years, sizes) == [2, 1, 3, 0]
+    with pytest.raises(ValueError, match="Unknown schedule order"):
+        Scheduler("smallest")
+
+def test_parse_priorities():
+    assert parse_priorities("00622_keele=10, 00623_oaken=-1,") == {"00622_keele": 10, "00623_oaken": -1}
+    with pytest.raises(ValueError):
+        parse_priorities("00622_keele")
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_retriever_starts_largest_files_first(workers):
+    repository = MagicMock()
+    started = []
+
+    def download_hourly_file(historic_county, station_id, year, quality_control_version):
+        started.append((station_id, year))
+        return f"{station_id}_{year}.csv"
+    repository.download_hourly_file.side_effect = download_hourly_file
+    retriever = Retriever(workers=workers, repository_factory=lambda: repository, dataset_index=make_index(), scheduler=Scheduler(LARGEST))
+
+    files = retriever.download_hourly_files("staffordshire", ["00622_keele", "00624_tiny"], 2020, 2022)
+
+    # Results keep the requested order
+    assert files == ["00622_keele_2020.csv", "00622_keele_2021.csv", "00622_keele_2022.csv", "00624_tiny_2022.csv"]
+    if workers == 1:
+        assert started == [("00622_keele", 2021), ("00624_tiny", 2022), ("00622_keele", 2022), ("00622_keele", 2020)]
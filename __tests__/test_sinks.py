@@ -0,0 +1,190 @@
+import pytest
+import os
+import gzip
+import hashlib
+import ftplib
+from unittest.mock import MagicMock
+from midas_open_downloader.downloader.errors import DownloadError
+from midas_open_downloader.downloader.ftp_downloader import FTPDownloader
+from midas_open_downloader.downloader.ftp_pool import FTPConnectionPool
+from midas_open_downloader.downloader.integrity import get_default_checksum_registry
+from midas_open_downloader.downloader.rate_limiter import RateLimiter
+from midas_open_downloader.downloader.sinks import LocalSink, S3Sink
+from midas_open_downloader.repository import Repository
+from midas_open_downloader.sync import Manifest
+
+hourly_path = "/dataset-version-202308/staffordshire/00622_keele/qc-version-1/hourly_2022.csv"
+capability_path = "/dataset-version-202308/staffordshire/00622_keele/keele_capability.csv"
+body = b"0123456789abcdef" * 4096
+
+
+class FakeS3Client:
+    """An in-memory stand-in for the boto3 S3 client methods the sink uses."""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.aborted = []
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = f"upload-{len(self.uploads)}"
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = Body
+        return {'ETag': hashlib.md5(Body).hexdigest()}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        self.objects[(Bucket, Key)] = b"".join(parts[part['PartNumber']] for part in MultipartUpload['Parts'])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+        self.aborted.append(Key)
+
+
+@pytest.fixture
+def s3():
+    return FakeS3Client()
+
+@pytest.fixture
+def serve(stub_server):
+    stub_server.bodies[hourly_path] = body
+    return stub_server
+
+def download(make_stub_downloader, stub_server, path, sink):
+    downloader = make_stub_downloader(chunk_size=1024, sink=sink).init()
+    try:
+        return downloader, downloader.download(stub_server.base_url + path)
+    finally:
+        downloader.cleanup()
+
+def test_local_sink_layouts():
+    assert LocalSink().location("dataset-version-202308/county/station/qc-version-1/file.csv") == "file.csv"
+    assert LocalSink("mirror").location("dataset-version-202308/county/station/qc-version-1/file.csv") == os.path.join(
+        "mirror", "dataset-version-202308", "county", "station", "qc-version-1", "file.csv")
+    assert LocalSink(compression='gzip').location("county/station/file.csv") == "file.csv.gz"
+    # Capability files are parsed after download, so they stay uncompressed
+    assert LocalSink(compression='zstd').location("county/station/station_capability.csv") == "station_capability.csv"
+    with pytest.raises(ValueError, match="Unknown compression 'lz4'"):
+        LocalSink(compression='lz4')
+
+def test_mirror_sink_keeps_dataset_versions_apart(make_stub_downloader, serve, tmp_path):
+    newer_path = hourly_path.replace("202308", "202407")
+    serve.bodies[newer_path] = b"newer"
+
+    _, older = download(make_stub_downloader, serve, hourly_path, LocalSink(str(tmp_path)))
+    _, newer = download(make_stub_downloader, serve, newer_path, LocalSink(str(tmp_path)))
+
+    assert older == str(tmp_path / hourly_path.lstrip('/'))
+    assert open(older, 'rb').read() == body
+    assert open(newer, 'rb').read() == b"newer"
+
+def test_gzip_sink_compresses_while_downloading(make_stub_downloader, serve, tmp_path):
+    downloader, filename = download(make_stub_downloader, serve, hourly_path, LocalSink(str(tmp_path), compression='gzip'))
+
+    assert filename.endswith("hourly_2022.csv.gz")
+    stored = open(filename, 'rb').read()
+    assert gzip.decompress(stored) == body
+    assert len(stored) < len(body)
+    # The recorded checksum describes the file as stored, so the manifest and verify agree with it
+    assert downloader.last_checksum['sha256'] == hashlib.sha256(stored).hexdigest()
+    assert get_default_checksum_registry().lookup(filename)['size'] == len(stored)
+    # The manifest keeps the uncompressed size, to compare with the server
+    entry = Manifest(str(tmp_path / "manifest.json")).record_file("key", filename, "202308")
+    assert (entry['size'], entry['remote_size']) == (len(stored), len(body))
+    assert sorted(os.listdir(os.path.dirname(filename))) == ["hourly_2022.csv.gz"]
+
+def test_gzip_output_is_reproducible(make_stub_downloader, serve, tmp_path):
+    _, first = download(make_stub_downloader, serve, hourly_path, LocalSink(str(tmp_path / "a"), compression='gzip'))
+    _, second = download(make_stub_downloader, serve, hourly_path, LocalSink(str(tmp_path / "b"), compression='gzip'))
+
+    assert open(first, 'rb').read() == open(second, 'rb').read()
+
+def test_zstd_sink(make_stub_downloader, serve, tmp_path):
+    zstandard = pytest.importorskip('zstandard')
+    _, filename = download(make_stub_downloader, serve, hourly_path, LocalSink(str(tmp_path), compression='zstd'))
+
+    assert filename.endswith(".zst")
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(open(filename, 'rb').read()) == body
+
+def test_compressed_download_restarts_instead_of_resuming(make_stub_downloader, serve, tmp_path):
+    sink = LocalSink(str(tmp_path), compression='gzip')
+    target = sink.location(hourly_path.lstrip('/'))
+    os.makedirs(os.path.dirname(target))
+    with open(target + ".part", 'wb') as f:
+        f.write(b"stale")
+
+    _, filename = download(make_stub_downloader, serve, hourly_path, sink)
+
+    assert gzip.decompress(open(filename, 'rb').read()) == body
+    assert serve.range_requests[-1] is None
+
+def test_s3_sink_uploads_small_files_in_one_put(make_stub_downloader, serve, s3, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sink = S3Sink("bucket", prefix="midas/", client=s3)
+
+    downloader, location = download(make_stub_downloader, serve, hourly_path, sink)
+
+    key = "midas" + hourly_path
+    assert location == f"s3://bucket/{key}"
+    assert s3.objects[("bucket", key)] == body
+    assert downloader.last_checksum == {'size': len(body), 'sha256': hashlib.sha256(body).hexdigest(), 'checks': ['size']}
+    assert os.listdir(tmp_path) == []
+
+def test_s3_sink_multipart_upload_with_compression(make_stub_downloader, serve, s3):
+    sink = S3Sink("bucket", client=s3, compression='gzip', part_size=16 * 1024)
+    serve.bodies[hourly_path] = os.urandom(100 * 1024)
+
+    _, location = download(make_stub_downloader, serve, hourly_path, sink)
+
+    assert location == f"s3://bucket{hourly_path}.gz"
+    assert gzip.decompress(s3.objects[("bucket", hourly_path.lstrip('/') + ".gz")]) == serve.bodies[hourly_path]
+    assert s3.uploads == {}
+
+def test_s3_sink_keeps_capability_files_local(make_stub_downloader, serve, s3, tmp_path):
+    sink = S3Sink("bucket", client=s3, metadata_sink=LocalSink(str(tmp_path)))
+
+    _, location = download(make_stub_downloader, serve, capability_path, sink)
+
+    assert location == str(tmp_path / capability_path.lstrip('/'))
+    assert os.path.exists(location)
+    assert s3.objects == {}
+
+def test_failed_transfer_aborts_the_upload(s3, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ftp = MagicMock()
+    ftp.size.return_value = len(body)
+    ftp.voidcmd.return_value = "213 20230801000000"
+
+    def retrbinary(cmd, callback, rest=None):
+        callback(body[:20000])
+        raise ftplib.error_temp("426 Connection closed; transfer aborted")
+    ftp.retrbinary.side_effect = retrbinary
+    pool = FTPConnectionPool(connect=lambda: ftp)
+    downloader = FTPDownloader(rate_limiter=RateLimiter(requests_per_second=None), pool=pool,
+                               sink=S3Sink("bucket", client=s3, part_size=8 * 1024))
+
+    with pytest.raises(DownloadError):
+        downloader.download(downloader.base_path + hourly_path)
+    pool.close()
+
+    assert s3.aborted == [hourly_path.lstrip('/')]
+    assert s3.uploads == {} and s3.objects == {}
+
+def test_repository_tee_uses_the_sink(make_stub_downloader, serve, tmp_path):
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_hourly_file.txt"), 'rb') as f:
+        serve.bodies[hourly_path] = f.read()
+    downloader = make_stub_downloader(sink=LocalSink(str(tmp_path), compression='gzip')).init()
+    downloader.get_hourly_path = lambda *args, **kwargs: downloader.base_path + hourly_path
+
+    records = list(Repository(downloader=downloader).iter_hourly_records("staffordshire", "00622_keele", 2022, "1", tee=True))
+    downloader.cleanup()
+
+    assert len(records) == 4
+    stored = (tmp_path / (hourly_path.lstrip('/') + ".gz")).read_bytes()
+    assert gzip.decompress(stored) == serve.bodies[hourly_path]
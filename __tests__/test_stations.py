@@ -0,0 +1,127 @@
+import pytest
+import os
+import random
+from unittest.mock import MagicMock
+from midas_open_downloader.stations import StationCatalogue, group_by_county, haversine_km, read_station_location
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+test_capabilities_file = os.path.join(current_dir, "test_capabilities_file.txt")
+
+HEADER = (
+    "Conventions,G,BADC-CSV,1\n"
+    "observation_station,G,{name}\n"
+    "historic_county_name,G,staffordshire\n"
+    "location,G,{latitude},{longitude}\n"
+    "height,G,179,m\n"
+    "data\n"
+    "id,id_type,met_domain_name,first_year,last_year\n"
+    "4617,DCNN,AWSHRLY,2006,2022\n"
+    "end data\n"
+)
+
+def write_capability_file(path, name="keele", latitude=52.998, longitude=-2.272):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(HEADER.format(name=name, latitude=latitude, longitude=longitude))
+    return path
+
+@pytest.fixture
+def catalogue():
+    generator = random.Random(1)
+    catalogue = StationCatalogue()
+    for index in range(2000):
+        catalogue.add_station(f"county{index % 7}", f"{index:05d}_station", generator.uniform(49.5, 61.0), generator.uniform(-8.5, 2.0))
+    return catalogue
+
+def brute_force_nearest(catalogue, latitude, longitude, count, historic_county=None):
+    stations = [station for station in catalogue.stations.values() if historic_county in (None, station['historic_county'])]
+    stations.sort(key=lambda station: haversine_km(latitude, longitude, station['latitude'], station['longitude']))
+    return [station['station_id'] for station in stations[:count]]
+
+def test_haversine():
+    # London to Edinburgh
+    assert haversine_km(51.5074, -0.1278, 55.9533, -3.1883) == pytest.approx(534, abs=2)
+
+@pytest.mark.parametrize("latitude,longitude,count,county", [
+    (53.0, -2.27, 1, None), (51.5, -0.1, 10, None), (58.0, -5.0, 25, "county3"), (40.0, 10.0, 5, None),
+])
+def test_nearest_matches_brute_force(catalogue, latitude, longitude, count, county):
+    nearest = catalogue.nearest(latitude, longitude, count, historic_county=county)
+
+    assert [station['station_id'] for station in nearest] == brute_force_nearest(catalogue, latitude, longitude, count, county)
+    assert [station['distance_km'] for station in nearest] == sorted(station['distance_km'] for station in nearest)
+
+def test_nearest_within_distance(catalogue):
+    nearest = catalogue.nearest(53.0, -2.27, count=100, max_distance_km=20)
+
+    assert nearest and all(station['distance_km'] <= 20 for station in nearest)
+    assert len(nearest) == sum(haversine_km(53.0, -2.27, s['latitude'], s['longitude']) <= 20 for s in catalogue.stations.values())
+
+def test_within_matches_brute_force(catalogue):
+    found = catalogue.within(52.0, -3.0, 54.0, -1.0)
+
+    expected = sorted((s['historic_county'], s['station_id']) for s in catalogue.stations.values()
+                      if 52.0 <= s['latitude'] <= 54.0 and -3.0 <= s['longitude'] <= -1.0)
+    assert [(s['historic_county'], s['station_id']) for s in found] == expected
+    assert all(s['historic_county'] == "county2" for s in catalogue.within(52.0, -3.0, 54.0, -1.0, historic_county="county2"))
+
+def test_catalogue_and_tree_are_persisted(catalogue, tmp_path):
+    catalogue.path = str(tmp_path / "stations.json")
+    catalogue.save()
+
+    loaded = StationCatalogue(catalogue.path)
+
+    assert loaded._trees.keys() == catalogue._trees.keys()
+    assert loaded._trees[None].order == catalogue._trees[None].order
+    assert loaded.nearest(53.0, -2.27, 5) == catalogue.nearest(53.0, -2.27, 5)
+    loaded.add_station("county0", "new_station", 53.0, -2.27)
+    assert loaded.nearest(53.0, -2.27, 1)[0]['station_id'] == "new_station"
+
+def test_read_station_location(tmp_path):
+    path = write_capability_file(str(tmp_path / "keele_capability.csv"))
+
+    assert read_station_location(path) == {'name': 'keele', 'latitude': 52.998, 'longitude': -2.272, 'height': 179.0}
+    assert read_station_location(test_capabilities_file) is None
+
+def test_update_locates_missing_stations(tmp_path):
+    catalogue = StationCatalogue(str(tmp_path / "stations.json"))
+    fetched = []
+
+    def make_repository():
+        repository = MagicMock()
+
+        def download_station_capabilities(historic_county, station_id, dataset_version):
+            fetched.append(station_id)
+            if station_id == "00001_nowhere":
+                return test_capabilities_file
+            return write_capability_file(str(tmp_path / f"{station_id}_capability.csv"), name=station_id)
+        repository.download_station_capabilities.side_effect = download_station_capabilities
+        return repository
+
+    unresolved = catalogue.update("staffordshire", ["00622_keele", "00001_nowhere"], make_repository, workers=2)
+    catalogue.update("staffordshire", ["00622_keele"], make_repository)
+
+    assert unresolved == ["00001_nowhere"]
+    assert sorted(fetched) == ["00001_nowhere", "00622_keele"]
+    assert StationCatalogue(catalogue.path).get_station("staffordshire", "00622_keele")['name'] == "00622_keele"
+
+def test_scan_local_mirror(tmp_path):
+    station_dir = tmp_path / "dataset-version-202308" / "staffordshire" / "00622_keele"
+    write_capability_file(str(station_dir / "midas-open_uk-hourly-weather-obs_dv-202308_staffordshire_00622_keele_capability.csv"))
+    write_capability_file(str(station_dir / "qc-version-1" / "hourly_2022.csv"))
+    catalogue = StationCatalogue()
+
+    assert catalogue.scan(str(tmp_path)) == 1
+    assert catalogue.get_station("staffordshire", "00622_keele")['latitude'] == 52.998
+
+def test_select_feeds_station_lists(catalogue):
+    nearest = catalogue.select("county1", near=(53.0, -2.27), count=3)
+    boxed = catalogue.select("county1", bbox=(52.0, -3.0, 54.0, -1.0))
+    both = catalogue.select("county1", near=(53.0, -2.27), count=3, bbox=(53.5, -4.0, 55.0, 0.0))
+
+    assert nearest == brute_force_nearest(catalogue, 53.0, -2.27, 3, "county1")
+    assert boxed == sorted(boxed) and boxed
+    # The nearest stations that are also inside the box
+    assert len(both) == 3 and all(catalogue.get_station("county1", station_id)['latitude'] >= 53.5 for station_id in both)
+    assert catalogue.select("county1", near=(53.0, -2.27), count=3, station_ids=nearest[1:]) == nearest[1:]
+    assert group_by_county(catalogue.nearest(53.0, -2.27, 20)).keys() <= {f"county{i}" for i in range(7)}
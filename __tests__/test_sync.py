@@ -0,0 +1,90 @@
+import pytest
+import os
+from unittest.mock import MagicMock, patch
+from midas_open_downloader.retriever import Retriever
+from midas_open_downloader.parser import StationCapabilities
+from midas_open_downloader.sync import Manifest, plan_sync, station_year_key
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+test_capabilities_file = os.path.join(current_dir, "test_capabilities_file.txt")
+
+@pytest.fixture
+def mock_repository(tmp_path):
+    with patch("midas_open_downloader.retriever.Repository") as mock_repo:
+        repository = mock_repo.return_value
+        repository.get_station_capabilities.return_value = StationCapabilities(test_capabilities_file)
+
+        def download_hourly_file(historic_county, station_id, year, quality_control_version, dataset_version):
+            path = tmp_path / f"{dataset_version}_{station_id}_{year}.csv"
+            path.write_text(f"{station_id} {year}")
+            return str(path)
+        repository.download_hourly_file.side_effect = download_hourly_file
+        yield repository
+
+@pytest.fixture
+def manifest(tmp_path):
+    return Manifest(str(tmp_path / "manifest.json"))
+
+def test_first_sync_fetches_everything_and_records_it(mock_repository, manifest):
+    synced = Retriever().sync_hourly_files("staffordshire", ["00622_keele"], 2020, 2022, manifest)
+
+    assert len(synced) == 3
+    entry = Manifest(manifest.path).files[station_year_key("202308", "staffordshire", "00622_keele", "1", 2021)]
+    assert entry['size'] == len("00622_keele 2021")
+    assert entry['dataset_version'] == "202308"
+    assert len(entry['sha256']) == 64
+
+def test_noop_sync_makes_no_requests(mock_repository, manifest):
+    Retriever().sync_hourly_files("staffordshire", ["00622_keele"], 2020, 2022, manifest)
+    mock_repository.reset_mock()
+
+    synced = Retriever().sync_hourly_files("staffordshire", ["00622_keele"], 2020, 2022, Manifest(manifest.path))
+
+    assert synced == []
+    mock_repository.initialize.assert_not_called()
+    mock_repository.get_station_capabilities.assert_not_called()
+    mock_repository.download_hourly_file.assert_not_called()
+
+def test_only_missing_or_damaged_years_are_fetched(mock_repository, manifest):
+    Retriever().sync_hourly_files("staffordshire", ["00622_keele"], 2020, 2021, manifest)
+    os.remove(manifest.files[station_year_key("202308", "staffordshire", "00622_keele", "1", 2020)]['path'])
+    mock_repository.reset_mock()
+
+    Retriever().sync_hourly_files("staffordshire", ["00622_keele"], 2020, 2022, manifest)
+
+    assert [c.args[2] for c in mock_repository.download_hourly_file.call_args_list] == [2020, 2022]
+    mock_repository.get_station_capabilities.assert_not_called()
+
+def test_years_outside_station_range_are_skipped(mock_repository, manifest):
+    synced = Retriever().sync_hourly_files("staffordshire", ["00622_keele"], 2021, 2024, manifest)
+
+    assert len(synced) == 2
+    assert plan_sync(manifest, "202308", "staffordshire", ["00622_keele"], 2021, 2024, "1") == ([], [])
+
+def test_new_dataset_version_carries_over_unchanged_files(mock_repository, manifest):
+    Retriever().sync_hourly_files("staffordshire", ["00622_keele"], 2021, 2022, manifest)
+    old_2021 = manifest.files[station_year_key("202308", "staffordshire", "00622_keele", "1", 2021)]
+    mock_repository.probe_hourly_file.side_effect = lambda county, station, year, qcv, dv: {'size': old_2021['size'] if year == 2021 else 1}
+    mock_repository.reset_mock()
+
+    synced = Retriever().sync_hourly_files("staffordshire", ["00622_keele"], 2021, 2022, manifest, dataset_version="202407", carry_over_unchanged=True)
+
+    assert [c.args[2] for c in mock_repository.download_hourly_file.call_args_list] == [2022]
+    carried = manifest.files[station_year_key("202407", "staffordshire", "00622_keele", "1", 2021)]
+    assert carried['path'] == old_2021['path']
+    assert carried['carried_over_from'] == "202308"
+    assert len(synced) == 1
+
+def test_compressed_files_carry_over_by_their_remote_size(mock_repository, manifest, tmp_path):
+    compressed = tmp_path / "202308_00622_keele_2021.csv.gz"
+    compressed.write_bytes(b"compressed")
+    manifest.record_file(station_year_key("202308", "staffordshire", "00622_keele", "1", 2021), str(compressed), "202308", remote_size=5000)
+    manifest.record_station_years("202407", "staffordshire", "00622_keele", 2000, 2022)
+    mock_repository.probe_hourly_file.return_value = {'size': 5000}
+
+    synced = Retriever().sync_hourly_files("staffordshire", ["00622_keele"], 2021, 2021, manifest, dataset_version="202407", carry_over_unchanged=True)
+
+    mock_repository.download_hourly_file.assert_not_called()
+    carried = manifest.files[station_year_key("202407", "staffordshire", "00622_keele", "1", 2021)]
+    assert (carried['size'], carried['remote_size']) == (len(b"compressed"), 5000)
+    assert synced == []
@@ -0,0 +1,121 @@
+import pytest
+import datetime
+import os
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+
+from midas_open_downloader.timeseries import FileTimeIndex, TimeSeriesQuery
+from midas_open_downloader.badc import load_badc_dataframe
+
+HEADER = (
+    "Conventions,G,BADC-CSV,1\n"
+    "type,ob_time,char\ntype,air_temperature,float\ntype,wind_speed,int\ntype,met_domain_name,char\n"
+    "data\n"
+    "ob_time,air_temperature,wind_speed,met_domain_name\n"
+)
+
+def hourly_name(station_id, year, dataset_version="202308", county="staffordshire"):
+    return f"midas-open_uk-hourly-weather-obs_dv-{dataset_version}_{county}_{station_id}_qcv-1_{year}.csv"
+
+def write_hourly_file(path, year, hours, skip=(), offset=0.0, shuffle=False):
+    """One row per hour of the year, air_temperature = hour of the year + offset."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    rows = []
+    for hour in range(hours):
+        if hour in skip:
+            continue
+        ob_time = datetime.datetime(year, 1, 1) + datetime.timedelta(hours=hour)
+        wind_speed = '' if hour % 5 == 0 else str(hour % 20)
+        rows.append(f"{ob_time:%Y-%m-%d %H:%M:%S},{hour + offset:.1f},{wind_speed},AWSHRLY\n")
+    if shuffle:
+        rows.reverse()
+    with open(path, 'w') as f:
+        f.write(HEADER + ''.join(rows) + "end data\n")
+    return str(path)
+
+@pytest.fixture
+def mirror(tmp_path):
+    station_dir = tmp_path / "dataset-version-202308" / "staffordshire"
+    write_hourly_file(station_dir / "00622_keele" / "qc-version-1" / hourly_name("00622_keele", 2021), 2021, 8760)
+    write_hourly_file(station_dir / "00622_keele" / "qc-version-1" / hourly_name("00622_keele", 2022), 2022, 8760)
+    write_hourly_file(station_dir / "00623_oaken" / "qc-version-1" / hourly_name("00623_oaken", 2022), 2022, 2000, skip={3, 4}, offset=1000)
+    return tmp_path
+
+def test_file_index(mirror):
+    path = TimeSeriesQuery(str(mirror)).find_file("00623_oaken", 2022)
+    index = FileTimeIndex.build(path)
+
+    assert len(index.times) == 1998 and len(index.offsets) == 1999
+    assert index.is_sorted
+    with open(path, 'rb') as f:
+        f.seek(int(index.offsets[5]))
+        assert f.readline().startswith(b"2022-01-01 07:00:00,")
+    assert index.row_range(np.datetime64('2022-01-01T02:00:00'), np.datetime64('2022-01-01T06:00:00')) == (2, 5)
+
+def test_query_aligns_stations_on_hourly_axis(mirror):
+    query = TimeSeriesQuery(str(mirror))
+
+    result = query.query(["00622_keele", "00623_oaken", "99999_missing"], "2022-01-01T01:30", datetime.datetime(2022, 1, 1, 6),
+                         columns=["air_temperature", "wind_speed"])
+
+    assert list(result.times) == [np.datetime64(f'2022-01-01T0{hour}:00:00') for hour in range(1, 7)]
+    assert result["air_temperature"].shape == (3, 6)
+    # The rounded down first hour is only filled from 01:30 on, so it is empty
+    np.testing.assert_array_equal(result["air_temperature"][0], [np.nan, 2, 3, 4, 5, 6])
+    np.testing.assert_array_equal(result["air_temperature"][1], [np.nan, 1002, np.nan, np.nan, 1005, 1006])
+    assert np.isnan(result["air_temperature"][2]).all()
+    np.testing.assert_array_equal(result["wind_speed"][0], [np.nan, 2, 3, 4, np.nan, 6])
+
+def test_query_spans_years_and_reads_only_the_range(mirror):
+    query = TimeSeriesQuery(str(mirror))
+
+    result = query.query(["00622_keele"], "2021-12-31T22:00", "2022-01-01T01:00", columns=["air_temperature"])
+
+    np.testing.assert_array_equal(result["air_temperature"][0], [8758, 8759, 0, 1])
+    assert result.bytes_read < 200
+    full = load_badc_dataframe(query.find_file("00622_keele", 2021), ["air_temperature"])
+    assert full["air_temperature"].iloc[-1] == 8759
+
+def test_index_is_persisted_and_rebuilt_when_the_file_changes(mirror, tmp_path, monkeypatch):
+    index_dir = str(tmp_path / "index")
+    TimeSeriesQuery(str(mirror), index_dir).query(["00623_oaken"], "2022-01-01", "2022-01-02", ["air_temperature"])
+    assert len(os.listdir(index_dir)) == 1
+
+    def build(file_path):
+        raise AssertionError("index rebuilt")
+    with monkeypatch.context() as patch:
+        patch.setattr(FileTimeIndex, 'build', build)
+        result = TimeSeriesQuery(str(mirror), index_dir).query(["00623_oaken"], "2022-01-01", "2022-01-02", ["air_temperature"])
+    assert result["air_temperature"][0][0] == 1000
+
+    path = TimeSeriesQuery(str(mirror)).find_file("00623_oaken", 2022)
+    write_hourly_file(path, 2022, 100, offset=2000)
+    os.utime(path, ns=(1, 1))
+    result = TimeSeriesQuery(str(mirror), index_dir).query(["00623_oaken"], "2022-01-01", "2022-01-02", ["air_temperature"])
+    assert result["air_temperature"][0][0] == 2000
+
+def test_unsorted_file_is_read_whole(tmp_path):
+    write_hourly_file(tmp_path / hourly_name("00622_keele", 2022), 2022, 48, shuffle=True)
+    query = TimeSeriesQuery(str(tmp_path))
+
+    result = query.query(["00622_keele"], "2022-01-01T10:00", "2022-01-01T12:00", ["air_temperature"])
+
+    np.testing.assert_array_equal(result["air_temperature"][0], [10, 11, 12])
+    assert result.bytes_read > 48 * 20
+
+def test_newest_dataset_version_is_used(tmp_path):
+    write_hourly_file(tmp_path / hourly_name("00622_keele", 2022, "202207"), 2022, 24, offset=-100)
+    write_hourly_file(tmp_path / hourly_name("00622_keele", 2022, "202308"), 2022, 24)
+    query = TimeSeriesQuery(str(tmp_path))
+
+    assert query.query(["00622_keele"], "2022-01-01", "2022-01-01", ["air_temperature"])["air_temperature"][0][0] == 0
+    assert query.query(["00622_keele"], "2022-01-01", "2022-01-01", ["air_temperature"], dataset_version="202207")["air_temperature"][0][0] == -100
+
+def test_columns_must_be_numeric(mirror):
+    query = TimeSeriesQuery(str(mirror))
+
+    with pytest.raises(ValueError, match="not numeric"):
+        query.query(["00622_keele"], "2022-01-01", "2022-01-02", ["met_domain_name"])
+    with pytest.raises(ValueError, match="No column 'dewpoint'"):
+        query.query(["00622_keele"], "2022-01-01", "2022-01-02", ["dewpoint"])
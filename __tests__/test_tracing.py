@@ -0,0 +1,134 @@
+import pytest
+import asyncio
+from unittest.mock import MagicMock
+from midas_open_downloader.downloader import tracing
+from midas_open_downloader.downloader.tracing import Tracer, Hook, current_span, record_phase, timed_phase, event
+from midas_open_downloader.downloader.rate_limiter import RateLimiter
+from midas_open_downloader.downloader.retry import RetryPolicy
+from midas_open_downloader.downloader.errors import DownloadError
+from midas_open_downloader.retriever import Retriever
+
+hourly_path = "/dataset-version-202308/staffordshire/00622_keele/qc-version-1/hourly_2022.csv"
+
+class RecordingHook(Hook):
+    def __init__(self):
+        self.spans = []
+        self.events = []
+
+    def on_span_end(self, span):
+        self.spans.append(span)
+
+    def on_event(self, name, value, attributes):
+        self.events.append((name, value, attributes))
+
+@pytest.fixture
+def hook():
+    return RecordingHook()
+
+@pytest.fixture
+def tracer(hook):
+    return Tracer([hook])
+
+def test_span_collects_phases_and_events(tracer, hook):
+    with tracer.span('file', kind='hourly') as span:
+        assert current_span() is span
+        record_phase(tracing.THROTTLE, 0.5)
+        record_phase(tracing.THROTTLE, 0.25)
+        event(tracing.BYTES, 100)
+        event(tracing.BYTES, 20)
+
+    assert current_span() is None
+    assert hook.spans == [span]
+    assert span.phases == {tracing.THROTTLE: 0.75}
+    assert span.counters == {tracing.BYTES: 120}
+    assert span.duration >= 0
+    assert hook.events[0] == (tracing.BYTES, 100, {})
+
+def test_phases_outside_spans_are_ignored():
+    record_phase(tracing.CONNECT, 1.0)
+    with timed_phase(tracing.TRANSFER):
+        pass
+
+def test_span_records_error(tracer, hook):
+    with pytest.raises(ValueError):
+        with tracer.span('file'):
+            raise ValueError("boom")
+
+    assert hook.spans[0].error == "ValueError: boom"
+
+def test_failing_hook_does_not_fail_the_operation(tracer, hook):
+    broken = MagicMock(spec=Hook)
+    broken.on_span_end.side_effect = RuntimeError("broken hook")
+    tracer.add_hook(broken)
+
+    with tracer.span('file'):
+        pass
+
+    assert len(hook.spans) == 1
+
+def test_timed_phase_excludes_nested_phases(tracer):
+    clock = iter([0.0, 10.0])
+    with tracer.span('file') as span:
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            monkeypatch.setattr(tracing.time, 'perf_counter', lambda: next(clock))
+            with timed_phase(tracing.TTFB, exclude=tracing.CONNECTION_PHASES):
+                record_phase(tracing.CONNECT, 3.0)
+                record_phase(tracing.TLS, 2.0)
+
+    assert span.phases[tracing.TTFB] == 5.0
+
+def test_spans_follow_asyncio_tasks(tracer, hook):
+    async def download(name):
+        with tracer.span('file', station_id=name):
+            await asyncio.sleep(0)
+            record_phase(tracing.TRANSFER, 1.0 if name == 'a' else 2.0)
+
+    async def run():
+        await asyncio.gather(download('a'), download('b'))
+
+    asyncio.run(run())
+
+    assert {span.attributes['station_id']: span.phases[tracing.TRANSFER] for span in hook.spans} == {'a': 1.0, 'b': 2.0}
+
+def test_rate_limiter_records_throttle(tracer):
+    limiter = RateLimiter(requests_per_second=1.0, burst=1, clock=lambda: 0.0, sleep=lambda delay: None)
+
+    with tracer.span('file') as span:
+        limiter.acquire()
+        limiter.acquire()
+
+    assert span.phases[tracing.THROTTLE] == pytest.approx(1.0)
+
+def test_retry_records_event_and_wait(tracer, hook):
+    policy = RetryPolicy(jitter=lambda: 1.0, sleep=lambda delay: None)
+    operation = MagicMock(side_effect=[DownloadError("Incomplete download of x"), "done"])
+
+    with tracer.span('file') as span:
+        assert policy.call(operation, "file") == "done"
+
+    assert span.counters[tracing.RETRY] == 1
+    assert span.phases[tracing.RETRY_WAIT] == 1.0
+    assert (tracing.RETRY, 1, {'kind': 'transient'}) in hook.events
+
+def test_http_download_records_phases(make_stub_downloader, stub_server, tracer, hook, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stub_server.bodies[hourly_path] = b"x" * 5000
+    downloader = make_stub_downloader(chunk_size=1024).init()
+
+    with tracer.span('file') as span:
+        downloader.download(stub_server.base_url + hourly_path)
+    downloader.cleanup()
+
+    assert set(span.phases) >= {tracing.CONNECT, tracing.TTFB, tracing.TRANSFER}
+    assert tracing.TLS not in span.phases
+    assert span.counters[tracing.BYTES] == 5000
+
+def test_retriever_reports_file_spans(tracer, hook):
+    repository = MagicMock()
+    repository.download_hourly_file.side_effect = ["local_file_path", DownloadError("not found")]
+    retriever = Retriever(repository_factory=lambda: repository, tracer=tracer)
+
+    retriever._download_station_years("staffordshire", [("00622_keele", 2021), ("00622_keele", 2022)], "1")
+
+    assert [(span.attributes['year'], span.attributes['outcome']) for span in hook.spans] == [(2021, 'ok'), (2022, 'failed')]
+    assert all(tracing.COOLDOWN in span.phases for span in hook.spans)
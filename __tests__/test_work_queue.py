@@ -0,0 +1,129 @@
+import threading
+
+import pytest
+from midas_open_downloader.work_queue import SQLiteWorkQueue, PENDING, LEASED, DONE, FAILED
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def units(*keys, shard=0):
+    return [{'key': key, 'shard': shard, 'station_id': key} for key in keys]
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    queue = SQLiteWorkQueue(str(tmp_path / "queue.sqlite"), max_attempts=2, clock=clock)
+    yield queue
+    queue.close()
+
+
+def test_claim_and_ack(queue):
+    queue.enqueue(units("a", "b"))
+    unit = queue.claim("worker-1", lease_seconds=60)
+    assert unit['key'] == "a"
+    assert unit['attempt'] == 1
+    assert queue.ack("a", "worker-1", "/data/a.csv")
+    assert queue.claim("worker-1")['key'] == "b"
+    assert queue.claim("worker-1") is None
+    assert queue.stats() == {PENDING: 0, LEASED: 1, DONE: 1, FAILED: 0, 'expired': 0}
+
+
+def test_enqueue_is_idempotent(queue):
+    queue.enqueue(units("a"))
+    queue.claim("worker-1")
+    queue.ack("a", "worker-1")
+    queue.enqueue(units("a", "b"))
+    assert queue.stats()[DONE] == 1
+    assert queue.stats()[PENDING] == 1
+
+
+def test_claim_only_from_shard(queue):
+    queue.enqueue(units("a", shard=0) + units("b", shard=1))
+    assert queue.claim("worker-1", shard=1)['key'] == "b"
+    assert queue.claim("worker-1", shard=1) is None
+
+
+def test_expired_lease_is_reissued(queue, clock):
+    queue.enqueue(units("a"))
+    queue.claim("worker-1", lease_seconds=60)
+    assert queue.claim("worker-2", lease_seconds=60) is None
+
+    clock.now += 61
+    assert queue.stats()['expired'] == 1
+    unit = queue.claim("worker-2", lease_seconds=60)
+    assert unit['key'] == "a"
+    assert unit['attempt'] == 2
+    # The first worker lost its lease
+    assert not queue.extend("a", "worker-1")
+    assert not queue.ack("a", "worker-1")
+    assert queue.ack("a", "worker-2")
+
+
+def test_extend_keeps_lease(queue, clock):
+    queue.enqueue(units("a"))
+    queue.claim("worker-1", lease_seconds=60)
+    clock.now += 50
+    assert queue.extend("a", "worker-1", lease_seconds=60)
+    clock.now += 50
+    assert queue.claim("worker-2") is None
+
+
+def test_unit_fails_after_max_attempts(queue, clock):
+    queue.enqueue(units("a"))
+    queue.claim("worker-1", lease_seconds=60)
+    assert queue.fail("a", "worker-1", "timed out")
+    assert queue.claim("worker-1", lease_seconds=60)['attempt'] == 2
+    assert queue.fail("a", "worker-1", "timed out again")
+    assert queue.claim("worker-1") is None
+    assert queue.failures() == [{'key': "a", 'shard': 0, 'station_id': "a", 'attempts': 2, 'error': "timed out again"}]
+
+
+def test_permanent_failure_is_not_retried(queue):
+    queue.enqueue(units("a"))
+    queue.claim("worker-1")
+    queue.fail("a", "worker-1", "not found", retry=False)
+    assert queue.claim("worker-1") is None
+    assert queue.stats()[FAILED] == 1
+
+
+def test_unit_fails_when_every_lease_expired(queue, clock):
+    queue.enqueue(units("a", "b"))
+    for _ in range(2):
+        assert queue.claim("worker-1", lease_seconds=60)['key'] == "a"
+        clock.now += 61
+    assert queue.claim("worker-1")['key'] == "b"
+    assert queue.failures()[0]['error'] == "lease expired"
+
+
+def test_concurrent_claims_are_exclusive(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    SQLiteWorkQueue(path).enqueue(units(*[f"unit-{i:03d}" for i in range(100)]))
+    claimed = []
+    lock = threading.Lock()
+
+    def work(worker_id):
+        # A queue per worker, like separate processes
+        queue = SQLiteWorkQueue(path)
+        while (unit := queue.claim(worker_id)) is not None:
+            with lock:
+                claimed.append(unit['key'])
+            queue.ack(unit['key'], worker_id)
+        queue.close()
+
+    threads = [threading.Thread(target=work, args=(f"worker-{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == [f"unit-{i:03d}" for i in range(100)]
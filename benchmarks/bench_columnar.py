@@ -0,0 +1,68 @@
+"""
+Load times of hourly observations from raw BADC-CSV files versus the Parquet
+store written by ColumnarStore.
+
+Generates `--files` synthetic station-years, converts them once, then times
+loading all of them with midas_open_parser.parse_badc_csv (one dict per row),
+loading the whole Parquet dataset, and loading two columns from it.
+
+    python benchmarks/bench_columnar.py --files 20 --repeat 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from midas_open_parser import parse_badc_csv
+
+from midas_open_downloader.columnar import ColumnarStore
+from synthetic import write_hourly_file
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=20, help='Number of station-year files')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement, the best is reported')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_files = []
+        for index in range(args.files):
+            path = os.path.join(directory, f"station{index:03d}_2022.csv")
+            write_hourly_file(path, seed=index)
+            csv_files.append((path, f"{index:05d}_station"))
+        csv_size = sum(os.path.getsize(path) for path, _ in csv_files)
+
+        store = ColumnarStore(os.path.join(directory, 'parquet'))
+        started = time.perf_counter()
+        for path, station_id in csv_files:
+            store.write_hourly_file(path, station_id, 2022)
+        convert_time = time.perf_counter() - started
+        parquet_size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(store.root) for name in names)
+
+        csv_time = best_of(args.repeat, lambda: [parse_badc_csv(path) for path, _ in csv_files])
+        parquet_time = best_of(args.repeat, lambda: store.read())
+        projected_time = best_of(args.repeat, lambda: store.read(columns=['ob_time', 'air_temperature']))
+
+    print(f"{args.files} station-years, {csv_size / 2 ** 20:.1f} MiB CSV, {parquet_size / 2 ** 20:.1f} MiB Parquet")
+    print(f"{'one-off conversion':<32} {convert_time:>8.3f} s")
+    print(f"{'parse_badc_csv, all columns':<32} {csv_time:>8.3f} s")
+    print(f"{'Parquet, all columns':<32} {parquet_time:>8.3f} s  ({csv_time / parquet_time:.0f}x)")
+    print(f"{'Parquet, 2 columns':<32} {projected_time:>8.3f} s  ({csv_time / projected_time:.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
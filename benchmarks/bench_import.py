@@ -0,0 +1,58 @@
+"""
+Startup cost of the package: wall time of fresh interpreters that import a
+module or run the CLI with --help, and which heavy third-party libraries they
+load. Backends are resolved lazily, so importing the package (or running an FTP
+job) should not load requests, bs4, cryptography or contrail.
+
+    python benchmarks/bench_import.py --repeat 20
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ('requests', 'bs4', 'cryptography', 'contrail', 'aiohttp', 'pandas', 'pyarrow', 'asyncio')
+
+TARGETS = {
+    'python': 'pass',
+    'repository': 'import midas_open_downloader.repository',
+    'retriever': 'import midas_open_downloader.retriever',
+    'cli': 'import midas_open_downloader.__main__',
+    'ftp backend': 'from midas_open_downloader.downloader.backends import get_backend; get_backend("ftp")',
+    'dap backend': 'from midas_open_downloader.downloader.backends import get_backend; get_backend("dap")',
+}
+
+
+def loaded_heavy_modules(statement):
+    check = f"{statement}\nimport sys\nprint(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    return subprocess.check_output([sys.executable, '-c', check], cwd=ROOT, text=True).split()
+
+
+def time_command(command, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10, help='Interpreters started per target; the median is reported (default: 10)')
+    args = parser.parse_args()
+
+    print(f"{'target':<14} {'median (ms)':>11}  heavy modules loaded")
+    for name, statement in TARGETS.items():
+        seconds = time_command([sys.executable, '-c', statement], args.repeat)
+        print(f"{name:<14} {seconds * 1000:>11.1f}  {' '.join(loaded_heavy_modules(statement)) or '-'}")
+    seconds = time_command([sys.executable, '-m', 'midas_open_downloader', '--help'], args.repeat)
+    print(f"{'cli --help':<14} {seconds * 1000:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Parse times and peak memory of hourly observation files:
+midas_open_parser.parse_badc_csv (one dict of strings per row, optionally
+followed by converting the values to numbers the way row-wise callers have
+to) versus badc.load_badc_dataframe (one vectorized pass with typed columns),
+with and without mmap.
+
+    python benchmarks/bench_parser.py --files 10 --repeat 3
+"""
+import argparse
+import os
+import sys
+import datetime
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from midas_open_parser import parse_badc_csv
+
+from midas_open_downloader.badc import load_badc_dataframe, read_badc_header_from_path, FLOAT, INT, TIMESTAMP, NA_VALUES, TIMESTAMP_FORMAT
+from synthetic import write_hourly_file
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def peak_memory(function):
+    tracemalloc.start()
+    result = function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def parse_badc_csv_typed(path):
+    types = read_badc_header_from_path(path).column_types()
+    convert = {
+        FLOAT: float,
+        INT: int,
+        TIMESTAMP: lambda value: datetime.datetime.strptime(value, TIMESTAMP_FORMAT),
+    }
+    rows = parse_badc_csv(path)
+    for row in rows:
+        for column, value in row.items():
+            if value in NA_VALUES:
+                row[column] = None
+            elif types[column] in convert:
+                row[column] = convert[types[column]](value)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=10, help='Number of station-year files')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement, the best is reported')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for index in range(args.files):
+            path = os.path.join(directory, f"station{index:03d}_2022.csv")
+            write_hourly_file(path, seed=index)
+            paths.append(path)
+        size = sum(os.path.getsize(path) for path in paths)
+
+        parsers = [
+            ('parse_badc_csv, strings', lambda: [parse_badc_csv(path) for path in paths]),
+            ('parse_badc_csv, typed', lambda: [parse_badc_csv_typed(path) for path in paths]),
+            ('load_badc_dataframe', lambda: [load_badc_dataframe(path, use_mmap=False) for path in paths]),
+            ('load_badc_dataframe, mmap', lambda: [load_badc_dataframe(path) for path in paths]),
+            ('load_badc_dataframe, 2 columns', lambda: [load_badc_dataframe(path, columns=['ob_time', 'air_temperature']) for path in paths]),
+        ]
+        results = [(name, best_of(args.repeat, function), peak_memory(function)) for name, function in parsers]
+
+    print(f"{args.files} station-years of 8760 rows, {size / 2 ** 20:.1f} MiB")
+    print(f"{'':<32} {'time (s)':>9} {'vs typed':>9} {'peak (MiB)':>11}")
+    baseline = results[1][1]
+    for name, seconds, peak in results:
+        print(f"{name:<32} {seconds:>9.3f} {baseline / seconds:>8.1f}x {peak / 2 ** 20:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+End-to-end throughput of Retriever against local mock CEDA servers.
+
+Each scenario starts a mock DAP or FTP server (see mock_ceda.py) with its own
+latency, bandwidth cap and fault rates, then runs Retriever.download_hourly_files
+in a fresh child process, so the reported peak RSS belongs to the download
+alone. Reported per scenario: files/s, MB/s, p50/p99 time per file (including
+retries) and peak RSS, each the median of --repeat runs.
+
+Results are compared with the stored baselines and the exit status is 1 if a
+scenario got slower or bigger than the baseline by more than --tolerance.
+Every baseline keeps the --stations, --years, --hours and --latency it was
+recorded with; scenarios run with other values are not compared.
+Baselines are machine-specific; record new ones with --save-baseline after a
+deliberate change or on a new machine.
+
+    python benchmarks/bench_retriever.py
+    python benchmarks/bench_retriever.py --scenarios dap-workers-4 ftp-faults --stations 8
+    python benchmarks/bench_retriever.py --save-baseline
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_ceda import BASE_PATH, MockCedaArchive, MockCedaFTPServer, MockCedaHTTPServer
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'bench_retriever.json')
+HISTORIC_COUNTY = 'benchshire'
+MIB = 1024 * 1024
+
+SCENARIOS = {
+    'dap-serial': {'backend': 'dap', 'workers': 1},
+    'dap-workers-4': {'backend': 'dap', 'workers': 4},
+    'dap-workers-8-capped': {'backend': 'dap', 'workers': 8, 'bandwidth': 4 * MIB},
+    'dap-faults': {'backend': 'dap', 'workers': 4, 'error_rate': 0.2, 'drop_rate': 0.1},
+    'ftp-serial': {'backend': 'ftp', 'workers': 1},
+    'ftp-workers-4': {'backend': 'ftp', 'workers': 4},
+    'ftp-faults': {'backend': 'ftp', 'workers': 4, 'error_rate': 0.2, 'drop_rate': 0.1},
+}
+
+# Where higher is worse, and where lower is worse
+HIGHER_IS_WORSE = ('latency_p50', 'latency_p99', 'peak_rss_mib')
+LOWER_IS_WORSE = ('files_per_second', 'mb_per_second')
+# Differences below these are noise whatever the relative change
+MIN_DELTAS = {'latency_p50': 0.05, 'latency_p99': 0.05, 'peak_rss_mib': 8.0}
+
+
+def child(config):
+    import ftplib
+    from midas_open_downloader.retriever import Retriever
+    from midas_open_downloader.repository import Repository
+    from midas_open_downloader.metrics import MetricsCollector
+    from midas_open_downloader.downloader.dap_downloader import HTTPDownloader
+    from midas_open_downloader.downloader.ftp_downloader import FTPDownloader
+    from midas_open_downloader.downloader.ftp_pool import FTPConnectionPool
+    from midas_open_downloader.downloader.rate_limiter import RateLimiter, set_default_rate_limiter
+    from midas_open_downloader.downloader.retry import RetryPolicy
+    from midas_open_downloader.downloader.tracing import Tracer
+
+    class LocalHTTPDownloader(HTTPDownloader):
+        def __init__(self, base_url):
+            super().__init__()
+            self.base_path = base_url + BASE_PATH
+            self.cert_file = None
+
+        def setup_credentials(self):
+            return False
+
+    def ftp_login():
+        ftp = ftplib.FTP()
+        ftp.connect(config['ftp_host'], config['ftp_port'], timeout=30)
+        ftp.login('benchmark', 'benchmark')
+        return ftp
+
+    set_default_rate_limiter(RateLimiter(requests_per_second=None))
+    if config['backend'] == 'dap':
+        repository_factory = lambda: Repository(downloader=LocalHTTPDownloader(config['http_url']))
+        pool = None
+    else:
+        pool = FTPConnectionPool(size=config['workers'], connect=ftp_login)
+        repository_factory = lambda: Repository(downloader=FTPDownloader(pool=pool))
+
+    tracer = Tracer()
+    metrics = tracer.add_hook(MetricsCollector())
+    retry_policy = RetryPolicy(base_delay=0.05, max_delay=0.5, max_retries_per_run=None)
+    retriever = Retriever(workers=config['workers'], repository_factory=repository_factory, retry_policy=retry_policy, tracer=tracer)
+    station_ids = [f"{index:05d}_station" for index in range(config['stations'])]
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        started = time.perf_counter()
+        files = retriever.download_hourly_files(HISTORIC_COUNTY, station_ids, config['first_year'], config['last_year'])
+        elapsed = time.perf_counter() - started
+    if pool:
+        pool.close()
+
+    summary = metrics.summary()
+    durations = summary['durations'].get('hourly', {})
+    print(json.dumps({
+        'files': len(files),
+        'failures': len(retriever.failures),
+        'seconds': elapsed,
+        'files_per_second': len(files) / elapsed,
+        'mb_per_second': summary['bytes'] / MIB / elapsed,
+        'latency_p50': durations.get('p50'),
+        'latency_p99': durations.get('p99'),
+        'retries': summary['events'].get('retry', 0),
+        'peak_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def run_scenario(name, scenario, args):
+    archive = MockCedaArchive(
+        first_year=args.first_year, last_year=args.first_year + args.years - 1, hours=args.hours,
+        latency=scenario.get('latency', args.latency), bandwidth=scenario.get('bandwidth'),
+        error_rate=scenario.get('error_rate', 0.0), drop_rate=scenario.get('drop_rate', 0.0),
+    )
+    # Generate the bodies up front so that is not part of the measurement
+    for year in range(archive.first_year, archive.last_year + 1):
+        archive.hourly_body(year)
+    server = (MockCedaHTTPServer(archive) if scenario['backend'] == 'dap' else MockCedaFTPServer(archive)).start()
+    config = {
+        'backend': scenario['backend'],
+        'workers': scenario['workers'],
+        'stations': args.stations,
+        'first_year': archive.first_year,
+        'last_year': archive.last_year,
+        'http_url': getattr(server, 'base_url', None),
+        'ftp_host': getattr(server, 'host', None),
+        'ftp_port': getattr(server, 'port', None),
+    }
+    runs = []
+    try:
+        for _ in range(args.repeat):
+            output = subprocess.check_output([sys.executable, __file__, '--child', json.dumps(config)], stderr=subprocess.DEVNULL)
+            runs.append(json.loads(output))
+    finally:
+        server.stop()
+    # The median run of every metric, so one noisy run does not decide the comparison
+    result = {metric: statistics.median(run[metric] for run in runs) for metric in runs[0]}
+    result['failures'] = max(run['failures'] for run in runs)
+    result['injected_faults'] = (archive.errors + archive.drops) / len(runs)
+    return result
+
+
+def baseline_config(args):
+    """The options a result depends on, stored with every baseline."""
+    return {'stations': args.stations, 'years': args.years, 'hours': args.hours, 'latency': args.latency}
+
+
+def compare(name, result, baseline, tolerance):
+    """Return the metrics of result that regressed against baseline by more than tolerance."""
+    regressions = []
+    for metric in HIGHER_IS_WORSE:
+        if (baseline.get(metric) and result.get(metric) is not None and result[metric] > baseline[metric] * (1 + tolerance)
+                and result[metric] - baseline[metric] > MIN_DELTAS[metric]):
+            regressions.append(f"{name}: {metric} {result[metric]:.3f} > baseline {baseline[metric]:.3f}")
+    for metric in LOWER_IS_WORSE:
+        if baseline.get(metric) and result.get(metric) is not None and result[metric] < baseline[metric] * (1 - tolerance):
+            regressions.append(f"{name}: {metric} {result[metric]:.3f} < baseline {baseline[metric]:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=list(SCENARIOS), help='Scenarios to run (default: all)')
+    parser.add_argument('--stations', type=int, default=8, help='Stations per scenario (default: 8)')
+    parser.add_argument('--years', type=int, default=3, help='Years per station (default: 3)')
+    parser.add_argument('--first-year', type=int, default=2020)
+    parser.add_argument('--hours', type=int, default=8760, help='Rows per hourly file (default: 8760, about 1.3 MB)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per scenario; the median is reported (default: 3)')
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds per request or FTP command (default: 0.02)')
+    parser.add_argument('--baseline', type=str, default=DEFAULT_BASELINE_PATH, help='Baseline results to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative regression (default: 0.25)')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(json.loads(args.child))
+        return 0
+
+    results = {}
+    print(f"{'scenario':<22} {'files':>5} {'files/s':>8} {'MB/s':>7} {'p50 (s)':>8} {'p99 (s)':>8} {'faults':>6} {'retries':>7} {'peak RSS (MiB)':>15}")
+    for name in args.scenarios:
+        result = results[name] = run_scenario(name, SCENARIOS[name], args)
+        result['config'] = baseline_config(args)
+        print(f"{name:<22} {result['files']:>5.0f} {result['files_per_second']:>8.2f} {result['mb_per_second']:>7.2f} "
+              f"{result['latency_p50']:>8.3f} {result['latency_p99']:>8.3f} {result['injected_faults']:>6.0f} {result['retries']:>7.0f} {result['peak_rss_mib']:>15.1f}")
+
+    if args.save_baseline:
+        baselines = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baselines = json.load(f)
+        baselines.update(results)
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; record one with --save-baseline.")
+        return 0
+    with open(args.baseline) as f:
+        baselines = json.load(f)
+    comparable = {}
+    for name, result in results.items():
+        if name not in baselines:
+            continue
+        if baselines[name].get('config') != result['config']:
+            print(f"SKIPPED {name}: the baseline was recorded with {baselines[name].get('config', 'unknown options')}, not {result['config']}")
+            continue
+        comparable[name] = result
+    regressions = [regression for name, result in comparable.items()
+                   for regression in compare(name, result, baselines[name], args.tolerance)]
+    incomplete = [name for name, result in results.items() if result['failures']]
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    for name in incomplete:
+        print(f"FAILED {name}: {results[name]['failures']} station-years were not downloaded")
+    return 1 if regressions or incomplete else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
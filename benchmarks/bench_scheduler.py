@@ -0,0 +1,75 @@
+"""
+Wall time of a concurrent Retriever run with skewed file sizes, in the
+requested order versus largest-first.
+
+A fake repository "downloads" each station-year by sleeping for its size
+divided by --bandwidth, so only the order the pool starts the files in
+differs between the runs. Sizes come from a DatasetIndex, as with
+--listing-index: most files are small, and --huge files are ten times bigger
+and requested last, the worst case for the requested order.
+
+    python benchmarks/bench_scheduler.py --workers 4 --stations 12 --years 4
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from midas_open_downloader.listing import DatasetIndex
+from midas_open_downloader.retriever import Retriever
+from midas_open_downloader.scheduler import GIVEN, LARGEST, Scheduler
+
+HISTORIC_COUNTY = 'benchshire'
+MIB = 1024 * 1024
+
+
+def run(index, station_ids, args, order):
+    def make_repository():
+        repository = MagicMock()
+
+        def download_hourly_file(historic_county, station_id, year, quality_control_version):
+            time.sleep(index.years(historic_county, station_id)[year] / args.bandwidth)
+            return f"{station_id}_{year}.csv"
+        repository.download_hourly_file.side_effect = download_hourly_file
+        return repository
+
+    retriever = Retriever(workers=args.workers, repository_factory=make_repository, dataset_index=index, scheduler=Scheduler(order))
+    started = time.perf_counter()
+    retriever.download_hourly_files(HISTORIC_COUNTY, station_ids, args.first_year, args.first_year + args.years - 1)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent workers (default: 4)')
+    parser.add_argument('--stations', type=int, default=12, help='Stations (default: 12)')
+    parser.add_argument('--years', type=int, default=4, help='Years per station (default: 4)')
+    parser.add_argument('--huge', type=int, default=3, help='Station-years ten times the usual size (default: 3)')
+    parser.add_argument('--first-year', type=int, default=2019)
+    parser.add_argument('--bandwidth', type=float, default=50 * MIB, help='Simulated bytes per second per worker (default: 50 MiB)')
+    args = parser.parse_args()
+
+    generator = random.Random(1)
+    index = DatasetIndex()
+    station_ids = [f"{number:05d}_station" for number in range(args.stations)]
+    for number, station_id in enumerate(station_ids):
+        years = {year: int(generator.uniform(1.0, 1.5) * MIB) for year in range(args.first_year, args.first_year + args.years)}
+        if number >= args.stations - args.huge:
+            years[args.first_year + args.years - 1] *= 10
+        index.set_station(HISTORIC_COUNTY, station_id, {"1": years})
+    total = sum(sum(index.years(HISTORIC_COUNTY, station_id).values()) for station_id in station_ids)
+    ideal = max(total / args.workers, max(max(index.years(HISTORIC_COUNTY, s).values()) for s in station_ids)) / args.bandwidth
+
+    given = run(index, station_ids, args, GIVEN)
+    largest = run(index, station_ids, args, LARGEST)
+    print(f"{args.stations * args.years} files, {total / MIB:.0f} MiB, {args.workers} workers (lower bound {ideal:.2f} s)")
+    print(f"{'requested order':<16} {given:>6.2f} s")
+    print(f"{'largest first':<16} {largest:>6.2f} s  ({given / largest:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Query latency of the station catalogue's k-d tree: nearest-N and bounding-box
+lookups over random stations spread across the UK, compared with a linear scan.
+
+    python benchmarks/bench_stations.py --stations 10000 --queries 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from midas_open_downloader.stations import StationCatalogue, haversine_km
+
+
+def linear_nearest(stations, latitude, longitude, count):
+    return sorted(stations, key=lambda station: haversine_km(latitude, longitude, station['latitude'], station['longitude']))[:count]
+
+
+def time_queries(query, points):
+    timings = []
+    for point in points:
+        started = time.perf_counter()
+        query(*point)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stations', type=int, default=10000, help='Stations in the catalogue (default: 10000)')
+    parser.add_argument('--queries', type=int, default=2000, help='Queries per kind (default: 2000)')
+    parser.add_argument('--count', type=int, default=10, help='Stations per nearest query (default: 10)')
+    args = parser.parse_args()
+
+    generator = random.Random(0)
+    catalogue = StationCatalogue()
+    for index in range(args.stations):
+        catalogue.add_station(f"county{index % 50}", f"{index:05d}_station", generator.uniform(49.5, 61.0), generator.uniform(-8.5, 2.0))
+    started = time.perf_counter()
+    catalogue.nearest(53.0, -2.0)
+    print(f"build: {(time.perf_counter() - started) * 1000:.1f} ms for {args.stations} stations")
+
+    points = [(generator.uniform(50.0, 59.0), generator.uniform(-6.0, 1.5)) for _ in range(args.queries)]
+    boxes = [(latitude, longitude, latitude + 0.5, longitude + 0.8) for latitude, longitude in points]
+    stations = list(catalogue.stations.values())
+    results = {
+        f'nearest {args.count}': time_queries(lambda latitude, longitude: catalogue.nearest(latitude, longitude, args.count), points),
+        f'nearest {args.count} in county': time_queries(lambda latitude, longitude: catalogue.nearest(latitude, longitude, args.count, historic_county='county7'), points),
+        'bbox': time_queries(catalogue.within, boxes),
+        f'linear nearest {args.count}': time_queries(lambda latitude, longitude: linear_nearest(stations, latitude, longitude, args.count), points[:50]),
+    }
+    print(f"{'query':<26} {'p50 (us)':>9} {'p99 (us)':>9}")
+    for name, (p50, p99) in results.items():
+        print(f"{name:<26} {p50 * 1e6:>9.1f} {p99 * 1e6:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Peak RSS of HTTPDownloader.download for growing file sizes.
+
+Every download runs in a fresh child process against a local HTTP server that
+generates the body on the fly, so the reported peak RSS belongs to the
+download alone. With streaming the peak should stay flat as the size grows.
+
+    python benchmarks/bench_streaming.py --sizes 16 64 256 --chunk-size 1048576
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BLOCK = b"2022-01-01 00:00:00,4617,DCNN,AWSHRLY,1,12.3,4.5,1010.2\n" * 1024
+
+
+class GeneratingHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        size = int(self.path.rsplit('/', 1)[-1].split('_', 1)[0])
+        self.send_response(200)
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        remaining = size
+        while remaining > 0:
+            block = BLOCK[:remaining]
+            self.wfile.write(block)
+            remaining -= len(block)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def child(url, chunk_size):
+    from midas_open_downloader.downloader.dap_downloader import HTTPDownloader
+    from midas_open_downloader.downloader.rate_limiter import RateLimiter
+    import requests
+
+    downloader = HTTPDownloader(rate_limiter=RateLimiter(requests_per_second=None), chunk_size=chunk_size)
+    downloader.cert_file = None
+    downloader.session = requests.Session()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        downloader.download(url)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(baseline, peak)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[16, 64, 256], help='File sizes in MiB')
+    parser.add_argument('--chunk-size', type=int, default=1024 * 1024)
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], int(args.child[1]))
+        return
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), GeneratingHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{httpd.server_address[1]}"
+
+    print(f"{'size (MiB)':>10} {'baseline RSS (MiB)':>19} {'peak RSS (MiB)':>15}")
+    for size_mib in args.sizes:
+        url = f"{base_url}/{size_mib * 1024 * 1024}_hourly.csv"
+        output = subprocess.check_output([sys.executable, __file__, '--child', url, str(args.chunk_size)])
+        baseline_kib, peak_kib = (int(value) for value in output.split())
+        print(f"{size_mib:>10} {baseline_kib / 1024:>19.1f} {peak_kib / 1024:>15.1f}")
+
+    httpd.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Multi-station time-range queries over downloaded hourly files with
+TimeSeriesQuery versus loading and filtering every yearly file.
+
+Generates `--stations` x `--years` synthetic station-years in the mirror
+layout, then queries one column for all stations over `--days` days:
+
+- a full load of each file with load_badc_dataframe, then filtering;
+- the first indexed query, which builds and persists the time indexes;
+- the same query in a new TimeSeriesQuery reading the persisted indexes;
+- repeated queries with the indexes in memory.
+
+    python benchmarks/bench_timeseries.py --stations 20 --years 2 --days 7
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from midas_open_downloader.badc import load_badc_dataframe
+from midas_open_downloader.timeseries import TimeSeriesQuery
+from synthetic import write_hourly_file
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stations', type=int, default=20, help='Number of stations (default: 20)')
+    parser.add_argument('--years', type=int, default=2, help='Years per station (default: 2)')
+    parser.add_argument('--days', type=int, default=7, help='Days per query (default: 7)')
+    parser.add_argument('--repeat', type=int, default=20, help='Warm queries (default: 20)')
+    args = parser.parse_args()
+
+    first_year = 2021
+    last_year = first_year + args.years - 1
+    station_ids = [f"{index:05d}_station" for index in range(args.stations)]
+    start = np.datetime64(f'{last_year}-06-01T00:00:00')
+    end = start + np.timedelta64(args.days * 24 - 1, 'h')
+
+    with tempfile.TemporaryDirectory() as directory:
+        root = os.path.join(directory, 'midas')
+        for index, station_id in enumerate(station_ids):
+            station_dir = os.path.join(root, 'dataset-version-202308', 'benchshire', station_id, 'qc-version-1')
+            os.makedirs(station_dir)
+            for year in range(first_year, last_year + 1):
+                name = f"midas-open_uk-hourly-weather-obs_dv-202308_benchshire_{station_id}_qcv-1_{year}.csv"
+                write_hourly_file(os.path.join(station_dir, name), year=year, seed=index * 100 + year)
+        query = TimeSeriesQuery(root, index_dir=os.path.join(directory, 'index'))
+        files = [query.find_file(station_id, last_year) for station_id in station_ids]
+        total_bytes = sum(os.path.getsize(path) for path in files)
+
+        def full_scan():
+            for path in files:
+                frame = load_badc_dataframe(path, ['ob_time', 'air_temperature'])
+                frame[(frame['ob_time'] >= start) & (frame['ob_time'] <= end)]
+
+        scan_time, _ = timed(full_scan)
+        cold_time, result = timed(lambda: query.query(station_ids, start, end, ['air_temperature']))
+        persisted_time, _ = timed(lambda: TimeSeriesQuery(root, index_dir=query.index.index_dir).query(station_ids, start, end, ['air_temperature']))
+        warm_times = [timed(lambda: query.query(station_ids, start, end, ['air_temperature']))[0] for _ in range(args.repeat)]
+        warm_time = sorted(warm_times)[len(warm_times) // 2]
+
+    print(f"{args.stations} stations, {args.days} days of air_temperature from {total_bytes / 2 ** 20:.1f} MiB of files "
+          f"-> array {result['air_temperature'].shape}, {result.bytes_read / 2 ** 10:.0f} KiB of rows read")
+    print(f"{'load and filter every file':<34} {scan_time * 1000:>8.1f} ms")
+    print(f"{'first query, building indexes':<34} {cold_time * 1000:>8.1f} ms")
+    print(f"{'new process, persisted indexes':<34} {persisted_time * 1000:>8.1f} ms  ({scan_time / persisted_time:.0f}x)")
+    print(f"{'repeated query (median)':<34} {warm_time * 1000:>8.1f} ms  ({scan_time / warm_time:.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
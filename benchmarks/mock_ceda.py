@@ -0,0 +1,270 @@
+"""
+Local stand-ins for the CEDA DAP (HTTP) and FTP servers for the benchmarks.
+
+Both serve synthetic capability and hourly files at the real path layout of
+get_station_capabilities_path / get_hourly_path, so the downloaders run
+unchanged against them. Every request (every command for FTP) is delayed by
+`latency` seconds and every connection is capped at `bandwidth` bytes/sec.
+Hourly file transfers fail at `error_rate` (HTTP 503 / FTP 450) or are cut
+off halfway at `drop_rate`. Failures are drawn from a seeded random
+generator, so a run is reproducible.
+"""
+import os
+import re
+import random
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from synthetic import write_hourly_file
+
+BASE_PATH = "/badc/ukmo-midas-open/data/uk-hourly-weather-obs"
+BLOCK_SIZE = 64 * 1024
+MDTM = "20230801000000"
+
+_FILE_PATTERN = re.compile(
+    r'/dataset-version-(?P<dv>[^/]+)/(?P<county>[^/]+)/(?P<station>[^/]+)/'
+    r'(?:qc-version-(?P<qcv>\d+)/)?midas-open_uk-hourly-weather-obs_dv-(?P=dv)_(?P=county)_(?P=station)_'
+    r'(?:qcv-(?P=qcv)_(?P<year>\d{4})|capability)\.csv$'
+)
+
+
+class MockCedaArchive:
+    """The synthetic files and the fault injection shared by the mock servers."""
+
+    def __init__(self, first_year=2000, last_year=2022, hours=8760, latency=0.0, bandwidth=None,
+                 error_rate=0.0, drop_rate=0.0, seed=0):
+        """
+        Args:
+            first_year (int): First year in every station's capability file.
+            last_year (int): Last year in every station's capability file.
+            hours (int): Rows per hourly file; 8760 is a full year (about 1.3 MB).
+            latency (float): Seconds added to every request or FTP command.
+            bandwidth (float): Bytes/sec per connection, None for no cap.
+            error_rate (float): Fraction of transfers refused with a transient error.
+            drop_rate (float): Fraction of transfers cut off halfway.
+        """
+        self.first_year = first_year
+        self.last_year = last_year
+        self.hours = hours
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.requests = 0
+        self.errors = 0
+        self.drops = 0
+        self.bytes_sent = 0
+        self._random = random.Random(seed)
+        self._bodies = {}
+        self._lock = threading.Lock()
+
+    def capability_body(self):
+        return (
+            "Conventions,G,BADC-CSV,1\ndata\nid,id_type,met_domain_name,first_year,last_year\n"
+            f"4617,DCNN,AWSHRLY,{self.first_year},{self.last_year}\nend data\n"
+        ).encode()
+
+    def hourly_body(self, year):
+        with self._lock:
+            if year not in self._bodies:
+                with tempfile.TemporaryDirectory() as directory:
+                    path = os.path.join(directory, 'hourly.csv')
+                    write_hourly_file(path, year=year, hours=self.hours, seed=year)
+                    with open(path, 'rb') as f:
+                        self._bodies[year] = f.read()
+            return self._bodies[year]
+
+    def lookup(self, path):
+        """The body served at path, or None if it is not part of the archive."""
+        if not path.startswith(BASE_PATH):
+            return None
+        match = _FILE_PATTERN.fullmatch(path[len(BASE_PATH):])
+        if not match:
+            return None
+        if match.group('year') is None:
+            return self.capability_body()
+        year = int(match.group('year'))
+        return self.hourly_body(year) if self.first_year <= year <= self.last_year else None
+
+    def fault(self, path):
+        """Draw the fate of a transfer: None, 'error' or 'drop'. Only hourly files fail."""
+        with self._lock:
+            self.requests += 1
+            if path.endswith('_capability.csv'):
+                return None
+            draw = self._random.random()
+            if draw < self.error_rate:
+                self.errors += 1
+                return 'error'
+            if draw < self.error_rate + self.drop_rate:
+                self.drops += 1
+                return 'drop'
+            return None
+
+    def send(self, write, data):
+        """Write data in blocks, no faster than the bandwidth cap."""
+        for start in range(0, len(data), BLOCK_SIZE):
+            block = data[start:start + BLOCK_SIZE]
+            write(block)
+            if self.bandwidth:
+                time.sleep(len(block) / self.bandwidth)
+        with self._lock:
+            self.bytes_sent += len(data)
+
+
+class MockCedaHTTPServer:
+    """The DAP server: GET with Range support, 503 with Retry-After for injected errors."""
+
+    def __init__(self, archive):
+        self.archive = archive
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                time.sleep(archive.latency)
+                path = self.path.split('?', 1)[0]
+                body = archive.lookup(path)
+                if body is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                fault = archive.fault(path)
+                if fault == 'error':
+                    self.send_response(503)
+                    self.send_header('Retry-After', '0')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                total = len(body)
+                range_header = self.headers.get('Range')
+                if range_header and range_header.startswith('bytes='):
+                    start = int(range_header[len('bytes='):].split('-', 1)[0])
+                    self.send_response(206)
+                    self.send_header('Content-Range', f"bytes {start}-{total - 1}/{total}")
+                    body = body[start:]
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', f'"{total}"')
+                self.end_headers()
+                if fault == 'drop':
+                    archive.send(self.wfile.write, body[:len(body) // 2])
+                    self.close_connection = True
+                    return
+                archive.send(self.wfile.write, body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class MockCedaFTPServer:
+    """
+    The FTP server: just enough of RFC 959 for ftplib in passive mode (USER,
+    PASS, TYPE, SIZE, MDTM, PASV, REST, RETR, NOOP, ABOR, QUIT). Any user name
+    and password are accepted.
+    """
+
+    def __init__(self, archive):
+        self.archive = archive
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                time.sleep(archive.latency)
+                self.wfile.write(f"{line}\r\n".encode())
+
+            def handle(self):
+                self.listener = None
+                self.rest = 0
+                self.reply("220 Mock CEDA FTP server")
+                for raw in self.rfile:
+                    command, _, argument = raw.decode('latin-1').strip().partition(' ')
+                    command = command.upper()
+                    if command == 'QUIT':
+                        self.reply("221 Goodbye")
+                        break
+                    self.dispatch(command, argument)
+                self.close_listener()
+
+            def dispatch(self, command, argument):
+                if command == 'USER':
+                    self.reply("331 Password required")
+                elif command == 'PASS':
+                    self.reply("230 Logged in")
+                elif command in ('TYPE', 'NOOP', 'ABOR'):
+                    self.reply("200 OK" if command != 'ABOR' else "226 Abort successful")
+                elif command == 'SIZE':
+                    body = archive.lookup(argument)
+                    self.reply(f"213 {len(body)}" if body is not None else "550 No such file")
+                elif command == 'MDTM':
+                    self.reply(f"213 {MDTM}" if archive.lookup(argument) is not None else "550 No such file")
+                elif command == 'PASV':
+                    self.close_listener()
+                    self.listener = socket.create_server(('127.0.0.1', 0))
+                    self.listener.settimeout(10)
+                    port = self.listener.getsockname()[1]
+                    self.reply(f"227 Entering Passive Mode (127,0,0,1,{port >> 8},{port & 0xff})")
+                elif command == 'REST':
+                    self.rest = int(argument)
+                    self.reply(f"350 Restarting at {self.rest}")
+                elif command == 'RETR':
+                    self.retrieve(argument)
+                else:
+                    self.reply("502 Command not implemented")
+
+            def retrieve(self, path):
+                rest, self.rest = self.rest, 0
+                body = archive.lookup(path)
+                if body is None or self.listener is None:
+                    self.close_listener()
+                    self.reply("550 No such file" if body is None else "425 Use PASV first")
+                    return
+                fault = archive.fault(path)
+                if fault == 'error':
+                    self.close_listener()
+                    self.reply("450 Transient failure")
+                    return
+                self.reply("150 Opening BINARY mode data connection")
+                data_connection, _ = self.listener.accept()
+                self.close_listener()
+                with data_connection:
+                    data = body[rest:]
+                    archive.send(data_connection.sendall, data[:len(data) // 2] if fault == 'drop' else data)
+                self.reply("426 Connection closed; transfer aborted" if fault == 'drop' else "226 Transfer complete")
+
+            def close_listener(self):
+                if self.listener is not None:
+                    self.listener.close()
+                    self.listener = None
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.host, self.port = self.server.server_address
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,40 @@
+"""
+Synthetic MIDAS Open hourly files for the benchmarks: the metadata block and
+column layout of uk-hourly-weather-obs, with one row per hour of a year.
+"""
+import datetime
+import random
+
+FLOAT_COLUMNS = ['air_temperature', 'dewpoint', 'wetb_temp', 'msl_pressure', 'stn_pres', 'alt_pres', 'rltv_hum', 'visibility', 'cld_base_ht']
+INT_COLUMNS = ['wind_direction', 'wind_speed', 'prst_wx_id', 'past_wx_id_1', 'cld_ttl_amt_id', 'low_cld_type_id', 'snow_depth']
+QC_COLUMNS = [f"{column}_q" for column in FLOAT_COLUMNS + INT_COLUMNS]
+FLAG_COLUMNS = [f"{column}_j" for column in FLOAT_COLUMNS[:4]]
+COLUMNS = ['ob_time', 'id', 'id_type', 'met_domain_name', 'src_id', 'rec_st_ind'] + FLOAT_COLUMNS + INT_COLUMNS + QC_COLUMNS + FLAG_COLUMNS + ['meto_stmp_time']
+TYPES = dict(
+    {'ob_time': 'char', 'id': 'int', 'id_type': 'char', 'met_domain_name': 'char', 'src_id': 'int', 'rec_st_ind': 'int', 'meto_stmp_time': 'char'},
+    **{column: 'float' for column in FLOAT_COLUMNS},
+    **{column: 'int' for column in INT_COLUMNS + QC_COLUMNS},
+    **{column: 'char' for column in FLAG_COLUMNS},
+)
+
+
+def write_hourly_file(path, year=2022, hours=8760, seed=0):
+    """Write a BADC-CSV hourly file with `hours` rows starting on 1 January of year."""
+    rng = random.Random(seed)
+    start = datetime.datetime(year, 1, 1)
+    with open(path, 'w') as f:
+        f.write("Conventions,G,BADC-CSV,1\ntitle,G,uk-hourly-weather-obs\nobservation_station,G,synthetic\n")
+        for column in COLUMNS:
+            f.write(f"long_name,{column},{column},1\ntype,{column},{TYPES[column]}\n")
+        f.write("data\n")
+        f.write(",".join(COLUMNS) + "\n")
+        for hour in range(hours):
+            ob_time = start + datetime.timedelta(hours=hour)
+            row = [ob_time.strftime('%Y-%m-%d %H:%M:%S'), '4617', 'DCNN', 'AWSHRLY', '19187', '1011']
+            row += [f"{rng.uniform(-10, 30):.1f}" if rng.random() > 0.05 else 'NA' for _ in FLOAT_COLUMNS]
+            row += [str(rng.randrange(0, 360)) if rng.random() > 0.05 else '' for _ in INT_COLUMNS]
+            row += ['1' for _ in QC_COLUMNS]
+            row += ['NA' for _ in FLAG_COLUMNS]
+            row.append((ob_time + datetime.timedelta(minutes=30)).strftime('%Y-%m-%d %H:%M:%S'))
+            f.write(",".join(row) + "\n")
+        f.write("end data\n")
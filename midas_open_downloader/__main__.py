@@ -1,29 +1,222 @@
+import sys
 import argparse
+import json
+import logging
 from .retriever import Retriever
+from .repository import Repository
+from .cache import DownloadCache
+from .capabilities import CapabilityIndex
+from .listing import DatasetIndex
+from .stations import StationCatalogue
+from .sync import Manifest, DEFAULT_MANIFEST_PATH
+from .journal import Journal, DEFAULT_JOURNAL_PATH
+from .metrics import MetricsCollector
+from .progress import Progress, ProgressDisplay
+from .scheduler import GIVEN, LARGEST, SCHEDULE_ORDERS, Scheduler, SizeEstimator, parse_priorities
+from .downloader.abstract_downloader import DEFAULT_DATASET_VERSION
+from .downloader.backends import DAP, DEFAULT_BACKEND, FTP, available_backends
+from .downloader.rate_limiter import RateLimiter, set_default_rate_limiter
+from .downloader.retry import RetryPolicy
+from .downloader.sinks import COMPRESSION_SUFFIXES, LocalSink, S3Sink
+from .downloader.tracing import get_default_tracer
 
 def main():
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:2] == ['verify']:
+        from .verify import main as verify_main
+        sys.exit(verify_main(sys.argv[2:]))
+
     parser = argparse.ArgumentParser(
         description='Download hourly weather data from MIDAS Open.',
         epilog='''
 Example:
   python -m midas_open_downloader staffordshire "00622_keele,00623_oaken" 2022 2022
+
+Check the files of a local mirror against the manifest:
+  python -m midas_open_downloader verify --manifest ./midas_manifest.json
 '''
     )
     parser.add_argument('historic_county', type=str, help='Historic county name')
-    parser.add_argument('station_ids', type=str, help='Comma-separated list of station IDs')
+    parser.add_argument('station_ids', type=str, help='Comma-separated list of station IDs, or "all" with --listing-index')
     parser.add_argument('start_year', type=int, help='Start year')
     parser.add_argument('end_year', type=int, help='End year')
+    parser.add_argument('--backend', type=str, choices=available_backends(), default=DEFAULT_BACKEND, help=f'Download over DAP (HTTPS) or FTP (default: {DEFAULT_BACKEND})')
+    parser.add_argument('--workers', type=int, default=1, help='Number of concurrent download workers (default: 1)')
+    parser.add_argument('--max-requests-per-second', type=float, default=1.0, help='Request budget shared by all workers (default: 1.0)')
+    parser.add_argument('--max-bytes-per-second', type=float, default=None, help='Transfer budget shared by all workers (default: unlimited)')
+    parser.add_argument('--cache-dir', type=str, default=None, help='Cache downloaded files in this directory')
+    parser.add_argument('--cache-max-size-mb', type=float, default=None, help='Evict least recently used cache entries above this size')
+    parser.add_argument('--cache-max-age-days', type=float, default=None, help='Evict cache entries older than this')
+    parser.add_argument('--no-revalidate', action='store_true', help='Use cached files without asking the server whether they changed')
+    parser.add_argument('--capability-index', type=str, default=None, help='Resolve station year ranges in one pass and persist them in this file')
+    parser.add_argument('--listing-index', type=str, default=None, help='Plan downloads from server directory listings persisted in this file')
+    parser.add_argument('--refresh-listing', action='store_true', help='Re-list the county before planning with --listing-index')
+    parser.add_argument('--station-catalogue', type=str, default=None, help='Station locations persisted in this file, for --near and --bbox')
+    parser.add_argument('--near', type=str, default=None, metavar='LAT,LON', help='Only download the stations of the county nearest to this point')
+    parser.add_argument('--nearest', type=int, default=5, help='Number of stations selected with --near (default: 5)')
+    parser.add_argument('--bbox', type=str, default=None, metavar='MIN_LAT,MIN_LON,MAX_LAT,MAX_LON', help='Only download the stations of the county inside this box')
+    parser.add_argument('--sync', action='store_true', help='Only fetch station-years that are missing or changed according to the manifest')
+    parser.add_argument('--manifest', type=str, default=DEFAULT_MANIFEST_PATH, help=f'Manifest used by --sync (default: {DEFAULT_MANIFEST_PATH})')
+    parser.add_argument('--dataset-version', type=str, default=DEFAULT_DATASET_VERSION, help=f'Dataset version used by --sync (default: {DEFAULT_DATASET_VERSION})')
+    parser.add_argument('--rehash', action='store_true', help='With --sync, re-hash local files instead of only checking their size')
+    parser.add_argument('--carry-over-unchanged', action='store_true', help='With --sync, keep files from an older dataset version whose remote size is unchanged')
+    parser.add_argument('--parquet-dir', type=str, default=None, help='Also convert downloaded files into a Parquet dataset in this directory (requires pyarrow)')
+    parser.add_argument('--max-attempts', type=int, default=4, help='Attempts per file on transient errors (default: 4)')
+    parser.add_argument('--max-retries-per-run', type=int, default=100, help='Retries allowed across the whole run (default: 100)')
+    parser.add_argument('--journal', type=str, default=None, help=f'Record the progress of the run in this journal (default with --resume: {DEFAULT_JOURNAL_PATH})')
+    parser.add_argument('--resume', action='store_true', help='Continue the run recorded in the journal, skipping completed station-years')
+    parser.add_argument('--metrics-json', type=str, default=None, help='Write a JSON summary of per-file timings, bytes, retries and cache hits to this file ("-" for stdout)')
+    parser.add_argument('--metrics-prometheus', type=str, default=None, help='Write the metrics in the Prometheus text format to this file')
+    parser.add_argument('--metrics-port', type=int, default=None, help='Serve the metrics for Prometheus on this port during the run')
+    parser.add_argument('--output-dir', type=str, default=None, help='Mirror the remote dataset-version/county/station/qc-version tree in this directory (default: flat in the working directory)')
+    parser.add_argument('--compress', type=str, choices=sorted(COMPRESSION_SUFFIXES), default=None, help='Compress hourly files while they are downloaded (zstd requires the zstandard package)')
+    parser.add_argument('--s3-bucket', type=str, default=None, help='Upload hourly files to this S3 bucket instead of writing them to disk (requires boto3)')
+    parser.add_argument('--s3-prefix', type=str, default='', help='Key prefix the remote tree is mirrored under in the bucket')
+    parser.add_argument('--s3-endpoint-url', type=str, default=None, help='Endpoint of an S3-compatible store other than AWS')
+    parser.add_argument('--order', type=str, choices=SCHEDULE_ORDERS, default=LARGEST, help=f'Start the largest files first (sizes from --listing-index or earlier runs) or keep the {GIVEN} order (default: {LARGEST})')
+    parser.add_argument('--priority', type=str, default=None, metavar='STATION=N,...', help='Start the files of stations with a higher priority first (default priority: 0)')
+    parser.add_argument('--no-station-fairness', action='store_true', help='With --order largest, do not let stations take turns')
+    parser.add_argument('--progress', action='store_true', help='Show the files and bytes done, throughput and ETA on stderr')
+    parser.add_argument('--failures-file', type=str, default=None, help='Write the station-years that could not be downloaded to this JSON file')
 
     args = parser.parse_args()
 
     # Split the comma-separated station IDs into a list
     station_ids = [station_id.strip() for station_id in args.station_ids.split(',')]
+    near = bbox = None
+    if args.near or args.bbox:
+        if not args.station_catalogue:
+            parser.error('--near and --bbox require --station-catalogue')
+        try:
+            near = [float(value) for value in args.near.split(',')] if args.near else None
+            bbox = [float(value) for value in args.bbox.split(',')] if args.bbox else None
+        except ValueError:
+            parser.error('--near and --bbox take comma-separated numbers')
+        if (near and len(near) != 2) or (bbox and len(bbox) != 4):
+            parser.error('--near takes LAT,LON and --bbox takes MIN_LAT,MIN_LON,MAX_LAT,MAX_LON')
+    if args.station_ids == 'all':
+        if not args.listing_index and not (near or bbox):
+            parser.error('"all" stations requires --listing-index, or --near/--bbox with --station-catalogue')
+        station_ids = None
+    if args.s3_bucket:
+        local_only = [option for option, value in (('--cache-dir', args.cache_dir), ('--parquet-dir', args.parquet_dir), ('--sync', args.sync), ('--journal', args.journal or args.resume)) if value]
+        if local_only:
+            parser.error(f"--s3-bucket can not be combined with {', '.join(local_only)}, which need local files")
+    if args.compress and args.parquet_dir:
+        parser.error("--compress can not be combined with --parquet-dir")
+    try:
+        priorities = parse_priorities(args.priority) if args.priority else None
+    except ValueError as e:
+        parser.error(f"--priority: {e}")
+
+    set_default_rate_limiter(RateLimiter(
+        requests_per_second=args.max_requests_per_second,
+        bytes_per_second=args.max_bytes_per_second,
+    ))
+
+    cache = None
+    if args.cache_dir:
+        cache = DownloadCache(
+            args.cache_dir,
+            max_size=args.cache_max_size_mb * 1024 * 1024 if args.cache_max_size_mb is not None else None,
+            max_age=args.cache_max_age_days * 24 * 3600 if args.cache_max_age_days is not None else None,
+            revalidate=not args.no_revalidate,
+        )
+
+    sink = LocalSink(args.output_dir, compression=args.compress)
+    if args.s3_bucket:
+        sink = S3Sink(args.s3_bucket, prefix=args.s3_prefix, endpoint_url=args.s3_endpoint_url, compression=args.compress, metadata_sink=LocalSink(args.output_dir))
+
+    columnar_store = None
+    if args.parquet_dir:
+        from .columnar import ColumnarStore
+        columnar_store = ColumnarStore(args.parquet_dir)
 
+    metrics = None
+    if args.metrics_json or args.metrics_prometheus or args.metrics_port is not None:
+        metrics = get_default_tracer().add_hook(MetricsCollector())
+        if args.metrics_port is not None:
+            metrics.start_http_server(args.metrics_port)
+
+    retry_policy = RetryPolicy(max_attempts=args.max_attempts, max_retries_per_run=args.max_retries_per_run)
+    journal = None
+    if args.journal or args.resume:
+        journal = Journal(args.journal or DEFAULT_JOURNAL_PATH, resume=args.resume)
+    retriever = None
+    ftp_pool = None
     try:
-        retriever = Retriever()
-        retriever.download_hourly_files(args.historic_county, station_ids, args.start_year, args.end_year)
+        downloader_options = {}
+        if args.backend == FTP:
+            # One pool for every repository of the run, so logins never exceed the workers
+            from .downloader.ftp_downloader import FTP_SERVER, read_ftp_account
+            from .downloader.ftp_pool import FTPConnectionPool
+            ftp_pool = downloader_options['pool'] = FTPConnectionPool(FTP_SERVER, *read_ftp_account(), size=max(1, args.workers))
+        capability_index = CapabilityIndex(args.capability_index) if args.capability_index else None
+        dataset_index = DatasetIndex(args.listing_index) if args.listing_index else None
+        repository_factory = lambda: Repository(cache=cache, columnar_store=columnar_store, backend=args.backend, sink=sink, downloader_options=downloader_options)
+        if dataset_index and (args.refresh_listing or not dataset_index.has_county(args.historic_county)):
+            dataset_index.crawl(repository_factory, args.workers, [args.historic_county])
+        if station_ids is None and dataset_index:
+            station_ids = dataset_index.stations(args.historic_county)
+        if near or bbox:
+            catalogue = StationCatalogue(args.station_catalogue)
+            if station_ids:
+                unresolved = catalogue.update(args.historic_county, station_ids, repository_factory, args.workers)
+                if unresolved:
+                    print(f"Could not locate stations: {', '.join(unresolved)}")
+            station_ids = catalogue.select(args.historic_county, near=near, count=args.nearest, bbox=bbox, station_ids=station_ids)
+            print(f"Selected stations: {', '.join(station_ids) or 'none'}")
+        manifest = Manifest(args.manifest) if args.sync else None
+        progress = None
+        if args.progress:
+            display = ProgressDisplay(sys.stderr)
+            progress = Progress(display, interval=1.0 if display.is_terminal else 30.0)
+        retriever = Retriever(
+            workers=args.workers, repository_factory=repository_factory, capability_index=capability_index, dataset_index=dataset_index,
+            retry_policy=retry_policy, journal=journal, scheduler=Scheduler(args.order, priorities, fair=not args.no_station_fairness),
+            progress=progress, size_estimator=SizeEstimator(dataset_index=dataset_index, manifest=manifest, journal=journal),
+        )
+        if args.sync:
+            retriever.sync_hourly_files(
+                args.historic_county, station_ids, args.start_year, args.end_year, manifest,
+                dataset_version=args.dataset_version, verify=args.rehash, carry_over_unchanged=args.carry_over_unchanged,
+            )
+        else:
+            retriever.download_hourly_files(args.historic_county, station_ids, args.start_year, args.end_year)
     except Exception as e:
         print(f"An error occurred: {str(e)}")
 
+    if retriever and retriever.failures:
+        print(f"Failed to download {len(retriever.failures)} station-years:")
+        for failure in retriever.failures:
+            print(f"  {failure['station_id']} {failure['year']}: {failure['kind']} error after {failure['attempts']} attempt(s): {failure['error']}")
+    if retriever and args.failures_file:
+        with open(args.failures_file, 'w') as f:
+            json.dump(retriever.failures, f, indent=2)
+
+    if journal:
+        journal.close()
+        summary = journal.summary()
+        print(f"Journal: {summary['completed']} completed, {summary['failed']} failed, {summary['planned'] + summary['started']} unfinished")
+
+    if cache:
+        stats = cache.stats()
+        print(f"Cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries, {stats['size']} bytes")
+
+    if metrics:
+        if args.metrics_json == '-':
+            print(json.dumps(metrics.summary(), indent=2))
+        elif args.metrics_json:
+            metrics.write_json(args.metrics_json)
+        if args.metrics_prometheus:
+            metrics.write_prometheus(args.metrics_prometheus)
+        metrics.stop_http_server()
+
+    if ftp_pool:
+        ftp_pool.close()
+    if args.backend == DAP:
+        from .downloader.credentials import stop_default_credential_manager
+        stop_default_credential_manager()
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from typing import List
+
+from .downloader.async_dap_downloader import AsyncHTTPDownloader
+from .downloader.errors import DownloadError, RetriesExhaustedError
+from .downloader.retry import RetryPolicy
+from .downloader.tracing import get_default_tracer
+from .parser import StationCapabilities
+from .repository import _dataset_version_kwargs
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_IN_FLIGHT = 100
+
+
+class AsyncRepository:
+    """The asyncio counterpart of Repository, backed by an AsyncHTTPDownloader."""
+
+    def __init__(self, downloader=None):
+        self.downloader = downloader or AsyncHTTPDownloader()
+
+    async def initialize(self):
+        await self.downloader.init()
+
+    async def cleanup(self):
+        await self.downloader.cleanup()
+
+    async def reauthenticate(self):
+        logger.info("Re-authenticating downloader")
+        await self.downloader.reauthenticate()
+
+    async def get_station_capabilities(self, historic_county, station_id, dataset_version=None):
+        capabilities_file = await self.download_station_capabilities(historic_county, station_id, dataset_version)
+        if capabilities_file:
+            return StationCapabilities(capabilities_file)
+        return None
+
+    async def download_station_capabilities(self, historic_county, station_id, dataset_version=None):
+        file_path = self.downloader.get_station_capabilities_path(historic_county, station_id, **_dataset_version_kwargs(dataset_version))
+        try:
+            logger.info(f"Downloading station capabilities file: {file_path}")
+            return await self.downloader.download(file_path)
+        except DownloadError as e:
+            logger.error(f"Error downloading station capabilities file: {file_path}. Error: {str(e)}")
+            return None
+
+    async def download_hourly_file(self, historic_county, station_id, year, quality_control_version, dataset_version=None):
+        file_path = self.downloader.get_hourly_path(historic_county, station_id, quality_control_version, year, **_dataset_version_kwargs(dataset_version))
+        logger.info(f"Downloading file: {file_path}")
+        local_file_path = await self.downloader.download(file_path)
+        logger.info(f"Downloaded file: {local_file_path}")
+        return local_file_path
+
+
+class AsyncRetriever:
+    """
+    The asyncio counterpart of Retriever. Capability files and hourly files are
+    fetched concurrently, with at most max_in_flight requests outstanding.
+    Failed downloads are retried according to retry_policy and the station-years
+    it gives up on are listed in self.failures.
+    """
+
+    def __init__(self, repository=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT, retry_policy=None, tracer=None):
+        self.repository = repository or AsyncRepository()
+        self.max_in_flight = max_in_flight
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.tracer = tracer or get_default_tracer()
+        self.failures = []
+
+    async def _get_station_years(self, semaphore, historic_county, station_id, dataset_version):
+        with self.tracer.span('file', kind='capabilities', historic_county=historic_county, station_id=station_id) as span:
+            async with semaphore:
+                capabilities = await self.repository.get_station_capabilities(historic_county, station_id, dataset_version)
+            span.attributes['outcome'] = 'ok' if capabilities else 'failed'
+        return capabilities.get_station_years() if capabilities else (None, None)
+
+    async def _download_station_year(self, semaphore, historic_county, station_id, year, quality_control_version, dataset_version):
+        async def download():
+            async with semaphore:
+                return await self.repository.download_hourly_file(historic_county, station_id, year, quality_control_version, dataset_version)
+
+        with self.tracer.span('file', kind='hourly', historic_county=historic_county, station_id=station_id, year=year) as span:
+            span.attributes['outcome'] = 'failed'
+            try:
+                local_file_path = await self.retry_policy.call_async(download, f"station {station_id}, year {year}", self.repository.reauthenticate)
+            except RetriesExhaustedError as e:
+                self.failures.append({
+                    'historic_county': historic_county,
+                    'station_id': station_id,
+                    'year': year,
+                    'kind': e.kind,
+                    'attempts': e.attempts,
+                    'error': str(e.error),
+                })
+                return None
+            span.attributes['outcome'] = 'ok'
+            return local_file_path
+
+    async def download_hourly_files(self, historic_county, station_ids: List[str], start_year: int, end_year: int,
+                                    quality_control_version="1", dataset_version=None):
+        """
+        Download the hourly files of the stations for every year in the range. Stations
+        whose capabilities do not cover the whole range are skipped, as with Retriever.
+
+        Returns:
+            List[str]: The local files, in station/year order.
+        """
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        downloaded_files = []
+        self.failures = []
+        self.retry_policy.reset()
+        await self.repository.initialize()
+        try:
+            station_years = await asyncio.gather(*(
+                self._get_station_years(semaphore, historic_county, station_id, dataset_version) for station_id in station_ids
+            ))
+            work = []
+            for station_id, (first_year, last_year) in zip(station_ids, station_years):
+                if first_year is None or not (start_year >= first_year and end_year <= last_year):
+                    logger.warning(f"Requested years are not within the available range for station {station_id}")
+                    continue
+                work.extend((station_id, year) for year in range(start_year, end_year + 1))
+            results = await asyncio.gather(*(
+                self._download_station_year(semaphore, historic_county, station_id, year, quality_control_version, dataset_version)
+                for station_id, year in work
+            ))
+            downloaded_files = [local_file_path for local_file_path in results if local_file_path]
+        finally:
+            await self.repository.cleanup()
+        logger.info(f"Downloaded {len(downloaded_files)} files.")
+        return downloaded_files
+
+    def download_hourly_files_sync(self, *args, **kwargs):
+        """Blocking wrapper around download_hourly_files for callers without an event loop."""
+        return asyncio.run(self.download_hourly_files(*args, **kwargs))
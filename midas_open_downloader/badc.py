@@ -0,0 +1,302 @@
+import csv
+import mmap
+import datetime
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Column types of the parsed data section
+TIMESTAMP = 'timestamp'
+FLOAT = 'float'
+INT = 'int'
+STRING = 'string'
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+TIMESTAMP_COLUMNS = ('ob_time', 'ob_end_time', 'meto_stmp_time', 'midas_stmp_etime')
+NA_VALUES = ('', 'NA')
+
+_BADC_TYPES = {'float': FLOAT, 'real': FLOAT, 'double': FLOAT, 'int': INT, 'integer': INT}
+
+
+class BadcHeader:
+    """
+    The metadata block of a BADC-CSV file up to and including the column names
+    that follow the `data` line.
+    """
+
+    def __init__(self, metadata: Dict[str, List[Tuple[str, List[str]]]], columns: List[str], data_offset: int):
+        """
+        Args:
+            metadata: Label -> [(reference, values)], as parse_badc_csv_metadata returns it.
+            columns: The column names of the data section.
+            data_offset: Byte offset of the first data row.
+        """
+        self.metadata = metadata
+        self.columns = columns
+        self.data_offset = data_offset
+
+    def declared_types(self) -> Dict[str, str]:
+        """The `type` declared for each column in the metadata block (e.g. 'float', 'char')."""
+        return {reference: values[0].strip().lower() for reference, values in self.metadata.get('type', []) if values}
+
+    def column_types(self) -> Dict[str, str]:
+        """
+        The type of every data column: TIMESTAMP, FLOAT, INT or STRING.
+
+        Declared types are used where present. Without one, QC flag columns
+        (`*_q`) are INT and everything else is STRING; time columns are always
+        TIMESTAMP.
+        """
+        declared = self.declared_types()
+        types = {}
+        for column in self.columns:
+            if column in TIMESTAMP_COLUMNS:
+                types[column] = TIMESTAMP
+            elif column.endswith('_q'):
+                types[column] = INT
+            else:
+                types[column] = _BADC_TYPES.get(declared.get(column), STRING)
+        return types
+
+
+def read_badc_header(binary_file) -> BadcHeader:
+    """
+    Read the metadata block and column names from a binary file object or mmap,
+    leaving it positioned at the first data row.
+
+    Raises:
+        ValueError: If the file has no data section.
+    """
+    metadata = {}
+    offset = 0
+    for line in iter(binary_file.readline, b''):
+        offset += len(line)
+        row = next(csv.reader([line.decode('utf-8', errors='replace')]), [])
+        if row and row[0].strip().lower() == 'data':
+            columns_line = binary_file.readline()
+            offset += len(columns_line)
+            columns = [column.strip() for column in next(csv.reader([columns_line.decode('utf-8')]), [])]
+            return BadcHeader(metadata, columns, offset)
+        if len(row) >= 3:
+            metadata.setdefault(row[0].strip(), []).append((row[1].strip(), [value.strip() for value in row[2:]]))
+    raise ValueError("No data section in BADC-CSV file")
+
+
+def read_badc_header_from_path(file_path: str) -> BadcHeader:
+    with open(file_path, 'rb') as binary_file:
+        return read_badc_header(binary_file)
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return int(float(value))
+
+
+def _to_timestamp(value):
+    return datetime.datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+_CONVERTERS = {FLOAT: float, INT: _to_int, TIMESTAMP: _to_timestamp}
+
+
+class BadcRecordParser:
+    """
+    An incremental BADC-CSV parser: bytes are fed in as they arrive and every
+    complete data row comes out as a typed record, so a file can be consumed
+    while it is still being transferred. Only the current partial line is
+    buffered.
+
+    Records map column names to float, int, datetime or str values, or None
+    for empty fields and 'NA'.
+    """
+
+    def __init__(self):
+        self.header = None
+        self.finished = False
+        self._metadata = {}
+        self._buffer = b''
+        self._offset = 0
+        self._in_data = False
+        self._converters = None
+
+    def feed(self, chunk: bytes) -> List[dict]:
+        """Parse chunk and return the records of the lines it completed."""
+        if self.finished:
+            return []
+        lines = (self._buffer + chunk).split(b'\n')
+        self._buffer = lines.pop()
+        return self._parse_lines(lines)
+
+    def close(self) -> List[dict]:
+        """Parse whatever is left after the last newline."""
+        lines, self._buffer = [self._buffer], b''
+        records = self._parse_lines(lines) if lines[0].strip() and not self.finished else []
+        if self.header is None:
+            raise ValueError("No data section in BADC-CSV file")
+        return records
+
+    def _parse_lines(self, lines):
+        records = []
+        for row in csv.reader(line.decode('utf-8', errors='replace') for line in self._track_offset(lines)):
+            if self.finished:
+                break
+            if self.header is not None:
+                records.append(self._record(row))
+            elif self._in_data:
+                self.header = BadcHeader(self._metadata, [column.strip() for column in row], self._offset)
+                types = self.header.column_types()
+                self._converters = [(column, _CONVERTERS.get(types[column])) for column in self.header.columns]
+            elif row and row[0].strip().lower() == 'data':
+                self._in_data = True
+            elif len(row) >= 3:
+                self._metadata.setdefault(row[0].strip(), []).append((row[1].strip(), [value.strip() for value in row[2:]]))
+        return [record for record in records if record is not None]
+
+    def _track_offset(self, lines):
+        for line in lines:
+            if self.header is None:
+                self._offset += len(line) + 1
+            yield line
+
+    def _record(self, row):
+        if not row:
+            return None
+        if row[0].strip().lower() == 'end data':
+            self.finished = True
+            return None
+        record = {}
+        for (column, convert), value in zip(self._converters, row):
+            value = value.strip()
+            if value in NA_VALUES:
+                record[column] = None
+            elif convert is None:
+                record[column] = value
+            else:
+                try:
+                    record[column] = convert(value)
+                except ValueError:
+                    logger.warning(f"Can not parse {column} value: {value}")
+                    record[column] = None
+        return record
+
+
+def iter_badc_records(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """Yield the typed records of a BADC-CSV file arriving as an iterable of byte chunks."""
+    parser = BadcRecordParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+# INT columns are parsed as float64 and then masked, which is much faster than
+# letting the CSV parser produce nullable integers directly
+_PANDAS_DTYPES = {FLOAT: 'float64', INT: 'float64', STRING: object, TIMESTAMP: object}
+
+
+def _nullable_int(values):
+    import numpy as np
+    import pandas as pd
+
+    mask = np.isnan(values)
+    return pd.arrays.IntegerArray(np.where(mask, 0, values).astype('int64'), mask)
+
+
+def load_badc_dataframe(file_path: str, columns: Optional[List[str]] = None, use_mmap=True):
+    """
+    Load the data section of a BADC-CSV file into a pandas DataFrame in one
+    vectorized pass.
+
+    The header is read once for the column names and types, then the data rows
+    are handed to pandas' C parser with explicit dtypes: FLOAT columns become
+    float64, INT columns nullable Int64, TIMESTAMP columns datetime64 and the
+    rest strings. Empty fields and 'NA' are missing values.
+
+    Args:
+        file_path (str): The BADC-CSV file.
+        columns (List[str]): Only load these columns.
+        use_mmap (bool): Memory-map the file instead of reading it through a buffer.
+
+    Returns:
+        pandas.DataFrame
+    """
+    with open(file_path, 'rb') as file_object:
+        source = mmap.mmap(file_object.fileno(), 0, access=mmap.ACCESS_READ) if use_mmap else file_object
+        try:
+            header = read_badc_header(source)
+            return load_badc_rows(source, header, columns)
+        finally:
+            if use_mmap:
+                source.close()
+
+
+def load_badc_rows(source, header: BadcHeader, columns: Optional[List[str]] = None):
+    """
+    Parse data rows of a BADC-CSV file into a typed pandas DataFrame, as
+    load_badc_dataframe does. source is a binary file object positioned at a
+    data row, e.g. after read_badc_header or holding a byte range of rows.
+
+    Args:
+        header (BadcHeader): The header of the file the rows belong to.
+        columns (List[str]): Only load these columns.
+
+    Returns:
+        pandas.DataFrame
+    """
+    import pandas as pd
+
+    types = header.column_types()
+    first_column = header.columns[0]
+    usecols = None
+    if columns is not None:
+        # The first column is needed to find the `end data` trailer
+        usecols = [first_column] + [column for column in columns if column != first_column]
+    frame = pd.read_csv(
+        source,
+        header=None,
+        names=header.columns,
+        usecols=usecols,
+        dtype={column: _PANDAS_DTYPES[types[column]] for column in header.columns},
+        na_values=list(NA_VALUES),
+        keep_default_na=False,
+        engine='c',
+    )
+
+    # The `end data` trailer is parsed as a last row with a single field
+    if len(frame) and str(frame[first_column].iloc[-1]).strip().lower() == 'end data':
+        frame = frame.iloc[:-1]
+    converted = {}
+    for column in frame.columns:
+        if types[column] == TIMESTAMP:
+            converted[column] = pd.to_datetime(frame[column], format=TIMESTAMP_FORMAT)
+        elif types[column] == INT:
+            converted[column] = _nullable_int(frame[column].to_numpy())
+        elif types[column] == STRING:
+            converted[column] = frame[column].astype('string')
+    frame = frame.assign(**converted)
+    if columns is not None:
+        frame = frame[list(columns)]
+    return frame.reset_index(drop=True)
+
+
+def load_badc_arrays(file_path: str, columns: Optional[List[str]] = None, use_mmap=True):
+    """
+    Like load_badc_dataframe, but return a NumPy array per column. INT columns
+    with missing values are float64 with NaN; missing timestamps are NaT and
+    missing strings None.
+
+    Returns:
+        Dict[str, numpy.ndarray]
+    """
+    frame = load_badc_dataframe(file_path, columns, use_mmap)
+    arrays = {}
+    for column in frame.columns:
+        if frame[column].dtype == 'Int64':
+            has_na = frame[column].isna().any()
+            arrays[column] = frame[column].to_numpy(dtype='float64' if has_na else 'int64', na_value=float('nan') if has_na else None)
+        elif frame[column].dtype == 'string':
+            arrays[column] = frame[column].to_numpy(dtype=object, na_value=None)
+        else:
+            arrays[column] = frame[column].to_numpy()
+    return arrays
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+
+from .downloader.integrity import get_default_checksum_registry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = './.cache'
+
+_DATASET_VERSION_PATTERN = re.compile(r'dataset-version-(\w+)')
+
+
+def dataset_version_of(remote_path):
+    """Return the dataset version embedded in a MIDAS Open path, or '' if there is none."""
+    match = _DATASET_VERSION_PATTERN.search(remote_path)
+    return match.group(1) if match else ''
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def recorded_sha256(file_path):
+    """The SHA-256 of file_path computed while it was downloaded; the file is only hashed if there is none."""
+    entry = get_default_checksum_registry().lookup(file_path)
+    return entry['sha256'] if entry else file_sha256(file_path)
+
+
+class DownloadCache:
+    """
+    A persistent, content-addressed cache of downloaded files.
+
+    Entries are keyed by dataset version and remote path and point at a blob
+    stored under its SHA-256 digest, so identical files are stored once. Each
+    entry keeps the remote validators (ETag/Last-Modified for DAP, MDTM/SIZE
+    for FTP) used for conditional requests. Files are cached as the sink stored
+    them, so compressed copies are kept apart from uncompressed ones by their
+    compression.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=None, max_age=None, revalidate=True):
+        """
+        Args:
+            cache_dir (str): Directory holding the index and the blobs.
+            max_size (int): Evict least recently used entries above this many bytes.
+            max_age (float): Evict entries stored more than this many seconds ago.
+            revalidate (bool): Ask the server whether a cached file changed before using it.
+                Dataset versions are immutable, so this can be turned off.
+        """
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.max_size = max_size
+        self.max_age = max_age
+        self.revalidate = revalidate
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.entries = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(temp_path, self.index_path)
+
+    def _key(self, remote_path, compression=None):
+        key = f"{dataset_version_of(remote_path)}:{remote_path}"
+        return f"{key}:{compression}" if compression else key
+
+    def _blob_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def lookup(self, remote_path, compression=None):
+        """Return the cache entry for remote_path stored with compression, or None if it is not cached."""
+        with self._lock:
+            entry = self.entries.get(self._key(remote_path, compression))
+            if entry and not os.path.exists(self._blob_path(entry['digest'])):
+                del self.entries[self._key(remote_path, compression)]
+                return None
+            return entry
+
+    def restore(self, remote_path, entry, local_file_path):
+        """Copy the cached blob for entry to local_file_path and count a hit."""
+        if os.path.dirname(local_file_path):
+            os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+        shutil.copyfile(self._blob_path(entry['digest']), local_file_path)
+        with self._lock:
+            entry['last_used'] = time.time()
+            self.hits += 1
+            self._save_index()
+        logger.info(f"Cache hit: {remote_path}")
+        return local_file_path
+
+    def store(self, remote_path, local_file_path, validators=None, compression=None):
+        """Add a freshly downloaded file, as stored with compression, to the cache and count a miss."""
+        digest = recorded_sha256(local_file_path)
+        blob_path = self._blob_path(digest)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            temp_path = f"{blob_path}.{threading.get_ident()}.tmp"
+            shutil.copyfile(local_file_path, temp_path)
+            os.replace(temp_path, blob_path)
+        now = time.time()
+        with self._lock:
+            self.misses += 1
+            self.entries[self._key(remote_path, compression)] = {
+                'remote_path': remote_path,
+                'dataset_version': dataset_version_of(remote_path),
+                'compression': compression,
+                'digest': digest,
+                'size': os.path.getsize(blob_path),
+                'validators': validators or {},
+                'stored_at': now,
+                'last_used': now,
+            }
+            self._evict(now)
+            self._save_index()
+
+    def evict(self):
+        with self._lock:
+            self._evict(time.time())
+            self._save_index()
+
+    def _evict(self, now):
+        evicted = []
+        if self.max_age is not None:
+            for key, entry in list(self.entries.items()):
+                if now - entry['stored_at'] > self.max_age:
+                    evicted.append(self.entries.pop(key))
+        if self.max_size is not None:
+            by_last_use = sorted(self.entries.items(), key=lambda item: item[1]['last_used'])
+            while by_last_use and self._total_size() > self.max_size:
+                key, _ = by_last_use.pop(0)
+                evicted.append(self.entries.pop(key))
+        if evicted:
+            referenced = {entry['digest'] for entry in self.entries.values()}
+            for entry in evicted:
+                if entry['digest'] not in referenced:
+                    try:
+                        os.remove(self._blob_path(entry['digest']))
+                    except OSError:
+                        pass
+            logger.info(f"Evicted {len(evicted)} cache entries")
+
+    def _total_size(self):
+        sizes = {entry['digest']: entry['size'] for entry in self.entries.values()}
+        return sum(sizes.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self.entries),
+                'size': self._total_size(),
+            }
@@ -0,0 +1,95 @@
+import json
+import logging
+import os
+import threading
+
+from .downloader.abstract_downloader import DEFAULT_DATASET_VERSION
+from .pool import RepositoryPool, run_in_pool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPABILITY_INDEX_PATH = './midas_capabilities.json'
+
+
+def _station_key(dataset_version, historic_county, station_id):
+    return f"{dataset_version}/{historic_county}/{station_id}"
+
+
+class CapabilityIndex:
+    """
+    The available year range of every known station, keyed by dataset version,
+    historic county and station id.
+
+    Missing stations are resolved in one concurrent pass over their capability
+    files. With a path the index is persisted, so later runs validate year
+    ranges without any round-trips.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                self.entries = json.load(f)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(self.entries, f, sort_keys=True)
+            os.replace(temp_path, self.path)
+
+    def get_station_years(self, historic_county, station_id, dataset_version=DEFAULT_DATASET_VERSION):
+        """Return (first_year, last_year) for the station, or None if it is not indexed."""
+        years = self.entries.get(_station_key(dataset_version, historic_county, station_id))
+        return tuple(years) if years else None
+
+    def set_station_years(self, historic_county, station_id, first_year, last_year, dataset_version=DEFAULT_DATASET_VERSION):
+        with self._lock:
+            self.entries[_station_key(dataset_version, historic_county, station_id)] = [int(first_year), int(last_year)]
+
+    def update(self, historic_county, station_ids, repository_factory, workers=1, dataset_version=DEFAULT_DATASET_VERSION, repository=None):
+        """
+        Fetch and parse the capability files of all stations that are not indexed yet.
+
+        Args:
+            repository_factory (callable): Creates the repositories used to download the files.
+            workers (int): Number of capability files fetched concurrently.
+            repository (Repository): An initialised repository used instead with one worker,
+                so no second downloader has to log in.
+
+        Returns:
+            List[str]: The station ids that could not be resolved.
+        """
+        missing = [station_id for station_id in station_ids
+                   if self.get_station_years(historic_county, station_id, dataset_version) is None]
+        if not missing:
+            return []
+
+        logger.info(f"Resolving capabilities for {len(missing)} stations")
+
+        def resolve(repository, station_id):
+            capabilities = repository.get_station_capabilities(historic_county, station_id, dataset_version)
+            return capabilities.get_station_years() if capabilities else (None, None)
+
+        if repository is not None and workers <= 1:
+            results = [resolve(repository, station_id) for station_id in missing]
+        else:
+            pool = RepositoryPool(repository_factory)
+            try:
+                results = run_in_pool(pool, missing, resolve, max(1, workers))
+            finally:
+                pool.cleanup()
+
+        unresolved = []
+        for station_id, (first_year, last_year) in zip(missing, results):
+            if first_year is None or last_year is None:
+                logger.error(f"Can not parse station years for station {station_id}")
+                unresolved.append(station_id)
+            else:
+                self.set_station_years(historic_county, station_id, first_year, last_year, dataset_version)
+        self.save()
+        return unresolved
@@ -0,0 +1,153 @@
+import os
+import logging
+from typing import List, Optional
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as pa_dataset
+import pyarrow.parquet as pq
+
+from .badc import read_badc_header, NA_VALUES, TIMESTAMP, TIMESTAMP_FORMAT, FLOAT, INT
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_DIR = './midas_parquet'
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+_ARROW_TYPES = {TIMESTAMP: pa.timestamp('s'), FLOAT: pa.float64(), INT: pa.int32()}
+
+PARTITIONING = pa_dataset.partitioning(
+    pa.schema([
+        ('quality_control_version', pa.string()),
+        ('station_id', pa.string()),
+        ('year', pa.int32()),
+    ]),
+    flavor='hive',
+)
+
+
+def arrow_schema(header):
+    """The Arrow schema of a BADC-CSV data section, from the header's column types."""
+    types = header.column_types()
+    return pa.schema([(column, _ARROW_TYPES.get(types[column], pa.string())) for column in header.columns])
+
+
+def _skip_trailer(row):
+    """Skip the `end data` trailer, which has a single column; other malformed rows are errors."""
+    return 'skip' if row.text.strip().lower() == 'end data' else 'error'
+
+
+def iter_record_batches(file_path, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Parse the data section of a BADC-CSV file into typed Arrow record batches,
+    reading block_size bytes at a time, so memory use does not depend on the
+    file size.
+
+    Returns:
+        Tuple[pa.Schema, Iterator[pa.RecordBatch]]
+    """
+    file_object = open(file_path, 'rb')
+    try:
+        header = read_badc_header(file_object)
+        schema = arrow_schema(header)
+        file_object.seek(header.data_offset)
+        reader = pa_csv.open_csv(
+            file_object,
+            read_options=pa_csv.ReadOptions(column_names=header.columns, block_size=block_size),
+            parse_options=pa_csv.ParseOptions(invalid_row_handler=_skip_trailer),
+            convert_options=pa_csv.ConvertOptions(
+                column_types=schema,
+                null_values=list(NA_VALUES),
+                strings_can_be_null=True,
+                timestamp_parsers=[TIMESTAMP_FORMAT],
+            ),
+        )
+    except Exception:
+        file_object.close()
+        raise
+
+    def batches():
+        try:
+            for batch in reader:
+                yield batch
+        finally:
+            file_object.close()
+
+    return schema, batches()
+
+
+class ColumnarStore:
+    """
+    A Parquet dataset of hourly observations, partitioned by quality control
+    version, station and year:
+
+        <root>/quality_control_version=1/station_id=00622_keele/year=2022/part-0.parquet
+
+    Each BADC-CSV file is converted once with typed columns (timestamps,
+    floats, QC flags), so analyses read only the columns they need instead of
+    re-parsing the CSV files.
+    """
+
+    def __init__(self, root=DEFAULT_STORE_DIR, block_size=DEFAULT_BLOCK_SIZE, compression='zstd'):
+        """
+        Args:
+            root (str): Directory of the dataset.
+            block_size (int): Bytes of CSV parsed and written per row group.
+            compression (str): Parquet compression codec.
+        """
+        self.root = root
+        self.block_size = block_size
+        self.compression = compression
+
+    def partition_path(self, station_id, year, quality_control_version="1"):
+        return os.path.join(self.root, f"quality_control_version={quality_control_version}", f"station_id={station_id}", f"year={year}", "part-0.parquet")
+
+    def is_current(self, local_file_path, station_id, year, quality_control_version="1"):
+        """True if the partition was written from local_file_path, or from a copy that is not older."""
+        path = self.partition_path(station_id, year, quality_control_version)
+        return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(local_file_path)
+
+    def write_hourly_file(self, local_file_path, station_id, year, quality_control_version="1"):
+        """
+        Convert a downloaded hourly file into its partition, streaming block by block.
+
+        Returns:
+            str: The path of the Parquet file.
+        """
+        path = self.partition_path(station_id, year, quality_control_version)
+        if self.is_current(local_file_path, station_id, year, quality_control_version):
+            logger.info(f"Columnar partition is up to date: {path}")
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Hidden, so a leftover of an interrupted conversion is not read as part of the dataset
+        part_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.part")
+        schema, batches = iter_record_batches(local_file_path, self.block_size)
+        rows = 0
+        with pq.ParquetWriter(part_path, schema, compression=self.compression) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        os.replace(part_path, path)
+        logger.info(f"Wrote {rows} rows to {path}")
+        return path
+
+    def dataset(self):
+        """The store as a pyarrow dataset; the partition keys are available as columns."""
+        return pa_dataset.dataset(self.root, format='parquet', partitioning=PARTITIONING)
+
+    def read(self, station_ids: Optional[List[str]] = None, start_year: Optional[int] = None, end_year: Optional[int] = None,
+             columns: Optional[List[str]] = None, quality_control_version="1"):
+        """
+        Load observations into an Arrow table, reading only the matching partitions and columns.
+
+        Returns:
+            pa.Table
+        """
+        condition = pa_dataset.field('quality_control_version') == quality_control_version
+        if station_ids is not None:
+            condition = condition & pa_dataset.field('station_id').isin(station_ids)
+        if start_year is not None:
+            condition = condition & (pa_dataset.field('year') >= start_year)
+        if end_year is not None:
+            condition = condition & (pa_dataset.field('year') <= end_year)
+        return self.dataset().to_table(columns=columns, filter=condition)
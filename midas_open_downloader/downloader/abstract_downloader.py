@@ -1,15 +1,59 @@
 import logging
-import time
 from abc import ABC, abstractmethod
 from .errors import DownloadError
+from .rate_limiter import get_default_rate_limiter
+from .sinks import LocalSink
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class MidasOpenDownloader(ABC):
-    def __init__(self):
-        pass
+DEFAULT_DATASET_VERSION = "202308"
+
+class DatasetDownloader(ABC):
+    """
+    What the sync and asyncio downloaders share: the rate limiter, the sink and
+    the remote and local paths of the dataset files. Subclasses set base_path.
+    """
+
+    def __init__(self, rate_limiter=None, sink=None):
+        self.rate_limiter = rate_limiter or get_default_rate_limiter()
+        # Where downloaded files are stored; by default flat in the working directory
+        self.sink = sink or LocalSink()
+        # Remote validators of the last successful download, used for conditional requests
+        self.last_validators = {}
+        # Size, SHA-256 and checks passed of the last successful download (see integrity.ChecksumRegistry)
+        self.last_checksum = None
+
+    def relative_path(self, file_path):
+        """file_path relative to the dataset base path, or just its name if it is outside of it."""
+        base_path = self.base_path.rstrip('/') + '/'
+        if file_path.startswith(base_path):
+            return file_path[len(base_path):]
+        return file_path.rsplit('/', 1)[-1]
+
+    def local_path(self, file_path):
+        """The location download() stores file_path at, as decided by the sink."""
+        return self.sink.location(self.relative_path(file_path))
+
+    def get_directory_path(self, dataset_version=DEFAULT_DATASET_VERSION, historic_county=None, station=None, qcv=None):
+        parts = [self.base_path, f"dataset-version-{dataset_version}"]
+        for part in (historic_county, station, f"qc-version-{qcv}" if qcv else None):
+            if part is None:
+                break
+            parts.append(part)
+        return "/".join(parts)
 
+    def get_hourly_path(self, historic_county, station, qcv, year, dataset_version=DEFAULT_DATASET_VERSION):
+        filebasename = "midas-open_uk-hourly-weather-obs"
+        file_path = f"{self.base_path}/dataset-version-{dataset_version}/{historic_county}/{station}/qc-version-{qcv}/{filebasename}_dv-{dataset_version}_{historic_county}_{station}_qcv-{qcv}_{year}.csv"
+        return file_path
+
+    def get_station_capabilities_path(self, historic_county, station_id, dataset_version=DEFAULT_DATASET_VERSION):
+        filebasename = "midas-open_uk-hourly-weather-obs"
+        file_path = f"{self.base_path}/dataset-version-{dataset_version}/{historic_county}/{station_id}/{filebasename}_dv-{dataset_version}_{historic_county}_{station_id}_capability.csv"
+        return file_path
+
+
+class MidasOpenDownloader(DatasetDownloader):
     @abstractmethod
     def init(self):
         pass
@@ -22,22 +66,82 @@ class MidasOpenDownloader(ABC):
     def setup_credentials(self):
         pass
 
+    def reauthenticate(self):
+        """Start over with fresh credentials after the server rejected the current ones."""
+        self.cleanup()
+        self.init()
+
     @abstractmethod
-    def download(self, file_path):
+    def download(self, file_path, validators=None):
+        """
+        Download file_path and return the local file path. If validators from an
+        earlier download are given and the remote file still matches them,
+        NotModifiedError is raised instead of transferring the file.
+        """
+        pass
+
+    @abstractmethod
+    def iter_chunks(self, file_path):
+        """
+        Yield the content of file_path as byte chunks while it is being transferred,
+        without writing it to disk.
+        """
+        pass
+
+    @abstractmethod
+    def probe(self, file_path):
+        """
+        Return the remote size and validators of file_path without transferring it.
+        """
+        pass
+
+    @abstractmethod
+    def list_directory(self, directory_path):
+        """
+        List a remote directory.
+
+        Returns:
+            List[dict]: One dict per entry with 'name', 'type' ('dir' or 'file') and 'size' (bytes or None).
+        """
         pass
 
     def cooldown(self):
-        """Cooldown between downloads"""
-        logger.info("Cooldown...")
-        time.sleep(3)
+        """
+        Cooldown between downloads. Pacing is done by the shared rate limiter
+        before each request, so there is no fixed sleep here any more.
+        """
+        logger.debug("Cooldown handled by rate limiter")
 
-    def get_hourly_path(self, historic_county, station, qcv, year, dataset_version="202308"):
-        filebasename = "midas-open_uk-hourly-weather-obs"
-        file_path = f"{self.base_path}/dataset-version-{dataset_version}/{historic_county}/{station}/qc-version-{qcv}/{filebasename}_dv-{dataset_version}_{historic_county}_{station}_qcv-{qcv}_{year}.csv"
-        return file_path
 
-    def get_station_capabilities_path(self, historic_county, station_id, dataset_version="202308"):
-        filebasename = "midas-open_uk-hourly-weather-obs"
-        file_path = f"{self.base_path}/dataset-version-{dataset_version}/{historic_county}/{station_id}/{filebasename}_dv-{dataset_version}_{historic_county}_{station_id}_capability.csv"
-        return file_path
+class AsyncMidasOpenDownloader(DatasetDownloader):
+    """The asyncio counterpart of MidasOpenDownloader; the transfer methods are coroutines."""
+
+    @abstractmethod
+    async def init(self):
+        pass
+
+    @abstractmethod
+    async def cleanup(self):
+        pass
+
+    @abstractmethod
+    async def setup_credentials(self):
+        pass
+
+    async def reauthenticate(self):
+        """Start over with fresh credentials after the server rejected the current ones."""
+        await self.cleanup()
+        await self.init()
+
+    @abstractmethod
+    async def download(self, file_path, validators=None):
+        """
+        Download file_path and return the local file path. If validators from an
+        earlier download are given and the remote file still matches them,
+        NotModifiedError is raised instead of transferring the file.
+        """
+        pass
 
+    async def cooldown(self):
+        """Pacing is done by the rate limiter before each request."""
+        logger.debug("Cooldown handled by rate limiter")
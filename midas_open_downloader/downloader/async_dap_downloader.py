@@ -0,0 +1,226 @@
+import asyncio
+import contextlib
+import logging
+import os
+import ssl
+import sys
+import time
+
+import aiohttp
+
+from .abstract_downloader import AsyncMidasOpenDownloader
+from .credentials import get_default_credential_manager
+from .dap_downloader import DEFAULT_CHUNK_SIZE, _int_or_none, _content_range_start, _content_range_total
+from .errors import DownloadError, NotModifiedError
+from .integrity import StreamingChecksum, parse_digest_headers
+from .rate_limiter import HTTP_BACKOFF_STATUS_CODES, RateLimiter, parse_retry_after
+from .tracing import BYTES, CONNECT, CONNECTION_PHASES, DNS, THROTTLE, TRANSFER, TTFB, event, record_phase, timed_phase
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONNECTIONS = 100
+
+
+def _trace_config():
+    """
+    Add DNS and connection setup time to the span of the task making the request.
+    aiohttp reports connection creation including DNS and the TLS handshake, so
+    CONNECT covers TCP connect and TLS here.
+    """
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_dns_resolvehost_start(session, context, params):
+        context.dns_started = time.perf_counter()
+
+    async def on_dns_resolvehost_end(session, context, params):
+        context.dns_seconds = time.perf_counter() - context.dns_started
+        record_phase(DNS, context.dns_seconds)
+
+    async def on_connection_create_start(session, context, params):
+        context.connect_started = time.perf_counter()
+        context.dns_seconds = 0.0
+
+    async def on_connection_create_end(session, context, params):
+        record_phase(CONNECT, time.perf_counter() - context.connect_started - context.dns_seconds)
+
+    trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return trace_config
+
+
+@contextlib.asynccontextmanager
+async def _open_in_thread(partial, append):
+    """partial.open() as an async context manager, opened and closed on a worker thread."""
+    file_object = await asyncio.to_thread(partial.open, append)
+    try:
+        yield file_object
+    except BaseException:
+        await asyncio.to_thread(file_object.__exit__, *sys.exc_info())
+        raise
+    await asyncio.to_thread(file_object.__exit__, None, None, None)
+
+
+class AsyncHTTPDownloader(AsyncMidasOpenDownloader):
+    """
+    An asyncio DAP downloader. All requests share one aiohttp session whose
+    connection pool is capped at max_connections, so hundreds of transfers can
+    be in flight at once. It authenticates with the same shared CredentialManager
+    as HTTPDownloader.
+
+    Unless a rate_limiter is given, requests are not paced: the shared default
+    limiter of the sync downloaders would start only one request per second. The
+    connection cap bounds the load instead, and the limiter still backs off when
+    the server asks to slow down. File I/O runs on worker threads, so a slow disk
+    or sink does not hold up the other transfers.
+    """
+
+    def __init__(self, rate_limiter=None, chunk_size=DEFAULT_CHUNK_SIZE, max_connections=DEFAULT_MAX_CONNECTIONS, credentials=None, sink=None):
+        super().__init__(rate_limiter or RateLimiter(requests_per_second=None), sink)
+        self.base_url = "https://dap.ceda.ac.uk/badc/ukmo-midas-open/data/uk-hourly-weather-obs"
+        self.base_path = self.base_url
+        self.credentials = credentials or get_default_credential_manager()
+        self.cert_file = self.credentials.cert_file
+        self.chunk_size = chunk_size
+        self.max_connections = max_connections
+        self.session = None
+        self._credentials_generation = None
+
+    async def setup_credentials(self):
+        # Issuing a certificate is blocking, so keep it off the event loop
+        self._credentials_generation = await asyncio.to_thread(self.credentials.ensure_valid)
+
+    async def reauthenticate(self):
+        self._credentials_generation = await asyncio.to_thread(self.credentials.refresh, self._credentials_generation)
+        # The certificate is loaded into the connector's SSL context, so start a new session
+        await self.cleanup()
+        await self._open_session()
+
+    def _ssl_context(self):
+        context = ssl.create_default_context()
+        if self.cert_file and os.path.exists(self.cert_file):
+            context.load_cert_chain(self.cert_file)
+        return context
+
+    async def init(self):
+        await self.setup_credentials()
+        await self._open_session()
+        return self
+
+    async def _open_session(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections, ssl=self._ssl_context())
+        cookies = {cookie['name']: cookie['value'] for cookie in self.credentials.cookies()}
+        self.session = aiohttp.ClientSession(connector=connector, cookies=cookies, trace_configs=[_trace_config()])
+
+    async def cleanup(self):
+        if self.session:
+            await self.session.close()
+
+    async def download(self, uri, validators=None):
+        """
+        Stream uri to `<name>.part`, resuming an interrupted transfer with a Range
+        request, and rename it into place once it has the expected size. With
+        validators the request is conditional, as with HTTPDownloader.download.
+        """
+        filename = self.local_path(uri)
+        partial = self.sink.partial(filename)
+        offset = partial.resume_offset(uri)
+        headers = {}
+        if validators and not offset:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+        if offset:
+            metadata = partial.load_metadata()
+            headers['Range'] = f"bytes={offset}-"
+            validator = metadata.get('etag') or metadata.get('last_modified')
+            if validator:
+                headers['If-Range'] = validator
+
+        restart = False
+        await self.rate_limiter.acquire_async()
+        try:
+            with timed_phase(TTFB, exclude=CONNECTION_PHASES):
+                response = await self.session.get(uri, headers=headers)
+            async with response:
+                if response.status in HTTP_BACKOFF_STATUS_CODES:
+                    self.rate_limiter.backoff(parse_retry_after(response.headers.get('Retry-After')))
+                if response.status == 304 and validators:
+                    self.rate_limiter.recover()
+                    raise NotModifiedError(uri)
+                if response.status == 416 and offset:
+                    metadata = partial.load_metadata()
+                    expected_size = metadata.get('size')
+                    published = metadata.get('checksums', {})
+                    checksum = StreamingChecksum(published)
+                    await asyncio.to_thread(checksum.update_from_file, partial.part_path)
+                elif response.status == 206 and _content_range_start(response.headers.get('Content-Range')) != offset:
+                    # Appending another range than the one asked for would corrupt the file
+                    logger.warning(f"Got Content-Range {response.headers.get('Content-Range')} for a request from byte {offset}, "
+                                   f"downloading the whole file: {uri}")
+                    await asyncio.to_thread(partial.discard)
+                    restart = True
+                else:
+                    response.raise_for_status()
+                    expected_size, checksum, published = await self._write_response(response, partial, uri)
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise DownloadError(e)
+        if restart:
+            return await self.download(uri, validators)
+
+        metadata = partial.load_metadata() or {}
+        mismatches = checksum.mismatches(published) if checksum.size == expected_size or expected_size is None else []
+        if mismatches:
+            await asyncio.to_thread(partial.discard)
+            raise DownloadError(f"Corrupt download of {uri}: {', '.join(mismatches)} checksum mismatch")
+        if not await asyncio.to_thread(partial.commit, expected_size):
+            if status == 416:
+                await asyncio.to_thread(partial.discard)
+            raise DownloadError(f"Incomplete download of {uri}: expected {expected_size} bytes")
+        checks = (['size'] if expected_size is not None else []) + sorted(published)
+        self.last_checksum = await asyncio.to_thread(partial.record, checksum, checks)
+        self.last_validators = {'etag': metadata.get('etag'), 'last_modified': metadata.get('last_modified')}
+        self.rate_limiter.recover()
+        return filename
+
+    async def _write_response(self, response, partial, uri):
+        published = parse_digest_headers(response.headers, whole_body=response.status != 206)
+        if response.status == 206:
+            mode = 'ab'
+            expected_size = _content_range_total(response.headers.get('Content-Range'))
+            published = dict(partial.load_metadata().get('checksums', {}), **published)
+        else:
+            mode = 'wb'
+            expected_size = _int_or_none(response.headers.get('Content-Length'))
+        if response.headers.get('Content-Encoding'):
+            expected_size = None
+            published = {}
+        checksum = StreamingChecksum(published)
+        if mode == 'ab':
+            await asyncio.to_thread(checksum.update_from_file, partial.part_path)
+
+        partial.save_metadata({
+            'remote_path': uri,
+            'size': expected_size,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'checksums': published,
+        })
+        transferred = 0
+        try:
+            async with _open_in_thread(partial, mode == 'ab') as file_object:
+                def write(chunk):
+                    file_object.write(chunk)
+                    checksum.update(chunk)
+
+                with timed_phase(TRANSFER, exclude=(THROTTLE,)):
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        await asyncio.to_thread(write, chunk)
+                        transferred += len(chunk)
+                        await self.rate_limiter.consume_async(len(chunk))
+        finally:
+            event(BYTES, transferred)
+        return expected_size, checksum, published
@@ -0,0 +1,64 @@
+import importlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DAP = 'dap'
+FTP = 'ftp'
+DEFAULT_BACKEND = DAP
+
+# Backend name -> "module:class". Modules are only imported when their backend
+# is first used, so e.g. an FTP run never imports requests or the DAP credentials.
+_backends = {
+    DAP: 'midas_open_downloader.downloader.dap_downloader:HTTPDownloader',
+    FTP: 'midas_open_downloader.downloader.ftp_downloader:FTPDownloader',
+}
+_resolved = {}
+_lock = threading.Lock()
+
+
+def register_backend(name, target):
+    """
+    Make a downloader available under name.
+
+    Args:
+        name (str): The backend name, e.g. for the --backend option.
+        target (Union[str, type]): The MidasOpenDownloader subclass, or "module:class" to
+            import it lazily on first use.
+    """
+    with _lock:
+        _backends[name] = target
+        _resolved.pop(name, None)
+
+
+def available_backends():
+    with _lock:
+        return sorted(_backends)
+
+
+def get_backend(name):
+    """
+    Return the downloader class registered as name, importing its module on first use.
+
+    Raises:
+        ValueError: If no backend is registered as name.
+    """
+    with _lock:
+        if name in _resolved:
+            return _resolved[name]
+        if name not in _backends:
+            raise ValueError(f"Unknown backend {name!r}, expected one of: {', '.join(sorted(_backends))}")
+        target = _backends[name]
+    if isinstance(target, str):
+        module_name, _, class_name = target.partition(':')
+        logger.debug(f"Loading backend {name} from {module_name}")
+        target = getattr(importlib.import_module(module_name), class_name)
+    with _lock:
+        _resolved[name] = target
+    return target
+
+
+def create_downloader(name=DEFAULT_BACKEND, **kwargs):
+    """Instantiate the downloader registered as name with kwargs."""
+    return get_backend(name)(**kwargs)
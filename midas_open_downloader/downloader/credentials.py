@@ -0,0 +1,347 @@
+import os
+import json
+import time
+import datetime
+import logging
+import threading
+
+# requests, bs4, cryptography and contrail are imported where they are used, so
+# importing this module (e.g. for an FTP-only run) stays cheap
+
+logger = logging.getLogger(__name__)
+
+# Created when credentials are first written, not on import
+CERTS_DIR = os.path.expanduser('./.certs')
+
+TRUSTROOTS_DIR = os.path.join(CERTS_DIR, 'ca-trustroots')
+CREDENTIALS_FILE_PATH = os.path.join(CERTS_DIR, 'credentials.pem')
+COOKIES_FILE_PATH = os.path.join(CERTS_DIR, 'cookies.json')
+DAP_ACCOUNT_FILE = "./conf/dap_account.txt"
+
+TRUSTROOTS_SERVICE = 'https://slcs.ceda.ac.uk/onlineca/trustroots/'
+CERT_SERVICE = 'https://slcs.ceda.ac.uk/onlineca/certificate/'
+LOGIN_URL = 'https://auth.ceda.ac.uk/account/signin/'
+
+# A certificate must stay valid this long to be used; it is refreshed in the
+# background once less than twice this is left
+DEFAULT_MIN_LIFETIME = 3600
+BACKGROUND_RETRY_INTERVAL = 60
+
+
+def cert_expiry(cert_file):
+    """Return the UTC expiry time of the PEM certificate in cert_file, or None if it can not be read."""
+    try:
+        with open(cert_file, 'rb') as f:
+            crt_data = f.read()
+    except IOError:
+        return None
+
+    from cryptography import x509
+    from cryptography.hazmat.backends import default_backend
+
+    try:
+        cert = x509.load_pem_x509_certificate(crt_data, default_backend())
+    except ValueError:
+        return None
+    now = datetime.datetime.now(datetime.timezone.utc)
+    if cert.not_valid_before_utc > now:
+        return None
+    return cert.not_valid_after_utc
+
+
+def _cert_is_valid(cert_file, min_lifetime=0):
+    """
+    Returns boolean - True if the certificate is in date.
+    Optional argument min_lifetime is the number of seconds
+    which must remain.
+
+    :param cert_file: certificate file path.
+    :param min_lifetime: minimum lifetime (seconds)
+    :return: boolean
+    """
+    expiry = cert_expiry(cert_file)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return expiry is not None and expiry > now + datetime.timedelta(seconds=min_lifetime)
+
+
+def fallback_signin(session, username, password):
+    from bs4 import BeautifulSoup
+
+    login_url = LOGIN_URL
+
+    # Get the CSRF token
+    response = session.get(login_url)
+    soup = BeautifulSoup(response.content, 'html.parser')
+    csrf_token = soup.find('input', {'name': 'csrfmiddlewaretoken'})['value']
+
+    # Prepare login data
+    login_data = {
+        'csrfmiddlewaretoken': csrf_token,
+        'username': username,
+        'password': password
+    }
+
+    # Headers to mimic a browser request
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.93 Safari/537.36',
+        'Referer': login_url
+    }
+
+    # Submit the login form
+    login_response = session.post(login_url, data=login_data, headers=headers)
+
+    # Check if login was successful
+    if login_response.ok:
+        logger.info("Login successful")
+        return True
+    else:
+        logger.error("Login failed")
+        return False
+
+
+def read_dap_account(account_file=DAP_ACCOUNT_FILE):
+    """Return the (username, password) stored one per line in account_file."""
+    with open(account_file, "r") as f:
+        lines = f.readlines()
+        return lines[0].strip(), lines[1].strip()
+
+
+def issue_certificate(cert_file, username, password):
+    """Bootstrap the OnlineCA trust roots and write a new short-lived certificate to cert_file."""
+    from contrail.security.onlineca.client import OnlineCaClient
+
+    os.makedirs(TRUSTROOTS_DIR, exist_ok=True)
+    os.makedirs(os.path.dirname(cert_file) or '.', exist_ok=True)
+    onlineca_client = OnlineCaClient()
+    onlineca_client.ca_cert_dir = TRUSTROOTS_DIR
+
+    # Set up trust roots
+    onlineca_client.get_trustroots(
+        TRUSTROOTS_SERVICE,
+        bootstrap=True,
+        write_to_ca_cert_dir=True)
+
+    # Write certificate credentials file
+    onlineca_client.get_certificate(
+        username,
+        password,
+        CERT_SERVICE,
+        pem_out_filepath=cert_file)
+
+
+def sign_in(username, password):
+    """Sign in to the CEDA web login and return the session cookies, or None if it failed."""
+    import requests
+
+    with requests.Session() as session:
+        if fallback_signin(session, username, password):
+            return session.cookies
+    return None
+
+
+class CredentialManager:
+    """
+    The DAP client certificate and session cookies, shared by all downloaders
+    (and so all workers) that are given it.
+
+    Validity is checked locally against the certificate's expiry, so reusing
+    cached credentials costs no requests. A new certificate is only issued when
+    the cached one has less than min_lifetime left, when the server rejected it
+    (refresh), or ahead of time by a background thread, so a long run never
+    sees the certificate expire.
+    """
+
+    def __init__(self, cert_file=CREDENTIALS_FILE_PATH, cookie_file=COOKIES_FILE_PATH, account_file=DAP_ACCOUNT_FILE,
+                 min_lifetime=DEFAULT_MIN_LIFETIME, background_refresh=True, issue=issue_certificate, sign_in=sign_in):
+        """
+        Args:
+            cert_file (str): Where the certificate is cached.
+            cookie_file (str): Where the sign-in cookies are cached, None to keep them in memory only.
+            min_lifetime (float): Seconds a certificate must still be valid for to be used.
+            background_refresh (bool): Refresh the certificate in a background thread once
+                less than twice min_lifetime is left.
+            issue (callable): issue(cert_file, username, password) writes a new certificate.
+            sign_in (callable): sign_in(username, password) returns session cookies or None.
+        """
+        self.cert_file = cert_file
+        self.cookie_file = cookie_file
+        self.account_file = account_file
+        self.min_lifetime = min_lifetime
+        self.background_refresh = background_refresh
+        self._issue = issue
+        self._sign_in = sign_in
+        # Incremented on every refresh, so concurrent callers that saw the same
+        # rejected credentials refresh only once
+        self.generation = 0
+        self.refreshes = 0
+        self._expiry = None
+        self._cookies = None
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._refresh_thread = None
+
+    def _seconds_left(self):
+        if self._expiry is None:
+            self._expiry = cert_expiry(self.cert_file)
+        if self._expiry is None:
+            return 0.0
+        return (self._expiry - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+
+    def is_valid(self):
+        """True if the cached certificate is valid for at least min_lifetime more seconds."""
+        with self._lock:
+            return self._seconds_left() > self.min_lifetime
+
+    def ensure_valid(self):
+        """
+        Make sure a usable certificate is cached, issuing one only if needed.
+
+        Returns:
+            int: The credential generation, to pass to refresh() if the server rejects it.
+        """
+        with self._lock:
+            if not self.is_valid():
+                logger.info('Security credentials missing or about to expire. Updating...')
+                self._refresh()
+            else:
+                logger.info('Security credentials already set up.')
+            generation = self.generation
+        self._start_background_refresh()
+        return generation
+
+    def refresh(self, stale_generation=None):
+        """
+        Issue a new certificate and sign in again, because the server rejected the
+        credentials of stale_generation. If another caller already refreshed them,
+        nothing is done.
+
+        Returns:
+            int: The current credential generation.
+        """
+        with self._lock:
+            if stale_generation is None or stale_generation == self.generation:
+                self._refresh()
+                self._refresh_cookies()
+            return self.generation
+
+    def _refresh(self):
+        self._install(self._issue_new())
+
+    def _issue_new(self):
+        """Issue a certificate into a new file next to cert_file and return its path."""
+        username, password = read_dap_account(self.account_file)
+        new_cert_file = f"{self.cert_file}.{threading.get_ident()}.new"
+        self._issue(new_cert_file, username, password)
+        return new_cert_file
+
+    def _install(self, new_cert_file):
+        """Replace the cached certificate with new_cert_file; must be called with the lock held."""
+        os.replace(new_cert_file, self.cert_file)
+        self._expiry = None
+        self.generation += 1
+        self.refreshes += 1
+        logger.info('Security credentials set up.')
+
+    def _refresh_cookies(self):
+        username, password = read_dap_account(self.account_file)
+        cookies = self._sign_in(username, password)
+        if cookies is None:
+            return
+        self._cookies = [
+            {'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path, 'expires': c.expires, 'secure': c.secure}
+            for c in cookies
+        ]
+        if self.cookie_file:
+            os.makedirs(os.path.dirname(self.cookie_file) or '.', exist_ok=True)
+            with open(self.cookie_file, 'w') as f:
+                json.dump(self._cookies, f)
+
+    def cookies(self):
+        """Return the cached sign-in cookies that have not expired."""
+        with self._lock:
+            if self._cookies is None:
+                self._cookies = []
+                if self.cookie_file and os.path.exists(self.cookie_file):
+                    try:
+                        with open(self.cookie_file) as f:
+                            self._cookies = json.load(f)
+                    except ValueError:
+                        logger.warning(f"Ignoring unreadable cookie file: {self.cookie_file}")
+            now = time.time()
+            return [cookie for cookie in self._cookies if not cookie.get('expires') or cookie['expires'] > now]
+
+    def apply(self, session):
+        """Add the cached sign-in cookies to a requests session."""
+        for cookie in self.cookies():
+            session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'],
+                                expires=cookie.get('expires'), secure=cookie.get('secure', False))
+
+    def seconds_until_refresh(self):
+        """Seconds until the background thread refreshes the certificate."""
+        with self._lock:
+            return max(0.0, self._seconds_left() - 2 * self.min_lifetime)
+
+    def _start_background_refresh(self):
+        with self._lock:
+            if not self.background_refresh or self._refresh_thread is not None or self._stopped.is_set():
+                return
+            self._refresh_thread = threading.Thread(target=self._refresh_in_background, name='credential-refresh', daemon=True)
+            self._refresh_thread.start()
+
+    def _refresh_in_background(self):
+        delay = self.seconds_until_refresh()
+        while not self._stopped.wait(delay):
+            try:
+                with self._lock:
+                    due = self.seconds_until_refresh() <= 0
+                    generation = self.generation
+                if due:
+                    # Issued without the lock, so downloads can use the current certificate meanwhile
+                    new_cert_file = self._issue_new()
+                    with self._lock:
+                        if self.generation == generation:
+                            self._install(new_cert_file)
+                        else:
+                            # Refreshed by a downloader in the meantime
+                            os.remove(new_cert_file)
+                delay = self.seconds_until_refresh()
+                if delay <= 0:
+                    # The new certificate is not valid for longer than the refresh margin, or can
+                    # not be read; do not ask the CA for another one right away
+                    logger.warning(f"Refreshed security credentials expire within {2 * self.min_lifetime:.0f}s, retrying in {BACKGROUND_RETRY_INTERVAL}s")
+                    delay = BACKGROUND_RETRY_INTERVAL
+            except Exception as e:
+                logger.error(f"Error refreshing security credentials. Error: {e}")
+                delay = BACKGROUND_RETRY_INTERVAL
+
+    def stop(self):
+        """Stop the background refresh."""
+        self._stopped.set()
+
+
+_default_credential_manager = None
+_default_credential_manager_lock = threading.Lock()
+
+
+def get_default_credential_manager():
+    """Return the process-wide credential manager shared by downloaders that were not given one."""
+    global _default_credential_manager
+    with _default_credential_manager_lock:
+        if _default_credential_manager is None:
+            _default_credential_manager = CredentialManager()
+        return _default_credential_manager
+
+
+def stop_default_credential_manager():
+    """Stop the background refresh of the process-wide credential manager, if one was created."""
+    global _default_credential_manager
+    with _default_credential_manager_lock:
+        credential_manager, _default_credential_manager = _default_credential_manager, None
+    if credential_manager is not None:
+        credential_manager.stop()
+
+
+def set_default_credential_manager(credential_manager):
+    global _default_credential_manager
+    with _default_credential_manager_lock:
+        _default_credential_manager = credential_manager
@@ -1,147 +1,92 @@
-import os
+import re
 import requests
-import datetime
 import logging
 from typing import List
-from bs4 import BeautifulSoup
+from urllib.parse import urljoin, unquote
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
 from .abstract_downloader import MidasOpenDownloader
-from .errors import DownloadError
+from .credentials import get_default_credential_manager
+from .errors import DownloadError, NotModifiedError
+from .integrity import StreamingChecksum, parse_digest_headers
+from .rate_limiter import HTTP_BACKOFF_STATUS_CODES, parse_retry_after
+from .tracing import BYTES, CONNECT, CONNECTION_PHASES, THROTTLE, TLS, TRANSFER, TTFB, event, timed_phase
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Import third-party libraries
-from cryptography import x509
-from cryptography.hazmat.backends import default_backend
-from contrail.security.onlineca.client import OnlineCaClient
+DEFAULT_CHUNK_SIZE = 1024 * 1024
 
+_SIZE_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*([kKMGT]i?B|[kKMGT]|B|bytes)\b')
+_SIZE_UNITS = {'B': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
 
-CERTS_DIR = os.path.expanduser('./.certs')
-if not os.path.isdir(CERTS_DIR):
-    os.makedirs(CERTS_DIR)
 
-TRUSTROOTS_DIR = os.path.join(CERTS_DIR, 'ca-trustroots')
-CREDENTIALS_FILE_PATH = os.path.join(CERTS_DIR, 'credentials.pem')
+class _TimedConnectionMixin:
+    def _new_conn(self):
+        # Resolving the host name is part of creating the socket, so DNS time counts as CONNECT
+        with timed_phase(CONNECT):
+            return super()._new_conn()
 
-TRUSTROOTS_SERVICE = 'https://slcs.ceda.ac.uk/onlineca/trustroots/'
-CERT_SERVICE = 'https://slcs.ceda.ac.uk/onlineca/certificate/'
 
-def _cert_is_valid(cert_file, min_lifetime=0):
-    """
-    Returns boolean - True if the certificate is in date.
-    Optional argument min_lifetime is the number of seconds
-    which must remain.
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
 
-    :param cert_file: certificate file path.
-    :param min_lifetime: minimum lifetime (seconds)
-    :return: boolean
-    """
-    try:
-        with open(cert_file, 'rb') as f:
-            crt_data = f.read()
-    except IOError:
-        return False
 
-    try:
-        cert = x509.load_pem_x509_certificate(crt_data, default_backend())
-    except ValueError:
-        return False
-
-    now = datetime.datetime.now()
-
-    now = datetime.datetime.now(datetime.timezone.utc)
-    return (cert.not_valid_before_utc <= now
-            and cert.not_valid_after_utc > now + datetime.timedelta(seconds=min_lifetime))
-
-def fallback_signin(session, username, password):
-    login_url = 'https://auth.ceda.ac.uk/account/signin/'
-
-    # Get the CSRF token
-    response = session.get(login_url)
-    soup = BeautifulSoup(response.content, 'html.parser')
-    csrf_token = soup.find('input', {'name': 'csrfmiddlewaretoken'})['value']
-    
-    # Prepare login data
-    login_data = {
-        'csrfmiddlewaretoken': csrf_token,
-        'username': username,
-        'password': password
-    }
-    
-    # Headers to mimic a browser request
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.93 Safari/537.36',
-        'Referer': login_url
-    }
-    
-    # Submit the login form
-    login_response = session.post(login_url, data=login_data, headers=headers)
-    
-    # Check if login was successful
-    if login_response.ok:
-        logger.info("Login successful")
-        # You can now use `session` to make further requests while logged in
-        return True
-    else:
-        logger.error("Login failed")
-        return False
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    def connect(self):
+        with timed_phase(TLS, exclude=(CONNECT,)):
+            super().connect()
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """An HTTPAdapter whose new connections add their connect and TLS handshake time to the current span."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool, 'https': _TimedHTTPSConnectionPool}
 
 
 class HTTPDownloader(MidasOpenDownloader):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, rate_limiter=None, chunk_size=DEFAULT_CHUNK_SIZE, credentials=None, sink=None):
+        """
+        Args:
+            credentials (CredentialManager): The certificate and cookies to authenticate with,
+                shared with other downloaders. Defaults to the process-wide manager.
+            sink (StorageSink): Where downloaded files are stored (default: the working directory).
+        """
+        super().__init__(rate_limiter, sink)
+        self.chunk_size = chunk_size
         self.base_url = "https://dap.ceda.ac.uk/badc/ukmo-midas-open/data/uk-hourly-weather-obs"
         self.base_path = self.base_url
+        self.credentials = credentials or get_default_credential_manager()
+        self.cert_file = self.credentials.cert_file
         self.session = None
+        self._credentials_generation = None
 
     def setup_credentials(self):
-        # only re-get credentials if it doesn't exist
-        if _cert_is_valid(CREDENTIALS_FILE_PATH):
-            logger.info('Security credentials already set up.')
-            try:
-              self.download('/dataset-version-202308/00README_catalogue_and_licence.txt')
-              return False
-            except:
-              logger.info('Security credentials are invalid. Updating...')
-              pass
-    
-        with open("./conf/dap_account.txt","r") as f:
-            lines = f.readlines()
-            username = lines[0].strip()
-            password = lines[1].strip()
-    
-        onlineca_client = OnlineCaClient()
-        onlineca_client.ca_cert_dir = TRUSTROOTS_DIR
-    
-        # Set up trust roots
-        trustroots = onlineca_client.get_trustroots(
-            TRUSTROOTS_SERVICE,
-            bootstrap=True,
-            write_to_ca_cert_dir=True)
-    
-        # Write certificate credentials file
-        key_pair, certs = onlineca_client.get_certificate(
-            username,
-            password,
-            CERT_SERVICE,
-            pem_out_filepath=CREDENTIALS_FILE_PATH)
-    
-        logger.info('Security credentials set up.')
-        try:
-          self.download('/dataset-version-202308/00README_catalogue_and_licence.txt')
-          return True
-        except:
-          logger.info('Dap authentication failed, using fallback sign in')
-          if fallback_signin(self.session, username, password):
-              logger.info('Fallback sign in finished...')
-              return True
-        return False
+        """Use the shared credentials, which are only re-issued if they are missing or about to expire."""
+        self._credentials_generation = self.credentials.ensure_valid()
+        self.credentials.apply(self.session)
 
-        pass
+    def reauthenticate(self):
+        """Refresh the shared credentials after the server rejected them."""
+        self._credentials_generation = self.credentials.refresh(self._credentials_generation)
+        self.credentials.apply(self.session)
 
     def init(self):
         self.session = requests.Session()
+        adapter = TimedHTTPAdapter()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.setup_credentials()
         return self
 
@@ -149,14 +94,241 @@ class HTTPDownloader(MidasOpenDownloader):
         if self.session:
             self.session.close()
 
-    def download(self, uri):
-        filename = uri.rsplit('/', 1)[-1]
+    def download(self, uri, validators=None):
+        """
+        Stream uri to disk in chunks of self.chunk_size bytes, so memory use does
+        not depend on the file size. The body is written to `<name>.part` and only
+        renamed into place once it has the expected size. If an earlier transfer
+        was interrupted, it is resumed with a Range request.
+
+        With validators (ETag/Last-Modified) the request is conditional and
+        NotModifiedError is raised on 304 Not Modified.
+
+        The SHA-256 checksum is computed while the body streams in, plus any
+        checksum the server publishes in Digest, Repr-Digest or Content-MD5
+        headers. A file that has the expected size but does not match a
+        published checksum is discarded and DownloadError is raised.
+        """
+        filename = self.local_path(uri)
+        partial = self.sink.partial(filename)
+        offset = partial.resume_offset(uri)
+        headers = {}
+        if validators and not offset:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+        if offset:
+            metadata = partial.load_metadata()
+            headers['Range'] = f"bytes={offset}-"
+            validator = metadata.get('etag') or metadata.get('last_modified')
+            if validator:
+                headers['If-Range'] = validator
+            logger.info(f"Resuming download at byte {offset}: {uri}")
+
+        restart = False
+        self.rate_limiter.acquire()
         try:
-            response = self.session.get(uri, cert=(CREDENTIALS_FILE_PATH))
-            response.raise_for_status()
+            with timed_phase(TTFB, exclude=CONNECTION_PHASES):
+                response = self.session.get(uri, cert=self.cert_file, stream=True, headers=headers)
+            with response:
+                if response.status_code in HTTP_BACKOFF_STATUS_CODES:
+                    self.rate_limiter.backoff(parse_retry_after(response.headers.get('Retry-After')))
+                if response.status_code == 304 and validators:
+                    self.rate_limiter.recover()
+                    raise NotModifiedError(uri)
+                if response.status_code == 416 and offset:
+                    # Nothing left to send, the partial file may already be complete
+                    metadata = partial.load_metadata()
+                    expected_size = metadata.get('size')
+                    published = metadata.get('checksums', {})
+                    checksum = StreamingChecksum(published)
+                    checksum.update_from_file(partial.part_path)
+                elif response.status_code == 206 and _content_range_start(response.headers.get('Content-Range')) != offset:
+                    # Appending another range than the one asked for would corrupt the file
+                    logger.warning(f"Got Content-Range {response.headers.get('Content-Range')} for a request from byte {offset}, "
+                                   f"downloading the whole file: {uri}")
+                    partial.discard()
+                    restart = True
+                else:
+                    response.raise_for_status()
+                    expected_size, checksum, published = self._write_response(response, partial, uri, offset)
         except requests.exceptions.RequestException as e:
             raise DownloadError(e)
+        if restart:
+            return self.download(uri, validators)
 
-        with open(filename, 'wb') as file_object:
-            file_object.write(response.content)
+        metadata = partial.load_metadata() or {}
+        mismatches = checksum.mismatches(published) if checksum.size == expected_size or expected_size is None else []
+        if mismatches:
+            partial.discard()
+            raise DownloadError(f"Corrupt download of {uri}: {', '.join(mismatches)} checksum mismatch")
+        if not partial.commit(expected_size):
+            if response.status_code == 416:
+                partial.discard()
+            raise DownloadError(f"Incomplete download of {uri}: expected {expected_size} bytes")
+        checks = (['size'] if expected_size is not None else []) + sorted(published)
+        self.last_checksum = partial.record(checksum, checks)
+        self.last_validators = {'etag': metadata.get('etag'), 'last_modified': metadata.get('last_modified')}
+        self.rate_limiter.recover()
         return filename
+
+    def iter_chunks(self, uri):
+        self.rate_limiter.acquire()
+        try:
+            with timed_phase(TTFB, exclude=CONNECTION_PHASES):
+                response = self.session.get(uri, cert=self.cert_file, stream=True)
+            with response:
+                if response.status_code in HTTP_BACKOFF_STATUS_CODES:
+                    self.rate_limiter.backoff(parse_retry_after(response.headers.get('Retry-After')))
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    self.rate_limiter.consume(len(chunk))
+                    event(BYTES, len(chunk))
+                    yield chunk
+        except requests.exceptions.RequestException as e:
+            raise DownloadError(e)
+        self.rate_limiter.recover()
+
+    def probe(self, uri):
+        self.rate_limiter.acquire()
+        try:
+            response = self.session.head(uri, cert=self.cert_file, allow_redirects=True)
+            if response.status_code in HTTP_BACKOFF_STATUS_CODES:
+                self.rate_limiter.backoff(parse_retry_after(response.headers.get('Retry-After')))
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            raise DownloadError(e)
+        return {
+            'size': _int_or_none(response.headers.get('Content-Length')),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+
+    def list_directory(self, directory_path):
+        """
+        List a DAP directory. JSON listings are used when the server returns one,
+        otherwise the links of the HTML index page are parsed.
+        """
+        url = directory_path.rstrip('/') + '/'
+        self.rate_limiter.acquire()
+        try:
+            response = self.session.get(url, cert=self.cert_file)
+            if response.status_code in HTTP_BACKOFF_STATUS_CODES:
+                self.rate_limiter.backoff(parse_retry_after(response.headers.get('Retry-After')))
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            raise DownloadError(e)
+        self.rate_limiter.recover()
+        if 'json' in response.headers.get('Content-Type', ''):
+            return _parse_json_listing(response.json())
+        return _parse_html_listing(url, response.text)
+
+    def _write_response(self, response, partial, uri, offset):
+        """
+        Write the response body to the partial file, hashing it on the way.
+
+        Returns:
+            Tuple[int, StreamingChecksum, dict]: The expected total size, the checksum of
+            the whole partial file and the published checksums of the remote file.
+        """
+        published = parse_digest_headers(response.headers, whole_body=response.status_code != 206)
+        if response.status_code == 206:
+            mode = 'ab'
+            expected_size = _content_range_total(response.headers.get('Content-Range'))
+            # Checksums published with the first part still describe the whole file
+            published = dict(partial.load_metadata().get('checksums', {}), **published)
+        else:
+            # The server ignored the range (or the file changed), start over
+            mode = 'wb'
+            expected_size = _int_or_none(response.headers.get('Content-Length'))
+        if response.headers.get('Content-Encoding'):
+            # iter_content decodes the body, so the header sizes and checksums do not apply
+            expected_size = None
+            published = {}
+        checksum = StreamingChecksum(published)
+        if mode == 'ab':
+            checksum.update_from_file(partial.part_path)
+
+        partial.save_metadata({
+            'remote_path': uri,
+            'size': expected_size,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'checksums': published,
+        })
+        transferred = 0
+        try:
+            with partial.open(append=mode == 'ab') as file_object, timed_phase(TRANSFER, exclude=(THROTTLE,)):
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    file_object.write(chunk)
+                    checksum.update(chunk)
+                    transferred += len(chunk)
+                    self.rate_limiter.consume(len(chunk))
+        finally:
+            event(BYTES, transferred)
+        return expected_size, checksum, published
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _content_range_start(content_range):
+    """Return the first byte position from a `bytes start-end/total` Content-Range header."""
+    if not content_range or not content_range.startswith('bytes ') or '-' not in content_range:
+        return None
+    return _int_or_none(content_range[len('bytes '):].split('-', 1)[0])
+
+
+def _content_range_total(content_range):
+    """Return the total size from a `bytes start-end/total` Content-Range header."""
+    if not content_range or '/' not in content_range:
+        return None
+    return _int_or_none(content_range.rsplit('/', 1)[-1])
+
+
+def _parse_size(text):
+    """Parse a human readable size such as '12.3 KB' or '512 B' into bytes."""
+    match = _SIZE_PATTERN.search(text)
+    if not match:
+        return None
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)[0].upper()])
+
+
+def _parse_json_listing(data):
+    items = data.get('items', data.get('files', [])) if isinstance(data, dict) else data
+    entries = []
+    for item in items:
+        name = (item.get('name') or item.get('path', '')).rstrip('/').rsplit('/', 1)[-1]
+        if not name:
+            continue
+        is_dir = item.get('type') in ('dir', 'directory') or item.get('is_dir', False)
+        entries.append({'name': name, 'type': 'dir' if is_dir else 'file', 'size': _int_or_none(item.get('size'))})
+    return entries
+
+
+def _parse_html_listing(url, html):
+    """Return the direct children of url linked from its HTML index page."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    entries = {}
+    for link in soup.find_all('a', href=True):
+        target = urljoin(url, link['href']).split('?', 1)[0].split('#', 1)[0]
+        if not target.startswith(url) or target == url:
+            continue
+        remainder = unquote(target[len(url):])
+        name = remainder.rstrip('/')
+        if not name or '/' in name or name in entries:
+            continue
+        row = link.find_parent('tr')
+        size = None
+        if row is not None and not remainder.endswith('/'):
+            cells = [cell.get_text(' ', strip=True) for cell in row.find_all('td') if cell.find('a') is None]
+            size = next((_parse_size(cell) for cell in cells if _parse_size(cell) is not None), None)
+        entries[name] = {'name': name, 'type': 'dir' if remainder.endswith('/') else 'file', 'size': size}
+    return list(entries.values())
@@ -1,3 +1,17 @@
 class DownloadError(Exception):
     pass
 
+
+class NotModifiedError(Exception):
+    """Raised by a conditional download when the remote file matches the given validators."""
+    pass
+
+
+class RetriesExhaustedError(DownloadError):
+    """Raised by RetryPolicy when it gives up on an operation."""
+
+    def __init__(self, error, kind, attempts):
+        super().__init__(error)
+        self.error = error
+        self.kind = kind
+        self.attempts = attempts
@@ -1,45 +1,255 @@
 import os
+import time
 import ftplib
 import logging
+from contextlib import contextmanager
 from typing import List
 
 from .abstract_downloader import MidasOpenDownloader
-from .errors import DownloadError
+from .errors import DownloadError, NotModifiedError
+from .ftp_pool import FTPConnectionPool, is_connection_lost
+from .integrity import StreamingChecksum
+from .rate_limiter import FTP_BACKOFF_REPLY_CODES
+from .tracing import BYTES, THROTTLE, TRANSFER, TTFB, event, record_phase, timed_phase
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+FTP_SERVER = "ftp.ceda.ac.uk"
+FTP_ACCOUNT_FILE = "./conf/ftp_account.txt"
+DEFAULT_BLOCK_SIZE = 64 * 1024
+
+
+def read_ftp_account(account_file=FTP_ACCOUNT_FILE):
+    """Return the (username, password) stored one per line in account_file."""
+    with open(account_file, "r") as f:
+        lines = f.readlines()
+        return lines[0].strip(), lines[1].strip()
+
+
+@contextmanager
+def _local_io(filename):
+    """
+    Report local I/O errors, e.g. a full disk, as a DownloadError that is not
+    retried, so they are not taken for a network error.
+    """
+    try:
+        yield
+    except OSError as e:
+        raise DownloadError(f"Could not write {filename}: {e}") from e
+
 
 class FTPDownloader(MidasOpenDownloader):
-    def __init__(self):
-        super().__init__()
-        self.ftp_server = "ftp.ceda.ac.uk"
+    def __init__(self, rate_limiter=None, pool=None, sink=None):
+        """
+        Args:
+            pool (FTPConnectionPool): A connection pool shared with other downloaders. Without
+                one, init() opens a private single-connection pool.
+            sink (StorageSink): Where downloaded files are stored (default: the working directory).
+        """
+        super().__init__(rate_limiter, sink)
+        self.ftp_server = FTP_SERVER
         self.base_path = "/badc/ukmo-midas-open/data/uk-hourly-weather-obs"
-        self.ftp = None
+        self.pool = pool
+        self._owns_pool = False
 
     def init(self):
-        self.setup_credentials()
-        self.ftp = ftplib.FTP(self.ftp_server)
-        self.ftp.login(self.username, self.password)
+        if self.pool is None:
+            self.setup_credentials()
+            self.pool = FTPConnectionPool(self.ftp_server, self.username, self.password, size=1)
+            self._owns_pool = True
 
     def cleanup(self):
-        if self.ftp:
-            self.ftp.close()
+        if self.pool and self._owns_pool:
+            self.pool.close()
+            self.pool = None
+            self._owns_pool = False
 
     def setup_credentials(self):
-        with open("./conf/ftp_account.txt", "r") as f:
-            lines = f.readlines()
-            self.username = lines[0].strip()
-            self.password = lines[1].strip()
-
-    def download(self, file_path):
-        filename = file_path.rsplit('/', 1)[-1]
-        with open(filename, 'wb') as file_object:
+        self.username, self.password = read_ftp_account()
+
+    def _run(self, file_path, operation):
+        """
+        Run operation(ftp) on a pooled connection. If the connection turns out to be
+        dead, it is run once more on a fresh connection.
+        """
+        for attempt in range(2):
             try:
-                self.ftp.retrbinary(f'RETR {file_path}', file_object.write)
+                with self.pool.connection() as ftp:
+                    return operation(ftp)
             except ftplib.error_perm as e:
                 logger.error(f"Error downloading file: {file_path}. Error: {str(e)}")
                 raise DownloadError(e)
+            except (ftplib.error_temp, OSError, EOFError) as e:
+                if str(e)[:3] in FTP_BACKOFF_REPLY_CODES:
+                    self.rate_limiter.backoff()
+                if attempt == 0 and is_connection_lost(e):
+                    logger.warning(f"FTP connection lost, reconnecting. Error: {str(e)}")
+                    continue
+                logger.error(f"Error downloading file: {file_path}. Error: {str(e)}")
+                raise DownloadError(e)
+
+    def download(self, file_path, validators=None):
+        """
+        Retrieve file_path into `<name>.part` and rename it into place once it has
+        the size reported by SIZE. An interrupted transfer of the same, unchanged
+        (MDTM) file is resumed with a REST offset, also when the connection drops
+        and the transfer is retried on a new one.
+
+        With validators (MDTM/SIZE) NotModifiedError is raised without a RETR if
+        the remote file still matches them.
+
+        The SHA-256 checksum is computed from the blocks as they arrive; FTP
+        publishes no checksums, so the file is only verified against SIZE.
+        """
+        filename = self.local_path(file_path)
+        partial = self.sink.partial(filename)
+
+        def retrieve(ftp):
+            ftp.voidcmd('TYPE I')
+            expected_size = self._remote_size(ftp, file_path)
+            modified = self._remote_modified(ftp, file_path)
+            current_validators = {'mdtm': modified, 'size': expected_size}
+            if validators and modified is not None and validators == current_validators:
+                raise NotModifiedError(file_path)
+            offset = partial.resume_offset(file_path, current_validators)
+            checksum = StreamingChecksum()
+            with _local_io(filename):
+                partial.save_metadata({'remote_path': file_path, 'size': expected_size, 'mdtm': modified})
+                if offset:
+                    logger.info(f"Resuming download at byte {offset}: {file_path}")
+                    checksum.update_from_file(partial.part_path)
+            if not offset or offset != expected_size:
+                self._retrieve(ftp, file_path, partial, offset, checksum)
+            return current_validators, checksum
+
+        self.rate_limiter.acquire()
+        try:
+            current_validators, checksum = self._run(file_path, retrieve)
+        except NotModifiedError:
+            self.rate_limiter.recover()
+            raise
+
+        with _local_io(filename):
+            committed = partial.commit(current_validators['size'])
+        if not committed:
+            raise DownloadError(f"Incomplete download of {file_path}: expected {current_validators['size']} bytes")
+        checks = ['size'] if current_validators['size'] is not None else []
+        with _local_io(filename):
+            self.last_checksum = partial.record(checksum, checks)
+        self.last_validators = current_validators
+        self.rate_limiter.recover()
         return filename
 
+    def _retrieve(self, ftp, file_path, partial, offset, checksum):
+        """RETR file_path from offset on, appending it to the partial download and checksum."""
+        transferred = 0
+        requested = None
+
+        def write(block):
+            nonlocal transferred
+            if not transferred:
+                record_phase(TTFB, time.perf_counter() - requested)
+            with _local_io(partial.filename):
+                file_object.write(block)
+            checksum.update(block)
+            transferred += len(block)
+            self.rate_limiter.consume(len(block))
+
+        try:
+            with _local_io(partial.filename):
+                file_object = partial.open(append=bool(offset))
+            with file_object, timed_phase(TRANSFER, exclude=(TTFB, THROTTLE)):
+                requested = time.perf_counter()
+                try:
+                    ftp.retrbinary(f'RETR {file_path}', write, rest=offset or None)
+                except DownloadError:
+                    # The reply to the RETR is still outstanding, so the connection is not returned to the pool
+                    ftp.close()
+                    raise
+        finally:
+            event(BYTES, transferred)
+
+    def iter_chunks(self, file_path, chunk_size=DEFAULT_BLOCK_SIZE):
+        """
+        Yield the file in chunks straight from the data connection. The pooled
+        control connection is held until the transfer is finished or abandoned.
+        """
+        self.rate_limiter.acquire()
+        try:
+            with self.pool.connection() as ftp:
+                ftp.voidcmd('TYPE I')
+                with ftp.transfercmd(f'RETR {file_path}') as data_connection:
+                    try:
+                        while True:
+                            chunk = data_connection.recv(chunk_size)
+                            if not chunk:
+                                break
+                            self.rate_limiter.consume(len(chunk))
+                            event(BYTES, len(chunk))
+                            yield chunk
+                    except GeneratorExit:
+                        # The consumer stopped early, cancel the transfer so the connection can be reused
+                        self._abort(ftp)
+                        raise
+                ftp.voidresp()
+        except ftplib.error_perm as e:
+            logger.error(f"Error downloading file: {file_path}. Error: {str(e)}")
+            raise DownloadError(e)
+        except (ftplib.error_temp, ftplib.error_reply, OSError, EOFError) as e:
+            if str(e)[:3] in FTP_BACKOFF_REPLY_CODES:
+                self.rate_limiter.backoff()
+            logger.error(f"Error downloading file: {file_path}. Error: {str(e)}")
+            raise DownloadError(e)
+        self.rate_limiter.recover()
+
+    def _abort(self, ftp):
+        try:
+            ftp.abort()
+        except ftplib.all_errors:
+            # The next NOOP or command fails and the pool replaces the connection
+            ftp.close()
+
+    def probe(self, file_path):
+        def probe(ftp):
+            ftp.voidcmd('TYPE I')
+            return {'size': self._remote_size(ftp, file_path), 'mdtm': self._remote_modified(ftp, file_path)}
+
+        self.rate_limiter.acquire()
+        return self._run(file_path, probe)
+
+    def list_directory(self, directory_path):
+        """List a directory with MLSD, falling back to NLST plus SIZE on servers without it."""
+        def list_entries(ftp):
+            try:
+                return [
+                    {'name': name, 'type': facts['type'], 'size': int(facts['size']) if 'size' in facts else None}
+                    for name, facts in ftp.mlsd(directory_path, facts=['type', 'size'])
+                    if facts.get('type') in ('dir', 'file')
+                ]
+            except ftplib.error_perm as e:
+                if not str(e).startswith('50'):
+                    raise
+            entries = []
+            for name in ftp.nlst(directory_path):
+                name = name.rstrip('/').rsplit('/', 1)[-1]
+                if name in ('.', '..'):
+                    continue
+                # SIZE fails for directories
+                size = self._remote_size(ftp, f"{directory_path}/{name}")
+                entries.append({'name': name, 'type': 'dir' if size is None else 'file', 'size': size})
+            return entries
+
+        self.rate_limiter.acquire()
+        return self._run(directory_path, list_entries)
+
+    def _remote_size(self, ftp, file_path):
+        try:
+            return ftp.size(file_path)
+        except (ftplib.error_perm, ftplib.error_reply):
+            return None
 
+    def _remote_modified(self, ftp, file_path):
+        try:
+            return ftp.voidcmd(f'MDTM {file_path}').split(' ', 1)[-1].strip()
+        except (ftplib.error_perm, ftplib.error_reply):
+            return None
@@ -0,0 +1,209 @@
+import ftplib
+import logging
+import queue
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from .tracing import CONNECT, timed_phase
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KEEPALIVE_INTERVAL = 30.0
+DEFAULT_TIMEOUT = 60
+
+
+def is_connection_lost(error):
+    """
+    True for errors after which the control connection can not be used any more.
+    Other OSErrors, such as a full disk while writing the file, leave it usable.
+    """
+    if isinstance(error, ftplib.error_temp):
+        return str(error).startswith('421')
+    return isinstance(error, (ConnectionError, socket.timeout, EOFError))
+
+
+class FTPConnectionPool:
+    """
+    A pool of up to `size` logged-in FTP control connections shared by all
+    FTPDownloaders (and so all workers) that are given it.
+
+    Idle connections get a NOOP every keepalive_interval so the server's idle
+    timeout does not drop them, and are checked with a NOOP before reuse.
+    Connections that turn out to be dead are closed and replaced by a fresh,
+    logged-in one. No more than `size` connections are ever open at once,
+    counting those being pinged, as the server limits concurrent logins.
+    """
+
+    def __init__(self, host=None, username=None, password=None, size=4,
+                 keepalive_interval=DEFAULT_KEEPALIVE_INTERVAL, timeout=DEFAULT_TIMEOUT, connect=None):
+        """
+        Args:
+            size (int): Maximum number of connections.
+            keepalive_interval (float): Seconds of idleness after which a NOOP is sent.
+            connect (callable): Returns a new logged-in ftplib.FTP; defaults to logging
+                in to host with username and password.
+        """
+        self.host = host
+        self.username = username
+        self.password = password
+        self.size = size
+        self.keepalive_interval = keepalive_interval
+        self.timeout = timeout
+        self._connect = connect or self._login
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = threading.Event()
+        self._keepalive_thread = None
+        self._lock = threading.Lock()
+        # Open connections: checked out, idle or being pinged. Guarded by _lock
+        self._open = 0
+        self._available = threading.Condition(self._lock)
+
+    def _login(self):
+        ftp = ftplib.FTP(self.host, timeout=self.timeout)
+        ftp.login(self.username, self.password)
+        return ftp
+
+    def _start_keepalive(self):
+        with self._lock:
+            if self._keepalive_thread is None and self.keepalive_interval:
+                self._keepalive_thread = threading.Thread(target=self._keepalive, name='ftp-keepalive', daemon=True)
+                self._keepalive_thread.start()
+
+    def _keepalive(self):
+        while not self._closed.wait(self.keepalive_interval / 2):
+            self.ping_idle()
+
+    def ping_idle(self):
+        """Send a NOOP on every connection idle for longer than keepalive_interval; drop dead ones."""
+        stale = []
+        with self._lock:
+            fresh = []
+            now = time.monotonic()
+            while True:
+                try:
+                    ftp, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                (stale if now - last_used >= self.keepalive_interval else fresh).append((ftp, last_used))
+            # Oldest at the bottom of the LIFO, as before
+            for entry in reversed(fresh):
+                self._idle.put(entry)
+        # Stale connections stay counted as open while they are pinged, one at a time
+        for ftp, _ in reversed(stale):
+            if self._noop(ftp):
+                self._release(ftp)
+
+    def _noop(self, ftp):
+        try:
+            ftp.voidcmd('NOOP')
+            return True
+        except ftplib.all_errors as e:
+            logger.info(f"Dropping dead FTP connection: {e}")
+            self._discard(ftp)
+            return False
+
+    def _close(self, ftp):
+        try:
+            ftp.close()
+        except Exception:
+            pass
+
+    def _discard(self, ftp):
+        """Close an open connection for good, making room for a new one."""
+        self._close(ftp)
+        with self._available:
+            self._open -= 1
+            self._available.notify()
+
+    def _release(self, ftp):
+        """Return an open connection to the idle ones, or close it if the pool was closed."""
+        if self._closed.is_set():
+            self._quit(ftp)
+            with self._available:
+                self._open -= 1
+            return
+        with self._available:
+            self._idle.put((ftp, time.monotonic()))
+            self._available.notify()
+
+    def _quit(self, ftp):
+        try:
+            ftp.quit()
+        except ftplib.all_errors:
+            self._close(ftp)
+
+    def _checkout(self):
+        while True:
+            with self._available:
+                while True:
+                    if self._closed.is_set():
+                        raise ftplib.error_temp('421 Connection pool is closed')
+                    try:
+                        ftp, last_used = self._idle.get_nowait()
+                        break
+                    except queue.Empty:
+                        pass
+                    if self._open < self.size:
+                        self._open += 1
+                        ftp = None
+                        break
+                    # Every connection is checked out or being pinged
+                    self._available.wait()
+            if ftp is None:
+                logger.info(f"Opening FTP connection to {self.host}")
+                try:
+                    with timed_phase(CONNECT):
+                        return self._connect()
+                except BaseException:
+                    with self._available:
+                        self._open -= 1
+                        self._available.notify()
+                    raise
+            if time.monotonic() - last_used < self.keepalive_interval or self._noop(ftp):
+                return ftp
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a logged-in connection. If the block fails because the connection
+        was lost, the connection is discarded instead of being returned to the pool.
+        """
+        if self._closed.is_set():
+            raise ftplib.error_temp('421 Connection pool is closed')
+        self._slots.acquire()
+        ftp = None
+        try:
+            ftp = self._checkout()
+            self._start_keepalive()
+            yield ftp
+        except BaseException as e:
+            if ftp is not None and is_connection_lost(e):
+                self._discard(ftp)
+                ftp = None
+            raise
+        finally:
+            if ftp is not None:
+                # A connection closed by its user (sock is None) is not returned either
+                if ftp.sock is None:
+                    self._discard(ftp)
+                else:
+                    self._release(ftp)
+            self._slots.release()
+
+    def close(self):
+        """Quit the idle connections; connections still checked out are quit when they are returned."""
+        with self._available:
+            self._closed.set()
+            idle = []
+            while True:
+                try:
+                    idle.append(self._idle.get_nowait()[0])
+                except queue.Empty:
+                    break
+            self._open -= len(idle)
+            self._available.notify_all()
+        for ftp in idle:
+            self._quit(ftp)
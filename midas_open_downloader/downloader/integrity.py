@@ -0,0 +1,126 @@
+import os
+import base64
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Digest algorithm names used in HTTP headers -> hashlib names
+HTTP_DIGEST_ALGORITHMS = {'sha-512': 'sha512', 'sha-256': 'sha256', 'sha': 'sha1', 'md5': 'md5'}
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class StreamingChecksum:
+    """
+    Checksums of a file, updated with the bytes as they are written, so the
+    file never has to be read back to hash it. SHA-256 is always computed;
+    further algorithms are added to check published checksums.
+    """
+
+    def __init__(self, algorithms=()):
+        self._hashes = {name: hashlib.new(name) for name in {'sha256', *algorithms}}
+        self.size = 0
+
+    def update(self, data):
+        for digest in self._hashes.values():
+            digest.update(data)
+        self.size += len(data)
+
+    def update_from_file(self, file_path):
+        """Hash what is already on disk, e.g. the prefix of a resumed transfer."""
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+                self.update(chunk)
+
+    def hexdigest(self, algorithm='sha256'):
+        return self._hashes[algorithm].hexdigest()
+
+    def mismatches(self, published):
+        """The algorithms whose published hex digest differs from the computed one."""
+        return sorted(name for name, expected in published.items() if self.hexdigest(name) != expected.lower())
+
+
+def parse_digest_headers(headers, whole_body=True):
+    """
+    Return the published checksums of an HTTP response as {hashlib name: hex digest}.
+
+    Digest (RFC 3230) and Repr-Digest (RFC 9530) describe the whole file. Content-MD5
+    only describes the body, so it is only used when whole_body is true, i.e. not for
+    206 Partial Content.
+    """
+    published = {}
+    values = [headers.get('Digest'), headers.get('Repr-Digest')]
+    for value in values:
+        for item in (value or '').split(','):
+            name, _, encoded = item.strip().partition('=')
+            algorithm = HTTP_DIGEST_ALGORITHMS.get(name.strip().lower())
+            if algorithm and encoded:
+                digest = _base64_to_hex(encoded.strip().strip(':'))
+                if digest:
+                    published[algorithm] = digest
+    if whole_body and headers.get('Content-MD5'):
+        digest = _base64_to_hex(headers['Content-MD5'].strip())
+        if digest:
+            published.setdefault('md5', digest)
+    return published
+
+
+def _base64_to_hex(value):
+    try:
+        return base64.b64decode(value, validate=True).hex()
+    except ValueError:
+        logger.warning(f"Ignoring malformed checksum: {value}")
+        return None
+
+
+class ChecksumRegistry:
+    """
+    The checksums computed while files were downloaded, so that recording a
+    file (in the manifest, journal or cache) does not hash it again. An entry
+    is only used while the file keeps the size and modification time it had
+    when it was recorded.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def record(self, file_path, checksum, checks=(), remote_size=None):
+        """
+        Args:
+            checksum (StreamingChecksum): The checksum of the complete file.
+            checks (Iterable[str]): What the file was verified against: 'size' and/or algorithms
+                of published checksums.
+            remote_size (int): The size of the file on the server, if it was stored differently,
+                e.g. compressed.
+        """
+        stat = os.stat(file_path)
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': checksum.hexdigest(), 'checks': sorted(checks)}
+        if remote_size is not None:
+            entry['remote_size'] = remote_size
+        with self._lock:
+            self._entries[os.path.abspath(file_path)] = entry
+        return entry
+
+    def lookup(self, file_path):
+        """The recorded entry of file_path, or None if there is none or the file changed since."""
+        with self._lock:
+            entry = self._entries.get(os.path.abspath(file_path))
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        if (stat.st_size, stat.st_mtime_ns) != (entry['size'], entry['mtime_ns']):
+            return None
+        return entry
+
+
+_default_checksum_registry = ChecksumRegistry()
+
+
+def get_default_checksum_registry():
+    return _default_checksum_registry
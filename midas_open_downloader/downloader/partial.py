@@ -0,0 +1,94 @@
+import json
+import logging
+import os
+
+from .integrity import get_default_checksum_registry
+
+logger = logging.getLogger(__name__)
+
+PART_SUFFIX = '.part'
+METADATA_SUFFIX = '.part.json'
+
+
+class PartialDownload:
+    """
+    A partially downloaded file kept next to its final name as `<name>.part`,
+    together with `<name>.part.json` describing what it is a prefix of.
+
+    The metadata records the remote path, the expected total size and the
+    remote validators (ETag/Last-Modified for DAP, MDTM for FTP). A transfer is
+    only resumed if the validators still match, otherwise it starts over.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.part_path = filename + PART_SUFFIX
+        self.metadata_path = filename + METADATA_SUFFIX
+
+    def load_metadata(self):
+        try:
+            with open(self.metadata_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_metadata(self, metadata):
+        with open(self.metadata_path, 'w') as f:
+            json.dump(metadata, f)
+
+    def resume_offset(self, remote_path, validators=None):
+        """
+        Return the number of bytes already on disk for remote_path, or 0 if there
+        is nothing usable to resume from.
+
+        Args:
+            remote_path (str): The remote path the partial file must belong to.
+            validators (dict): Current remote validators; any that are set must match
+                the ones recorded with the partial file.
+        """
+        metadata = self.load_metadata()
+        if not metadata or metadata.get('remote_path') != remote_path or not os.path.exists(self.part_path):
+            return 0
+        for key, value in (validators or {}).items():
+            if value is not None and metadata.get(key) not in (None, value):
+                logger.info(f"Remote file changed since partial download ({key}), restarting: {remote_path}")
+                return 0
+        offset = os.path.getsize(self.part_path)
+        expected_size = metadata.get('size')
+        if expected_size is not None and offset > expected_size:
+            return 0
+        return offset
+
+    def open(self, append=False):
+        """Open the partial file to write the body to, appending to what is there if append is true."""
+        return open(self.part_path, 'ab' if append else 'wb')
+
+    def discard(self):
+        for path in (self.part_path, self.metadata_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def commit(self, expected_size=None):
+        """
+        Move the partial file to its final name once it is complete.
+
+        Returns:
+            bool: False if the partial file does not have the expected size yet.
+        """
+        if expected_size is not None and self._size() != expected_size:
+            return False
+        os.replace(self.part_path, self.filename)
+        try:
+            os.remove(self.metadata_path)
+        except OSError:
+            pass
+        return True
+
+    def _size(self):
+        return os.path.getsize(self.part_path)
+
+    def record(self, checksum, checks=()):
+        """Record the checksum of the committed file in the checksum registry and return its entry."""
+        return get_default_checksum_registry().record(self.filename, checksum, checks)
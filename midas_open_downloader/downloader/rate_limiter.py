@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+
+from .tracing import THROTTLE, record_phase
+
+logger = logging.getLogger(__name__)
+
+# Status codes with which the servers tell us to slow down
+HTTP_BACKOFF_STATUS_CODES = (429, 503)
+FTP_BACKOFF_REPLY_CODES = ('421',)
+
+
+class TokenBucket:
+    """
+    A token bucket that hands out reservations. Tokens may go negative; the
+    caller then sleeps for the returned delay, which keeps concurrent callers
+    fair without holding a lock while sleeping.
+    """
+
+    def __init__(self, capacity, now):
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def reserve(self, amount, rate, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / rate
+
+
+class RateLimiter:
+    """
+    Shared requests/sec and bytes/sec budgets for all downloaders and workers.
+
+    The effective rates are scaled by a factor that is halved whenever the
+    server pushes back (HTTP 429/503, FTP 421) and grows back additively after
+    every successful download.
+    """
+
+    def __init__(self, requests_per_second=1.0, bytes_per_second=None, burst=4,
+                 min_factor=0.05, recovery_step=0.05, clock=time.monotonic, sleep=time.sleep):
+        """
+        Args:
+            requests_per_second (float): Request budget, None for no limit.
+            bytes_per_second (float): Transfer budget, None for no limit.
+            burst (int): Number of requests that may be issued back to back.
+            min_factor (float): Lower bound for the backoff factor.
+            recovery_step (float): How much of the full rate is regained per success.
+        """
+        self.requests_per_second = requests_per_second
+        self.bytes_per_second = bytes_per_second
+        self.min_factor = min_factor
+        self.recovery_step = recovery_step
+        self.clock = clock
+        self.sleep = sleep
+        self.factor = 1.0
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+        now = clock()
+        self._request_bucket = TokenBucket(burst, now) if requests_per_second else None
+        self._byte_bucket = TokenBucket(bytes_per_second, now) if bytes_per_second else None
+
+    def _wait(self, delay):
+        if delay > 0:
+            record_phase(THROTTLE, delay)
+            self.sleep(delay)
+
+    def _reserve_request(self):
+        with self._lock:
+            now = self.clock()
+            delay = self.paused_until - now
+            if self._request_bucket:
+                delay = max(delay, self._request_bucket.reserve(1, self.requests_per_second * self.factor, now))
+        return delay
+
+    def _reserve_bytes(self, nbytes):
+        if not self._byte_bucket or nbytes <= 0:
+            return 0.0
+        with self._lock:
+            return self._byte_bucket.reserve(nbytes, self.bytes_per_second * self.factor, self.clock())
+
+    def acquire(self):
+        """Block until the next request may be sent."""
+        self._wait(self._reserve_request())
+
+    def consume(self, nbytes):
+        """Account for nbytes transferred, blocking if the bytes budget is exceeded."""
+        self._wait(self._reserve_bytes(nbytes))
+
+    async def acquire_async(self):
+        """Like acquire, but waits without blocking the event loop."""
+        import asyncio
+
+        delay = self._reserve_request()
+        if delay > 0:
+            record_phase(THROTTLE, delay)
+            await asyncio.sleep(delay)
+
+    async def consume_async(self, nbytes):
+        """Like consume, but waits without blocking the event loop."""
+        import asyncio
+
+        delay = self._reserve_bytes(nbytes)
+        if delay > 0:
+            record_phase(THROTTLE, delay)
+            await asyncio.sleep(delay)
+
+    def backoff(self, retry_after=None):
+        """Slow down after the server signalled overload."""
+        with self._lock:
+            self.factor = max(self.min_factor, self.factor / 2)
+            pause = retry_after
+            if pause is None:
+                pause = 1.0 / (self.requests_per_second * self.factor) if self.requests_per_second else 1.0
+            self.paused_until = max(self.paused_until, self.clock() + pause)
+        logger.warning(f"Server asked us to slow down, backing off for {pause:.1f}s (rate factor {self.factor:.2f})")
+
+    def recover(self):
+        """Regain part of the full rate after a successful download."""
+        with self._lock:
+            self.factor = min(1.0, self.factor + self.recovery_step)
+
+
+def parse_retry_after(value):
+    """Return the Retry-After header value in seconds, or None if it is absent or not a number."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+_default_rate_limiter = None
+_default_rate_limiter_lock = threading.Lock()
+
+
+def get_default_rate_limiter():
+    """Return the process-wide rate limiter shared by downloaders that were not given one."""
+    global _default_rate_limiter
+    with _default_rate_limiter_lock:
+        if _default_rate_limiter is None:
+            _default_rate_limiter = RateLimiter()
+        return _default_rate_limiter
+
+
+def set_default_rate_limiter(rate_limiter):
+    global _default_rate_limiter
+    with _default_rate_limiter_lock:
+        _default_rate_limiter = rate_limiter
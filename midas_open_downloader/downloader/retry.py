@@ -0,0 +1,179 @@
+import ftplib
+import logging
+import random
+import threading
+import time
+# On Python 3.11+ this and asyncio.TimeoutError are both the builtin TimeoutError; on
+# older versions they are separate classes and asyncio's is matched by name below
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+from .errors import DownloadError, RetriesExhaustedError
+from .tracing import RETRY, RETRY_WAIT, event, record_phase
+
+logger = logging.getLogger(__name__)
+
+TRANSIENT = 'transient'
+AUTH = 'auth'
+PERMANENT = 'permanent'
+
+# HTTP status codes that are worth retrying; other 4xx are permanent
+TRANSIENT_HTTP_STATUS_CODES = (408, 425, 429, 500, 502, 503, 504)
+AUTH_HTTP_STATUS_CODES = (401, 403)
+AUTH_FTP_REPLY_CODES = ('530', '532')
+
+
+def _status_code(error):
+    """Return the HTTP status of a requests or aiohttp error, if it has one."""
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status is None:
+        status = getattr(error, 'status', None)
+    return status if isinstance(status, int) else None
+
+
+def classify_error(error):
+    """
+    Sort a download error into TRANSIENT, AUTH or PERMANENT.
+
+    DownloadErrors are classified by the error they wrap. HTTP 401/403 and FTP
+    530/532 are AUTH; timeouts, dropped connections, incomplete or corrupt transfers, HTTP
+    408/425/429/5xx and FTP 4xx replies are TRANSIENT; everything else is PERMANENT.
+    """
+    if isinstance(error, RetriesExhaustedError):
+        return error.kind
+    if isinstance(error, DownloadError) and error.args:
+        cause = error.args[0]
+        if isinstance(cause, BaseException):
+            return classify_error(cause)
+        # Raised with a message only, e.g. for a transfer cut short or corrupted on the way
+        return TRANSIENT if str(cause).startswith(('Incomplete download', 'Corrupt download')) else PERMANENT
+
+    status = _status_code(error)
+    if status is not None:
+        if status in AUTH_HTTP_STATUS_CODES:
+            return AUTH
+        return TRANSIENT if status in TRANSIENT_HTTP_STATUS_CODES else PERMANENT
+    if isinstance(error, ftplib.error_perm):
+        return AUTH if str(error)[:3] in AUTH_FTP_REPLY_CODES else PERMANENT
+    if isinstance(error, ValueError):
+        # e.g. requests.InvalidURL, which is also an OSError
+        return PERMANENT
+    if isinstance(error, (ftplib.error_temp, ftplib.error_reply, EOFError, OSError, FuturesTimeoutError)):
+        return TRANSIENT
+    # Not all aiohttp connection errors derive from OSError, nor does asyncio.TimeoutError
+    # before Python 3.11; match them by name rather than importing them here
+    if any(name in type(error).__name__ for name in ('Timeout', 'Connection', 'ChunkedEncoding', 'Disconnected', 'PayloadError')):
+        return TRANSIENT
+    return PERMANENT
+
+
+class RetryPolicy:
+    """
+    Retries failed downloads with exponential backoff and full jitter.
+
+    Transient errors are retried up to max_attempts times per file, and at most
+    max_retries_per_run times across the whole run, so a server that is down does
+    not stall a large run for hours. Auth errors are retried once after calling
+    the reauthenticate callback; permanent errors are not retried.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=60.0, max_retries_per_run=100,
+                 classify=classify_error, jitter=random.random, sleep=time.sleep):
+        """
+        Args:
+            max_attempts (int): Attempts per file, including the first one.
+            base_delay (float): Delay ceiling in seconds for the first retry; doubles every retry.
+            max_delay (float): Upper bound of the delay ceiling.
+            max_retries_per_run (int): Retries allowed across all files until reset(); None for no limit.
+            classify (callable): Maps an exception to TRANSIENT, AUTH or PERMANENT.
+            jitter (callable): Returns a random fraction of the backoff ceiling to wait.
+        """
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retries_per_run = max_retries_per_run
+        self.classify = classify
+        self.jitter = jitter
+        self.sleep = sleep
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Start a new run with a fresh per-run retry budget."""
+        with self._lock:
+            self.retries = 0
+
+    def delay(self, retry):
+        """Seconds to wait before retry number retry (1-based), drawn uniformly below the backoff ceiling."""
+        return self.jitter() * min(self.max_delay, self.base_delay * 2 ** (retry - 1))
+
+    def _take_retry(self):
+        with self._lock:
+            if self.max_retries_per_run is not None and self.retries >= self.max_retries_per_run:
+                return False
+            self.retries += 1
+            return True
+
+    def _next_delay(self, error, attempt, auth_retried, description):
+        """Return the delay before the next attempt, or raise RetriesExhaustedError to give up."""
+        kind = self.classify(error)
+        if kind == AUTH and auth_retried:
+            retry = False
+        elif kind == AUTH:
+            retry = True
+        else:
+            retry = kind == TRANSIENT and attempt < self.max_attempts
+        if not retry or not self._take_retry():
+            logger.error(f"Giving up on {description} after {attempt} attempt(s) ({kind}). Error: {error}")
+            raise RetriesExhaustedError(error, kind, attempt) from error
+        delay = 0.0 if kind == AUTH else self.delay(attempt)
+        event(RETRY, kind=kind)
+        record_phase(RETRY_WAIT, delay)
+        logger.warning(f"{kind.capitalize()} error on attempt {attempt} for {description}, retrying in {delay:.1f}s. Error: {error}")
+        return kind, delay
+
+    def call(self, operation, description, reauthenticate=None):
+        """
+        Run operation() until it succeeds or the policy gives up.
+
+        Args:
+            operation (callable): The download to run.
+            description (str): Identifies the item in log messages.
+            reauthenticate (callable): Called before retrying after an auth error.
+
+        Raises:
+            RetriesExhaustedError: When giving up; the last error is its cause.
+        """
+        attempt = 0
+        auth_retried = False
+        while True:
+            attempt += 1
+            try:
+                return operation()
+            except DownloadError as e:
+                kind, delay = self._next_delay(e, attempt, auth_retried, description)
+            if kind == AUTH:
+                auth_retried = True
+                if reauthenticate:
+                    reauthenticate()
+            elif delay > 0:
+                self.sleep(delay)
+
+    async def call_async(self, operation, description, reauthenticate=None):
+        """Like call, for a coroutine function operation and an optional coroutine function reauthenticate."""
+        import asyncio
+
+        attempt = 0
+        auth_retried = False
+        while True:
+            attempt += 1
+            try:
+                return await operation()
+            except DownloadError as e:
+                kind, delay = self._next_delay(e, attempt, auth_retried, description)
+            if kind == AUTH:
+                auth_retried = True
+                if reauthenticate:
+                    await reauthenticate()
+            elif delay > 0:
+                await asyncio.sleep(delay)
@@ -0,0 +1,324 @@
+import os
+import zlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+
+from .integrity import StreamingChecksum, get_default_checksum_registry
+from .partial import PartialDownload
+
+logger = logging.getLogger(__name__)
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+COMPRESSION_SUFFIXES = {GZIP: '.gz', ZSTD: '.zst'}
+
+CAPABILITY_SUFFIX = '_capability.csv'
+# S3 requires every part of a multipart upload but the last to be at least 5 MiB
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+
+
+def is_observation_file(relative_path):
+    """
+    Whether relative_path is an observation file rather than station metadata.
+    Capability files are parsed right after they are downloaded, so sinks always
+    keep them as plain local files.
+    """
+    return not relative_path.endswith(CAPABILITY_SUFFIX)
+
+
+class StorageSink(ABC):
+    """
+    Where downloaded files are stored. A downloader asks the sink for the
+    location of a remote file (given relative to the dataset base path) and
+    streams the body into the partial download the sink hands out for that
+    location, which stores it in a single pass once it is committed.
+    """
+
+    @abstractmethod
+    def location(self, relative_path):
+        """The location (local path or URI) the file at relative_path is stored at."""
+        pass
+
+    @abstractmethod
+    def partial(self, location):
+        """The PartialDownload to stream the file stored at location into."""
+        pass
+
+
+class LocalSink(StorageSink):
+    """
+    Store files on the local file system. Without root, files are written flat to
+    the working directory under their remote name. With root, the remote tree is
+    mirrored below it (dataset-version/county/station/qc-version/file), so files of
+    different dataset versions or stations never collide.
+
+    With compression ('gzip', or 'zstd' which requires the zstandard package)
+    observation files are compressed on the fly and get a .gz/.zst suffix. A
+    compressed transfer can not be appended to, so it is not resumed.
+    """
+
+    def __init__(self, root=None, compression=None, level=None):
+        """
+        Args:
+            root (str): Directory to mirror the remote tree in; None for the flat layout.
+            compression (str): 'gzip', 'zstd' or None.
+            level (int): Compression level; None for the library default.
+        """
+        if compression is not None and compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unknown compression {compression!r}, expected one of: {', '.join(COMPRESSION_SUFFIXES)}")
+        self.root = root
+        self.compression = compression
+        self.level = level
+
+    def location(self, relative_path):
+        if self.root is None:
+            path = relative_path.rsplit('/', 1)[-1]
+        else:
+            path = os.path.join(self.root, *relative_path.split('/'))
+        if self.compression and is_observation_file(relative_path):
+            path += COMPRESSION_SUFFIXES[self.compression]
+        return path
+
+    def partial(self, location):
+        directory = os.path.dirname(location)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        for compression, suffix in COMPRESSION_SUFFIXES.items():
+            if location.endswith(suffix):
+                return CompressedPartialDownload(location, compression, self.level)
+        return PartialDownload(location)
+
+
+class S3Sink(StorageSink):
+    """
+    Upload observation files to an S3-compatible object store while they are
+    transferred, with a multipart upload of part_size parts for large files and
+    a single PUT for small ones. Nothing is written to disk, so uploads are not
+    resumed. Capability files are stored by metadata_sink instead.
+    """
+
+    def __init__(self, bucket, prefix='', client=None, endpoint_url=None, compression=None, level=None,
+                 part_size=DEFAULT_PART_SIZE, metadata_sink=None):
+        """
+        Args:
+            bucket (str): The bucket to upload to.
+            prefix (str): Key prefix the remote tree is mirrored under.
+            client: A boto3 S3 client, or any object with the same put_object and multipart
+                upload methods. Created with boto3 on first use if not given.
+            endpoint_url (str): Endpoint of a non-AWS S3-compatible store, for the created client.
+            compression (str): 'gzip', 'zstd' or None.
+            level (int): Compression level; None for the library default.
+            part_size (int): Bytes buffered per uploaded part.
+            metadata_sink (StorageSink): Where capability files go (default: the working directory).
+        """
+        if compression is not None and compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unknown compression {compression!r}, expected one of: {', '.join(COMPRESSION_SUFFIXES)}")
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.endpoint_url = endpoint_url
+        self.compression = compression
+        self.level = level
+        self.part_size = part_size
+        self.metadata_sink = metadata_sink or LocalSink()
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                import boto3
+                self._client = boto3.client('s3', endpoint_url=self.endpoint_url)
+            return self._client
+
+    def location(self, relative_path):
+        if not is_observation_file(relative_path):
+            return self.metadata_sink.location(relative_path)
+        key = f"{self.prefix}/{relative_path}" if self.prefix else relative_path
+        if self.compression:
+            key += COMPRESSION_SUFFIXES[self.compression]
+        return f"s3://{self.bucket}/{key}"
+
+    def partial(self, location):
+        if not location.startswith(f"s3://{self.bucket}/"):
+            return self.metadata_sink.partial(location)
+        key = location[len(f"s3://{self.bucket}/"):]
+        return S3PartialUpload(location, self.client, self.bucket, key, self.part_size, self.compression, self.level)
+
+
+class CompressedPartialDownload(PartialDownload):
+    """A partial download whose body is compressed into `<name>.part` as it is written."""
+
+    def __init__(self, filename, compression, level=None):
+        super().__init__(filename)
+        self.compression = compression
+        self.level = level
+        self._writer = None
+
+    def resume_offset(self, remote_path, validators=None):
+        return 0
+
+    def open(self, append=False):
+        self._writer = _CompressingWriter(open(self.part_path, 'wb'), self.compression, self.level)
+        return self._writer
+
+    def _size(self):
+        # Complete means all uncompressed bytes were written
+        return self._writer.size if self._writer else 0
+
+    def record(self, checksum, checks=()):
+        # Checksums in the registry, manifest and journal describe the file as stored, the
+        # uncompressed size is kept to compare with the server
+        return get_default_checksum_registry().record(self.filename, self._writer.stored, checks, remote_size=self._writer.size)
+
+
+class S3PartialUpload:
+    """
+    The PartialDownload of an object being uploaded. Metadata is only kept in
+    memory and the upload is only completed by commit().
+    """
+
+    def __init__(self, filename, client, bucket, key, part_size, compression=None, level=None):
+        self.filename = filename
+        self.part_path = None
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.compression = compression
+        self.level = level
+        self._metadata = None
+        self._upload = None
+        self._writer = None
+
+    def load_metadata(self):
+        return self._metadata
+
+    def save_metadata(self, metadata):
+        self._metadata = metadata
+
+    def resume_offset(self, remote_path, validators=None):
+        return 0
+
+    def open(self, append=False):
+        self._upload = _MultipartUpload(self.client, self.bucket, self.key, self.part_size)
+        self._writer = _CompressingWriter(self._upload, self.compression, self.level) if self.compression else self._upload
+        return self._writer
+
+    def discard(self):
+        if self._upload:
+            self._upload.abort()
+
+    def commit(self, expected_size=None):
+        """
+        Complete the upload once it has the expected size.
+
+        Returns:
+            bool: False (and the upload is aborted) if it does not have the expected size.
+        """
+        if expected_size is not None and self._writer.size != expected_size:
+            self._upload.abort()
+            return False
+        self._upload.complete()
+        return True
+
+    def record(self, checksum, checks=()):
+        """The size and SHA-256 of the stored object; there is no local file to register."""
+        stored = self._writer.stored if self.compression else checksum
+        return {'size': stored.size, 'sha256': stored.hexdigest(), 'checks': sorted(checks)}
+
+
+class _CompressingWriter:
+    """
+    Compress what is written into file_object, counting the uncompressed bytes
+    and hashing the compressed ones on the way.
+    """
+
+    def __init__(self, file_object, compression, level=None):
+        self._file = file_object
+        self.size = 0
+        self.stored = StreamingChecksum()
+        if compression == GZIP:
+            # wbits 31 writes a gzip header without a timestamp, so the output is reproducible
+            self._compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if level is None else level, zlib.DEFLATED, 31)
+        else:
+            import zstandard
+            self._compressor = zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+
+    def write(self, data):
+        self.size += len(data)
+        self._emit(self._compressor.compress(data))
+
+    def _emit(self, data):
+        if data:
+            self._file.write(data)
+            self.stored.update(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._emit(self._compressor.flush())
+        return self._file.__exit__(exc_type, exc, tb)
+
+
+class _MultipartUpload:
+    """
+    A write-only file object that uploads what is written to an S3 object in
+    parts. Files smaller than one part are uploaded with a single PUT by complete().
+    """
+
+    def __init__(self, client, bucket, key, part_size):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.size = 0
+        self.stored = StreamingChecksum()
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+
+    def write(self, data):
+        self._buffer += data
+        self.size += len(data)
+        self.stored.update(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+
+    def _upload_part(self, data):
+        if self._upload_id is None:
+            self._upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)['UploadId']
+        number = len(self._parts) + 1
+        response = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, PartNumber=number, Body=data)
+        self._parts.append({'PartNumber': number, 'ETag': response['ETag']})
+
+    def complete(self):
+        if self._upload_id is None:
+            self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer))
+        else:
+            if self._buffer:
+                self._upload_part(bytes(self._buffer))
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, MultipartUpload={'Parts': self._parts},
+            )
+        self._buffer = bytearray()
+        logger.debug(f"Uploaded s3://{self.bucket}/{self.key}")
+
+    def abort(self):
+        if self._upload_id is not None:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+            self._upload_id = None
+        self._buffer = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # The upload is completed by commit(); a failed transfer leaves no parts behind
+        if exc_type is not None:
+            self.abort()
+        return False
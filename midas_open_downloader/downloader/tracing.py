@@ -0,0 +1,202 @@
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Phases of a file download, in seconds
+CONNECT = 'connect'      # DNS lookup (unless reported as DNS) and TCP connect, or FTP connect and login
+DNS = 'dns'
+TLS = 'tls'
+TTFB = 'ttfb'            # Request sent until the first byte of the response, without connection setup
+TRANSFER = 'transfer'    # First byte until the last one
+THROTTLE = 'throttle'    # Waiting for the rate limiter
+RETRY_WAIT = 'retry_wait'
+COOLDOWN = 'cooldown'
+
+CONNECTION_PHASES = (DNS, CONNECT, TLS)
+
+# Events
+BYTES = 'bytes'
+RETRY = 'retry'
+CACHE_HIT = 'cache_hit'
+CACHE_MISS = 'cache_miss'
+
+_current_span = contextvars.ContextVar('midas_current_span', default=None)
+
+
+class Span:
+    """
+    The timings of one operation, usually a file download including its retries.
+    Phases add up the seconds spent in each part of the operation, counters the
+    events that happened during it.
+    """
+
+    def __init__(self, name, attributes, tracer=None):
+        self.name = name
+        self.tracer = tracer
+        self.attributes = dict(attributes)
+        self.phases = {}
+        self.counters = {}
+        self.error = None
+        self.start_time = time.time()
+        self.duration = None
+        self._started = time.perf_counter()
+
+    def add_phase(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, phase):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(phase, time.perf_counter() - started)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'attributes': self.attributes,
+            'start_time': self.start_time,
+            'duration': self.duration,
+            'phases': self.phases,
+            'counters': self.counters,
+            'error': self.error,
+        }
+
+
+class Hook:
+    """Receives spans and events from a Tracer. Override the methods you need."""
+
+    def on_span_start(self, span):
+        pass
+
+    def on_span_end(self, span):
+        pass
+
+    def on_event(self, name, value, attributes):
+        pass
+
+
+class LoggingHook(Hook):
+    """Logs a one-line timing breakdown of every finished span at DEBUG level."""
+
+    def on_span_end(self, span):
+        phases = ', '.join(f"{phase} {seconds:.3f}s" for phase, seconds in sorted(span.phases.items()))
+        logger.debug(f"{span.name} {span.attributes} took {span.duration:.3f}s ({phases}) {span.counters}")
+
+
+class Tracer:
+    """
+    Creates spans and passes them and events on to the registered hooks. The
+    current span is kept in a context variable, so it follows both threads and
+    asyncio tasks, and instrumented code deep down (rate limiter, connection
+    setup) adds to the span of the operation it is part of.
+
+    A hook that raises is logged and otherwise ignored, so instrumentation never
+    fails a download.
+    """
+
+    def __init__(self, hooks=()):
+        self.hooks = list(hooks)
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        with self._lock:
+            self.hooks = self.hooks + [hook]
+        return hook
+
+    def remove_hook(self, hook):
+        with self._lock:
+            self.hooks = [h for h in self.hooks if h is not hook]
+
+    def _notify(self, method, *args):
+        for hook in self.hooks:
+            try:
+                getattr(hook, method)(*args)
+            except Exception as e:
+                logger.error(f"Instrumentation hook {type(hook).__name__}.{method} failed. Error: {e}")
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span = Span(name, attributes, self)
+        token = _current_span.set(span)
+        self._notify('on_span_start', span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.finish()
+            _current_span.reset(token)
+            self._notify('on_span_end', span)
+
+    def event(self, name, value=1, **attributes):
+        """Count an event on the current span and pass it on to the hooks."""
+        span = _current_span.get()
+        if span is not None:
+            span.count(name, value)
+        if self.hooks:
+            self._notify('on_event', name, value, attributes)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def record_phase(phase, seconds):
+    """Add seconds to a phase of the current span, if there is one."""
+    span = _current_span.get()
+    if span is not None and seconds > 0:
+        span.add_phase(phase, seconds)
+
+
+def _phase_seconds(phases):
+    span = _current_span.get()
+    return sum(span.phases.get(phase, 0.0) for phase in phases) if span is not None else 0.0
+
+
+@contextmanager
+def timed_phase(phase, exclude=()):
+    """
+    Add the time spent in the block to a phase of the current span.
+
+    Args:
+        exclude (Iterable[str]): Phases recorded inside the block whose time is not
+            counted again, e.g. connection setup while waiting for the first byte.
+    """
+    excluded = _phase_seconds(exclude)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started - (_phase_seconds(exclude) - excluded))
+
+
+_default_tracer = Tracer()
+
+
+def get_default_tracer():
+    return _default_tracer
+
+
+def set_default_tracer(tracer):
+    global _default_tracer
+    _default_tracer = tracer
+
+
+def event(name, value=1, **attributes):
+    """Emit an event through the tracer of the current span, or the default tracer outside of spans."""
+    span = _current_span.get()
+    tracer = span.tracer if span is not None and span.tracer is not None else _default_tracer
+    tracer.event(name, value, **attributes)
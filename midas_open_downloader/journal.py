@@ -0,0 +1,143 @@
+import os
+import json
+import logging
+import threading
+import time
+
+from .cache import file_sha256, recorded_sha256
+from .sync import station_year_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL_PATH = './midas_journal.jsonl'
+
+# Unit states, in the order a unit goes through them
+PLANNED = 'planned'
+STARTED = 'started'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+
+class Journal:
+    """
+    An append-only JSON Lines log of a retrieval run: one event per line for
+    every station-year that is planned, started, completed (with its local
+    path, size and SHA-256 checksum) or failed. Every event is flushed and
+    fsynced before the run moves on, so the journal survives the process being
+    killed; a torn last line is ignored when it is replayed.
+
+    Replaying the journal with resume gives the last state of every unit, so a
+    new run can skip what completed and continue with the rest.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH, resume=False, fsync=True):
+        """
+        Args:
+            path (str): The journal file.
+            resume (bool): Replay and extend an existing journal; otherwise it is started over.
+            fsync (bool): Force every event to disk before returning.
+        """
+        self.path = path
+        self.fsync = fsync
+        self.units = {}
+        self._lock = threading.Lock()
+        if resume:
+            self._replay()
+        self._file = open(path, 'a' if resume else 'w')
+
+    @classmethod
+    def read_units(cls, path):
+        """
+        Replay the journal at path without opening it for writing, e.g. to check it.
+
+        Returns:
+            Dict[str, dict]: The last state of every unit by key, as in Journal.units.
+        """
+        units = {}
+        try:
+            with open(path, 'r') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return units
+        for number, line in enumerate(lines, 1):
+            try:
+                event = json.loads(line)
+            except ValueError:
+                logger.warning(f"Ignoring unreadable journal line {number} in {path}")
+                continue
+            unit = units.setdefault(event['key'], {})
+            unit.update(event)
+            unit['state'] = unit.pop('event')
+        return units
+
+    def _replay(self):
+        self.units = self.read_units(self.path)
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b'\n'
+        except OSError:
+            # Missing or empty
+            torn = False
+        if torn:
+            # Start appending on a fresh line after a torn write
+            with open(self.path, 'a') as f:
+                f.write('\n')
+        logger.info(f"Replayed {len(self.units)} units from {self.path}")
+
+    def _append(self, event, key, **fields):
+        record = dict(fields, event=event, key=key, time=time.time())
+        with self._lock:
+            self._file.write(json.dumps(record, sort_keys=True) + '\n')
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            unit = self.units.setdefault(key, {})
+            unit.update(record)
+            unit['state'] = unit.pop('event')
+
+    def plan(self, historic_county, station_years, quality_control_version, dataset_version):
+        """Record the (station_id, year) pairs a run is going to fetch."""
+        for station_id, year in station_years:
+            key = station_year_key(dataset_version, historic_county, station_id, quality_control_version, year)
+            self._append(PLANNED, key, historic_county=historic_county, station_id=station_id, year=year,
+                         quality_control_version=quality_control_version, dataset_version=dataset_version)
+
+    def start(self, key):
+        self._append(STARTED, key)
+
+    def complete(self, key, local_file_path):
+        """Record a finished download with the size and checksum of the file that landed on disk."""
+        self._append(COMPLETED, key, path=os.path.abspath(local_file_path),
+                     size=os.path.getsize(local_file_path), sha256=recorded_sha256(local_file_path))
+
+    def fail(self, key, kind, attempts, error):
+        self._append(FAILED, key, kind=kind, attempts=attempts, error=str(error))
+
+    def state(self, key):
+        return self.units.get(key, {}).get('state')
+
+    def completed_file(self, key, verify=False):
+        """
+        The local file of a completed unit if it is still intact (it exists and has the
+        recorded size and, with verify, the recorded checksum), otherwise None.
+        """
+        unit = self.units.get(key, {})
+        if unit.get('state') != COMPLETED or not os.path.exists(unit['path']):
+            return None
+        if os.path.getsize(unit['path']) != unit['size']:
+            return None
+        if verify and file_sha256(unit['path']) != unit['sha256']:
+            return None
+        return unit['path']
+
+    def summary(self):
+        """The number of units per state."""
+        counts = {state: 0 for state in (PLANNED, STARTED, COMPLETED, FAILED)}
+        for unit in self.units.values():
+            counts[unit['state']] += 1
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+import re
+import threading
+
+from .downloader.abstract_downloader import DEFAULT_DATASET_VERSION
+from .downloader.errors import DownloadError
+from .pool import RepositoryPool, run_in_pool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATASET_INDEX_PATH = './midas_listing.json'
+
+_QC_VERSION_PATTERN = re.compile(r'^qc-version-(\w+)$')
+_HOURLY_YEAR_PATTERN = re.compile(r'_(\d{4})\.csv$')
+
+
+class DatasetIndex:
+    """
+    A persistent index of what actually exists on the server, built from
+    directory listings:
+
+        dataset version -> historic county -> station -> qc version -> {year: size}
+
+    Downloads planned from the index only request files that exist, and a
+    whole county can be requested without knowing its station ids.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.versions = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                self.versions = json.load(f)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(self.versions, f, sort_keys=True)
+            os.replace(temp_path, self.path)
+
+    def counties(self, dataset_version=DEFAULT_DATASET_VERSION):
+        return sorted(self.versions.get(dataset_version, {}))
+
+    def has_county(self, historic_county, dataset_version=DEFAULT_DATASET_VERSION):
+        return historic_county in self.versions.get(dataset_version, {})
+
+    def stations(self, historic_county, dataset_version=DEFAULT_DATASET_VERSION):
+        return sorted(self.versions.get(dataset_version, {}).get(historic_county, {}))
+
+    def years(self, historic_county, station_id, quality_control_version="1", dataset_version=DEFAULT_DATASET_VERSION):
+        """Return {year: size in bytes (or None)} of the hourly files of a station."""
+        station = self.versions.get(dataset_version, {}).get(historic_county, {}).get(station_id, {})
+        return {int(year): size for year, size in station.get(str(quality_control_version), {}).items()}
+
+    def station_years(self, historic_county, station_ids, start_year, end_year, quality_control_version="1", dataset_version=DEFAULT_DATASET_VERSION):
+        """
+        Return the (station_id, year) pairs in the year range that exist on the server.
+        With station_ids None, all stations of the county are used.
+        """
+        if station_ids is None:
+            station_ids = self.stations(historic_county, dataset_version)
+        station_years = []
+        for station_id in station_ids:
+            years = self.years(historic_county, station_id, quality_control_version, dataset_version)
+            station_years.extend((station_id, year) for year in sorted(years) if start_year <= year <= end_year)
+        return station_years
+
+    def set_station(self, historic_county, station_id, qc_versions, dataset_version=DEFAULT_DATASET_VERSION):
+        with self._lock:
+            county = self.versions.setdefault(dataset_version, {}).setdefault(historic_county, {})
+            county[station_id] = _station_entry(qc_versions)
+
+    def crawl(self, repository_factory, workers=1, historic_counties=None, dataset_version=DEFAULT_DATASET_VERSION):
+        """
+        List the dataset on the server and (re)build the index for the given counties,
+        or for every county of the dataset version if none are given. Stations of a
+        county are listed concurrently by `workers` repositories.
+        """
+        pool = RepositoryPool(repository_factory)
+        try:
+            if historic_counties is None:
+                repository = pool.get()
+                historic_counties = [entry['name'] for entry in repository.list_directory(dataset_version)
+                                     if entry['type'] == 'dir']
+            for historic_county in historic_counties:
+                self._crawl_county(pool, workers, historic_county, dataset_version)
+        finally:
+            pool.cleanup()
+        self.save()
+
+    def _crawl_county(self, pool, workers, historic_county, dataset_version):
+        station_ids = [entry['name'] for entry in pool.get().list_directory(dataset_version, historic_county)
+                       if entry['type'] == 'dir']
+        logger.info(f"Listing {len(station_ids)} stations in {historic_county}")
+
+        def list_station(repository, station_id):
+            try:
+                return self._list_station(repository, historic_county, station_id, dataset_version)
+            except DownloadError as e:
+                logger.error(f"Error listing station {station_id}. Error: {str(e)}")
+                return None
+
+        # The county is rebuilt, so stations that are gone from the server are dropped
+        with self._lock:
+            previous = self.versions.get(dataset_version, {}).get(historic_county, {})
+        county = {}
+        for station_id, qc_versions in zip(station_ids, run_in_pool(pool, station_ids, list_station, max(1, workers))):
+            if qc_versions is not None:
+                county[station_id] = _station_entry(qc_versions)
+            elif station_id in previous:
+                # Keep what was known of a station that could not be listed this time
+                county[station_id] = previous[station_id]
+        with self._lock:
+            self.versions.setdefault(dataset_version, {})[historic_county] = county
+
+    def _list_station(self, repository, historic_county, station_id, dataset_version):
+        qc_versions = {}
+        for entry in repository.list_directory(dataset_version, historic_county, station_id):
+            match = _QC_VERSION_PATTERN.match(entry['name'])
+            if entry['type'] != 'dir' or not match:
+                continue
+            years = {}
+            for file_entry in repository.list_directory(dataset_version, historic_county, station_id, match.group(1)):
+                year = _HOURLY_YEAR_PATTERN.search(file_entry['name'])
+                if file_entry['type'] == 'file' and year:
+                    years[int(year.group(1))] = file_entry.get('size')
+            qc_versions[match.group(1)] = years
+        return qc_versions
+
+
+def _station_entry(qc_versions):
+    """The index entry of a station: qc version -> {year as str: size}, as stored in JSON."""
+    return {
+        qcv: {str(year): size for year, size in years.items()}
+        for qcv, years in qc_versions.items()
+    }
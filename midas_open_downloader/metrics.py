@@ -0,0 +1,180 @@
+import json
+import math
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .downloader.tracing import Hook, BYTES
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def percentile(values, fraction):
+    """The value below which fraction of the sorted values fall (nearest rank)."""
+    if not values:
+        return None
+    index = max(0, math.ceil(fraction * len(values)) - 1)
+    return values[index]
+
+
+def _describe(values):
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'total': sum(values),
+        'mean': sum(values) / len(values) if values else None,
+        'p50': percentile(values, 0.5),
+        'p99': percentile(values, 0.99),
+        'max': values[-1] if values else None,
+    }
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+class MetricsCollector(Hook):
+    """
+    Aggregates the spans and events of a Tracer into run metrics: files per
+    kind and outcome, bytes, event counts (retries, cache hits and misses) and
+    the distribution of every phase and of the file durations.
+
+    Register it with tracer.add_hook, then export with summary() / write_json()
+    or to_prometheus() / write_prometheus(), or serve the Prometheus text on a
+    port with start_http_server().
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.files = {}
+        self.bytes = 0
+        self.events = {}
+        self.phases = {}
+        self.durations = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def on_span_end(self, span):
+        kind = span.attributes.get('kind', span.name)
+        outcome = span.attributes.get('outcome', 'failed' if span.error else 'ok')
+        with self._lock:
+            self.files[(kind, outcome)] = self.files.get((kind, outcome), 0) + 1
+            self.durations.setdefault(kind, []).append(span.duration)
+            for phase, seconds in span.phases.items():
+                self.phases.setdefault(phase, []).append(seconds)
+
+    def on_event(self, name, value, attributes):
+        with self._lock:
+            if name == BYTES:
+                self.bytes += value
+            else:
+                self.events[name] = self.events.get(name, 0) + value
+
+    def summary(self):
+        """
+        Returns:
+            dict: 'files' (kind -> outcome -> count), 'bytes', 'events' (name -> count),
+            'phases' and 'durations' (name -> count, total, mean, p50, p99 and max seconds).
+        """
+        with self._lock:
+            files = {}
+            for (kind, outcome), count in sorted(self.files.items()):
+                files.setdefault(kind, {})[outcome] = count
+            return {
+                'files': files,
+                'bytes': self.bytes,
+                'events': dict(sorted(self.events.items())),
+                'phases': {phase: _describe(values) for phase, values in sorted(self.phases.items())},
+                'durations': {kind: _describe(values) for kind, values in sorted(self.durations.items())},
+            }
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def _histogram(self, name, label, series):
+        lines = []
+        for key, values in sorted(series.items()):
+            values = sorted(values)
+            count = 0
+            for bound in self.buckets:
+                while count < len(values) and values[count] <= bound:
+                    count += 1
+                lines.append(f"{name}_bucket{_labels(**{label: key, 'le': bound})} {count}")
+            lines.append(f"{name}_bucket{_labels(**{label: key, 'le': '+Inf'})} {len(values)}")
+            lines.append(f"{name}_sum{_labels(**{label: key})} {sum(values)}")
+            lines.append(f"{name}_count{_labels(**{label: key})} {len(values)}")
+        return lines
+
+    def to_prometheus(self):
+        """The metrics in the Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                '# HELP midas_files_total Files processed, by kind and outcome.',
+                '# TYPE midas_files_total counter',
+            ]
+            lines += [f"midas_files_total{_labels(kind=kind, outcome=outcome)} {count}" for (kind, outcome), count in sorted(self.files.items())]
+            lines += [
+                '# HELP midas_bytes_total Bytes transferred.',
+                '# TYPE midas_bytes_total counter',
+                f"midas_bytes_total {self.bytes}",
+                '# HELP midas_events_total Retries, cache hits and other events.',
+                '# TYPE midas_events_total counter',
+            ]
+            lines += [f"midas_events_total{_labels(event=name)} {count}" for name, count in sorted(self.events.items())]
+            lines += [
+                '# HELP midas_phase_seconds Time spent per file in each phase of a download.',
+                '# TYPE midas_phase_seconds histogram',
+            ]
+            lines += self._histogram('midas_phase_seconds', 'phase', self.phases)
+            lines += [
+                '# HELP midas_file_duration_seconds Time per file, including retries and cooldown.',
+                '# TYPE midas_file_duration_seconds histogram',
+            ]
+            lines += self._histogram('midas_file_duration_seconds', 'kind', self.durations)
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Write the metrics for the node exporter textfile collector."""
+        with open(path, 'w') as f:
+            f.write(self.to_prometheus())
+
+    def start_http_server(self, port, host=''):
+        """Serve the metrics at http://host:port/metrics from a background thread while the run goes on."""
+        collector = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = collector.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True).start()
+        logger.info(f"Serving metrics on port {self._server.server_address[1]}")
+        return self._server.server_address[1]
+
+    def stop_http_server(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
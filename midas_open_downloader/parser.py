@@ -1,9 +1,10 @@
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import os
 import logging
 from midas_open_parser import parse_badc_csv
 
-logging.basicConfig(level=logging.INFO)
+from .badc import load_badc_dataframe
+
 logger = logging.getLogger(__name__)
 
 
@@ -47,6 +48,22 @@ def parse_station_capabilities(file_path: str) -> Dict[str, Dict[str, str]]:
 
     return capabilities
 
+def parse_hourly_observations(file_path: str, columns: Optional[List[str]] = None):
+    """
+    Parse an hourly observations file into a DataFrame with typed columns.
+
+    Unlike parse_badc_csv, which builds a dict per row, the data section is
+    loaded in one vectorized pass; see badc.load_badc_dataframe. Requires pandas.
+
+    Args:
+        file_path (str): The path to the hourly observations file.
+        columns (List[str]): Only load these columns.
+
+    Returns:
+        pandas.DataFrame: One row per observation.
+    """
+    return load_badc_dataframe(file_path, columns)
+
 def get_station_years(capabilities: Dict[str, Dict[str, str]]) -> Tuple[int, int]:
     """
     Get the range of years from station capabilities.
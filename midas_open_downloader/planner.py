@@ -0,0 +1,248 @@
+import argparse
+import hashlib
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from .repository import Repository
+from .listing import DatasetIndex
+from .pool import RepositoryPool
+from .sync import station_year_key
+from .downloader.abstract_downloader import DEFAULT_DATASET_VERSION
+from .downloader.errors import DownloadError, RetriesExhaustedError
+from .downloader.retry import RetryPolicy, TRANSIENT
+from .downloader.tracing import COOLDOWN, get_default_tracer
+from .work_queue import SQLiteWorkQueue, DEFAULT_QUEUE_PATH, DEFAULT_LEASE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+HASH = 'hash'
+SIZE = 'size'
+
+
+def plan_work_units(dataset_index: DatasetIndex, historic_counties: Optional[List[str]], start_year: int, end_year: int,
+                    quality_control_version="1", dataset_version=DEFAULT_DATASET_VERSION) -> List[Dict]:
+    """
+    Expand a request into one work unit per station-year file listed in the index.
+
+    Args:
+        historic_counties (List[str]): The counties to plan, None for every county in the index.
+
+    Returns:
+        List[dict]: Units with 'key', 'historic_county', 'station_id', 'year',
+            'quality_control_version', 'dataset_version' and 'size' (bytes or None), in key order.
+    """
+    if historic_counties is None:
+        historic_counties = dataset_index.counties(dataset_version)
+    units = []
+    for historic_county in historic_counties:
+        for station_id in dataset_index.stations(historic_county, dataset_version):
+            years = dataset_index.years(historic_county, station_id, quality_control_version, dataset_version)
+            for year in sorted(years):
+                if start_year <= year <= end_year:
+                    units.append({
+                        'key': station_year_key(dataset_version, historic_county, station_id, quality_control_version, year),
+                        'historic_county': historic_county,
+                        'station_id': station_id,
+                        'year': year,
+                        'quality_control_version': quality_control_version,
+                        'dataset_version': dataset_version,
+                        'size': years[year],
+                    })
+    return sorted(units, key=lambda unit: unit['key'])
+
+
+def shard_of(key: str, shards: int) -> int:
+    """A stable shard for key, the same on every machine and Python version."""
+    return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], 'big') % shards
+
+
+def assign_shards(units: List[Dict], shards: int, strategy=HASH) -> List[Dict]:
+    """
+    Set 'shard' on every unit, deterministically, so every machine computes the same plan.
+
+    Args:
+        strategy (str): HASH spreads units by a hash of their key. SIZE balances the
+            total bytes per shard: the largest units go first to the least loaded
+            shard, with unknown sizes counted as the mean size.
+
+    Returns:
+        List[dict]: The units.
+    """
+    if strategy == HASH:
+        for unit in units:
+            unit['shard'] = shard_of(unit['key'], shards)
+    elif strategy == SIZE:
+        known = [unit['size'] for unit in units if unit.get('size') is not None]
+        default_size = sum(known) / len(known) if known else 1
+        loads = [0] * shards
+        for unit in sorted(units, key=lambda unit: (-(unit['size'] if unit.get('size') is not None else default_size), unit['key'])):
+            shard = min(range(shards), key=lambda index: (loads[index], index))
+            unit['shard'] = shard
+            loads[shard] += unit['size'] if unit.get('size') is not None else default_size
+    else:
+        raise ValueError(f"Unknown sharding strategy: {strategy}")
+    return units
+
+
+class ShardWorker:
+    """
+    Claims work units from a WorkQueue, downloads them and acknowledges them.
+
+    While a unit is being downloaded its lease is extended in the background, so
+    only units of workers that died are handed out again. Failed units are given
+    back to the queue for another attempt, unless the error is not transient.
+    Unexpected errors fail their unit for good without stopping the worker.
+    """
+
+    def __init__(self, queue, repository_factory=None, worker_id=None, shard=None, workers=1,
+                 lease_seconds=DEFAULT_LEASE_SECONDS, retry_policy=None, tracer=None):
+        """
+        Args:
+            queue (WorkQueue): The shared queue.
+            worker_id (str): Identifies this worker's leases, unique per process by default.
+            shard (int): Only claim units of this shard; None for any unit.
+            workers (int): Number of threads claiming and downloading concurrently.
+            tracer (Tracer): Receives a span per unit; the default tracer if not set.
+        """
+        self.queue = queue
+        self.repository_factory = repository_factory or Repository
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.shard = shard
+        self.workers = max(1, int(workers))
+        self.lease_seconds = lease_seconds
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.tracer = tracer or get_default_tracer()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def _heartbeat(self):
+        while not self._stopped.wait(self.lease_seconds / 3):
+            with self._lock:
+                keys = list(self._in_flight)
+            for key in keys:
+                if not self.queue.extend(key, self.worker_id, self.lease_seconds):
+                    logger.warning(f"Lost the lease on {key}")
+
+    def _process(self, repository, unit):
+        description = f"station {unit['station_id']}, year {unit['year']}"
+        with self.tracer.span('file', kind='hourly', historic_county=unit['historic_county'], station_id=unit['station_id'], year=unit['year']) as span:
+            span.attributes['outcome'] = 'failed'
+            try:
+                local_file_path = self.retry_policy.call(
+                    lambda: repository.download_hourly_file(unit['historic_county'], unit['station_id'], unit['year'],
+                                                            unit['quality_control_version'], unit['dataset_version']),
+                    description,
+                    repository.reauthenticate,
+                )
+            except RetriesExhaustedError as e:
+                self.queue.fail(unit['key'], self.worker_id, str(e.error), retry=e.kind == TRANSIENT)
+                return None
+            except DownloadError as e:
+                self.queue.fail(unit['key'], self.worker_id, str(e))
+                return None
+            except Exception as e:
+                # e.g. a local disk or conversion error; the worker keeps going with the next unit
+                logger.error(f"Error processing {description}. Error: {e}")
+                self.queue.fail(unit['key'], self.worker_id, str(e), retry=False)
+                return None
+            finally:
+                with span.phase(COOLDOWN):
+                    repository.cooldown()
+            span.attributes['outcome'] = 'ok'
+        if not self.queue.ack(unit['key'], self.worker_id, local_file_path):
+            logger.warning(f"Lease on {unit['key']} expired before it was acknowledged")
+        return local_file_path
+
+    def _work(self, pool, max_units):
+        processed = []
+        claimed = 0
+        while not self._stopped.is_set() and (max_units is None or claimed < max_units):
+            unit = self.queue.claim(self.worker_id, self.shard, self.lease_seconds)
+            if unit is None:
+                break
+            claimed += 1
+            with self._lock:
+                self._in_flight.add(unit['key'])
+            try:
+                local_file_path = self._process(pool.get(), unit)
+            finally:
+                with self._lock:
+                    self._in_flight.discard(unit['key'])
+            if local_file_path:
+                processed.append(local_file_path)
+        return processed
+
+    def run(self, max_units=None):
+        """
+        Work until the queue has no claimable units left, or each thread claimed max_units units.
+
+        Returns:
+            List[str]: The local files downloaded by this worker.
+        """
+        self._stopped.clear()
+        self.retry_policy.reset()
+        pool = RepositoryPool(self.repository_factory)
+        heartbeat = threading.Thread(target=self._heartbeat, name='lease-heartbeat', daemon=True)
+        heartbeat.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='midas-shard-worker') as executor:
+                results = list(executor.map(lambda _: self._work(pool, max_units), range(self.workers)))
+        finally:
+            self._stopped.set()
+            pool.cleanup()
+        downloaded_files = [local_file_path for files in results for local_file_path in files]
+        logger.info(f"Worker {self.worker_id} downloaded {len(downloaded_files)} files.")
+        return downloaded_files
+
+    def stop(self):
+        """Stop claiming new units; units in progress are finished."""
+        self._stopped.set()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Plan and work through the MIDAS Open hourly archive across machines.')
+    parser.add_argument('--queue', type=str, default=DEFAULT_QUEUE_PATH, help=f'SQLite work queue (default: {DEFAULT_QUEUE_PATH})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    plan = commands.add_parser('plan', help='Expand a request into work units and enqueue them')
+    plan.add_argument('start_year', type=int)
+    plan.add_argument('end_year', type=int)
+    plan.add_argument('--counties', type=str, default=None, help='Comma-separated historic counties (default: all)')
+    plan.add_argument('--listing-index', type=str, required=True, help='Dataset index to plan from; missing counties are crawled')
+    plan.add_argument('--shards', type=int, default=1)
+    plan.add_argument('--strategy', choices=[HASH, SIZE], default=HASH)
+    plan.add_argument('--dataset-version', type=str, default=DEFAULT_DATASET_VERSION)
+    work = commands.add_parser('work', help='Claim and download units')
+    work.add_argument('--shard', type=int, default=None, help='Only work on this shard')
+    work.add_argument('--workers', type=int, default=1)
+    work.add_argument('--lease-seconds', type=float, default=DEFAULT_LEASE_SECONDS)
+    commands.add_parser('status', help='Show the number of units per state')
+    args = parser.parse_args()
+
+    queue = SQLiteWorkQueue(args.queue)
+    if args.command == 'plan':
+        dataset_index = DatasetIndex(args.listing_index)
+        counties = [county.strip() for county in args.counties.split(',')] if args.counties else None
+        if counties is None:
+            if not dataset_index.counties(args.dataset_version):
+                dataset_index.crawl(Repository, dataset_version=args.dataset_version)
+        else:
+            missing = [county for county in counties if not dataset_index.has_county(county, args.dataset_version)]
+            if missing:
+                dataset_index.crawl(Repository, historic_counties=missing, dataset_version=args.dataset_version)
+        units = plan_work_units(dataset_index, counties, args.start_year, args.end_year, dataset_version=args.dataset_version)
+        assign_shards(units, args.shards, args.strategy)
+        queue.enqueue(units)
+        print(f"Planned {len(units)} units in {args.shards} shards.")
+    elif args.command == 'work':
+        ShardWorker(queue, shard=args.shard, workers=args.workers, lease_seconds=args.lease_seconds).run()
+    print(queue.stats())
+
+
+if __name__ == '__main__':
+    main()
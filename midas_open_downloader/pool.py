@@ -0,0 +1,57 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class RepositoryPool:
+    """
+    Hands out one initialised repository per worker thread, so every worker
+    gets its own downloader (its own HTTP session or FTP control connection).
+    """
+
+    def __init__(self, repository_factory):
+        self.repository_factory = repository_factory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._repositories = []
+
+    def get(self):
+        repository = getattr(self._local, 'repository', None)
+        if repository is None:
+            repository = self.repository_factory()
+            repository.initialize()
+            self._local.repository = repository
+            with self._lock:
+                self._repositories.append(repository)
+        return repository
+
+    def cleanup(self):
+        with self._lock:
+            repositories, self._repositories = self._repositories, []
+        for repository in repositories:
+            try:
+                repository.cleanup()
+            except Exception as e:
+                logger.error(f"Error cleaning up worker repository. Error: {e}")
+
+
+def run_in_pool(pool, work_items, work_fn, workers):
+    """
+    Run work_fn(repository, item) for every item using a bounded thread pool.
+
+    Args:
+        pool (RepositoryPool): The pool providing a repository per worker thread.
+        work_items (list): The items to process.
+        work_fn (callable): Called as work_fn(repository, item) on a worker thread.
+        workers (int): The maximum number of concurrent workers.
+
+    Returns:
+        list: The results of work_fn, in the same order as work_items.
+    """
+    def run(item):
+        return work_fn(pool.get(), item)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='midas-worker') as executor:
+        return list(executor.map(run, work_items))
@@ -0,0 +1,207 @@
+import sys
+import time
+import logging
+import threading
+from typing import List, Tuple
+
+from .downloader.tracing import BYTES, Hook, current_span
+
+logger = logging.getLogger(__name__)
+
+# Unit states
+PENDING = 'pending'
+ACTIVE = 'active'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def format_bytes(size):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(size) < 1024 or unit == 'GiB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return '--:--'
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+class Progress(Hook):
+    """
+    Live progress of a Retriever run: files done, failed and in flight, bytes
+    done out of the estimated total, throughput and the estimated time left.
+
+    Pass it to Retriever(progress=...); for the duration of a run it is a hook
+    of the Retriever's tracer and follows its hourly file spans and byte
+    events. The callback gets a snapshot() at most every interval seconds,
+    while bytes arrive and files finish, and always when the run begins and
+    ends. It is called on the worker threads, so it should return quickly.
+
+    Files served from the cache count as done without adding to the
+    throughput. The estimated total is refined with the actual size of every
+    finished file.
+    """
+
+    def __init__(self, callback=None, interval=1.0, clock=time.monotonic):
+        """
+        Args:
+            callback (callable): Called as callback(snapshot).
+            interval (float): Minimum seconds between two calls while the run is going.
+            clock (callable): Monotonic time in seconds.
+        """
+        self.callback = callback
+        self.interval = interval
+        self.clock = clock
+        # (station_id, year) -> {'state', 'size' (estimated), 'received'}
+        self._units = {}
+        self._received = 0
+        self._started = None
+        self._finished = False
+        self._last_report = None
+        self._lock = threading.Lock()
+
+    def begin(self, station_years: List[Tuple[str, int]], sizes: List[int]):
+        """Start tracking a run of the station-years with their estimated sizes."""
+        with self._lock:
+            self._units = {(station_id, int(year)): {'state': PENDING, 'size': size, 'received': 0}
+                           for (station_id, year), size in zip(station_years, sizes)}
+            self._received = 0
+            self._started = self.clock()
+            self._finished = False
+            self._last_report = None
+        self._report(force=True)
+
+    def end(self):
+        with self._lock:
+            self._finished = True
+        self._report(force=True)
+
+    def _unit(self, span):
+        if span is None or span.attributes.get('kind') != 'hourly':
+            return None
+        return self._units.get((span.attributes.get('station_id'), span.attributes.get('year')))
+
+    def on_span_start(self, span):
+        with self._lock:
+            unit = self._unit(span)
+            if unit is None:
+                return
+            unit['state'] = ACTIVE
+
+    def on_span_end(self, span):
+        with self._lock:
+            unit = self._unit(span)
+            if unit is None:
+                return
+            unit['state'] = DONE if span.attributes.get('outcome') == 'ok' else FAILED
+        self._report()
+
+    def on_event(self, name, value, attributes):
+        if name != BYTES:
+            return
+        with self._lock:
+            unit = self._unit(current_span())
+            if unit is None:
+                return
+            unit['received'] += value
+            self._received += value
+        self._report()
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: 'files_total', 'files_done', 'files_failed', 'files_active', 'bytes_done',
+                'bytes_total' (estimated), 'bytes_received' (transferred, without cache hits),
+                'elapsed' and 'eta' in seconds (None until it can be estimated), 'throughput'
+                in bytes per second, 'active' (the station-years in flight) and 'finished'.
+        """
+        with self._lock:
+            counts = {PENDING: 0, ACTIVE: 0, DONE: 0, FAILED: 0}
+            bytes_done = bytes_total = 0
+            active = []
+            for key, unit in self._units.items():
+                counts[unit['state']] += 1
+                if unit['state'] == DONE:
+                    size = unit['received'] or unit['size']
+                    bytes_done += size
+                    bytes_total += size
+                elif unit['state'] == FAILED:
+                    bytes_done += unit['received']
+                    bytes_total += unit['received']
+                else:
+                    bytes_done += unit['received']
+                    bytes_total += max(unit['size'], unit['received'])
+                    if unit['state'] == ACTIVE:
+                        active.append(key)
+            elapsed = self.clock() - self._started if self._started is not None else 0.0
+            received, finished, total = self._received, self._finished, len(self._units)
+        throughput = received / elapsed if elapsed > 0 else 0.0
+        left = counts[PENDING] + counts[ACTIVE]
+        if not left:
+            eta = 0.0
+        elif throughput > 0:
+            eta = (bytes_total - bytes_done) / throughput
+        elif counts[DONE]:
+            # Only cache hits so far: go by the number of files
+            eta = elapsed / counts[DONE] * left
+        else:
+            eta = None
+        return {
+            'files_total': total,
+            'files_done': counts[DONE],
+            'files_failed': counts[FAILED],
+            'files_active': counts[ACTIVE],
+            'bytes_done': bytes_done,
+            'bytes_total': bytes_total,
+            'bytes_received': received,
+            'elapsed': elapsed,
+            'throughput': throughput,
+            'eta': eta,
+            'active': sorted(active),
+            'finished': finished,
+        }
+
+    def _report(self, force=False):
+        if self.callback is None:
+            return
+        with self._lock:
+            now = self.clock()
+            if not force and self._last_report is not None and now - self._last_report < self.interval:
+                return
+            self._last_report = now
+        try:
+            self.callback(self.snapshot())
+        except Exception as e:
+            logger.error(f"Progress callback failed. Error: {e}")
+
+
+class ProgressDisplay:
+    """
+    A Progress callback that prints one status line per snapshot: rewritten in
+    place on a terminal, otherwise appended as log-friendly lines.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self.is_terminal = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self._width = 0
+
+    def format(self, snapshot):
+        failed = f", {snapshot['files_failed']} failed" if snapshot['files_failed'] else ''
+        return (f"{snapshot['files_done']}/{snapshot['files_total']} files{failed}, "
+                f"{format_bytes(snapshot['bytes_done'])} of ~{format_bytes(snapshot['bytes_total'])}, "
+                f"{format_bytes(snapshot['throughput'])}/s, "
+                f"{'elapsed ' + format_duration(snapshot['elapsed']) if snapshot['finished'] else 'ETA ' + format_duration(snapshot['eta'])}")
+
+    def __call__(self, snapshot):
+        line = self.format(snapshot)
+        if self.is_terminal:
+            self.stream.write('\r' + line.ljust(self._width) + ('\n' if snapshot['finished'] else ''))
+            self._width = 0 if snapshot['finished'] else len(line)
+        else:
+            self.stream.write(line + '\n')
+        self.stream.flush()
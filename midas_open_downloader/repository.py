@@ -1,20 +1,44 @@
 import logging
 
-from .downloader.ftp_downloader import FTPDownloader
-from .downloader.dap_downloader import HTTPDownloader
-from .downloader.errors import DownloadError
+from .badc import iter_badc_records
+
+from .downloader.backends import DEFAULT_BACKEND, create_downloader
+from .downloader.errors import DownloadError, NotModifiedError
+from .downloader.integrity import StreamingChecksum
+from .downloader.tracing import CACHE_HIT, CACHE_MISS, event
 from .parser import StationCapabilities
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+def _dataset_version_kwargs(dataset_version):
+    # Only pass dataset_version on when set, so the downloader default applies otherwise
+    return {'dataset_version': dataset_version} if dataset_version else {}
+
 class Repository:
 
-    def __init__(self, downloader=None):
+    def __init__(self, downloader=None, cache=None, columnar_store=None, backend=DEFAULT_BACKEND, sink=None, downloader_options=None):
+        """
+        Args:
+            downloader (MidasOpenDownloader): The downloader to use; created from backend if not given.
+            cache (DownloadCache): Optional cache consulted before every download.
+            columnar_store (ColumnarStore): Optional Parquet store every downloaded hourly
+                file is converted into.
+            backend (str): Name of the registered downloader backend, 'dap' (HTTPDownloader)
+                or 'ftp' (FTPDownloader). Its module is imported when the repository is created.
+            sink (StorageSink): Where the created downloader stores files (default: the working
+                directory). The cache and the columnar store need files on the local file system.
+            downloader_options (dict): Further keyword arguments of the created downloader, e.g.
+                {'pool': FTPConnectionPool(...)} to share FTP connections between repositories.
+        """
         self.downloader = downloader
+        self.cache = cache
+        self.columnar_store = columnar_store
         if not downloader:
-            self.downloader = HTTPDownloader()
-            # self.downloader = FTPDownloader()
+            options = dict(downloader_options or {})
+            if sink:
+                options['sink'] = sink
+            self.downloader = create_downloader(backend, **options)
 
     def initialize(self):
         self.downloader.init()
@@ -25,27 +49,96 @@ class Repository:
     def cooldown(self):
         self.downloader.cooldown()
 
-    def get_station_capabilities(self, historic_county, station_id):
-        capabilities_file = self.download_station_capabilities(historic_county, station_id)
+    def reauthenticate(self):
+        """Start a new session with fresh credentials after the server rejected the current ones."""
+        logger.info("Re-authenticating downloader")
+        self.downloader.reauthenticate()
+
+    def get_station_capabilities(self, historic_county, station_id, dataset_version=None):
+        capabilities_file = self.download_station_capabilities(historic_county, station_id, dataset_version)
         if capabilities_file:
             return StationCapabilities(capabilities_file)
         return None
 
-    def download_station_capabilities(self, historic_county, station_id):
+    def download_station_capabilities(self, historic_county, station_id, dataset_version=None):
         try:
-            file_path = self.downloader.get_station_capabilities_path(historic_county, station_id)
+            file_path = self.downloader.get_station_capabilities_path(historic_county, station_id, **_dataset_version_kwargs(dataset_version))
             logger.info(f"Downloading station capabilities file: {file_path}")
-            local_file_path = self.downloader.download(file_path)
+            local_file_path = self._download(file_path)
             logger.info(f"Downloaded station capabilities file: {local_file_path}")
             return local_file_path
         except DownloadError as e:
             logger.error(f"Error downloading station capabilities file: {file_path}. Error: {str(e)}")
             return None
 
-    def download_hourly_file(self, historic_county, station_id, year, quality_control_version):
-        file_path = self.downloader.get_hourly_path(historic_county, station_id, quality_control_version, year)
+    def download_hourly_file(self, historic_county, station_id, year, quality_control_version, dataset_version=None):
+        file_path = self.downloader.get_hourly_path(historic_county, station_id, quality_control_version, year, **_dataset_version_kwargs(dataset_version))
         logger.info(f"Downloading file: {file_path}")
-        local_file_path = self.downloader.download(file_path)
+        local_file_path = self._download(file_path)
+        logger.info(f"Downloaded file: {local_file_path}")
+        if self.columnar_store:
+            self._store_columnar(local_file_path, station_id, year, quality_control_version)
+        return local_file_path
+
+    def _store_columnar(self, local_file_path, station_id, year, quality_control_version):
+        # The CSV file is kept either way, so a conversion error does not fail the download
+        try:
+            self.columnar_store.write_hourly_file(local_file_path, station_id, year, quality_control_version)
+        except Exception as e:
+            logger.error(f"Error converting {local_file_path} to the columnar store. Error: {e}")
+
+    def iter_hourly_records(self, historic_county, station_id, year, quality_control_version, dataset_version=None, tee=False):
+        """
+        Yield the typed records of an hourly file while it is being transferred.
+
+        Args:
+            tee (bool): Also store the file with the downloader's sink, as download_hourly_file
+                would. It only appears there once the transfer is complete.
+        """
+        file_path = self.downloader.get_hourly_path(historic_county, station_id, quality_control_version, year, **_dataset_version_kwargs(dataset_version))
+        logger.info(f"Streaming file: {file_path}")
+        chunks = self.downloader.iter_chunks(file_path)
+        if tee:
+            chunks = self._tee(chunks, self.downloader.local_path(file_path))
+        yield from iter_badc_records(chunks)
+
+    def _tee(self, chunks, local_file_path):
+        partial = self.downloader.sink.partial(local_file_path)
+        checksum = StreamingChecksum()
+        with partial.open() as file_object:
+            for chunk in chunks:
+                file_object.write(chunk)
+                checksum.update(chunk)
+                yield chunk
+        partial.commit()
+        partial.record(checksum)
         logger.info(f"Downloaded file: {local_file_path}")
+
+    def probe_hourly_file(self, historic_county, station_id, year, quality_control_version, dataset_version=None):
+        file_path = self.downloader.get_hourly_path(historic_county, station_id, quality_control_version, year, **_dataset_version_kwargs(dataset_version))
+        return self.downloader.probe(file_path)
+
+    def list_directory(self, dataset_version, historic_county=None, station_id=None, quality_control_version=None):
+        directory_path = self.downloader.get_directory_path(dataset_version, historic_county, station_id, quality_control_version)
+        logger.info(f"Listing directory: {directory_path}")
+        return self.downloader.list_directory(directory_path)
+
+    def _download(self, file_path):
+        if not self.cache:
+            return self.downloader.download(file_path)
+
+        # Compressed files are cached apart, so a run restores them as its sink would store them
+        compression = getattr(self.downloader.sink, 'compression', None)
+        entry = self.cache.lookup(file_path, compression)
+        if entry and not self.cache.revalidate:
+            event(CACHE_HIT)
+            return self.cache.restore(file_path, entry, self.downloader.local_path(file_path))
+        try:
+            local_file_path = self.downloader.download(file_path, validators=entry['validators'] if entry else None)
+        except NotModifiedError:
+            event(CACHE_HIT)
+            return self.cache.restore(file_path, entry, self.downloader.local_path(file_path))
+        event(CACHE_MISS)
+        self.cache.store(file_path, local_file_path, self.downloader.last_validators, compression)
         return local_file_path
 
@@ -1,58 +1,366 @@
 import os
 import logging
-from typing import List
+import threading
+from typing import List, Optional
 
 from .repository import Repository
-from .downloader.errors import DownloadError
+from .downloader.abstract_downloader import DEFAULT_DATASET_VERSION
+from .downloader.errors import DownloadError, RetriesExhaustedError
+from .downloader.retry import RetryPolicy, TRANSIENT, classify_error
+from .downloader.tracing import COOLDOWN, get_default_tracer
+from .pool import RepositoryPool, run_in_pool
+from .scheduler import SizeEstimator
+from .sync import plan_sync, station_year_key
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 class Retriever:
 
-    def __init__(self):
-        self.repository = Repository()
+    def __init__(self, workers=1, repository_factory=None, capability_index=None, dataset_index=None, retry_policy=None, journal=None, tracer=None,
+                 scheduler=None, progress=None, size_estimator=None):
+        """
+        Args:
+            workers (int): Number of concurrent download workers. 1 keeps the serial behaviour.
+            repository_factory (callable): Creates a new Repository; used for the main
+                repository and for one repository per worker in concurrent mode.
+            capability_index (CapabilityIndex): Resolve station year ranges for all stations
+                in one concurrent pass and look them up there, instead of downloading a
+                capability file per station during validation.
+            dataset_index (DatasetIndex): Plan downloads from server directory listings;
+                counties missing from the index are crawled first.
+            retry_policy (RetryPolicy): How failed downloads are retried. Station-years it
+                gives up on are listed in self.failures after a run.
+            journal (Journal): Record every planned, started, completed and failed station-year.
+                Station-years a resumed journal records as completed are not fetched again while
+                their files are intact.
+            tracer (Tracer): Receives a span per file with its phase timings; the default
+                tracer if not set.
+            scheduler (Scheduler): Decides the order station-years are started in, e.g. the
+                largest files first; the requested order if not set.
+            progress (Progress): Follows the files and bytes of every run and reports the
+                progress and estimated time left.
+            size_estimator (SizeEstimator): Estimates file sizes for the scheduler and the
+                progress; by default from the dataset index and the journal.
+        """
+        self.workers = max(1, int(workers))
+        self.repository_factory = repository_factory or Repository
+        self.repository = self.repository_factory()
+        self.capability_index = capability_index
+        self.dataset_index = dataset_index
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.journal = journal
+        self.tracer = tracer or get_default_tracer()
+        self.scheduler = scheduler
+        self.progress = progress
+        self.size_estimator = size_estimator or SizeEstimator(dataset_index=dataset_index, journal=journal)
+        self.failures = []
+        self._failures_lock = threading.Lock()
+
+    def _get_station_years(self, station_id, historic_county):
+        if self.capability_index:
+            return self.capability_index.get_station_years(historic_county, station_id) or (None, None)
+        with self.tracer.span('file', kind='capabilities', historic_county=historic_county, station_id=station_id) as span:
+            capabilities = self.repository.get_station_capabilities(historic_county, station_id)
+            span.attributes['outcome'] = 'ok' if capabilities else 'failed'
+        if not capabilities:
+            return None
+        logger.info(f"Getting years from station id {station_id}")
+        return capabilities.get_station_years()
 
     def _validate_year_range(self, station_id, historic_county, start_year, end_year):
-        capabilities = self.repository.get_station_capabilities(historic_county, station_id)
-        if capabilities:
-            logger.info(f"Getting years from station id {station_id}")
-            first_year, last_year = capabilities.get_station_years()
+        station_years = self._get_station_years(station_id, historic_county)
+        if station_years:
+            first_year, last_year = station_years
             if first_year is None or last_year is None:
                 logger.error(f"Can not parse station years for station {station_id}")
                 return False
             if not (start_year >= int(first_year) and end_year <= int(last_year)):
                 logger.warning(f"Requested years are not within the available range for station {station_id}")
                 return False
-            return True 
+            return True
         return False
-        
 
-    def download_hourly_files(self, historic_county, station_ids: List[str], start_year: int, end_year: int, quality_control_version="1"):
+    def _get_valid_station_years(self, historic_county, station_ids, start_year, end_year):
+        station_years = []
+        for station_id in station_ids:
+            if not self._validate_year_range(station_id, historic_county, start_year, end_year):
+                logger.warning(f"Requested years are not within the available range for station {station_id}")
+                continue
+            for year in range(start_year, end_year + 1):
+                station_years.append((station_id, year))
+        return station_years
+
+    def _download_station_year(self, repository, historic_county, station_id, year, quality_control_version, dataset_version=None):
+        def download():
+            if dataset_version:
+                return repository.download_hourly_file(historic_county, station_id, year, quality_control_version, dataset_version)
+            return repository.download_hourly_file(historic_county, station_id, year, quality_control_version)
+
+        key = station_year_key(dataset_version or DEFAULT_DATASET_VERSION, historic_county, station_id, quality_control_version, year)
+        if self.journal:
+            self.journal.start(key)
+        with self.tracer.span('file', kind='hourly', historic_county=historic_county, station_id=station_id, year=year) as span:
+            span.attributes['outcome'] = 'failed'
+            try:
+                local_file_path = self.retry_policy.call(download, f"station {station_id}, year {year}", repository.reauthenticate)
+            except RetriesExhaustedError as e:
+                self._record_failure(historic_county, station_id, year, e.kind, e.attempts, e.error, key)
+                return None
+            except DownloadError as e:
+                logger.error(f"Error downloading file for station {station_id}, year {year}. Error: {str(e)}")
+                self._record_failure(historic_county, station_id, year, classify_error(e), 1, e, key)
+                return None
+            finally:
+                with span.phase(COOLDOWN):
+                    repository.cooldown()
+            span.attributes['outcome'] = 'ok'
+        if self.journal and local_file_path:
+            self.journal.complete(key, local_file_path)
+        return local_file_path
+
+    def _record_failure(self, historic_county, station_id, year, kind, attempts, error, key=None):
+        if self.journal and key:
+            self.journal.fail(key, kind, attempts, error)
+        with self._failures_lock:
+            self.failures.append({
+                'historic_county': historic_county,
+                'station_id': station_id,
+                'year': year,
+                'kind': kind,
+                'attempts': attempts,
+                'error': str(error),
+            })
+
+    def _download_station_years(self, historic_county, station_years, quality_control_version, dataset_version=None):
+        """
+        Download every (station_id, year) pair; the result has None for failed downloads.
+
+        Station-years that still fail with a transient error after the per-file retries
+        are tried once more at the end of the run, when the server has had time to recover.
+        Whatever fails for good is left in self.failures.
+        """
+        self.failures = []
+        self.retry_policy.reset()
+        results = [None] * len(station_years)
+        pending = list(range(len(station_years)))
+        if self.journal:
+            pending = self._skip_completed(historic_county, station_years, quality_control_version, dataset_version, results)
+            self.journal.plan(historic_county, [station_years[index] for index in pending], quality_control_version, dataset_version or DEFAULT_DATASET_VERSION)
+        sizes = None
+        if self.scheduler or self.progress:
+            sizes = self.size_estimator.estimate(historic_county, station_years, quality_control_version, dataset_version or DEFAULT_DATASET_VERSION)
+        if self.progress:
+            self.progress.begin([station_years[index] for index in pending], [sizes[index] for index in pending])
+            self.tracer.add_hook(self.progress)
+        try:
+            self._download_indices(historic_county, station_years, pending, quality_control_version, dataset_version, sizes, results)
+
+            deferred = {(failure['station_id'], failure['year']) for failure in self.failures if failure['kind'] == TRANSIENT}
+            if deferred:
+                logger.info(f"Retrying {len(deferred)} station-years that failed with transient errors.")
+                indices = [index for index, station_year in enumerate(station_years) if station_year in deferred]
+                self.failures = [failure for failure in self.failures if (failure['station_id'], failure['year']) not in deferred]
+                self._download_indices(historic_county, station_years, indices, quality_control_version, dataset_version, sizes, results)
+        finally:
+            if self.progress:
+                self.tracer.remove_hook(self.progress)
+                self.progress.end()
+        return results
+
+    def _download_indices(self, historic_county, station_years, indices, quality_control_version, dataset_version, sizes, results):
+        """Download the station-years at indices, in the order of the scheduler, into results."""
+        if self.scheduler:
+            indices = [indices[position] for position in self.scheduler.schedule([station_years[index] for index in indices], [sizes[index] for index in indices])]
+        downloaded = self._download_station_years_once(historic_county, [station_years[index] for index in indices], quality_control_version, dataset_version)
+        for index, local_file_path in zip(indices, downloaded):
+            results[index] = local_file_path
+
+    def _skip_completed(self, historic_county, station_years, quality_control_version, dataset_version, results):
+        """Fill results with the intact files the journal records as completed; return the indices still to fetch."""
+        pending = []
+        for index, (station_id, year) in enumerate(station_years):
+            key = station_year_key(dataset_version or DEFAULT_DATASET_VERSION, historic_county, station_id, quality_control_version, year)
+            results[index] = self.journal.completed_file(key)
+            if results[index] is None:
+                pending.append(index)
+        if len(pending) < len(station_years):
+            logger.info(f"Resuming: {len(station_years) - len(pending)} station-years already completed, {len(pending)} to go.")
+        return pending
+
+    def _download_station_years_once(self, historic_county, station_years, quality_control_version, dataset_version=None):
+        if self.workers == 1:
+            results = []
+            for station_id, year in station_years:
+                results.append(self._download_station_year(self.repository, historic_county, station_id, year, quality_control_version, dataset_version))
+            return results
+        return self._download_concurrently(historic_county, station_years, quality_control_version, dataset_version)
+
+    def _get_listed_station_years(self, historic_county, station_ids, start_year, end_year, quality_control_version):
+        if not self.dataset_index.has_county(historic_county):
+            self.dataset_index.crawl(self.repository_factory, self.workers, [historic_county])
+        return self.dataset_index.station_years(historic_county, station_ids, start_year, end_year, quality_control_version)
+
+    def download_hourly_files(self, historic_county, station_ids: Optional[List[str]], start_year: int, end_year: int, quality_control_version="1"):
+        """
+        Download the hourly files of the stations for every year in the range.
+
+        Without a dataset index, stations whose capabilities do not cover the whole
+        range are skipped. With a dataset index, exactly the files listed on the
+        server within the range are downloaded, and station_ids may be None to
+        download all stations of the county.
+        """
         downloaded_files = []
         self.repository.initialize()
         try:
-            for station_id in station_ids:
-                if not self._validate_year_range(station_id, historic_county, start_year, end_year):
-                    logger.warning(f"Requested years are not within the available range for station {station_id}")
-                    continue
-
-                # download each year from the station directory
-                for year in range(start_year, end_year + 1):
-                    try:
-                        local_file_path = self.repository.download_hourly_file(historic_county, station_id, year, quality_control_version)
-                        downloaded_files.append(local_file_path)
-                    except DownloadError as e:
-                        logger.error(f"Error downloading file: {file_path}. Error: {str(e)}")
-                    self.repository.cooldown()
+            # Planned from the request even when resuming, so stations and years added to it
+            # are fetched too; the journal only skips the station-years that completed
+            if self.dataset_index:
+                station_years = self._get_listed_station_years(historic_county, station_ids, start_year, end_year, quality_control_version)
+            else:
+                if self.capability_index:
+                    self.capability_index.update(historic_county, station_ids, self.repository_factory, self.workers, repository=self.repository)
+                station_years = self._get_valid_station_years(historic_county, station_ids, start_year, end_year)
+            results = self._download_station_years(historic_county, station_years, quality_control_version)
+            downloaded_files = [local_file_path for local_file_path in results if local_file_path]
         except Exception as e:
             logger.error(f"Error downloading stations. Error: {e}")
         self.repository.cleanup()
         logger.info(f"Downloaded {len(downloaded_files)} files.")
         return downloaded_files
 
+    def iter_observations(self, historic_county, station_ids: List[str], start_year: int, end_year: int, quality_control_version="1", tee=False):
+        """
+        Yield the observations of the stations for every year in the range while
+        the files are being transferred, one station-year after another, in
+        bounded memory.
+
+        Station-years are validated as in download_hourly_files. A station-year that
+        fails to transfer is recorded in self.failures and skipped; records it
+        yielded before the failure are not taken back.
+
+        Args:
+            tee (bool): Also keep the files on disk, as download_hourly_files would.
+
+        Yields:
+            Tuple[str, int, dict]: The station id, the year and a typed record.
+        """
+        self.failures = []
+        self.repository.initialize()
+        try:
+            station_years = self._get_valid_station_years(historic_county, station_ids, start_year, end_year)
+            for station_id, year in station_years:
+                try:
+                    for record in self.repository.iter_hourly_records(historic_county, station_id, year, quality_control_version, tee=tee):
+                        yield station_id, year, record
+                except DownloadError as e:
+                    logger.error(f"Error streaming file for station {station_id}, year {year}. Error: {str(e)}")
+                    self._record_failure(historic_county, station_id, year, classify_error(e), 1, e)
+                finally:
+                    self.repository.cooldown()
+        finally:
+            self.repository.cleanup()
+
+    def _download_concurrently(self, historic_county, station_years, quality_control_version, dataset_version=None):
+        pool = RepositoryPool(self.repository_factory)
+
+        def work(repository, station_year):
+            station_id, year = station_year
+            return self._download_station_year(repository, historic_county, station_id, year, quality_control_version, dataset_version)
+
+        try:
+            return run_in_pool(pool, station_years, work, self.workers)
+        finally:
+            pool.cleanup()
+
+    def sync_hourly_files(self, historic_county, station_ids: List[str], start_year: int, end_year: int, manifest,
+                          quality_control_version="1", dataset_version=DEFAULT_DATASET_VERSION, verify=False, carry_over_unchanged=False):
+        """
+        Fetch only the station-years that are missing or changed locally according to manifest.
+
+        Station year ranges are resolved once and remembered in the manifest, so a run
+        with nothing to do makes no requests at all. Years outside a station's range
+        are skipped rather than failing the whole station.
+
+        Args:
+            manifest (Manifest): The record of what has been fetched so far; updated in place.
+            dataset_version (str): The dataset version to sync.
+            verify (bool): Re-hash local files instead of only checking their size.
+            carry_over_unchanged (bool): For station-years fetched under an older dataset
+                version, compare the remote size of the new version and keep the old file
+                if it is unchanged instead of transferring it again.
+
+        Returns:
+            List[str]: The local files fetched by this run.
+        """
+        missing, unknown_stations = plan_sync(manifest, dataset_version, historic_county, station_ids, start_year, end_year, quality_control_version, verify)
+        if not missing:
+            logger.info("All requested station-years are up to date.")
+            return []
+
+        synced_files = []
+        self.repository.initialize()
+        try:
+            unavailable_stations = self._resolve_station_years(manifest, dataset_version, historic_county, unknown_stations)
+            known_station_ids = [station_id for station_id in station_ids if station_id not in unavailable_stations]
+            missing, _ = plan_sync(manifest, dataset_version, historic_county, known_station_ids, start_year, end_year, quality_control_version, verify)
+            if carry_over_unchanged:
+                missing = self._carry_over_unchanged(manifest, dataset_version, historic_county, missing, quality_control_version)
+
+            logger.info(f"Syncing {len(missing)} station-years.")
+            results = self._download_station_years(historic_county, missing, quality_control_version, dataset_version)
+            for (station_id, year), local_file_path in zip(missing, results):
+                if local_file_path:
+                    key = station_year_key(dataset_version, historic_county, station_id, quality_control_version, year)
+                    manifest.record_file(key, local_file_path, dataset_version)
+                    synced_files.append(local_file_path)
+        except Exception as e:
+            logger.error(f"Error syncing stations. Error: {e}")
+        finally:
+            manifest.save()
+        self.repository.cleanup()
+        logger.info(f"Synced {len(synced_files)} files.")
+        return synced_files
+
+    def _resolve_station_years(self, manifest, dataset_version, historic_county, station_ids):
+        """Record the available years of station_ids in manifest and return the stations without any."""
+        if self.capability_index:
+            self.capability_index.update(historic_county, station_ids, self.repository_factory, self.workers, dataset_version, repository=self.repository)
+        unavailable_stations = set()
+        for station_id in station_ids:
+            if self.capability_index:
+                first_year, last_year = self.capability_index.get_station_years(historic_county, station_id, dataset_version) or (None, None)
+            else:
+                capabilities = self.repository.get_station_capabilities(historic_county, station_id, dataset_version)
+                first_year, last_year = capabilities.get_station_years() if capabilities else (None, None)
+            if first_year is None or last_year is None:
+                logger.warning(f"No available years for station {station_id}")
+                unavailable_stations.add(station_id)
+                continue
+            manifest.record_station_years(dataset_version, historic_county, station_id, first_year, last_year)
+        return unavailable_stations
+
+    def _carry_over_unchanged(self, manifest, dataset_version, historic_county, station_years, quality_control_version):
+        """Record station-years whose file did not change since an older dataset version; return the rest."""
+        remaining = []
+        for station_id, year in station_years:
+            previous = manifest.previous_version_entry(dataset_version, historic_county, station_id, quality_control_version, year)
+            if previous and os.path.exists(previous['path']):
+                try:
+                    remote = self.repository.probe_hourly_file(historic_county, station_id, year, quality_control_version, dataset_version)
+                except DownloadError as e:
+                    logger.error(f"Error probing file for station {station_id}, year {year}. Error: {str(e)}")
+                    remote = {}
+                # Compressed files are compared by their uncompressed size
+                if remote.get('size') is not None and remote.get('size') == previous.get('remote_size', previous['size']):
+                    key = station_year_key(dataset_version, historic_county, station_id, quality_control_version, year)
+                    manifest.record_file(key, previous['path'], dataset_version, carried_over_from=previous['dataset_version'], remote_size=remote['size'])
+                    continue
+            remaining.append((station_id, year))
+        return remaining
+
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     try:
         historic_county = "staffordshire"
         station_ids = ["00622_keele", "00623_oaken"]
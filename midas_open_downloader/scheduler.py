@@ -0,0 +1,132 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from .downloader.abstract_downloader import DEFAULT_DATASET_VERSION
+from .sync import station_year_key
+
+logger = logging.getLogger(__name__)
+
+# Orders of the station-years of a run
+GIVEN = 'given'
+LARGEST = 'largest'
+SCHEDULE_ORDERS = (GIVEN, LARGEST)
+
+# Assumed size of an hourly file when nothing is known about any file of the run
+DEFAULT_UNIT_SIZE = 1024 * 1024
+
+
+class SizeEstimator:
+    """
+    Estimates the size of hourly files before they are downloaded, from the
+    server listing (DatasetIndex) or from earlier runs: the manifest, also for
+    older dataset versions of the same station-year, and completed units of a
+    journal. Files without a known size are estimated as the mean known size of
+    the same station, or else of all files in the batch.
+    """
+
+    def __init__(self, dataset_index=None, manifest=None, journal=None):
+        self.dataset_index = dataset_index
+        self.manifest = manifest
+        self.journal = journal
+
+    def known_size(self, historic_county, station_id, year, quality_control_version="1", dataset_version=DEFAULT_DATASET_VERSION):
+        """The size of the file according to the listing or history, or None."""
+        if self.dataset_index:
+            size = self.dataset_index.years(historic_county, station_id, quality_control_version, dataset_version).get(int(year))
+            if size is not None:
+                return size
+        key = station_year_key(dataset_version, historic_county, station_id, quality_control_version, year)
+        if self.manifest:
+            entry = self.manifest.files.get(key) or self.manifest.previous_version_entry(dataset_version, historic_county, station_id, quality_control_version, year)
+            if entry and entry.get('size') is not None:
+                return entry['size']
+        if self.journal:
+            size = self.journal.units.get(key, {}).get('size')
+            if size is not None:
+                return size
+        return None
+
+    def estimate(self, historic_county, station_years, quality_control_version="1", dataset_version=DEFAULT_DATASET_VERSION) -> List[int]:
+        """
+        Args:
+            station_years (List[Tuple[str, int]]): The (station_id, year) pairs.
+
+        Returns:
+            List[int]: The estimated size in bytes of every station-year.
+        """
+        sizes = [self.known_size(historic_county, station_id, year, quality_control_version, dataset_version)
+                 for station_id, year in station_years]
+        known = [size for size in sizes if size is not None]
+        default_size = sum(known) // len(known) if known else DEFAULT_UNIT_SIZE
+        by_station = {}
+        for (station_id, _), size in zip(station_years, sizes):
+            if size is not None:
+                by_station.setdefault(station_id, []).append(size)
+            elif station_id not in by_station and self.dataset_index:
+                # The other years of the station on the server
+                listed = self.dataset_index.years(historic_county, station_id, quality_control_version, dataset_version).values()
+                if any(size is not None for size in listed):
+                    by_station[station_id] = [size for size in listed if size is not None]
+        if len(known) < len(sizes):
+            logger.debug(f"No known size for {len(sizes) - len(known)} of {len(sizes)} station-years")
+        return [
+            size if size is not None else (sum(by_station[station_id]) // len(by_station[station_id]) if station_id in by_station else default_size)
+            for (station_id, _), size in zip(station_years, sizes)
+        ]
+
+
+class Scheduler:
+    """
+    Decides the order in which the station-years of a run are started.
+
+    With the LARGEST order the biggest files are started first, so with
+    concurrent workers no huge file is left to run alone at the end of a run.
+    Stations with a higher priority go before all others. With fair, the
+    stations of a priority take turns: every station's largest file, then
+    every station's second largest and so on, so no station waits for all
+    files of another one.
+    """
+
+    def __init__(self, order=LARGEST, priorities: Optional[Dict[str, int]] = None, fair=True):
+        """
+        Args:
+            order (str): LARGEST, or GIVEN to keep the requested order (only priorities apply).
+            priorities (Dict[str, int]): Station id -> priority; higher goes first, 0 if not set.
+            fair (bool): Take turns between the stations of a priority with the LARGEST order.
+        """
+        if order not in SCHEDULE_ORDERS:
+            raise ValueError(f"Unknown schedule order: {order}")
+        self.order = order
+        self.priorities = dict(priorities or {})
+        self.fair = fair
+
+    def schedule(self, station_years: List[Tuple[str, int]], sizes: List[int]) -> List[int]:
+        """
+        Returns:
+            List[int]: The indices of station_years in the order they should be started.
+        """
+        def priority(index):
+            return -self.priorities.get(station_years[index][0], 0)
+
+        if self.order == GIVEN:
+            return sorted(range(len(station_years)), key=priority)
+        # The position of every file among the files of its station, largest first
+        turns, counts = {}, {}
+        for index in sorted(range(len(station_years)), key=lambda index: (-sizes[index], index)):
+            station_id = station_years[index][0]
+            turns[index] = counts.get(station_id, 0)
+            counts[station_id] = turns[index] + 1
+        if self.fair:
+            return sorted(range(len(station_years)), key=lambda index: (priority(index), turns[index], -sizes[index], index))
+        return sorted(range(len(station_years)), key=lambda index: (priority(index), -sizes[index], index))
+
+
+def parse_priorities(value):
+    """Parse 'STATION=PRIORITY,...' as given on the command line, e.g. '00622_keele=10,00623_oaken=5'."""
+    priorities = {}
+    for item in filter(None, (item.strip() for item in value.split(','))):
+        station_id, separator, priority = item.rpartition('=')
+        if not separator or not station_id:
+            raise ValueError(f"Expected STATION=PRIORITY, got {item!r}")
+        priorities[station_id] = int(priority)
+    return priorities
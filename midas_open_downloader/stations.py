@@ -0,0 +1,341 @@
+import os
+import re
+import json
+import heapq
+import math
+import logging
+import threading
+
+from .badc import read_badc_header_from_path
+from .downloader.abstract_downloader import DEFAULT_DATASET_VERSION
+from .pool import RepositoryPool, run_in_pool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATION_CATALOGUE_PATH = './midas_stations.json'
+EARTH_RADIUS_KM = 6371.0
+
+LATITUDE = 0
+LONGITUDE = 1
+
+_CAPABILITY_FILE_PATTERN = re.compile(r'_capability\.csv$')
+
+
+def _station_key(historic_county, station_id):
+    return f"{historic_county}/{station_id}"
+
+
+def haversine_km(latitude1, longitude1, latitude2, longitude2):
+    """Great-circle distance between two points in kilometres."""
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(longitude2 - longitude1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _distance_to_split_km(latitude, longitude, axis, value):
+    """
+    A lower bound of the distance from the point to anything on the other side
+    of a k-d tree split: the parallel at latitude value or the meridian at
+    longitude value.
+    """
+    if axis == LATITUDE:
+        return EARTH_RADIUS_KM * math.radians(abs(latitude - value))
+    delta = math.radians(abs(longitude - value))
+    if delta >= math.pi / 2:
+        return 0.0
+    return EARTH_RADIUS_KM * math.asin(min(1.0, math.cos(math.radians(latitude)) * math.sin(delta)))
+
+
+def read_station_location(file_path):
+    """
+    Read the station name, location and height from the header of a capability
+    or hourly BADC-CSV file.
+
+    Returns:
+        dict: 'name', 'latitude', 'longitude' and 'height' (metres, or None), or None
+        if the header has no location.
+    """
+    metadata = read_badc_header_from_path(file_path).metadata
+    values = {label: next((values for reference, values in metadata.get(label, []) if reference == 'G'), None)
+              for label in ('location', 'height', 'observation_station')}
+    try:
+        latitude, longitude = float(values['location'][0]), float(values['location'][1])
+    except (TypeError, IndexError, ValueError):
+        return None
+    try:
+        height = float(values['height'][0])
+    except (TypeError, IndexError, ValueError):
+        height = None
+    name = values['observation_station'][0] if values['observation_station'] else None
+    return {'name': name, 'latitude': latitude, 'longitude': longitude, 'height': height}
+
+
+def group_by_county(stations):
+    """Group catalogue entries as {historic county: [station ids]}, e.g. to pass each county to Retriever."""
+    groups = {}
+    for station in stations:
+        groups.setdefault(station['historic_county'], []).append(station['station_id'])
+    return groups
+
+
+class _KDTree:
+    """
+    An implicit k-d tree over latitude and longitude: the station keys in tree
+    order, where the middle entry of every range is the node that splits it, on
+    latitude and longitude at alternating depths.
+    """
+
+    def __init__(self, order, stations):
+        self.order = order
+        # (latitude, longitude, latitude in radians, its cosine, longitude in radians) per node
+        self.points = []
+        for key in order:
+            latitude, longitude = stations[key]['latitude'], stations[key]['longitude']
+            self.points.append((latitude, longitude, math.radians(latitude), math.cos(math.radians(latitude)), math.radians(longitude)))
+
+    @classmethod
+    def build(cls, keys, stations):
+        def layout(keys, depth):
+            if not keys:
+                return []
+            field = 'latitude' if depth % 2 == LATITUDE else 'longitude'
+            keys = sorted(keys, key=lambda key: (stations[key][field], key))
+            middle = len(keys) // 2
+            return layout(keys[:middle], depth + 1) + [keys[middle]] + layout(keys[middle + 1:], depth + 1)
+
+        return cls(layout(list(keys), 0), stations)
+
+    def nearest(self, latitude, longitude, count, limit):
+        """The (distance, key) of the count nearest nodes within limit km, nearest first."""
+        points = self.points
+        phi, cos_phi, lambda_ = math.radians(latitude), math.cos(math.radians(latitude)), math.radians(longitude)
+        # Max-heap of the best candidates so far as (-distance, index)
+        best = []
+
+        def search(low, high, depth):
+            if low >= high:
+                return
+            middle = (low + high) // 2
+            point = points[middle]
+            # Haversine with the precomputed radians and cosines
+            a = math.sin((point[2] - phi) / 2) ** 2 + cos_phi * point[3] * math.sin((point[4] - lambda_) / 2) ** 2
+            distance = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+            if distance <= limit and (len(best) < count or distance < -best[0][0]):
+                heapq.heappush(best, (-distance, middle))
+                if len(best) > count:
+                    heapq.heappop(best)
+            axis = depth % 2
+            target = latitude if axis == LATITUDE else longitude
+            near, far = ((low, middle), (middle + 1, high)) if target < point[axis] else ((middle + 1, high), (low, middle))
+            search(near[0], near[1], depth + 1)
+            bound = -best[0][0] if len(best) == count else limit
+            if _distance_to_split_km(latitude, longitude, axis, point[axis]) <= bound:
+                search(far[0], far[1], depth + 1)
+
+        if count > 0:
+            search(0, len(points), 0)
+        return [(-negative, self.order[index]) for negative, index in sorted(best, reverse=True)]
+
+    def within(self, low_corner, high_corner):
+        """The keys of the nodes inside the (latitude, longitude) corners."""
+        points = self.points
+        found = []
+
+        def search(low, high, depth):
+            if low >= high:
+                return
+            middle = (low + high) // 2
+            point = points[middle]
+            if low_corner[0] <= point[0] <= high_corner[0] and low_corner[1] <= point[1] <= high_corner[1]:
+                found.append(self.order[middle])
+            axis = depth % 2
+            if low_corner[axis] <= point[axis]:
+                search(low, middle, depth + 1)
+            if point[axis] <= high_corner[axis]:
+                search(middle + 1, high, depth + 1)
+
+        search(0, len(points), 0)
+        return found
+
+
+class StationCatalogue:
+    """
+    The location and height of every known station, read from the headers of
+    their capability files, with k-d trees over latitude and longitude for
+    nearest-station and bounding-box queries: one over all stations and one per
+    historic county, so queries within a county only visit its stations.
+
+    With a path, the stations and the trees (as the station keys in tree
+    order) are persisted, so later runs answer queries without fetching or
+    sorting anything.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.stations = {}
+        # Historic county (None for all stations) -> _KDTree
+        self._trees = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                data = json.load(f)
+            self.stations = data.get('stations', {})
+            for county, order in data.get('trees', {}).items():
+                county = county or None
+                if sorted(order) == sorted(self._keys(county)):
+                    self._trees[county] = _KDTree(order, self.stations)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            for county in [None, *{station['historic_county'] for station in self.stations.values()}]:
+                self._tree(county)
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as f:
+                trees = {county or '': tree.order for county, tree in self._trees.items()}
+                json.dump({'stations': self.stations, 'trees': trees}, f, sort_keys=True)
+            os.replace(temp_path, self.path)
+
+    def __len__(self):
+        return len(self.stations)
+
+    def get_station(self, historic_county, station_id):
+        return self.stations.get(_station_key(historic_county, station_id))
+
+    def add_station(self, historic_county, station_id, latitude, longitude, height=None, name=None):
+        with self._lock:
+            self.stations[_station_key(historic_county, station_id)] = {
+                'historic_county': historic_county,
+                'station_id': station_id,
+                'name': name,
+                'latitude': float(latitude),
+                'longitude': float(longitude),
+                'height': height,
+            }
+            # Rebuilt on the next query
+            self._trees = {}
+
+    def add_file(self, file_path, historic_county, station_id):
+        """
+        Add the station from the header of one of its capability or hourly files.
+
+        Returns:
+            bool: False if the header has no location.
+        """
+        location = read_station_location(file_path)
+        if location is None:
+            logger.warning(f"No station location in {file_path}")
+            return False
+        self.add_station(historic_county, station_id, **location)
+        return True
+
+    def scan(self, root):
+        """
+        Add every station with a capability file in a local mirror (see LocalSink),
+        laid out as dataset-version/county/station/file.
+
+        Returns:
+            int: The number of stations added.
+        """
+        added = 0
+        for directory, _, file_names in os.walk(root):
+            parts = os.path.relpath(directory, root).split(os.sep)
+            if len(parts) != 3 or not parts[0].startswith('dataset-version-'):
+                continue
+            for file_name in file_names:
+                if _CAPABILITY_FILE_PATTERN.search(file_name):
+                    added += self.add_file(os.path.join(directory, file_name), parts[1], parts[2])
+                    break
+        return added
+
+    def update(self, historic_county, station_ids, repository_factory, workers=1, dataset_version=DEFAULT_DATASET_VERSION):
+        """
+        Fetch the capability files of all stations that are not catalogued yet and add them.
+
+        Args:
+            repository_factory (callable): Creates the repositories used to download the files.
+            workers (int): Number of capability files fetched concurrently.
+
+        Returns:
+            List[str]: The station ids that could not be located.
+        """
+        missing = [station_id for station_id in station_ids if self.get_station(historic_county, station_id) is None]
+        if not missing:
+            return []
+
+        logger.info(f"Locating {len(missing)} stations")
+        pool = RepositoryPool(repository_factory)
+
+        def locate(repository, station_id):
+            capabilities_file = repository.download_station_capabilities(historic_county, station_id, dataset_version)
+            return capabilities_file and self.add_file(capabilities_file, historic_county, station_id)
+
+        try:
+            results = run_in_pool(pool, missing, locate, max(1, workers))
+        finally:
+            pool.cleanup()
+        self.save()
+        return [station_id for station_id, located in zip(missing, results) if not located]
+
+    def nearest(self, latitude, longitude, count=1, historic_county=None, max_distance_km=None):
+        """
+        The count stations closest to a point, nearest first.
+
+        Args:
+            historic_county (str): Only consider stations in this county.
+            max_distance_km (float): Only consider stations within this great-circle distance.
+
+        Returns:
+            List[dict]: Copies of the catalogue entries with their 'distance_km' added.
+        """
+        with self._lock:
+            tree = self._tree(historic_county)
+        found = tree.nearest(latitude, longitude, count, math.inf if max_distance_km is None else max_distance_km)
+        return [dict(self.stations[key], distance_km=distance) for distance, key in found]
+
+    def within(self, min_latitude, min_longitude, max_latitude, max_longitude, historic_county=None):
+        """
+        The stations inside a latitude/longitude bounding box, ordered by county and station id.
+
+        Args:
+            historic_county (str): Only return stations in this county.
+        """
+        with self._lock:
+            tree = self._tree(historic_county)
+        stations = [dict(self.stations[key]) for key in tree.within((min_latitude, min_longitude), (max_latitude, max_longitude))]
+        return sorted(stations, key=lambda station: (station['historic_county'], station['station_id']))
+
+    def select(self, historic_county, near=None, count=1, bbox=None, station_ids=None):
+        """
+        The ids of the county's stations nearest to a point and/or inside a box,
+        e.g. as the station list of Retriever.download_hourly_files.
+
+        Args:
+            near (Tuple[float, float]): (latitude, longitude) to select the count nearest stations to.
+            bbox (Tuple[float, float, float, float]): (min latitude, min longitude, max latitude,
+                max longitude) the stations must be inside.
+            station_ids (List[str]): Only select from these stations.
+
+        Returns:
+            List[str]: Nearest first with near, otherwise sorted.
+        """
+        allowed = set(station_ids) if station_ids is not None else None
+        if bbox:
+            inside = {station['station_id'] for station in self.within(*bbox, historic_county=historic_county)}
+            allowed = inside if allowed is None else allowed & inside
+        if not near:
+            return sorted(allowed or [])
+        # With other constraints, rank the whole county and keep the first count that satisfy them
+        nearest = self.nearest(*near, count=count if allowed is None else len(self.stations), historic_county=historic_county)
+        return [station['station_id'] for station in nearest if allowed is None or station['station_id'] in allowed][:count]
+
+    def _keys(self, historic_county):
+        return [key for key, station in self.stations.items() if historic_county is None or station['historic_county'] == historic_county]
+
+    def _tree(self, historic_county):
+        """The tree of the county (None for all stations), built if the stations changed since. Needs the lock."""
+        if historic_county not in self._trees:
+            self._trees[historic_county] = _KDTree.build(self._keys(historic_county), self.stations)
+        return self._trees[historic_county]
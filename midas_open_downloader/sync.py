@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from .cache import file_sha256
+from .downloader.integrity import get_default_checksum_registry
+from .downloader.sinks import COMPRESSION_SUFFIXES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MANIFEST_PATH = './midas_manifest.json'
+
+
+def station_year_key(dataset_version, historic_county, station_id, quality_control_version, year):
+    return f"{dataset_version}/{historic_county}/{station_id}/qc-version-{quality_control_version}/{year}"
+
+
+def station_key(dataset_version, historic_county, station_id):
+    return f"{dataset_version}/{historic_county}/{station_id}"
+
+
+class Manifest:
+    """
+    A local record of every station-year fetched so far.
+
+    Each file entry holds the local path, size, SHA-256 checksum, dataset
+    version and fetch timestamp. The manifest also remembers the available
+    year range per station, so a sync that has nothing to do needs no network
+    round-trips at all.
+    """
+
+    def __init__(self, path=DEFAULT_MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.files = {}
+        self.stations = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.files = data.get('files', {})
+        self.stations = data.get('stations', {})
+
+    def save(self):
+        with self._lock:
+            data = {'files': self.files, 'stations': self.stations}
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(temp_path, self.path)
+
+    def record_file(self, key, local_file_path, dataset_version, carried_over_from=None, remote_size=None):
+        """
+        Record a fetched file. The checksum computed during the download is used if there
+        is one, along with what the download was verified against ('checks'), e.g. the
+        remote size or a published checksum.
+
+        The size of the file on the server is kept as 'remote_size', which differs from
+        'size' for compressed files. It is left out if it is not known.
+        """
+        downloaded = get_default_checksum_registry().lookup(local_file_path)
+        size = os.path.getsize(local_file_path)
+        if remote_size is None and downloaded:
+            remote_size = downloaded.get('remote_size')
+        if remote_size is None and not local_file_path.endswith(tuple(COMPRESSION_SUFFIXES.values())):
+            remote_size = size
+        entry = {
+            'path': os.path.abspath(local_file_path),
+            'size': size,
+            'sha256': downloaded['sha256'] if downloaded else file_sha256(local_file_path),
+            'checks': downloaded['checks'] if downloaded else [],
+            'dataset_version': dataset_version,
+            'fetched_at': time.time(),
+        }
+        if remote_size is not None:
+            entry['remote_size'] = remote_size
+        if carried_over_from:
+            entry['carried_over_from'] = carried_over_from
+        with self._lock:
+            self.files[key] = entry
+        return entry
+
+    def record_station_years(self, dataset_version, historic_county, station_id, first_year, last_year):
+        with self._lock:
+            self.stations[station_key(dataset_version, historic_county, station_id)] = [first_year, last_year]
+
+    def get_station_years(self, dataset_version, historic_county, station_id):
+        return self.stations.get(station_key(dataset_version, historic_county, station_id))
+
+    def is_current(self, key, verify=False):
+        """
+        True if key was fetched and the local file is still intact: it exists,
+        has the recorded size and, with verify, the recorded checksum.
+        """
+        entry = self.files.get(key)
+        if not entry or not os.path.exists(entry['path']):
+            return False
+        if os.path.getsize(entry['path']) != entry['size']:
+            return False
+        if verify and file_sha256(entry['path']) != entry['sha256']:
+            return False
+        return True
+
+    def previous_version_entry(self, dataset_version, historic_county, station_id, quality_control_version, year):
+        """Return the most recent entry for the same station-year under an older dataset version."""
+        suffix = station_year_key('', historic_county, station_id, quality_control_version, year)
+        candidates = [
+            entry for key, entry in self.files.items()
+            if key.endswith(suffix) and entry['dataset_version'] < dataset_version
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda entry: entry['dataset_version'])
+
+
+def plan_sync(manifest, dataset_version, historic_county, station_ids, start_year, end_year, quality_control_version, verify=False):
+    """
+    Work out which station-years still need fetching.
+
+    Returns:
+        Tuple[list, list]: The (station_id, year) pairs that are missing or changed
+        locally, and the station ids whose available years are not known yet.
+    """
+    missing = []
+    unknown_stations = []
+    for station_id in station_ids:
+        station_years = manifest.get_station_years(dataset_version, historic_county, station_id)
+        if station_years is None:
+            unknown_stations.append(station_id)
+            first_year, last_year = start_year, end_year
+        else:
+            first_year, last_year = max(start_year, station_years[0]), min(end_year, station_years[1])
+        for year in range(first_year, last_year + 1):
+            key = station_year_key(dataset_version, historic_county, station_id, quality_control_version, year)
+            if not manifest.is_current(key, verify):
+                missing.append((station_id, year))
+    return missing, unknown_stations
@@ -0,0 +1,280 @@
+import io
+import os
+import re
+import mmap
+import hashlib
+import logging
+import datetime
+import threading
+from typing import List, Optional
+
+from .badc import FLOAT, INT, load_badc_dataframe, load_badc_rows, read_badc_header, read_badc_header_from_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIME_INDEX_DIR = './midas_time_index'
+TIME_COLUMN = 'ob_time'
+
+HOURLY_FILE_PATTERN = re.compile(
+    r'^midas-open_uk-hourly-weather-obs_dv-(?P<dataset_version>[^_]+)_(?P<historic_county>[^_]+)_(?P<station_id>.+)'
+    r'_qcv-(?P<quality_control_version>[^_]+)_(?P<year>\d{4})\.csv$'
+)
+
+
+def _to_datetime64(value):
+    import numpy as np
+
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        value = datetime.datetime(value.year, value.month, value.day)
+    return np.datetime64(value, 's')
+
+
+class FileTimeIndex:
+    """
+    The observation time and byte offset of every data row of one hourly file,
+    so the rows of a time range can be read without touching the rest.
+
+    Attributes:
+        times (numpy.ndarray): datetime64[s] of each row, in file order.
+        offsets (numpy.ndarray): Byte offset of each row, plus the end of the last row.
+        is_sorted (bool): Whether times never decrease; otherwise ranges can not be
+            located and the whole file is read.
+    """
+
+    def __init__(self, file_path, times, offsets, size, mtime_ns):
+        self.file_path = file_path
+        self.times = times
+        self.offsets = offsets
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.is_sorted = bool((times[1:] >= times[:-1]).all())
+        self._header = None
+
+    @classmethod
+    def build(cls, file_path):
+        """Index a file in one pass over its lines, only splitting off the time column."""
+        import numpy as np
+
+        stat = os.stat(file_path)
+        times, offsets = [], []
+        with open(file_path, 'rb') as file_object, mmap.mmap(file_object.fileno(), 0, access=mmap.ACCESS_READ) as source:
+            header = read_badc_header(source)
+            column = header.columns.index(TIME_COLUMN)
+            position = header.data_offset
+            for line in iter(source.readline, b''):
+                stripped = line.strip()
+                if stripped.lower() == b'end data':
+                    break
+                if stripped:
+                    offsets.append(position)
+                    times.append(line.split(b',', column + 1)[column].strip().decode())
+                position += len(line)
+        offsets.append(position)
+        return cls(file_path, np.array(times, dtype='datetime64[s]'), np.array(offsets, dtype='int64'), stat.st_size, stat.st_mtime_ns)
+
+    def is_current(self):
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime_ns) == (self.size, self.mtime_ns)
+
+    def header(self):
+        if self._header is None:
+            self._header = read_badc_header_from_path(self.file_path)
+        return self._header
+
+    def row_range(self, start, end):
+        """The [first, last) rows observed between start and end, both inclusive."""
+        import numpy as np
+
+        return int(np.searchsorted(self.times, start, 'left')), int(np.searchsorted(self.times, end, 'right'))
+
+    def save(self, path):
+        import numpy as np
+
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(f, times=self.times.astype('int64'), offsets=self.offsets, stat=np.array([self.size, self.mtime_ns], dtype='int64'))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path, file_path):
+        import numpy as np
+
+        with np.load(path) as data:
+            size, mtime_ns = (int(value) for value in data['stat'])
+            return cls(file_path, data['times'].astype('datetime64[s]'), data['offsets'], size, mtime_ns)
+
+
+class TimeIndex:
+    """
+    The FileTimeIndex of every queried file, built on first use and kept in
+    memory. With index_dir they are also persisted, one .npz per file, so later
+    processes do not scan the files again. An index is rebuilt when its file
+    changes size or modification time.
+    """
+
+    def __init__(self, index_dir=None):
+        self.index_dir = index_dir
+        self._indexes = {}
+        self._lock = threading.Lock()
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+
+    def _index_path(self, file_path):
+        return os.path.join(self.index_dir, hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest() + '.npz')
+
+    def get(self, file_path):
+        key = os.path.abspath(file_path)
+        with self._lock:
+            index = self._indexes.get(key)
+        if index is not None and index.is_current():
+            return index
+        index = None
+        if self.index_dir and os.path.exists(self._index_path(file_path)):
+            try:
+                index = FileTimeIndex.load(self._index_path(file_path), file_path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable time index of {file_path}: {e}")
+        if index is None or not index.is_current():
+            logger.info(f"Indexing {file_path}")
+            index = FileTimeIndex.build(file_path)
+            if self.index_dir:
+                index.save(self._index_path(file_path))
+        with self._lock:
+            self._indexes[key] = index
+        return index
+
+
+class AlignedSeries:
+    """
+    Hourly observations of several stations on a common time axis.
+
+    Attributes:
+        times (numpy.ndarray): datetime64[s] of every hour from start to end.
+        station_ids (List[str]): The stations, in the order of the rows of each array.
+        values (Dict[str, numpy.ndarray]): Column -> float64 array of shape
+            (stations, hours), NaN where there is no observation.
+        bytes_read (int): Bytes of data rows read from the files to answer the query.
+    """
+
+    def __init__(self, times, station_ids, values, bytes_read):
+        self.times = times
+        self.station_ids = station_ids
+        self.values = values
+        self.bytes_read = bytes_read
+
+    def __getitem__(self, column):
+        return self.values[column]
+
+
+class TimeSeriesQuery:
+    """
+    Queries over the hourly files downloaded below root, in the flat layout or
+    mirrored with LocalSink. Only the files of the requested stations and years
+    are opened, and of those only the rows of the requested time range are read
+    and parsed, located with a per-file time index. Compressed files are not
+    queried, as they can not be read from an offset.
+    """
+
+    def __init__(self, root='.', index_dir=None):
+        """
+        Args:
+            root (str): Directory the hourly files are found in, recursively.
+            index_dir (str): Persist the time indexes in this directory; in memory only if None.
+        """
+        self.root = root
+        self.index = TimeIndex(index_dir)
+        self._files = None
+
+    def files(self, refresh=False):
+        """
+        The hourly files below root as {(station_id, quality_control_version, year):
+        {dataset_version: path}}. The directory is only walked once unless refresh is set.
+        """
+        if self._files is not None and not refresh:
+            return self._files
+        files = {}
+        for directory, _, file_names in os.walk(self.root):
+            for file_name in file_names:
+                match = HOURLY_FILE_PATTERN.match(file_name)
+                if match:
+                    key = (match.group('station_id'), match.group('quality_control_version'), int(match.group('year')))
+                    files.setdefault(key, {})[match.group('dataset_version')] = os.path.join(directory, file_name)
+        self._files = files
+        return files
+
+    def find_file(self, station_id, year, quality_control_version="1", dataset_version=None):
+        """The local hourly file of a station-year, from the newest dataset version unless one is given."""
+        versions = self.files().get((station_id, str(quality_control_version), int(year)), {})
+        if dataset_version is not None:
+            return versions.get(str(dataset_version))
+        return versions[max(versions)] if versions else None
+
+    def query(self, station_ids: List[str], start, end, columns: List[str], quality_control_version="1",
+              dataset_version: Optional[str] = None) -> AlignedSeries:
+        """
+        Load numeric columns of several stations between two timestamps, aligned hourly.
+
+        Args:
+            station_ids (List[str]): The stations, e.g. ['00622_keele'].
+            start: First hour (datetime, date, ISO string or numpy.datetime64), rounded down to the hour.
+            end: Last timestamp, inclusive.
+            columns (List[str]): FLOAT or INT columns, e.g. ['air_temperature'].
+
+        Returns:
+            AlignedSeries: The last observation in every hour per station and column.
+
+        Raises:
+            ValueError: If a column is missing from a file or is not numeric.
+        """
+        import numpy as np
+
+        start, end = _to_datetime64(start), _to_datetime64(end)
+        first_hour = start.astype('datetime64[h]').astype('datetime64[s]')
+        times = np.arange(first_hour, end + np.timedelta64(1, 's'), np.timedelta64(1, 'h'))
+        values = {column: np.full((len(station_ids), len(times)), np.nan) for column in columns}
+        bytes_read = 0
+        first_year, last_year = start.astype(object).year, end.astype(object).year
+        for row, station_id in enumerate(station_ids):
+            for year in range(first_year, last_year + 1):
+                file_path = self.find_file(station_id, year, quality_control_version, dataset_version)
+                if file_path is None:
+                    logger.debug(f"No local file for {station_id} {year}")
+                    continue
+                frame, size = self._read_rows(file_path, start, end, columns)
+                bytes_read += size
+                if frame is None or not len(frame):
+                    continue
+                hours = ((frame[TIME_COLUMN].to_numpy().astype('datetime64[s]') - first_hour) // np.timedelta64(1, 'h')).astype('int64')
+                # The last row of every hour inside the axis
+                positions = np.flatnonzero((hours >= 0) & (hours < len(times)))
+                _, last = np.unique(hours[positions][::-1], return_index=True)
+                positions = positions[len(positions) - 1 - last]
+                for column in columns:
+                    values[column][row, hours[positions]] = frame[column].to_numpy(dtype='float64', na_value=np.nan)[positions]
+        return AlignedSeries(times, list(station_ids), values, bytes_read)
+
+    def _read_rows(self, file_path, start, end, columns):
+        """The rows of file_path observed between start and end, and the bytes read for them."""
+        index = self.index.get(file_path)
+        header = index.header()
+        types = header.column_types()
+        for column in columns:
+            if column not in types:
+                raise ValueError(f"No column {column!r} in {file_path}")
+            if types[column] not in (FLOAT, INT):
+                raise ValueError(f"Column {column!r} is not numeric")
+        if not index.is_sorted:
+            # Rows out of time order can not be located by range, so read them all
+            frame = load_badc_dataframe(file_path, [TIME_COLUMN] + columns)
+            observed = frame[TIME_COLUMN].to_numpy().astype('datetime64[s]')
+            return frame[(observed >= start) & (observed <= end)], int(index.offsets[-1] - index.offsets[0])
+        first, last = index.row_range(start, end)
+        if first >= last:
+            return None, 0
+        with open(file_path, 'rb') as f:
+            f.seek(int(index.offsets[first]))
+            data = f.read(int(index.offsets[last] - index.offsets[first]))
+        return load_badc_rows(io.BytesIO(data), header, [TIME_COLUMN] + columns), len(data)
@@ -0,0 +1,103 @@
+import os
+import sys
+import json
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+from .cache import file_sha256
+from .journal import Journal, COMPLETED
+from .sync import Manifest, DEFAULT_MANIFEST_PATH
+
+logger = logging.getLogger(__name__)
+
+OK = 'ok'
+MISSING = 'missing'
+SIZE_MISMATCH = 'size mismatch'
+CHECKSUM_MISMATCH = 'checksum mismatch'
+
+
+def manifest_entries(manifest) -> Dict[str, dict]:
+    """The files recorded in a Manifest, by key."""
+    return dict(manifest.files)
+
+
+def journal_entries(units) -> Dict[str, dict]:
+    """The files of the units a Journal records as completed (from Journal.units or Journal.read_units), by key."""
+    return {key: unit for key, unit in units.items() if unit.get('state') == COMPLETED}
+
+
+def _check_file(item):
+    key, path, size, sha256 = item
+    try:
+        actual_size = os.path.getsize(path)
+    except OSError:
+        return key, path, MISSING
+    if actual_size != size:
+        return key, path, SIZE_MISMATCH
+    if file_sha256(path) != sha256:
+        return key, path, CHECKSUM_MISMATCH
+    return key, path, OK
+
+
+def verify_files(entries: Dict[str, dict], workers=None) -> List[dict]:
+    """
+    Re-hash local files and compare them with their recorded size and SHA-256.
+
+    Files are hashed by a pool of processes, so a large mirror is checked on all
+    cores. Each file is read once, in chunks.
+
+    Args:
+        entries (dict): Key -> entry with 'path', 'size' and 'sha256', e.g. from manifest_entries.
+        workers (int): Number of processes; defaults to the number of CPUs.
+
+    Returns:
+        List[dict]: 'key', 'path' and 'status' (OK, MISSING, SIZE_MISMATCH or
+        CHECKSUM_MISMATCH) per entry, in key order.
+    """
+    items = [(key, entry['path'], entry['size'], entry['sha256']) for key, entry in sorted(entries.items())]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(items) < 2:
+        results = map(_check_file, items)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_check_file, items, chunksize=max(1, len(items) // (workers * 4))))
+    return [{'key': key, 'path': path, 'status': status} for key, path, status in results]
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        prog='python -m midas_open_downloader verify',
+        description='Re-hash a local mirror and check it against the manifest or a journal.',
+    )
+    parser.add_argument('--manifest', type=str, default=DEFAULT_MANIFEST_PATH, help=f'Manifest to verify against (default: {DEFAULT_MANIFEST_PATH})')
+    parser.add_argument('--journal', type=str, default=None, help='Verify the files completed in this journal instead')
+    parser.add_argument('--workers', type=int, default=None, help='Hashing processes (default: number of CPUs)')
+    parser.add_argument('--report', type=str, default=None, help='Write the files that failed verification to this JSON file')
+    args = parser.parse_args(argv)
+
+    if args.journal:
+        if not os.path.exists(args.journal):
+            parser.error(f"Journal not found: {args.journal}")
+        # Only read, so verifying does not touch the journal
+        entries = journal_entries(Journal.read_units(args.journal))
+    else:
+        if not os.path.exists(args.manifest):
+            parser.error(f"Manifest not found: {args.manifest}")
+        entries = manifest_entries(Manifest(args.manifest))
+
+    results = verify_files(entries, args.workers)
+    problems = [result for result in results if result['status'] != OK]
+    for result in problems:
+        print(f"  {result['key']}: {result['status']} ({result['path']})")
+    print(f"Verified {len(results)} files: {len(results) - len(problems)} ok, {len(problems)} failed.")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(problems, f, indent=2)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
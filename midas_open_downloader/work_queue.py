@@ -0,0 +1,189 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_PATH = './midas_queue.sqlite'
+DEFAULT_LEASE_SECONDS = 15 * 60
+DEFAULT_MAX_ATTEMPTS = 3
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class WorkQueue(ABC):
+    """
+    A queue of work units shared by the workers of several machines.
+
+    A worker claims a unit and holds a lease on it for lease_seconds. The
+    worker acknowledges the unit when it is done, or fails it. If the worker
+    dies, the lease runs out and the unit is handed to the next claim.
+    Implementations must make claim atomic across processes and machines.
+    """
+
+    @abstractmethod
+    def enqueue(self, units: List[Dict]):
+        """Add units (dicts with a unique 'key' and a 'shard'); units already queued are left alone."""
+        pass
+
+    @abstractmethod
+    def claim(self, worker_id: str, shard: Optional[int] = None, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> Optional[Dict]:
+        """Lease the next pending or expired unit, of the given shard only if one is given; None if there is none."""
+        pass
+
+    @abstractmethod
+    def extend(self, key: str, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> bool:
+        """Extend a lease still held by worker_id; False if it was lost."""
+        pass
+
+    @abstractmethod
+    def ack(self, key: str, worker_id: str, result: Optional[str] = None) -> bool:
+        """Mark a unit done; False if worker_id no longer held its lease."""
+        pass
+
+    @abstractmethod
+    def fail(self, key: str, worker_id: str, error: str, retry: bool = True) -> bool:
+        """Give a unit back to be retried, or mark it failed for good after max_attempts or with retry False."""
+        pass
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """The number of units per state."""
+        pass
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """
+    A WorkQueue in a SQLite file. Claims run in an IMMEDIATE transaction, which
+    takes SQLite's file lock, so it is safe for workers in several processes on
+    one machine, or on machines sharing a file system with working locks.
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, max_attempts=DEFAULT_MAX_ATTEMPTS, clock=time.time):
+        """
+        Args:
+            path (str): The SQLite database file.
+            max_attempts (int): Claims of a unit before a failure is final.
+            clock (callable): Wall clock used for lease expiry; shared between machines.
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self._local = threading.local()
+        with self._transaction() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS units (
+                    key TEXT PRIMARY KEY,
+                    shard INTEGER NOT NULL,
+                    unit TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    worker_id TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    result TEXT
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS units_claim ON units (shard, state, lease_expires)")
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def enqueue(self, units):
+        with self._transaction() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO units (key, shard, unit, state) VALUES (?, ?, ?, ?)",
+                [(unit['key'], unit.get('shard', 0), json.dumps(unit, sort_keys=True), PENDING) for unit in units],
+            )
+
+    def claim(self, worker_id, shard=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+        now = self.clock()
+        query = "SELECT key, unit, attempts FROM units WHERE (state = ? OR (state = ? AND lease_expires < ?))"
+        parameters = [PENDING, LEASED, now]
+        if shard is not None:
+            query += " AND shard = ?"
+            parameters.append(shard)
+        query += " ORDER BY key LIMIT 1"
+        with self._transaction() as connection:
+            while True:
+                row = connection.execute(query, parameters).fetchone()
+                if row is None:
+                    return None
+                key, unit, attempts = row
+                if attempts < self.max_attempts:
+                    break
+                # Its last lease expired too, so the worker died on every attempt
+                connection.execute("UPDATE units SET state = ?, error = ? WHERE key = ?", (FAILED, 'lease expired', key))
+            connection.execute(
+                "UPDATE units SET state = ?, worker_id = ?, lease_expires = ?, attempts = attempts + 1 WHERE key = ?",
+                (LEASED, worker_id, now + lease_seconds, key),
+            )
+        unit = json.loads(unit)
+        unit['attempt'] = attempts + 1
+        return unit
+
+    def _update_lease(self, key, worker_id, assignments, parameters):
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                f"UPDATE units SET {assignments} WHERE key = ? AND state = ? AND worker_id = ?",
+                parameters + [key, LEASED, worker_id],
+            )
+            return cursor.rowcount == 1
+
+    def extend(self, key, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        return self._update_lease(key, worker_id, "lease_expires = ?", [self.clock() + lease_seconds])
+
+    def ack(self, key, worker_id, result=None):
+        return self._update_lease(key, worker_id, "state = ?, lease_expires = NULL, result = ?", [DONE, result])
+
+    def fail(self, key, worker_id, error, retry=True):
+        with self._transaction() as connection:
+            row = connection.execute("SELECT attempts FROM units WHERE key = ? AND state = ? AND worker_id = ?", (key, LEASED, worker_id)).fetchone()
+            if row is None:
+                return False
+            state = PENDING if retry and row[0] < self.max_attempts else FAILED
+            connection.execute("UPDATE units SET state = ?, lease_expires = NULL, error = ? WHERE key = ?", (state, error, key))
+        return True
+
+    def stats(self):
+        with self._transaction() as connection:
+            counts = dict(connection.execute("SELECT state, COUNT(*) FROM units GROUP BY state").fetchall())
+            expired = connection.execute("SELECT COUNT(*) FROM units WHERE state = ? AND lease_expires < ?", (LEASED, self.clock())).fetchone()[0]
+        stats = {state: counts.get(state, 0) for state in (PENDING, LEASED, DONE, FAILED)}
+        stats['expired'] = expired
+        return stats
+
+    def failures(self):
+        """The units that failed for good, with their last error."""
+        with self._transaction() as connection:
+            rows = connection.execute("SELECT unit, attempts, error FROM units WHERE state = ? ORDER BY key", (FAILED,)).fetchall()
+        return [dict(json.loads(unit), attempts=attempts, error=error) for unit, attempts, error in rows]
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None